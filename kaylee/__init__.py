@@ -31,7 +31,8 @@ from .errors import (KayleeError,
                      NodeNotSubscribedError,
                      InvalidResultError,
                      NodeRequestRejectedError,
-                     ApplicationCompletedError,)
+                     ApplicationCompletedError,
+                     ApplicationRemovedError,)
 
 kl = loader.LazyKaylee()
 
@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+"""
+    kaylee.admin
+    ~~~~~~~~~~~~
+
+    The management (admin) API of a running Kaylee server. The API
+    returns the live snapshots of the applications' state (progress,
+    pools, caches and storages), the nodes registry and the
+    configuration. The snapshots are built from the counters which are
+    maintained incrementally by the serving code, thus polling the API
+    costs nothing to the nodes' requests.
+
+    The API is available in-process as :attr:`Kaylee.admin
+    <kaylee.Kaylee.admin>` and is served by the front-ends under the
+    ``<url_prefix>/admin`` URLs. The HTTP requests are authorized by a
+    short-living token signed by the :config:`SECRET_KEY`
+    (see :func:`make_token`)::
+
+      Authorization: Kaylee-Admin 1371541925.5d41402abc4b2a76b9719d91...
+
+    :copyright: (c) 2013 by Zaur Nasibov.
+    :license: MIT, see LICENSE for more details.
+"""
+import re
+import json
+import time
+import hashlib
+from hmac import new as hmac, compare_digest
+
+from . import tracing
+
+#: The authorization scheme of the admin HTTP requests.
+AUTH_SCHEME = 'Kaylee-Admin'
+
+#: The default lifetime of the admin tokens (in seconds).
+DEFAULT_TOKEN_MAX_AGE = 300
+
+# the configuration values which are never exposed
+_sensitive_key_re = re.compile(r'secret|password|passwd|token|credential',
+                               re.IGNORECASE)
+
+_REDACTED = '********'
+
+
+def make_token(secret_key, timestamp=None):
+    """Returns an admin token: the timestamp and its HMAC-SHA256 signed
+    by the secret key, e.g.::
+
+        $ python -c "from kaylee.admin import make_token; \\
+                     print(make_token('<SECRET_KEY>'))"
+
+    :param secret_key: the :config:`SECRET_KEY` of the server.
+    :param timestamp: the UNIX time of the token (the current time by
+                      default).
+    """
+    if timestamp is None:
+        timestamp = time.time()
+    timestamp = str(int(timestamp))
+    return '{}.{}'.format(timestamp, _sign(secret_key, timestamp))
+
+
+def verify_token(secret_key, token, max_age=DEFAULT_TOKEN_MAX_AGE):
+    """Checks the token signature and that the token is not older (or
+    newer, which is a clock skew) than ``max_age`` seconds. A malformed
+    token is invalid."""
+    timestamp, sep, signature = token.partition('.')
+    if not sep or not (timestamp.isascii() and timestamp.isdigit()):
+        return False
+    try:
+        if abs(time.time() - int(timestamp)) > max_age:
+            return False
+    except (ValueError, OverflowError):
+        return False
+    return compare_digest(signature.encode('utf-8', 'replace'),
+                          _sign(secret_key, timestamp).encode('ascii'))
+
+
+def _sign(secret_key, timestamp):
+    return hmac(secret_key.encode('utf-8'),
+                b'kaylee.admin|' + timestamp.encode('ascii'),
+                hashlib.sha256).hexdigest()
+
+
+class AdminAPI(object):
+    """The admin API of a :class:`Kaylee <kaylee.Kaylee>` object.
+
+    :param kl: the :class:`Kaylee <kaylee.Kaylee>` object.
+    :param token_max_age: the lifetime of the HTTP requests' tokens in
+                          seconds (see :func:`verify_token`).
+    """
+    def __init__(self, kl, token_max_age=DEFAULT_TOKEN_MAX_AGE):
+        self.kl = kl
+        self.token_max_age = token_max_age
+
+    def snapshot(self):
+        """Returns the state of the server::
+
+          {
+              'time' : 1371541925.123,
+              'registry' : {'nodes' : 10, 'hosts' : {'2c9d4b5a' : 10}},
+              'applications' : {'hash_cracker' : { ... }, ... },
+              'config' : {'AUTO_GET_ACTION' : True, ... },
+          }
+
+        See :meth:`registry`, :meth:`Controller.snapshot
+        <kaylee.Controller.snapshot>` and :meth:`config`.
+        """
+        return {
+            'time' : time.time(),
+            'registry' : self.registry(),
+            'applications' : {app.name : app.snapshot()
+                              for app in self.kl.applications},
+            'config' : self.config(),
+        }
+
+    def application(self, name):
+        """Returns the state of an application (see
+        :meth:`Controller.snapshot <kaylee.Controller.snapshot>`).
+
+        :throws KeyError: if the application was not found.
+        """
+        return self.kl.applications[name].snapshot()
+
+    def registry(self):
+        """Returns the amount of the registered nodes and the per-host
+        amounts (see :meth:`NodesRegistry.hosts
+        <kaylee.NodesRegistry.hosts>`)."""
+        registry = self.kl.registry
+        return {'nodes' : len(registry), 'hosts' : registry.hosts()}
+
+    def config(self):
+        """Returns the configuration. The secret values (e.g.
+        :config:`SECRET_KEY` or a storage password) are masked."""
+        return {name : _redact(name, value)
+                for name, value in vars(self.kl.config).items()
+                if not name.startswith('_')}
+
+    def tracing(self):
+        """Returns the aggregated timings of the traced phases and the
+        slow requests (see :mod:`kaylee.tracing`)."""
+        return {'stats' : tracing.stats(),
+                'slow_requests' : tracing.slow_requests()}
+
+    def handle(self, resource, authorization):
+        """Handles an admin HTTP request and returns the
+        ``(HTTP status code, JSON body)`` pair. The resources are:
+
+        * ``''`` - the :meth:`snapshot`,
+        * ``'applications/<name>'`` - the :meth:`application` state,
+        * ``'tracing'`` - the :meth:`tracing` data.
+
+        The API is not served (``404``) unless :config:`SECRET_KEY` is
+        configured.
+
+        :param resource: the URL path relative to ``<url_prefix>/admin``.
+        :param authorization: the ``Authorization`` request header.
+        """
+        secret_key = getattr(self.kl.config, 'SECRET_KEY', None)
+        if not secret_key:
+            return 404, _json_error('Not found')
+        if not self._authorized(secret_key, authorization):
+            return 401, _json_error('Unauthorized')
+
+        parts = resource.strip('/').split('/')
+        if parts == ['']:
+            data = self.snapshot()
+        elif parts == ['tracing']:
+            data = self.tracing()
+        elif len(parts) == 2 and parts[0] == 'applications':
+            try:
+                data = self.application(parts[1])
+            except KeyError:
+                return 404, _json_error('Application not found')
+        else:
+            return 404, _json_error('Not found')
+        return 200, json.dumps(data, default=str)
+
+    def _authorized(self, secret_key, authorization):
+        if not authorization:
+            return False
+        scheme, _, token = authorization.strip().partition(' ')
+        if scheme != AUTH_SCHEME:
+            return False
+        return verify_token(secret_key, token.strip(), self.token_max_age)
+
+
+def _redact(name, value):
+    if _sensitive_key_re.search(str(name)):
+        return _REDACTED
+    if isinstance(value, dict):
+        return {key : _redact(key, val) for key, val in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_redact('', val) for val in value]
+    return value
+
+
+def _json_error(message):
+    return json.dumps({'error' : message})
@@ -0,0 +1,399 @@
+# -*- coding: utf-8 -*-
+"""
+    kaylee.assets
+    ~~~~~~~~~~~~~
+
+    Build-time bundling, minification and precompression of the client
+    assets. The bundles are named after their content hash, thus they can
+    be cached by the browsers forever. The mapping of the original
+    (logical) asset paths to the bundles is kept in the ``assets.json``
+    manifest in the build directory.
+
+    :copyright: (c) 2013 by Zaur Nasibov.
+    :license: MIT, see LICENSE for more details.
+"""
+import os
+import re
+import gzip
+import json
+import hashlib
+
+#: The assets manifest file name.
+ASSETS_MANIFEST = 'assets.json'
+ASSETS_MANIFEST_VERSION = 1
+
+#: The length of the content hash in the bundles' names.
+HASH_LENGTH = 12
+
+#: Matches the file names of the bundles, e.g. ``kaylee.0123456789ab.js``.
+hashed_name_re = re.compile(r'\.[0-9a-f]{%d}\.[A-Za-z0-9]+$' % HASH_LENGTH)
+
+#: The extensions of the text files which are precompressed.
+PRECOMPRESSED_EXTENSIONS = ('.js', '.css', '.html', '.json', '.svg')
+
+#: The files smaller than this size (in bytes) are not precompressed.
+PRECOMPRESS_MIN_SIZE = 256
+
+#: The Kaylee client files (relative to the build directory) bundled in
+#: the order of their inclusion by ``index.html``.
+KAYLEE_SCRIPTS = [
+    'kaylee/js/kaylee.js',
+    'kaylee/js/jquery.min.js',
+    'kaylee/js/kldebug.js',
+]
+KAYLEE_STYLES = [
+    'kaylee/css/klconsole.css',
+]
+
+#: The files which are loaded by the fixed URLs (e.g. the worker script
+#: whose URL is computed by the client) and are only precompressed.
+KAYLEE_FIXED_FILES = [
+    'kaylee/js/klworker.js',
+    'index.html',
+]
+
+_JS_WORD_RE = re.compile(r'[\w$\\\u0080-\uffff]+')
+_JS_REGEX_PRECEDERS = set('(,=:[!&|?{};+-*%<>~^')
+_JS_REGEX_KEYWORDS = {'return', 'typeof', 'case', 'do', 'else', 'in',
+                      'instanceof', 'new', 'delete', 'void', 'throw',
+                      'yield', 'await'}
+_JS_PUNCT = set('{}()[];,<>+-*%&|^!~?:=/.')
+# the line breaks after these characters can not terminate a statement
+_JS_CONTINUATION = set('{[(,;=:?&|*%<>!~.')
+# the characters which must stay separated, e.g. "a - -b" or "a / /r/"
+_JS_SEPARATED = {('+', '+'), ('-', '-'), ('/', '/'), ('/', '*')}
+
+
+def minify_js(source):
+    """A conservative JavaScript minifier: removes the comments (except
+    the ``/*! ... */`` license comments) and the redundant whitespace.
+    The strings, the template literals and the regular expression literals
+    are kept intact. The line breaks are removed only where they can not
+    terminate a statement, i.e. the automatic semicolon insertion works
+    the same way.
+    """
+    out = []
+    pending = None          # pending whitespace: None, ' ' or '\n'
+    last_kind = None        # the kind of the last emitted token
+    last_token = ''
+    i, n = 0, len(source)
+
+    def emit(token, kind):
+        nonlocal pending, last_kind, last_token
+        if pending is not None and out:
+            prev = last_token[-1]
+            nxt = token[0]
+            prev_punct = prev in _JS_PUNCT and last_kind == 'punct'
+            if pending == '\n':
+                if prev_punct and prev in _JS_CONTINUATION or \
+                        nxt in '}])':
+                    pending = ' '
+                else:
+                    out.append('\n')
+                    pending = None
+            if pending == ' ':
+                next_punct = nxt in _JS_PUNCT and kind == 'punct'
+                keep = not (prev_punct or next_punct) or \
+                    (prev, nxt) in _JS_SEPARATED or \
+                    (nxt == '.' and last_kind == 'word' and
+                     last_token[0].isdigit())
+                if keep:
+                    out.append(' ')
+        pending = None
+        out.append(token)
+        last_kind, last_token = kind, token
+
+    while i < n:
+        c = source[i]
+        if c in ' \t\r\n\f\v\u00a0\ufeff':
+            if c == '\n' or c == '\r':
+                pending = '\n'
+            elif pending is None:
+                pending = ' '
+            i += 1
+        elif source.startswith('//', i):
+            end = source.find('\n', i)
+            i = n if end == -1 else end
+        elif source.startswith('/*', i):
+            end = source.find('*/', i + 2)
+            end = n if end == -1 else end + 2
+            comment = source[i:end]
+            if comment.startswith('/*!'):
+                emit(comment, 'comment')
+                pending = '\n'
+            elif '\n' in comment:
+                pending = '\n'
+            elif pending is None:
+                pending = ' '
+            i = end
+        elif c in '\'"`':
+            end = _scan_quoted(source, i, c)
+            emit(source[i:end], 'string')
+            i = end
+        elif c == '/' and _regex_allowed(last_kind, last_token):
+            end = _scan_regex(source, i)
+            emit(source[i:end], 'regex')
+            i = end
+        else:
+            m = _JS_WORD_RE.match(source, i)
+            if m is not None:
+                emit(m.group(), 'word')
+                i = m.end()
+            else:
+                emit(c, 'punct')
+                i += 1
+    return ''.join(out)
+
+
+def _regex_allowed(last_kind, last_token):
+    if last_kind is None:
+        return True
+    if last_kind == 'punct':
+        return last_token in _JS_REGEX_PRECEDERS
+    return last_kind == 'word' and last_token in _JS_REGEX_KEYWORDS
+
+
+def _scan_quoted(source, start, quote):
+    i, n = start + 1, len(source)
+    while i < n:
+        c = source[i]
+        if c == '\\':
+            i += 2
+            continue
+        i += 1
+        if c == quote:
+            break
+    return min(i, n)
+
+
+def _scan_regex(source, start):
+    i, n = start + 1, len(source)
+    in_class = False
+    while i < n:
+        c = source[i]
+        if c == '\\':
+            i += 2
+            continue
+        i += 1
+        if c == '[':
+            in_class = True
+        elif c == ']':
+            in_class = False
+        elif c == '/' and not in_class:
+            break
+        elif c == '\n':
+            # not a regular expression after all
+            return start + 1
+    while i < n and (source[i].isalpha()):
+        i += 1
+    return min(i, n)
+
+
+def minify_css(source):
+    """A conservative CSS minifier: removes the comments (except the
+    ``/*! ... */`` license comments), collapses the whitespace and removes
+    it around the ``{};,>`` characters and after ``:``."""
+    out = []
+    pending = False
+    i, n = 0, len(source)
+    while i < n:
+        c = source[i]
+        if c.isspace():
+            pending = True
+            i += 1
+        elif source.startswith('/*', i):
+            end = source.find('*/', i + 2)
+            end = n if end == -1 else end + 2
+            if source.startswith('/*!', i):
+                out.append(source[i:end])
+            else:
+                pending = True
+            i = end
+        elif c in '\'"':
+            end = _scan_quoted(source, i, c)
+            if pending and out and out[-1][-1] not in '{};,>:':
+                out.append(' ')
+            pending = False
+            out.append(source[i:end])
+            i = end
+        else:
+            if c in '{};,>':
+                if c == '}' and out and out[-1] == ';':
+                    out.pop()
+            elif pending and out and out[-1][-1] not in '{};,>:':
+                out.append(' ')
+            pending = False
+            out.append(c)
+            i += 1
+    return ''.join(out)
+
+
+def hashed_name(path, data):
+    """Returns the content-hashed name of the asset, e.g.
+    ``js/kaylee.0123456789ab.js`` for ``js/kaylee.js``."""
+    digest = hashlib.sha256(data).hexdigest()[:HASH_LENGTH]
+    base, ext = os.path.splitext(path)
+    return '{}.{}{}'.format(base, digest, ext)
+
+
+def precompress(path):
+    """Writes the gzip-compressed ``<path>.gz`` sibling of the file if
+    it is worth it. The existing up to date sibling is kept.
+
+    :returns: ``True`` if the sibling exists.
+    """
+    gz_path = path + '.gz'
+    st = os.stat(path)
+    if os.path.exists(gz_path) and \
+            os.stat(gz_path).st_mtime_ns >= st.st_mtime_ns:
+        return True
+    if st.st_size < PRECOMPRESS_MIN_SIZE:
+        if os.path.exists(gz_path):
+            os.remove(gz_path)
+        return False
+    with open(path, 'rb') as f:
+        data = f.read()
+    # mtime=0 makes the output reproducible
+    compressed = gzip.compress(data, 9, mtime=0)
+    if len(compressed) >= len(data):
+        if os.path.exists(gz_path):
+            os.remove(gz_path)
+        return False
+    _write_atomic(gz_path, compressed)
+    return True
+
+
+def load_assets_manifest(build_dir):
+    """Returns the ``{logical path : bundle path}`` mapping of the build
+    directory (empty if the assets have not been bundled)."""
+    try:
+        with open(os.path.join(build_dir, ASSETS_MANIFEST)) as f:
+            data = json.load(f)
+        if data.get('version') == ASSETS_MANIFEST_VERSION:
+            return data['assets']
+    except (OSError, ValueError, KeyError):
+        pass
+    return {}
+
+
+def bundle_assets(build_dir, projects, index_template=None):
+    """Bundles and minifies the Kaylee client and the projects' scripts
+    and stylesheets, precompresses the bundles and writes the assets
+    manifest. The original files are kept.
+
+    Every project's scripts are bundled into ``<project>/js/<project>.js``
+    bundle (the main script goes last), and the stylesheets into
+    ``<project>/css/<project>.css`` bundle.
+
+    :param build_dir: the build directory.
+    :param projects: the names of the built projects (i.e. their
+                     build subdirectories).
+    :param index_template: the path of the ``index.html`` template whose
+                           asset URLs are replaced by the bundles' URLs.
+    :returns: the new assets manifest.
+    """
+    old_assets = load_assets_manifest(build_dir)
+    assets = {}
+
+    def _bundle(name, members, minify):
+        members = [m for m in members
+                   if os.path.isfile(os.path.join(build_dir, m))]
+        if not members:
+            return
+        chunks = []
+        for member in members:
+            with open(os.path.join(build_dir, member),
+                      encoding='utf-8') as f:
+                source = f.read()
+            if not member.endswith('.min.js'):
+                source = minify(source)
+            chunks.append(source)
+        # a semicolon protects against the scripts which rely on the
+        # automatic semicolon insertion at the end of the file
+        sep = ';\n' if name.endswith('.js') else '\n'
+        data = sep.join(chunks).encode('utf-8')
+        bundle = hashed_name(name, data)
+        bundle_path = os.path.join(build_dir, bundle)
+        if not os.path.exists(bundle_path):
+            _write_atomic(bundle_path, data)
+        precompress(bundle_path)
+        for member in members:
+            assets[member] = bundle
+
+    _bundle('kaylee/js/kaylee.js', KAYLEE_SCRIPTS, minify_js)
+    _bundle('kaylee/css/klconsole.css', KAYLEE_STYLES, minify_css)
+    for project in projects:
+        main = '{0}/js/{0}.js'.format(project)
+        _bundle(main, _project_files(build_dir, project, 'js', main),
+                minify_js)
+        _bundle('{0}/css/{0}.css'.format(project),
+                _project_files(build_dir, project, 'css'), minify_css)
+
+    if index_template is not None:
+        with open(index_template, encoding='utf-8') as f:
+            html = rewrite_asset_urls(f.read(), assets)
+        _write_atomic(os.path.join(build_dir, 'index.html'),
+                      html.encode('utf-8'))
+    for fname in KAYLEE_FIXED_FILES:
+        path = os.path.join(build_dir, fname)
+        if os.path.isfile(path):
+            precompress(path)
+
+    # remove the outdated bundles
+    for bundle in set(old_assets.values()) - set(assets.values()):
+        for path in (bundle, bundle + '.gz'):
+            path = os.path.join(build_dir, path)
+            if os.path.exists(path):
+                os.remove(path)
+
+    _write_atomic(os.path.join(build_dir, ASSETS_MANIFEST),
+                  json.dumps({'version' : ASSETS_MANIFEST_VERSION,
+                              'assets' : assets},
+                             indent=1, sort_keys=True).encode('utf-8'))
+    return assets
+
+
+def _project_files(build_dir, project, subdir, main=None):
+    dir_path = os.path.join(build_dir, project, subdir)
+    if not os.path.isdir(dir_path):
+        return []
+    files = ['{}/{}/{}'.format(project, subdir, fname)
+             for fname in sorted(os.listdir(dir_path))
+             if fname.endswith('.' + subdir)
+             and not hashed_name_re.search(fname)]
+    if main is not None:
+        if main not in files:
+            # the libraries are bundled only along with the main script
+            return []
+        files.remove(main)
+        files.append(main)
+    return files
+
+
+_asset_tag_re = re.compile(
+    r'<(script|link)\b[^>]*?\b(src|href)="/static/([^"]+)"[^>]*>'
+    r'(\s*</script>)?\s*', re.IGNORECASE)
+
+def rewrite_asset_urls(html, assets, static_url='/static/'):
+    """Replaces the ``/static/<path>`` URLs of the ``<script>`` and
+    ``<link>`` tags by the URLs of the bundles. The tags of the files
+    bundled together are collapsed into a single tag."""
+    seen = set()
+
+    def _replace(m):
+        path = m.group(3)
+        bundle = assets.get(path)
+        if bundle is None:
+            return m.group(0)
+        if bundle in seen:
+            return ''
+        seen.add(bundle)
+        return m.group(0).replace(static_url + path, static_url + bundle)
+    return _asset_tag_re.sub(_replace, html)
+
+
+def _write_atomic(path, data):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""
+    kaylee.blobs
+    ~~~~~~~~~~~~
+
+    This module implements the content-addressed storage of immutable
+    data blobs shared among the tasks of a project (lookup tables, model
+    weights etc.). A task refers to a blob by its key (the SHA-256 hash
+    of the blob's content), and the client fetches every blob only once.
+
+    :copyright: (c) 2013 by Zaur Nasibov.
+    :license: MIT, see LICENSE for more details.
+"""
+import json
+import threading
+from hashlib import sha256
+
+#: The ``Cache-Control`` header value of the blob responses. The blobs
+#: are immutable, thus they can be cached forever.
+BLOB_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+#: The blob key regular expression pattern which can be used in
+#: e.g. web frameworks' URL dispatchers.
+blob_key_pattern = r'[a-f\d]{64}'
+
+
+class Blob(object):
+    """An immutable data blob.
+
+    :param data: the blob content.
+    :param content_type: the blob MIME type.
+    :type data: bytes
+    """
+    __slots__ = ('key', 'data', 'content_type')
+
+    def __init__(self, data, content_type='application/octet-stream'):
+        #: The SHA-256 hex digest of the content.
+        self.key = sha256(data).hexdigest()
+        self.data = data
+        self.content_type = content_type
+
+    @property
+    def etag(self):
+        return '"{}"'.format(self.key)
+
+    @property
+    def headers(self):
+        """A list of the HTTP response headers."""
+        return [
+            ('Content-Type', self.content_type),
+            ('Content-Length', str(len(self.data))),
+            ('ETag', self.etag),
+            ('Cache-Control', BLOB_CACHE_CONTROL),
+        ]
+
+    def matches(self, if_none_match):
+        """Checks whether the ``If-None-Match`` request header value
+        matches the blob, i.e. the client has the blob already and
+        ``304 Not Modified`` can be returned."""
+        if not if_none_match:
+            return False
+        tags = [tag.strip() for tag in if_none_match.split(',')]
+        return '*' in tags or self.etag in tags or \
+            'W/' + self.etag in tags
+
+
+class BlobStore(object):
+    """A thread-safe in-memory store of :class:`Blob` objects keyed
+    by their content hash."""
+    def __init__(self):
+        self._blobs = {}
+        self._lock = threading.Lock()
+
+    def add(self, data, content_type=None):
+        """Adds the blob to the store and returns its key. Adding the same
+        content twice has no effect.
+
+        :param data: ``bytes`` (``'application/octet-stream'`` by default),
+                     ``str`` (``'text/plain'``) or a JSON-serializable
+                     object (``'application/json'``).
+        :param content_type: overrides the blob MIME type.
+        """
+        if isinstance(data, bytes):
+            default_type = 'application/octet-stream'
+        elif isinstance(data, str):
+            data = data.encode('utf-8')
+            default_type = 'text/plain; charset=utf-8'
+        else:
+            data = json.dumps(data, separators=(',', ':')).encode('utf-8')
+            default_type = 'application/json'
+        blob = Blob(data, content_type or default_type)
+        with self._lock:
+            blob = self._blobs.setdefault(blob.key, blob)
+        return blob.key
+
+    def get(self, key, default=None):
+        return self._blobs.get(key, default)
+
+    def __getitem__(self, key):
+        return self._blobs[key]
+
+    def __contains__(self, key):
+        return key in self._blobs
+
+    def __len__(self):
+        return len(self._blobs)
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+    kaylee.compression
+    ~~~~~~~~~~~~~~~~~~
+
+    This module implements the HTTP compression (``gzip`` and ``deflate``
+    content codings) of the task and result payloads: the negotiation of
+    the response coding via the ``Accept-Encoding`` request header and the
+    decoding of the compressed (``Content-Encoding``) request bodies.
+
+    :copyright: (c) 2013 by Zaur Nasibov.
+    :license: MIT, see LICENSE for more details.
+"""
+import zlib
+from functools import lru_cache
+
+#: The supported content codings in the order of preference.
+ENCODINGS = ('gzip', 'deflate')
+
+#: The default minimum size (in bytes) of a compressed response
+#: (see :config:`COMPRESSION_MIN_SIZE`).
+DEFAULT_COMPRESSION_MIN_SIZE = 1024
+
+#: The maximum size (in bytes) of a decompressed request body.
+MAX_DECOMPRESSED_SIZE = 16 * 1024 * 1024
+
+# zlib ``wbits`` of the content codings: gzip header and trailer for gzip,
+# zlib header and trailer for deflate (RFC 2616 "deflate" is zlib format).
+_WBITS = {
+    'gzip' : 31,
+    'deflate' : 15,
+}
+
+
+@lru_cache(maxsize=128)
+def negotiate_encoding(accept_encoding):
+    """Returns the preferred supported content coding (``'gzip'`` or
+    ``'deflate'``) acceptable according to the ``Accept-Encoding`` header
+    value or ``None`` if the response should not be compressed.
+
+    The header values sent by the clients are few, thus the results are
+    cached.
+    """
+    if not accept_encoding:
+        return None
+    qvalues = {}
+    for item in accept_encoding.split(','):
+        coding, _, params = item.partition(';')
+        coding = coding.strip().lower()
+        q = 1.0
+        for param in params.split(';'):
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        qvalues[coding] = q
+
+    best, best_q = None, 0.0
+    for coding in ENCODINGS:
+        q = qvalues.get(coding, qvalues.get('*', 0.0))
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+def compress(data, encoding, level=6):
+    """Compresses the data with the content coding.
+
+    :param data: the data to compress.
+    :param encoding: ``'gzip'`` or ``'deflate'``.
+    :param level: the zlib compression level (``1`` is the fastest,
+                  ``9`` gives the best compression).
+    :type data: bytes
+    """
+    return zlib.compress(data, level, _WBITS[encoding])
+
+
+def decompress(data, encoding, max_size=MAX_DECOMPRESSED_SIZE):
+    """Decompresses a request body encoded with the content coding.
+
+    :param data: the compressed data.
+    :param encoding: the ``Content-Encoding`` request header value.
+                     ``None``, an empty string and ``'identity'`` mean that
+                     the data is not compressed.
+    :param max_size: the maximum size of the decompressed data.
+    :throws ValueError: if the coding is not supported, the data is
+                        corrupted or the decompressed data is too large.
+    """
+    if not encoding:
+        return data
+    encoding = encoding.strip().lower()
+    if encoding == 'identity':
+        return data
+    if isinstance(data, str):
+        raise ValueError('A compressed request body must be bytes')
+    try:
+        wbits = _WBITS[encoding]
+    except KeyError:
+        raise ValueError('Unsupported content coding: "{}"'.format(encoding))
+    try:
+        return _decompress(data, wbits, max_size)
+    except zlib.error:
+        if encoding != 'deflate':
+            raise ValueError('Invalid {} data'.format(encoding))
+    # some clients send raw deflate data without the zlib header
+    try:
+        return _decompress(data, -15, max_size)
+    except zlib.error:
+        raise ValueError('Invalid deflate data')
+
+
+def _decompress(data, wbits, max_size):
+    decompressor = zlib.decompressobj(wbits)
+    result = decompressor.decompress(data, max_size)
+    if decompressor.unconsumed_tail:
+        raise ValueError('The decompressed request body exceeds {} bytes'
+                         .format(max_size))
+    if not decompressor.eof:
+        raise zlib.error('Incomplete compressed data')
+    return result
@@ -4,7 +4,8 @@
     ~~~~~~~~~~~~~~
 
     This sub-package contains code contributed to Kaylee.
-    It includes front-ends, Controllers, Storages, NodeRegistries etc.
+    It includes front-ends, Controllers, Storages, NodeRegistries,
+    Coordinators, Projects' base classes etc.
 
     :copyright: (c) 2012 by Zaur Nasibov.
     :license: MIT, see LICENSE for more details.
@@ -13,3 +14,6 @@
 from .controllers import SimpleController, ResultsComparatorController
 from .storages import MemoryTemporalStorage, MemoryPermanentStorage
 from .registries import MemoryNodesRegistry
+from .coordinators import SQLiteCoordinator
+from .projects import (FileProject, JSONLinesFileProject,
+                       FixedWidthFileProject)
@@ -8,10 +8,18 @@
     :copyright: (c) 2013 by Zaur Nasibov.
     :license: MIT, see LICENSE for more details.
 """
+from time import perf_counter
 from kaylee.controller import Controller, NO_SOLUTION, NOT_SOLVED
-from kaylee.errors import (ApplicationCompletedError,
-                           NodeRequestRejectedError,
-                           NoneResultAssertError,)
+from kaylee.metrics import registry as metrics_registry
+from kaylee import tracing
+from kaylee.errors import (NodeRequestRejectedError,
+                           NoneResultAssertError,
+                           InvalidResultError,)
+
+_temporal_add_duration = metrics_registry.histogram(
+    'kaylee_storage_add_duration_seconds',
+    'The duration of the result additions to the storages.',
+    ['storage']).labels('temporal')
 
 
 class SimpleController(Controller):
@@ -27,38 +35,59 @@ class SimpleController(Controller):
         self._project_depleted = False
 
     def get_task(self, node):
-        task = self.project.next_task()
+        task = self.next_project_task(node)
         if task is None:
-            try:
-                tp_id = self._tasks_pool.pop()
-                task = self.project[tp_id]
-            except KeyError:
-                # project depleted and nothing in the pool,
-                # looks like the application is completed.
-                self.completed = True
-                raise ApplicationCompletedError(self)
-
-        task_id = task['id']
+            self.progress.depleted = True
+            while task is None:
+                try:
+                    tp_id = self._tasks_pool.pop()
+                except KeyError:
+                    # project depleted and nothing in the pool,
+                    # looks like the application is completed.
+                    self.complete_depleted()
+                # the tasks taken over by another server are dropped
+                task = self.get_pooled_task(tp_id)
+        else:
+            self.progress.task_generated()
+
+        task_id = self.task_id_of(task)
         node.task_id = task_id
         self._tasks_pool.add(task_id)
+        self.progress.task_leased()
         return task
 
     def accept_result(self, node, result):
         if result == NO_SOLUTION:
+            if node.task_id not in self._tasks_pool:
+                return
             self._tasks_pool.remove(node.task_id)
+            self.complete_task(node.task_id)
+            self.update_completed()
             return
         elif result == NOT_SOLVED:
             return
 
-        norm_result = self.project.normalize_result(node.task_id, result)
+        try:
+            with tracing.span('normalize_result'):
+                norm_result = self.project.normalize_result(node.task_id,
+                                                            result)
+        except InvalidResultError:
+            self.progress.result_rejected()
+            raise
         if norm_result is None:
             raise NoneResultAssertError(result)
 
+        if node.task_id not in self._tasks_pool:
+            # a duplicate result of a re-dispatched task which has been
+            # completed by another node already
+            return
         self.store_result(node.task_id, norm_result)
         self._tasks_pool.remove(node.task_id)
-        if self.project.completed:
-            self.completed = True
+        self.update_completed()
 
+    @property
+    def pool_size(self):
+        return len(self._tasks_pool)
 
 
 class ResultsComparatorController(Controller):
@@ -79,24 +108,31 @@ class ResultsComparatorController(Controller):
         self._tasks_pool = set()
 
     def get_task(self, node):
-        task = self.project.next_task()
+        task = self.next_project_task(node)
         if task is None:
-            try:
-                tp_id = self._tasks_pool.pop()
-                task = self.project[tp_id]
-            except KeyError:
-                # project depleted and nothing in the pool,
-                # looks like the application has completed.
-                self.completed = True
-                raise ApplicationCompletedError(self)
-
-        task_id = task['id']
+            self.progress.depleted = True
+            while task is None:
+                try:
+                    tp_id = self._tasks_pool.pop()
+                except KeyError:
+                    # project depleted and nothing in the pool,
+                    # looks like the application has completed.
+                    self.complete_depleted()
+                # the tasks taken over by another server are dropped
+                task = self.get_pooled_task(tp_id)
+                if task is None and self.temporal_storage.contains(tp_id):
+                    del self.temporal_storage[tp_id]
+        else:
+            self.progress.task_generated()
+
+        task_id = self.task_id_of(task)
         node.task_id = task_id
         self._tasks_pool.add(task_id)
 
         if self.temporal_storage.contains(task_id, node.id):
             raise NodeRequestRejectedError('The result of this task has been '
                                            'already accepted.')
+        self.progress.task_leased()
         return task
 
     def accept_result(self, node, result):
@@ -108,13 +144,24 @@ class ResultsComparatorController(Controller):
         if result == NO_SOLUTION:
             norm_result = result
         else:
-            norm_result = self.project.normalize_result(task_id, result)
+            try:
+                with tracing.span('normalize_result'):
+                    norm_result = self.project.normalize_result(task_id,
+                                                                result)
+            except InvalidResultError:
+                self.progress.result_rejected()
+                raise
             if norm_result is None:
                 raise NoneResultAssertError(result)
 
+        if task_id not in self._tasks_pool:
+            # the task has been completed already
+            node.task_id = None
+            return
+
         # no previous results for current task
         if not self.temporal_storage.contains(task_id):
-            self.temporal_storage.add(task_id, node.id, norm_result)
+            self._add_temporal_result(task_id, node.id, norm_result)
             return
 
         tmp_results = self.temporal_storage[task_id]
@@ -124,17 +171,31 @@ class ResultsComparatorController(Controller):
                 self._tasks_pool.remove(task_id)
                 if result != NO_SOLUTION:
                     self.store_result(task_id, norm_result)
+                else:
+                    self.complete_task(task_id)
+                self.update_completed()
             else:
                 # Something is wrong with either current result or any result
                 # which was received previously. At this point we discard all
                 # results associated with task_id and task_id remains in
                 # tasks_pool (if the result is not NO_SOLUTION)
                 del self.temporal_storage[task_id]
+                self.progress.result_rejected()
                 if result == NO_SOLUTION:
                     self._tasks_pool.remove(task_id)
             node.task_id = None
         else:
-            self.temporal_storage.add(task_id, node.id, norm_result)
+            self._add_temporal_result(task_id, node.id, norm_result)
+
+    @property
+    def pool_size(self):
+        return len(self._tasks_pool)
+
+    def _add_temporal_result(self, task_id, node_id, result):
+        start = perf_counter()
+        with tracing.span('storage.temporal.add'):
+            self.temporal_storage.add(task_id, node_id, result)
+        _temporal_add_duration.observe(perf_counter() - start)
 
     @staticmethod
     def _results_are_equal(r0, res):
@@ -146,8 +207,7 @@ class ResultsComparatorController(Controller):
                 return False
         return True
 
-    def store_result(self, task_id, result):
-        super(ResultsComparatorController, self).store_result(task_id, result)
-        if self.project.completed:
-            self.completed = True
+    def update_completed(self):
+        super(ResultsComparatorController, self).update_completed()
+        if self.completed:
             self.temporal_storage.clear()
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+    kaylee.contrib.coordinators
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    The module provides basic Kaylee cluster coordinator implementation(s).
+
+    :copyright: (c) 2013 by Zaur Nasibov.
+    :license: MIT, see LICENSE for more details.
+"""
+import time
+import threading
+
+from kaylee.coordinator import Coordinator, normalize_task_id
+
+
+class SQLiteCoordinator(Coordinator):
+    """Keeps the cluster state in an SQLite database. The database file
+    can be shared by several server processes on the same host (or on a
+    file system with reliable locking), which makes the coordinator
+    suitable for testing and for small single-host clusters.
+
+    Every compare-and-set operation is a single SQL statement, thus it is
+    atomic across the processes.
+
+    :param path: the database file path.
+    :param busy_timeout: the time (in seconds) to wait for the database
+                         lock held by another process.
+    :param clock: a function returning the current UNIX time.
+    """
+    def __init__(self, owner, path, lease_timeout='10m', busy_timeout=5.0,
+                 clock=time.time):
+        import sqlite3
+        super(SQLiteCoordinator, self).__init__(owner, lease_timeout)
+        self.path = path
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=busy_timeout,
+                                   check_same_thread=False,
+                                   isolation_level=None)
+        self._db.execute('CREATE TABLE IF NOT EXISTS kl_leases ('
+                         'app TEXT, task_id TEXT, owner TEXT, expires REAL, '
+                         'completed INTEGER DEFAULT 0, '
+                         'PRIMARY KEY (app, task_id))')
+        self._db.execute('CREATE INDEX IF NOT EXISTS kl_leases_pending '
+                         'ON kl_leases (app, completed, expires)')
+        self._db.execute('CREATE TABLE IF NOT EXISTS kl_apps ('
+                         'app TEXT PRIMARY KEY, completed INTEGER)')
+
+    def lease(self, app_name, task_id):
+        now = self._clock()
+        with self._lock:
+            cur = self._db.execute(
+                'INSERT INTO kl_leases (app, task_id, owner, expires) '
+                'VALUES (?, ?, ?, ?) '
+                'ON CONFLICT (app, task_id) DO UPDATE '
+                'SET owner = excluded.owner, expires = excluded.expires '
+                'WHERE completed = 0 AND (owner = excluded.owner '
+                'OR expires < ?)',
+                (app_name, normalize_task_id(task_id), self.owner,
+                 now + self.lease_timeout, now))
+        return cur.rowcount == 1
+
+    def release(self, app_name, task_id):
+        with self._lock:
+            self._db.execute(
+                'UPDATE kl_leases SET expires = 0 WHERE app = ? '
+                'AND task_id = ? AND owner = ? AND completed = 0',
+                (app_name, normalize_task_id(task_id), self.owner))
+
+    def lease_expired(self, app_name):
+        now = self._clock()
+        with self._lock:
+            row = self._db.execute(
+                'UPDATE kl_leases SET owner = ?, expires = ? '
+                'WHERE rowid = (SELECT rowid FROM kl_leases WHERE app = ? '
+                'AND completed = 0 AND expires < ? LIMIT 1) '
+                'AND completed = 0 AND expires < ? '
+                'RETURNING task_id',
+                (self.owner, now + self.lease_timeout, app_name, now,
+                 now)).fetchone()
+        return row[0] if row is not None else None
+
+    def complete(self, app_name, task_id):
+        with self._lock:
+            cur = self._db.execute(
+                'INSERT INTO kl_leases (app, task_id, owner, expires, '
+                'completed) VALUES (?, ?, ?, 0, 1) '
+                'ON CONFLICT (app, task_id) DO UPDATE '
+                'SET owner = excluded.owner, completed = 1 '
+                'WHERE completed = 0',
+                (app_name, normalize_task_id(task_id), self.owner))
+        return cur.rowcount == 1
+
+    def pending(self, app_name):
+        with self._lock:
+            return self._db.execute(
+                'SELECT COUNT(*) FROM kl_leases WHERE app = ? '
+                'AND completed = 0', (app_name, )).fetchone()[0]
+
+    def set_completed(self, app_name):
+        with self._lock:
+            self._db.execute('INSERT OR REPLACE INTO kl_apps VALUES (?, 1)',
+                             (app_name, ))
+
+    def is_completed(self, app_name):
+        with self._lock:
+            row = self._db.execute('SELECT completed FROM kl_apps '
+                                   'WHERE app = ?', (app_name, )).fetchone()
+        return row is not None and bool(row[0])
+
+    def close(self):
+        self._db.close()
@@ -1,10 +1,14 @@
 from django.conf.urls import patterns, url
 from kaylee.controller import app_name_pattern
 from kaylee.node import node_id_pattern
+from kaylee.blobs import blob_key_pattern
 
 urlpatterns = patterns('kaylee.contrib.frontends.django_frontend.views',
     url(r'^register$', 'register_node'),
     url(r'^apps/(?P<app_name>{})/subscribe/(?P<node_id>{})$'
         .format(app_name_pattern, node_id_pattern), 'subscribe_node'),
     url(r'^actions/(?P<node_id>{})$'.format(node_id_pattern), 'actions'),
+    url(r'^blobs/(?P<key>{})$'.format(blob_key_pattern), 'blob'),
+    url(r'^metrics$', 'metrics'),
+    url(r'^admin(?:/(?P<resource>.*))?$', 'admin'),
 )
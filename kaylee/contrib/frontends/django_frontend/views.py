@@ -1,12 +1,13 @@
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
-from django.http import HttpResponse
+from django.http import HttpResponse, HttpResponseNotFound
 
 from kaylee import kl
+from kaylee.metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE
 
 def register_node(request):
     reg_data = kl.register(request.META['REMOTE_ADDR'])
-    return json_response(reg_data)
+    return json_response(reg_data, request)
 
 #pylint: disable-msg=W0613
 #W0613:  Unused argument 'request'
@@ -14,15 +15,54 @@ def register_node(request):
 @require_http_methods(["POST"])
 def subscribe_node(request, app_name, node_id):
     node_config = kl.subscribe(node_id, app_name)
-    return json_response(node_config)
+    return json_response(node_config, request)
 
 @csrf_exempt
 def actions(request, node_id):
     if request.method == 'GET':
-        return json_response( kl.get_action(node_id) )
+        return json_response(kl.get_action(node_id), request)
     elif request.method == 'POST':
-        next_task = kl.accept_result(node_id, request.raw_post_data)
-        return json_response(next_task)
+        next_task = kl.accept_result(
+            node_id, request.raw_post_data,
+            request.META.get('HTTP_CONTENT_ENCODING'))
+        return json_response(next_task, request)
 
-def json_response(s):
-    return HttpResponse(s, content_type = 'application/json')
+@require_http_methods(["GET"])
+def blob(request, key):
+    try:
+        blob = kl.get_blob(key)
+    except KeyError:
+        return HttpResponseNotFound('Blob not found')
+    if blob.matches(request.META.get('HTTP_IF_NONE_MATCH')):
+        response = HttpResponse(status=304)
+        headers = blob.headers[2:]
+    else:
+        response = HttpResponse(blob.data)
+        headers = blob.headers
+    for name, value in headers:
+        response[name] = value
+    return response
+
+@require_http_methods(["GET"])
+def metrics(request):
+    text = kl.export_metrics()
+    if text is None:
+        return HttpResponseNotFound('Not found')
+    return HttpResponse(text, content_type = METRICS_CONTENT_TYPE)
+
+@require_http_methods(["GET"])
+def admin(request, resource=None):
+    status, data = kl.admin.handle(resource or '',
+                                   request.META.get('HTTP_AUTHORIZATION'))
+    return HttpResponse(data, status = status,
+                        content_type = 'application/json')
+
+def json_response(s, request=None):
+    accept_encoding = (request.META.get('HTTP_ACCEPT_ENCODING')
+                       if request is not None else None)
+    body, encoding = kl.compress_response(s, accept_encoding)
+    response = HttpResponse(body, content_type = 'application/json')
+    if encoding is not None:
+        response['Content-Encoding'] = encoding
+        response['Vary'] = 'Accept-Encoding'
+    return response
@@ -2,6 +2,7 @@
 
 from flask import Blueprint, request, Response
 from kaylee import kl
+from kaylee.metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE
 
 bp = Blueprint('kaylee_blueprint', __name__)
 kaylee_blueprint = bp # just an alias for importing convenience
@@ -21,10 +22,41 @@ def tasks(node_id):
     if request.method == 'GET':
         return json_response(kl.get_action(node_id))
     else:
-        next_task = kl.accept_result(node_id, request.data)
+        next_task = kl.accept_result(
+            node_id, request.data, request.headers.get('Content-Encoding'))
         # the reason for using request.data instead of request.json
         # is that Kaylee expects the "raw", non-processed data
         return json_response(next_task)
 
+@bp.route('/blobs/<key>')
+def blob(key):
+    try:
+        blob = kl.get_blob(key)
+    except KeyError:
+        return Response('Blob not found', status=404)
+    if blob.matches(request.headers.get('If-None-Match')):
+        return Response(status=304, headers=blob.headers[2:])
+    return Response(blob.data, headers=blob.headers)
+
+@bp.route('/metrics')
+def metrics():
+    text = kl.export_metrics()
+    if text is None:
+        return Response('Not found', status=404)
+    return Response(text, content_type=METRICS_CONTENT_TYPE)
+
+@bp.route('/admin', defaults={'resource' : ''})
+@bp.route('/admin/<path:resource>')
+def admin(resource):
+    status, data = kl.admin.handle(resource,
+                                   request.headers.get('Authorization'))
+    return Response(data, status=status, mimetype='application/json')
+
 def json_response(s):
-    return Response(s, mimetype = 'application/json')
+    body, encoding = kl.compress_response(
+        s, request.headers.get('Accept-Encoding'))
+    response = Response(body, mimetype = 'application/json')
+    if encoding is not None:
+        response.headers['Content-Encoding'] = encoding
+        response.headers['Vary'] = 'Accept-Encoding'
+    return response
@@ -3,29 +3,59 @@
 from werkzeug.routing import Map, Rule
 from werkzeug.wrappers import Response
 from kaylee import kl
+from kaylee.metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE
 
 def kaylee_register_node(request):
     reg_data = kl.register(request.remote_addr)
-    return json_response(reg_data)
+    return json_response(reg_data, request)
 
 def kaylee_subscribe_node(request, app_name, node_id):
     #pylint: disable-msg=W0613
     #W0613:  Unused argument 'request'
     node_config = kl.subscribe(node_id, app_name)
-    return json_response(node_config)
+    return json_response(node_config, request)
 
 def kaylee_process_task(request, node_id):
     if request.method == 'GET':
-        return json_response(kl.get_action(node_id))
+        return json_response(kl.get_action(node_id), request)
     else:
-        data = request.data.decode('utf-8')
-        next_task = kl.accept_result(node_id, data)
+        next_task = kl.accept_result(
+            node_id, request.data, request.headers.get('Content-Encoding'))
         # the reason for using request.data instead of request.json
         # is that Kaylee expects the "raw", non-processed data
-        return json_response(next_task)
+        return json_response(next_task, request)
 
-def json_response(s):
-    return Response(s, mimetype = 'application/json')
+def kaylee_get_blob(request, key):
+    try:
+        blob = kl.get_blob(key)
+    except KeyError:
+        return Response('Blob not found', status=404)
+    if blob.matches(request.headers.get('If-None-Match')):
+        return Response(status=304, headers=blob.headers[2:])
+    return Response(blob.data, headers=blob.headers)
+
+def kaylee_metrics(request):
+    #pylint: disable-msg=W0613
+    #W0613:  Unused argument 'request'
+    text = kl.export_metrics()
+    if text is None:
+        return Response('Not found', status=404)
+    return Response(text, content_type=METRICS_CONTENT_TYPE)
+
+def kaylee_admin(request, resource=''):
+    status, data = kl.admin.handle(resource,
+                                   request.headers.get('Authorization'))
+    return Response(data, status=status, mimetype='application/json')
+
+def json_response(s, request=None):
+    accept_encoding = (request.headers.get('Accept-Encoding')
+                       if request is not None else None)
+    body, encoding = kl.compress_response(s, accept_encoding)
+    response = Response(body, mimetype = 'application/json')
+    if encoding is not None:
+        response.headers['Content-Encoding'] = encoding
+        response.headers['Vary'] = 'Accept-Encoding'
+    return response
 
 def make_url_map(url_prefix='/kaylee'):
     return Map([
@@ -37,5 +67,17 @@ def make_url_map(url_prefix='/kaylee'):
              endpoint=kaylee_subscribe_node),
         Rule(url_prefix + '/actions/<node_id>',
              methods=['GET', 'POST'],
-             endpoint=kaylee_process_task)
+             endpoint=kaylee_process_task),
+        Rule(url_prefix + '/blobs/<key>',
+             methods=['GET'],
+             endpoint=kaylee_get_blob),
+        Rule(url_prefix + '/metrics',
+             methods=['GET'],
+             endpoint=kaylee_metrics),
+        Rule(url_prefix + '/admin',
+             methods=['GET'],
+             endpoint=kaylee_admin),
+        Rule(url_prefix + '/admin/<path:resource>',
+             methods=['GET'],
+             endpoint=kaylee_admin),
     ])
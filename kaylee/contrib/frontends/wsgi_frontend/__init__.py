@@ -0,0 +1,2 @@
+# -*- coding: utf-8 -*-
+from .wsgi_frontend import KayleeWSGIApplication, make_wsgi_app
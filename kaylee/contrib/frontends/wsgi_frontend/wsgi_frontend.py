@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+"""
+    kaylee.contrib.frontends.wsgi_frontend
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    A framework-free WSGI front-end. The fixed Kaylee URLs are routed by
+    hand and the request body is passed to Kaylee as is, thus no request
+    or response objects are built per request.
+
+    :copyright: (c) 2013 by Zaur Nasibov.
+    :license: MIT, see LICENSE for more details.
+"""
+from kaylee import kl as kaylee_proxy
+from kaylee.metrics import CONTENT_TYPE as _METRICS_CONTENT_TYPE
+
+_STATUS_OK = '200 OK'
+_STATUS_NOT_MODIFIED = '304 Not Modified'
+_STATUS_UNAUTHORIZED = '401 Unauthorized'
+_STATUS_NOT_FOUND = '404 Not Found'
+_STATUS_NOT_ALLOWED = '405 Method Not Allowed'
+
+_ADMIN_STATUSES = {200 : _STATUS_OK,
+                   401 : _STATUS_UNAUTHORIZED,
+                   404 : _STATUS_NOT_FOUND}
+
+_JSON_TYPE = ('Content-Type', 'application/json')
+_TEXT_TYPE = ('Content-Type', 'text/plain; charset=utf-8')
+_VARY_ENCODING = ('Vary', 'Accept-Encoding')
+
+
+class KayleeWSGIApplication(object):
+    """A WSGI application which serves the Kaylee front-end URLs::
+
+      GET       <url_prefix>/register
+      POST      <url_prefix>/apps/<app_name>/subscribe/<node_id>
+      GET, POST <url_prefix>/actions/<node_id>
+      GET       <url_prefix>/blobs/<key>
+      GET       <url_prefix>/metrics
+      GET       <url_prefix>/admin[/<resource>]
+
+    The JSON responses are compressed according to the ``Accept-Encoding``
+    request header and the compressed (``Content-Encoding``) results are
+    accepted (see :meth:`Kaylee.compress_response
+    <kaylee.Kaylee.compress_response>`).
+
+    :param kl: the :class:`Kaylee <kaylee.Kaylee>` object. By default
+               the global :data:`kaylee.kl` object is used.
+    :param url_prefix: the URLs' prefix.
+    :param fallback: an optional WSGI application which serves the
+                     requests to other URLs (``404 Not Found`` is
+                     returned otherwise).
+    """
+    def __init__(self, kl=None, url_prefix='/kaylee', fallback=None):
+        self._kl = kl
+        self.url_prefix = url_prefix.rstrip('/') + '/'
+        self.fallback = fallback
+
+    @property
+    def kl(self):
+        return self._kl if self._kl is not None else kaylee_proxy._wrapped
+
+    def __call__(self, environ, start_response):
+        path = environ.get('PATH_INFO', '')
+        prefix = self.url_prefix
+        if not path.startswith(prefix):
+            return self._not_found(environ, start_response)
+        parts = path[len(prefix):].split('/')
+        method = environ['REQUEST_METHOD']
+        nparts = len(parts)
+
+        if nparts == 2 and parts[0] == 'actions':
+            if method == 'GET':
+                return self._json(environ, start_response,
+                                  self.kl.get_action(parts[1]))
+            elif method == 'POST':
+                return self._json(environ, start_response,
+                                  self.kl.accept_result(
+                                      parts[1], _read_body(environ),
+                                      environ.get('HTTP_CONTENT_ENCODING')))
+            return _not_allowed(start_response, 'GET, POST')
+        elif nparts == 4 and parts[0] == 'apps' and parts[2] == 'subscribe':
+            if method != 'POST':
+                return _not_allowed(start_response, 'POST')
+            return self._json(environ, start_response,
+                              self.kl.subscribe(parts[3], parts[1]))
+        elif nparts == 1 and parts[0] == 'register':
+            if method != 'GET':
+                return _not_allowed(start_response, 'GET')
+            return self._json(environ, start_response,
+                              self.kl.register(environ.get('REMOTE_ADDR',
+                                                           '')))
+        elif nparts == 1 and parts[0] == 'metrics':
+            if method != 'GET':
+                return _not_allowed(start_response, 'GET')
+            return self._metrics(environ, start_response)
+        elif parts[0] == 'admin':
+            if method != 'GET':
+                return _not_allowed(start_response, 'GET')
+            return self._admin(environ, start_response,
+                               '/'.join(parts[1:]))
+        elif nparts == 2 and parts[0] == 'blobs':
+            if method != 'GET':
+                return _not_allowed(start_response, 'GET')
+            return self._blob(environ, start_response, parts[1])
+        return self._not_found(environ, start_response)
+
+    def _json(self, environ, start_response, data):
+        body, encoding = self.kl.compress_response(
+            data, environ.get('HTTP_ACCEPT_ENCODING'))
+        headers = [_JSON_TYPE, ('Content-Length', str(len(body)))]
+        if encoding is not None:
+            headers.append(('Content-Encoding', encoding))
+            headers.append(_VARY_ENCODING)
+        start_response(_STATUS_OK, headers)
+        return [body]
+
+    def _blob(self, environ, start_response, key):
+        try:
+            blob = self.kl.get_blob(key)
+        except KeyError:
+            return _text(start_response, _STATUS_NOT_FOUND, 'Blob not found')
+        if blob.matches(environ.get('HTTP_IF_NONE_MATCH')):
+            start_response(_STATUS_NOT_MODIFIED, blob.headers[2:])
+            return []
+        start_response(_STATUS_OK, blob.headers)
+        return [blob.data]
+
+    def _metrics(self, environ, start_response):
+        text = self.kl.export_metrics()
+        if text is None:
+            return self._not_found(environ, start_response)
+        body = text.encode('utf-8')
+        start_response(_STATUS_OK, [('Content-Type', _METRICS_CONTENT_TYPE),
+                                    ('Content-Length', str(len(body)))])
+        return [body]
+
+    def _admin(self, environ, start_response, resource):
+        status, data = self.kl.admin.handle(
+            resource, environ.get('HTTP_AUTHORIZATION'))
+        body = data.encode('utf-8')
+        start_response(_ADMIN_STATUSES[status],
+                       [_JSON_TYPE, ('Content-Length', str(len(body)))])
+        return [body]
+
+    def _not_found(self, environ, start_response):
+        if self.fallback is not None:
+            return self.fallback(environ, start_response)
+        return _text(start_response, _STATUS_NOT_FOUND, 'Not found')
+
+
+def make_wsgi_app(kl=None, url_prefix='/kaylee', fallback=None):
+    """Returns the :class:`KayleeWSGIApplication`."""
+    return KayleeWSGIApplication(kl, url_prefix, fallback)
+
+
+def _read_body(environ):
+    try:
+        length = int(environ.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        length = 0
+    if length <= 0:
+        return b''
+    return environ['wsgi.input'].read(length)
+
+
+def _text(start_response, status, text):
+    body = text.encode('utf-8')
+    start_response(status, [_TEXT_TYPE, ('Content-Length', str(len(body)))])
+    return [body]
+
+
+def _not_allowed(start_response, allowed):
+    body = b'Method not allowed'
+    start_response(_STATUS_NOT_ALLOWED, [_TEXT_TYPE,
+                                         ('Allow', allowed),
+                                         ('Content-Length', str(len(body)))])
+    return [body]
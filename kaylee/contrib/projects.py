@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+"""
+    kaylee.contrib.projects
+    ~~~~~~~~~~~~~~~~~~~~~~~
+
+    The module provides base classes for projects which stream the tasks
+    from large input files.
+
+    :copyright: (c) 2013 by Zaur Nasibov.
+    :license: MIT, see LICENSE for more details.
+"""
+import os
+import json
+import mmap
+import threading
+from array import array
+from abc import abstractmethod
+
+from kaylee.project import Project
+
+
+class FileProject(Project):
+    """The base class for projects which stream the tasks from an input
+    file, a record per task. The file is memory-mapped, so that neither
+    the startup nor the random access to a task (e.g. for re-dispatching
+    it via ``project[task_id]``) require reading the whole file.
+
+    The ID of a task is the number of its record in the file
+    (``'0'``, ``'1'``, ...).
+
+    :param script_url: The URL of the project's client part (\\*.js file).
+    :param mode: defines :attr:`Project.mode <kaylee.Project.mode>`.
+    :param path: the input file path.
+    """
+    def __init__(self, script_url, mode, path, **kwargs):
+        super(FileProject, self).__init__(script_url, mode, **kwargs)
+        #: The input file path.
+        self.path = path
+        self._lock = threading.Lock()
+        self._next_record = 0
+        with open(path, 'rb') as f:
+            self._size = os.fstat(f.fileno()).st_size
+            # an empty file cannot be memory-mapped
+            self._mm = (mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                        if self._size > 0 else b'')
+
+    @abstractmethod
+    def parse_record(self, task_id, data):
+        """Converts the raw record to a task.
+
+        :param task_id: the ID of the task (the record number).
+        :param data: the raw record.
+        :type data: :class:`bytes`
+        :rtype: :class:`dict`
+        """
+
+    @abstractmethod
+    def locate_record(self, num):
+        """Returns the ``(start, end)`` offsets of the record in the file
+        or ``None`` if there is no such record."""
+
+    def next_task(self):
+        with self._lock:
+            num = self._next_record
+            bounds = self.locate_record(num)
+            if bounds is None:
+                return None
+            self._next_record += 1
+        return self._get_task(num, bounds)
+
+    def __getitem__(self, task_id):
+        try:
+            num = int(task_id)
+        except ValueError:
+            raise KeyError(task_id)
+        if num < 0:
+            raise KeyError(task_id)
+        with self._lock:
+            bounds = self.locate_record(num)
+        if bounds is None:
+            raise KeyError(task_id)
+        return self._get_task(num, bounds)
+
+    def close(self):
+        """Closes the memory-mapped input file."""
+        if self._size > 0:
+            self._mm.close()
+
+    def _get_task(self, num, bounds):
+        start, end = bounds
+        return self.parse_record(str(num), self._mm[start:end])
+
+
+class JSONLinesFileProject(FileProject):
+    """Streams the tasks from a JSON Lines file: a JSON value per line.
+    The blank lines are skipped. A JSON object becomes the task as is
+    (its ``'id'`` is set to the record number), any other value is
+    available as ``task['data']``.
+
+    The offsets of the records are indexed lazily: the index is extended
+    as the tasks are requested and keeps 8 bytes per record.
+    """
+    def __init__(self, *args, **kwargs):
+        super(JSONLinesFileProject, self).__init__(*args, **kwargs)
+        self._offsets = array('Q')
+        self._scan_pos = 0
+
+    @property
+    def total_tasks(self):
+        """Known only after the whole file has been indexed."""
+        if self._scan_pos < self._size:
+            return None
+        return len(self._offsets)
+
+    def locate_record(self, num):
+        offsets = self._offsets
+        while len(offsets) <= num:
+            if not self._index_next():
+                return None
+        start = offsets[num]
+        end = self._mm.find(b'\n', start)
+        return start, (end if end != -1 else self._size)
+
+    def parse_record(self, task_id, data):
+        record = json.loads(data.decode('utf-8'))
+        if isinstance(record, dict):
+            record['id'] = task_id
+            return record
+        return {'id' : task_id, 'data' : record}
+
+    def _index_next(self):
+        """Indexes the next non-blank line. Returns ``False`` at the end
+        of the file."""
+        mm, pos, size = self._mm, self._scan_pos, self._size
+        while pos < size:
+            end = mm.find(b'\n', pos)
+            if end == -1:
+                end = size
+            if mm[pos:end].strip():
+                self._offsets.append(pos)
+                self._scan_pos = end + 1
+                return True
+            pos = end + 1
+        self._scan_pos = size
+        return False
+
+
+class FixedWidthFileProject(FileProject):
+    """Streams the tasks from a file of fixed-size records. The offset of
+    a record is calculated, thus no index is kept at all.
+
+    :param record_size: the size of a record in bytes (including
+                        the line terminator if any).
+    :param fields: a list of ``(name, width)`` pairs. If defined,
+                   the record is split to the fields, which are decoded
+                   and stripped. Otherwise the whole record is available
+                   as ``task['data']``.
+    :param encoding: the records' encoding.
+    """
+    def __init__(self, script_url, mode, path, record_size, fields=None,
+                 encoding='utf-8', **kwargs):
+        if record_size < 1:
+            raise ValueError('Record size must be a positive integer, not {}'
+                             .format(record_size))
+        self.record_size = record_size
+        self.fields = [(name, int(width)) for name, width in (fields or [])]
+        if sum(width for name, width in self.fields) > record_size:
+            raise ValueError('The fields do not fit the record size')
+        self.encoding = encoding
+        super(FixedWidthFileProject, self).__init__(script_url, mode, path,
+                                                    **kwargs)
+
+    @property
+    def total_tasks(self):
+        return self._size // self.record_size
+
+    def locate_record(self, num):
+        start = num * self.record_size
+        end = start + self.record_size
+        if end > self._size:
+            return None
+        return start, end
+
+    def parse_record(self, task_id, data):
+        if not self.fields:
+            return {'id' : task_id,
+                    'data' : data.decode(self.encoding).rstrip('\r\n')}
+        task = {'id' : task_id}
+        pos = 0
+        for name, width in self.fields:
+            task[name] = data[pos:pos + width].decode(self.encoding).strip()
+            pos += width
+        return task
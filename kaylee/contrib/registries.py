@@ -10,6 +10,7 @@
 """
 
 from datetime import datetime
+from collections import Counter
 from kaylee.node import NodesRegistry, NodeID, extract_node_id
 
 
@@ -17,8 +18,11 @@ class MemoryNodesRegistry(NodesRegistry):
     def __init__(self, *args, **kwargs):
         super(MemoryNodesRegistry, self).__init__(*args, **kwargs)
         self._d = {}
+        self._hosts = Counter()
 
     def add(self, node):
+        if node.id not in self._d:
+            self._hosts[node.id.host_id] += 1
         self._d[node.id] = node
 
     def update(self, node):
@@ -30,10 +34,14 @@ class MemoryNodesRegistry(NodesRegistry):
                            'node {} was not found'.format(node))
 
     def clean(self):
-        nodes_to_clean = (node for node in self._d.items()
-                          if datetime.now() - node.id.timestamp > self.timeout)
-        for node in nodes_to_clean:
-            del self._d[node]
+        expiration_time = datetime.now() - self.timeout
+        nodes_to_clean = [node_id for node_id in self._d
+                          if node_id.timestamp < expiration_time]
+        removed = []
+        for node_id in nodes_to_clean:
+            removed.append(self._d.pop(node_id))
+            self._discount(node_id)
+        return removed
 
     def __len__(self):
         return len(self._d)
@@ -43,7 +51,17 @@ class MemoryNodesRegistry(NodesRegistry):
         try:
             del self._d[node_id]
         except KeyError:
-            pass
+            return
+        self._discount(node_id)
+
+    def hosts(self):
+        return dict(self._hosts)
+
+    def _discount(self, node_id):
+        host_id = node_id.host_id
+        self._hosts[host_id] -= 1
+        if self._hosts[host_id] <= 0:
+            del self._hosts[host_id]
 
     def __getitem__(self, node_id):
         node_id = extract_node_id(node_id)
@@ -10,7 +10,8 @@
 """
 #pylint: disable-msg=W0231
 
-from kaylee.storage import TemporalStorage, PermanentStorage
+from itertools import islice
+from kaylee.storage import TemporalStorage, PermanentStorage, _skip_to_cursor
 from kaylee.node import NodeID
 
 class MemoryTemporalStorage(TemporalStorage):
@@ -103,6 +104,22 @@ class MemoryPermanentStorage(PermanentStorage):
     def values(self):
         return iter(self._d.values())
 
+    def iter_chunks(self, size, after=None):
+        if size < 1:
+            raise ValueError('Chunk size must be a positive integer, not {}'
+                             .format(size))
+        items = iter(self._d.items())
+        if after is not None:
+            if after not in self._d:
+                raise KeyError('Cursor task {} was not found in the storage'
+                               .format(after))
+            _skip_to_cursor((task_id for task_id, _ in items), after)
+        while True:
+            chunk = list(islice(items, size))
+            if not chunk:
+                return
+            yield chunk
+
     @property
     def count(self):
         return len(self._d)
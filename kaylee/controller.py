@@ -9,7 +9,16 @@
     :license: MIT, see LICENSE for more details.
 """
 import re
+from time import perf_counter
+from collections import deque
 from abc import ABCMeta, abstractmethod
+from .errors import ApplicationCompletedError, NodeRequestRejectedError
+from .session import validate_session_keys
+from .taskcache import TaskCache, CachedTask
+from .coordinator import normalize_task_id
+from .project import KL_TASK_BLOBS
+from .metrics import registry as metrics_registry
+from . import tracing
 
 
 #: The Application name regular expression pattern which can be used in
@@ -20,6 +29,9 @@ app_name_pattern = r'[a-zA-Z\.\d_-]+'
 ACTIVE = 0x2
 #: Indicates completed state of an application.
 COMPLETED = 0x4
+#: Indicates that an application has been removed from a running Kaylee
+#: instance.
+REMOVED = 0x8
 
 KL_RESULT = '__klr__'
 
@@ -33,6 +45,11 @@ NO_SOLUTION = { KL_RESULT : 0x2 }
 #: accept.
 NOT_SOLVED = { KL_RESULT : 0x4 }
 
+_permanent_add_duration = metrics_registry.histogram(
+    'kaylee_storage_add_duration_seconds',
+    'The duration of the result additions to the storages.',
+    ['storage']).labels('permanent')
+
 
 class Controller(object, metaclass=ABCMeta):
     """A Controller object maintains the data (tasks and the results) flow
@@ -49,13 +66,22 @@ class Controller(object, metaclass=ABCMeta):
     :type project: :class:`Project`
     :type permanent_storage: :class:`PermanentStorage`
     :type temporal_storage: :class:`TemporalStorage`
+    :param task_cache_size: the amount of serialized tasks kept for
+                            re-dispatching (see :attr:`task_cache`).
+                            ``0`` disables the cache.
+    :param locality_lookahead: the amount of the project's tasks buffered
+                               in order to dispatch the tasks whose data
+                               blobs are resident on the requesting node
+                               first (see :meth:`next_project_task`).
+                               ``0`` (default) disables the buffering.
     """
 
 
     _app_name_re = re.compile('^{}$'.format(app_name_pattern))
 
     def __init__(self, name, project, permanent_storage,
-                 temporal_storage=None, **kwargs):
+                 temporal_storage=None, task_cache_size=1000,
+                 locality_lookahead=0, **kwargs):
         if Controller._app_name_re.match(name) is None:
             raise ValueError('Invalid application name: {}'
                              .format(name))
@@ -63,6 +89,24 @@ class Controller(object, metaclass=ABCMeta):
         self.project = project
         self.permanent_storage = permanent_storage
         self.temporal_storage = temporal_storage
+        #: The validated session keys schema of the project
+        #: (see :attr:`Project.session_keys <kaylee.Project.session_keys>`).
+        self.session_keys = validate_session_keys(
+            getattr(project, 'session_keys', None))
+        #: Application progress counters shared with the project
+        #: (:class:`Progress <kaylee.progress.Progress>`).
+        self.progress = project.progress
+        self.progress.total = project.total_tasks
+        #: The cache of serialized tasks (:class:`TaskCache
+        #: <kaylee.taskcache.TaskCache>`). The tasks are cached by
+        #: :class:`Kaylee` on the first dispatch and are served
+        #: from the cache by :meth:`get_pooled_task`.
+        self.task_cache = TaskCache(task_cache_size)
+        self.locality_lookahead = locality_lookahead
+        self._shard = None
+        self._coordinator = None
+        self._lookahead = deque()
+        self._head_skips = 0
         self._state = ACTIVE
 
     @abstractmethod
@@ -83,11 +127,228 @@ class Controller(object, metaclass=ABCMeta):
         :type result: :class:`dict` or :class:`list`
         """
 
+    @staticmethod
+    def task_id_of(task):
+        """Returns the normalized ID of a task (a :class:`dict` or
+        a :class:`CachedTask <kaylee.taskcache.CachedTask>`) and stores it
+        to the task's ``'id'`` key. The normalized ID is a stripped string
+        (e.g. ``'10'`` for ``10``); the controllers use it as the key of
+        the tasks pool, the :attr:`task_cache`, the storages and
+        the ``project[task_id]`` lookups."""
+        if isinstance(task, CachedTask):
+            return task.id
+        task_id = task['id'] = normalize_task_id(task['id'])
+        return task_id
+
     def store_result(self, task_id, result):
-        """Stores the result to permanent storage and notifies the bound
-        project."""
-        self.permanent_storage.add(task_id, result)
-        self.project.result_stored(task_id, result, self.permanent_storage)
+        """Completes the task (see :meth:`complete_task`), stores the
+        result to permanent storage and notifies the bound project.
+        The result is dropped if the task has been completed by another
+        server of the cluster."""
+        with tracing.span('complete_task'):
+            if not self.complete_task(task_id):
+                return
+        start = perf_counter()
+        with tracing.span('storage.permanent.add'):
+            self.permanent_storage.add(task_id, result)
+        _permanent_add_duration.observe(perf_counter() - start)
+        with tracing.span('result_stored'):
+            self.project.result_stored(task_id, result,
+                                       self.permanent_storage)
+
+    def complete_task(self, task_id):
+        """Marks the task as completed (e.g. on ``NO_SOLUTION``):
+        invalidates the cached task, updates the progress counters and,
+        if the application is coordinated (see :attr:`coordinator`),
+        marks the task as completed cluster-wide.
+
+        The method is called once per task: a controller drops the
+        duplicate results of the tasks which have been re-dispatched and
+        completed by another node already, otherwise the accepted tasks
+        would be counted more than once.
+
+        :returns: ``False`` if the task has been completed by another
+                  server already (the task is not counted then).
+        """
+        self.task_cache.invalidate(task_id)
+        if (self._coordinator is not None and
+                not self._coordinator.complete(self.name, task_id)):
+            return False
+        self.progress.result_accepted()
+        return True
+
+    def update_completed(self):
+        """Marks the application as completed if either the project is
+        completed or the progress counters indicate that all tasks have
+        been accepted. A coordinated application is completed only if no
+        tasks are pending on the other servers (or if another server has
+        marked the application as completed)."""
+        coordinator = self._coordinator
+        if coordinator is not None and coordinator.is_completed(self.name):
+            self._mark_completed()
+        elif self.project.completed or self.progress.completed:
+            if coordinator is not None:
+                if coordinator.pending(self.name) > 0:
+                    return
+                coordinator.set_completed(self.name)
+            self._mark_completed()
+
+    def complete_depleted(self):
+        """Is called by a controller when the project is depleted and there
+        are no tasks to re-dispatch. Marks the application as completed
+        and raises :class:`ApplicationCompletedError`. If the tasks are
+        still pending on the other servers of the cluster, the request is
+        rejected instead and the application remains active.
+
+        :throws ApplicationCompletedError: if the application is completed.
+        :throws NodeRequestRejectedError: if the tasks are pending on
+                                          the other servers.
+        """
+        coordinator = self._coordinator
+        if (coordinator is not None and not coordinator.is_completed(self.name)
+                and coordinator.pending(self.name) > 0):
+            raise NodeRequestRejectedError('No tasks are available at the '
+                                           'moment.')
+        if coordinator is not None:
+            coordinator.set_completed(self.name)
+        self._mark_completed()
+        raise ApplicationCompletedError(self)
+
+    def _mark_completed(self):
+        self.completed = True
+        self.task_cache.clear()
+
+    def next_project_task(self, node):
+        """Returns the next task of the project (``None`` if the project
+        is depleted).
+
+        If :attr:`locality_lookahead` is enabled, up to
+        ``locality_lookahead`` tasks are buffered, and the first buffered
+        task whose blobs (see :data:`KL_TASK_BLOBS
+        <kaylee.project.KL_TASK_BLOBS>`) are resident on the node is
+        returned. Otherwise, the oldest buffered task is returned.
+        The oldest task is also returned if it has been bypassed
+        ``locality_lookahead`` times, so that no task starves.
+
+        The leases of the buffered tasks of a coordinated application
+        (see :attr:`coordinator`) are renewed when the tasks leave the
+        buffer. The tasks whose leases have expired and have been taken
+        over by another server meanwhile are dropped.
+        """
+        if self.locality_lookahead <= 0:
+            return self._next_shard_task()
+
+        buf = self._lookahead
+        while True:
+            while len(buf) < self.locality_lookahead:
+                task = self._next_shard_task()
+                if task is None:
+                    break
+                buf.append(task)
+            if not buf:
+                return None
+            task = self._next_buffered_task(node, buf)
+            if (self._coordinator is None or
+                    self._coordinator.lease(self.name, task['id'])):
+                return task
+
+    def _next_buffered_task(self, node, buf):
+        if self._head_skips < self.locality_lookahead:
+            for i, task in enumerate(buf):
+                keys = task.get(KL_TASK_BLOBS)
+                if keys and node.has_resident_data(keys):
+                    if i == 0:
+                        break
+                    self._head_skips += 1
+                    del buf[i]
+                    return task
+        self._head_skips = 0
+        return buf.popleft()
+
+    def _next_shard_task(self):
+        task = self.project.next_task()
+        coordinator = self._coordinator
+        if coordinator is not None:
+            while (task is not None
+                   and not coordinator.lease(self.name, task['id'])):
+                task = self.project.next_task()
+            if task is None:
+                # take over the tasks of the failed servers
+                task_id = coordinator.lease_expired(self.name)
+                if task_id is not None:
+                    task = self.project[task_id]
+        elif self._shard is not None:
+            while task is not None and not self._shard.owns(task['id']):
+                task = self.project.next_task()
+        return task
+
+    @property
+    def shard(self):
+        """The :class:`Shard <kaylee.shard.Shard>` of the project's tasks
+        owned by the application (``None`` by default, i.e. all tasks).
+        The tasks of the other shards are skipped by
+        :meth:`next_project_task`, thus the project has to generate
+        the same task IDs in every shard. The total amount of the
+        shard's tasks is unknown, so the :attr:`progress` total
+        is reset."""
+        return self._shard
+
+    @shard.setter
+    def shard(self, shard):
+        self._shard = shard
+        self._update_progress_total()
+
+    @property
+    def coordinator(self):
+        """The cluster :class:`Coordinator <kaylee.coordinator.Coordinator>`
+        (``None`` by default). If defined, the project's tasks are
+        dispatched only if they are leased by the coordinator (the
+        :attr:`shard` is not used then), and the results are stored only
+        once per cluster."""
+        return self._coordinator
+
+    @coordinator.setter
+    def coordinator(self, coordinator):
+        self._coordinator = coordinator
+        self._update_progress_total()
+
+    def _update_progress_total(self):
+        # the total amount of the tasks dispatched by a sharded or
+        # coordinated application is unknown
+        if self._shard is None and self._coordinator is None:
+            self.progress.total = self.project.total_tasks
+        else:
+            self.progress.total = None
+
+    def get_pooled_task(self, task_id):
+        """Returns a previously dispatched task: either the serialized task
+        (:class:`CachedTask <kaylee.taskcache.CachedTask>`) from
+        :attr:`task_cache` or ``project[task_id]``.
+
+        If the application is coordinated, the task's lease is renewed.
+        The lease fails if it has expired and the task has been taken
+        over by another server (see :meth:`Coordinator.lease_expired
+        <kaylee.coordinator.Coordinator.lease_expired>`), then the task
+        must not be dispatched again and ``None`` is returned.
+
+        :param task_id: the normalized task ID (see :meth:`task_id_of`).
+        :returns: the task or ``None`` if the task has been taken over by
+                  another server.
+        """
+        if (self._coordinator is not None and
+                not self._coordinator.lease(self.name, task_id)):
+            self.task_cache.invalidate(task_id)
+            return None
+        task = self.task_cache.get(task_id)
+        if task is None:
+            task = self.project[task_id]
+        return task
+
+    @property
+    def pool_size(self):
+        """The amount of the dispatched, but not yet completed tasks kept
+        for re-dispatching or ``None`` if the controller keeps no pool."""
+        return None
 
     @property
     def completed(self):
@@ -101,5 +362,62 @@ class Controller(object, metaclass=ABCMeta):
         else:
             self._state &= ~COMPLETED
 
+    @property
+    def removed(self):
+        """Indicates whether the application has been removed from
+        a running :class:`Kaylee` instance (see
+        :meth:`Kaylee.remove_application`). The nodes subscribed to
+        a removed application are unsubscribed on their next task
+        request."""
+        return self._state & REMOVED == REMOVED
+
+    @removed.setter
+    def removed(self, val):
+        if val:
+            self._state |= REMOVED
+        else:
+            self._state &= ~REMOVED
+
+    def snapshot(self):
+        """Returns the current state of the application as a dict, e.g.::
+
+          {
+              'name' : 'hash_cracker',
+              'completed' : False,
+              'removed' : False,
+              'completion' : 0.25,
+              'progress' : {'total' : 100, 'generated' : 30, ... },
+              'pool_size' : 5,
+              'task_cache' : {'tasks' : 5, 'bytes' : 640, ... },
+              'permanent_storage' : {'tasks' : 25, 'results' : 25},
+              'temporal_storage' : {'tasks' : 5, 'results' : 7},
+          }
+
+        ``completion`` is the fraction of the accepted tasks (``None`` if
+        the total amount of tasks is unknown). Only the incrementally
+        maintained counters are read, thus taking a snapshot does not
+        interfere with the tasks' dispatching.
+        """
+        progress = self.progress.as_dict()
+        total = progress['total']
+        state = {
+            'name' : self.name,
+            'completed' : self.completed,
+            'removed' : self.removed,
+            'completion' : (min(1.0, progress['accepted'] / total)
+                            if total else None),
+            'progress' : progress,
+            'pool_size' : self.pool_size,
+            'task_cache' : self.task_cache.stats(),
+        }
+        for kind, storage in (('permanent_storage', self.permanent_storage),
+                              ('temporal_storage', self.temporal_storage)):
+            if storage is None:
+                state[kind] = None
+            else:
+                state[kind] = {'tasks' : storage.count,
+                               'results' : storage.total_count}
+        return state
+
     def __hash__(self):
         return hash(self.name)
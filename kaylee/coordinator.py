@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""
+    kaylee.coordinator
+    ~~~~~~~~~~~~~~~~~~
+
+    This module provides the interface of the cluster coordination backend
+    which allows several Kaylee servers to serve the same applications
+    without dispatching a task to more than one server at a time.
+
+    :copyright: (c) 2013 by Zaur Nasibov.
+    :license: MIT, see LICENSE for more details.
+"""
+
+from abc import ABCMeta, abstractmethod
+
+from .util import parse_timedelta
+
+
+class Coordinator(object, metaclass=ABCMeta):
+    """The interface of a cluster coordination backend. The coordinator
+    keeps the leases of the applications' tasks and the tasks' and the
+    applications' completion state shared among the cluster servers.
+    All state-changing operations are compare-and-set, i.e. atomic across
+    the servers.
+
+    A lease is owned by a server (identified by ``owner``) and is valid
+    for ``lease_timeout``. The leases of a failed server expire and are
+    taken over by the other servers (see :meth:`lease_expired`).
+
+    The task IDs are normalized to strings by the coordinator.
+
+    :param owner: the name of the server owning the leases.
+    :param lease_timeout: the lease timeout in ``1d 12h 59m 59s``
+                          format (see :class:`NodesRegistry
+                          <kaylee.NodesRegistry>`).
+    :type owner: str
+    :type lease_timeout: str
+    """
+    def __init__(self, owner, lease_timeout='10m'):
+        self.owner = owner
+        #: The lease timeout in seconds.
+        self.lease_timeout = parse_timedelta(lease_timeout).total_seconds()
+
+    @abstractmethod
+    def lease(self, app_name, task_id):
+        """Leases the task to :attr:`owner`. The lease succeeds if the task
+        is neither completed nor leased by another server (or its lease
+        has expired). Leasing a task owned already renews the lease.
+
+        :returns: ``True`` if the task has been leased.
+        """
+
+    @abstractmethod
+    def release(self, app_name, task_id):
+        """Releases the lease owned by :attr:`owner`, so that the task can
+        be leased by another server right away."""
+
+    @abstractmethod
+    def lease_expired(self, app_name):
+        """Takes over an expired lease of a non-completed task.
+
+        :returns: the ID of the leased task or ``None``.
+        """
+
+    @abstractmethod
+    def complete(self, app_name, task_id):
+        """Marks the task as completed.
+
+        :returns: ``False`` if the task has been completed already (e.g.
+                  by another server), i.e. the result must be dropped.
+        """
+
+    @abstractmethod
+    def pending(self, app_name):
+        """Returns the amount of the application's leased (including the
+        expired leases), but not completed tasks."""
+
+    @abstractmethod
+    def set_completed(self, app_name):
+        """Marks the application as completed."""
+
+    @abstractmethod
+    def is_completed(self, app_name):
+        """Checks whether the application has been marked as completed by
+        any of the servers."""
+
+
+def normalize_task_id(task_id):
+    """Returns the task ID as a stripped string."""
+    return str(task_id).strip()
@@ -12,21 +12,45 @@
 
 import sys
 import json
+import threading
 import traceback
 import logging
 from io import StringIO
+from time import perf_counter
 from functools import partial
 from contextlib import closing
 from functools import wraps
 
 from .node import Node, NodeID
-from .errors import (KayleeError, InvalidResultError, NodeRequestRejectedError)
+from .errors import (KayleeError, InvalidResultError, NodeRequestRejectedError,
+                     ApplicationRemovedError)
 
 from .controller import KL_RESULT
+from .taskcache import CachedTask
+from .compression import (negotiate_encoding, compress, decompress,
+                          DEFAULT_COMPRESSION_MIN_SIZE)
 from .util import DictAsObjectWrapper
+from .metrics import registry as metrics_registry, MetricFamily
+from .admin import AdminAPI
+from . import tracing
 
 log = logging.getLogger(__name__)
 
+_request_duration = metrics_registry.histogram(
+    'kaylee_request_duration_seconds',
+    'The duration of the Kaylee API calls.', ['endpoint'])
+_request_errors = metrics_registry.counter(
+    'kaylee_request_errors_total',
+    'The amount of the Kaylee API calls which returned an error.',
+    ['endpoint'])
+_requests_rejected = metrics_registry.counter(
+    'kaylee_requests_rejected_total',
+    'The amount of the task requests rejected by the applications.',
+    ['app'])
+_registry_clean_duration = metrics_registry.histogram(
+    'kaylee_registry_clean_duration_seconds',
+    'The duration of the nodes registry cleanups.')
+
 #: Returns the results of :function:`json.dumps` in compact encoding
 json.dumps = partial(json.dumps, separators=(',', ':'))
 
@@ -41,11 +65,22 @@ def json_error_handler(f):
     raised.
     """
     #pylint: disable-msg=W0703
+    # the metrics are bound once per API method
+    name = f.__name__
+    duration = _request_duration.labels(name)
+    errors = _request_errors.labels(name)
+
     @wraps(f)
     def wrapper(*args, **kwargs):
+        start = perf_counter()
         try:
-            return f(*args, **kwargs)
+            with tracing.trace(name) as span:
+                response = f(*args, **kwargs)
+                if response is not None:
+                    span.annotate('response_size', len(response))
+                return response
         except Exception as e:
+            errors.inc()
             exc_str = str(e)
             if log.getEffectiveLevel() == logging.DEBUG:
                 with closing(StringIO()) as buf:
@@ -56,10 +91,24 @@ def json_error_handler(f):
                                        file= buf)
                     exc_str += '\n' + buf.getvalue()
             return json.dumps({'error': exc_str })
+        finally:
+            duration.observe(perf_counter() - start)
 
     return wrapper
 
 
+def _annotate_request(node, payload=None):
+    """Attaches the node, its application and the request payload size
+    to the request trace (see :class:`kaylee.tracing.SlowRequestLog`)."""
+    if tracing.get_tracer() is None:
+        return
+    tracing.annotate('node_id', str(node.id))
+    if node.controller is not None:
+        tracing.annotate('app', node.controller.name)
+    if isinstance(payload, (str, bytes)):
+        tracing.annotate('request_size', len(payload))
+
+
 class Kaylee(object):
     """The Kaylee class serves as a layer between a WSGI server (framework)
     and Kaylee applications. The data flow between Kaylee server and the
@@ -91,6 +140,9 @@ class Kaylee(object):
         self.registry = registry
 
         self.session_data_manager = session_data_manager
+        self._shard = None
+        self._coordinator = None
+        self._admin = None
         if applications is not None:
             self._applications = Applications(applications)
         else:
@@ -111,8 +163,13 @@ class Kaylee(object):
         :param remote_host: the IP address of the remote host
         :type remote_host: string
         """
-        node = Node(NodeID.for_host(remote_host))
-        self.registry.add(node)
+        node_id = NodeID.for_host(remote_host)
+        if self._shard is not None:
+            while not self._shard.owns(node_id):
+                node_id = NodeID.for_host(remote_host)
+        node = Node(node_id)
+        with tracing.span('registry.add'):
+            self.registry.add(node)
         return json.dumps ({ 'node_id' : str(node.id),
                              'config' : self.config.client_config(),
                              'applications' : self._applications.names } )
@@ -126,7 +183,9 @@ class Kaylee(object):
         :param node_id: a valid node id
         :type node_id: string
         """
+        node = self.registry[node_id]
         del self.registry[node_id]
+        self._discard_session_data(node)
 
     @json_error_handler
     def subscribe(self, node_id, application):
@@ -160,7 +219,9 @@ class Kaylee(object):
         :param node_id: a valid node id.
         :type node_id: string
         """
-        self.registry[node_id].unsubscribe()
+        node = self.registry[node_id]
+        node.unsubscribe()
+        self._discard_session_data(node)
 
     @json_error_handler
     def get_action(self, node_id):
@@ -187,44 +248,66 @@ class Kaylee(object):
         :type node_id: string
         """
         node = self.registry[node_id]
+        _annotate_request(node)
         try:
-            task = node.get_task()
-            self._store_session_data(node, task)
+            with tracing.span('controller.get_task'):
+                task = node.get_task()
+            if not isinstance(task, CachedTask):
+                with tracing.span('serialize_task'):
+                    task = self._serialize_task(node, task)
+            if task.blobs:
+                node.add_resident_data(task.blobs)
+            response = self._json_task_action(node, task)
             # update node before returning a task
             if node.dirty:
-                self.registry.update(node)
+                with tracing.span('registry.update'):
+                    self.registry.update(node)
                 node.dirty = False
-            return self._json_action(ACTION_TASK, task)
+            return response
         except NodeRequestRejectedError as e:
+            _requests_rejected.labels(node.controller.name).inc()
+            if isinstance(e, ApplicationRemovedError):
+                self._drain_node(node)
             return self._json_action(ACTION_UNSUBSCRIBE,
                                      'The node has been automatically '
                                      'unsubscribed: {}'.format(e))
 
     @json_error_handler
-    def accept_result(self, node_id, result):
+    def accept_result(self, node_id, result, content_encoding=None):
         """Accepts the results from the node. Returns the next action if
         :config:`AUTO_GET_ACTION` configuration option is True. Otherwise
         returns the "nop" (no operatiotion) action.
 
         :param node_id: a valid node id
         :param result: the result returned by the node.
+        :param content_encoding: the ``Content-Encoding`` of the request
+                                 body (``'gzip'`` or ``'deflate'``) if
+                                 the result is compressed.
         :type node_id: string
-        :type result: string with JSON-encoded dict data.
+        :type result: string or UTF-8 encoded bytes (e.g. the raw request
+                      body) with JSON-encoded dict data.
         :returns: A task (an action) returned by :meth:`get_action` or
                  "nop" action.
         """
         node = self.registry[node_id]
+        _annotate_request(node, result)
         try:
-            if not isinstance(result, str):
+            if content_encoding:
+                with tracing.span('decompress'):
+                    result = decompress(result, content_encoding)
+            if not isinstance(result, (str, bytes)):
                 raise ValueError('Kaylee expects the incoming result to be in '
-                                 'string format, not {}'.format(
+                                 'string or bytes format, not {}'.format(
                                      result.__class__.__name__))
-            parsed_result = json.loads(result)
+            with tracing.span('parse_result'):
+                parsed_result = json.loads(result)
             if not isinstance(parsed_result, dict):
                 raise ValueError('The returned result was not parsed '
                                  'as dict: {}'.format(parsed_result))
-            self._restore_session_data(node, parsed_result)
-            node.accept_result(parsed_result)
+            with tracing.span('restore_session_data'):
+                self._restore_session_data(node, parsed_result)
+            with tracing.span('controller.accept_result'):
+                node.accept_result(parsed_result)
         except InvalidResultError as e:
             self.unsubscribe(node)
             raise e
@@ -235,18 +318,288 @@ class Kaylee(object):
         return self._json_action(ACTION_NOP)
 
     def clean(self):
-        """Removes the outdated nodes from Kaylee's nodes storage."""
-        self.registry.clean()
+        """Removes the outdated nodes from Kaylee's nodes storage and
+        the obsolete session data. The session data of the removed nodes
+        is discarded together with the nodes."""
+        start = perf_counter()
+        removed = self.registry.clean()
+        _registry_clean_duration.observe(perf_counter() - start)
+        if self.session_data_manager is not None:
+            for node in removed or ():
+                self.session_data_manager.discard(node)
+            self.session_data_manager.clean()
+
+    def add_application(self, app):
+        """Adds an application to the running Kaylee instance. The nodes
+        can subscribe to the application right away.
+
+        :param app: the application.
+        :type app: :class:`Controller`
+        :throws KayleeError: if an application with the same name
+                             already exists.
+        """
+        app.shard = self._shard
+        app.coordinator = self._coordinator
+        self._applications.add(app)
+        log.info('Application "{}" has been added'.format(app.name))
+
+    def remove_application(self, name):
+        """Removes an application from the running Kaylee instance and
+        returns it. The other applications are not affected.
+
+        The removed application is drained gracefully: the results of
+        the tasks which are being computed by its nodes are still
+        accepted, and the nodes are unsubscribed (receive the
+        ``"unsubscribe"`` action) on their next task request.
+
+        :param name: the application name.
+        :rtype: :class:`Controller`
+        :throws KayleeError: if the application was not found.
+        """
+        try:
+            app = self._applications.remove(name)
+        except KeyError:
+            raise KayleeError('Application "{}" was not found'.format(name))
+        self._retire(app)
+        log.info('Application "{}" has been removed'.format(name))
+        return app
+
+    def reload_application(self, app):
+        """Replaces the running application of the same name with ``app``
+        (e.g. an application re-loaded with a new configuration via
+        :meth:`Loader.load_application <kaylee.loader.Loader.load_application>`)
+        and returns the replaced application. The nodes subscribed to the
+        replaced application are drained as described in
+        :meth:`remove_application`; they may subscribe to the new
+        application right away.
+
+        :type app: :class:`Controller`
+        :rtype: :class:`Controller`
+        :throws KayleeError: if the application was not found.
+        """
+        app.shard = self._shard
+        app.coordinator = self._coordinator
+        try:
+            old_app = self._applications.replace(app)
+        except KeyError:
+            raise KayleeError('Application "{}" was not found'
+                              .format(app.name))
+        self._retire(old_app)
+        log.info('Application "{}" has been reloaded'.format(app.name))
+        return old_app
+
+    def compress_response(self, data, accept_encoding):
+        """Encodes a JSON response returned by Kaylee (e.g. by
+        :meth:`get_action`) and compresses it if the response is not
+        smaller than :config:`COMPRESSION_MIN_SIZE` and the client accepts
+        a supported content coding.
+
+        :param data: the response.
+        :param accept_encoding: the ``Accept-Encoding`` request header
+                                value.
+        :returns: a ``(body, content_encoding)`` tuple, where
+                  ``content_encoding`` is ``None`` if the body is not
+                  compressed.
+        """
+        body = data.encode('utf-8')
+        #pylint: disable-msg=E1101
+        min_size = self.config.COMPRESSION_MIN_SIZE
+        # the cheap size precheck goes first: the most of the responses
+        # (e.g. "nop" actions) are tiny
+        if min_size is None or len(body) < min_size:
+            return body, None
+        encoding = negotiate_encoding(accept_encoding)
+        if encoding is None:
+            return body, None
+        return compress(body, encoding), encoding
+
+    def get_blob(self, key):
+        """Returns a blob registered by any of the applications' projects
+        (see :meth:`Project.add_blob <kaylee.Project.add_blob>`).
+
+        :param key: the blob key.
+        :rtype: :class:`Blob <kaylee.blobs.Blob>`
+        :throws KeyError: if the blob was not found.
+        """
+        for app in self._applications:
+            blob = app.project.blobs.get(key)
+            if blob is not None:
+                return blob
+        raise KeyError(key)
+
+    def export_metrics(self):
+        """Returns the run-time metrics (see :mod:`kaylee.metrics`) in the
+        Prometheus text exposition format (served with the
+        :data:`kaylee.metrics.CONTENT_TYPE` content type) or ``None`` if
+        the export is disabled by :config:`METRICS_ENDPOINT`.
+
+        The process-wide metrics of :data:`kaylee.metrics.registry` are
+        exported together with the metrics of this instance only."""
+        #pylint: disable-msg=E1101
+        if not self.config.METRICS_ENDPOINT:
+            return None
+        return metrics_registry.exposition(self._collect_metrics)
+
+    def _collect_metrics(self):
+        """Collects the metrics of the registry, the applications and
+        their storages."""
+        nodes = MetricFamily('kaylee_nodes', 'gauge',
+                             'The amount of the registered nodes.')
+        nodes.add(len(self.registry))
+        families = [nodes]
+
+        def family(name, mtype, help_text):
+            fam = MetricFamily('kaylee_app_' + name, mtype, help_text)
+            families.append(fam)
+            return fam
+
+        generated = family('tasks_generated', 'counter',
+                           'The amount of the tasks generated by the project.')
+        leased = family('tasks_leased', 'counter',
+                        'The amount of the task dispatches (leases).')
+        accepted = family('results_accepted', 'counter',
+                          'The amount of the accepted results.')
+        rejected = family('results_rejected', 'counter',
+                          'The amount of the rejected results.')
+        outstanding = family('tasks_outstanding', 'gauge',
+                             'The amount of the generated, but not yet '
+                             'accepted tasks.')
+        pool = family('tasks_pool_size', 'gauge',
+                      'The amount of the tasks pooled for re-dispatching.')
+        completed = family('completed', 'gauge',
+                           '1 if the application is completed.')
+        cached = family('task_cache_tasks', 'gauge',
+                        'The amount of the cached serialized tasks.')
+        cached_bytes = family('task_cache_bytes', 'gauge',
+                              'The size of the cached serialized tasks.')
+        cache_hits = family('task_cache_hits', 'counter',
+                            'The amount of the task cache hits.')
+        cache_misses = family('task_cache_misses', 'counter',
+                              'The amount of the task cache misses.')
+        storage_tasks = family('storage_tasks', 'gauge',
+                               'The amount of the tasks in the storage.')
+        storage_results = family('storage_results', 'gauge',
+                                 'The amount of the results in the storage.')
+
+        for app in self._applications:
+            labels = [('app', app.name)]
+            progress = app.progress.as_dict()
+            generated.add(progress['generated'], labels, '_total')
+            leased.add(progress['leased'], labels, '_total')
+            accepted.add(progress['accepted'], labels, '_total')
+            rejected.add(progress['rejected'], labels, '_total')
+            outstanding.add(progress['outstanding'], labels)
+            if app.pool_size is not None:
+                pool.add(app.pool_size, labels)
+            completed.add(int(app.completed), labels)
+            stats = app.task_cache.stats()
+            cached.add(stats['tasks'], labels)
+            cached_bytes.add(stats['bytes'], labels)
+            cache_hits.add(stats['hits'], labels, '_total')
+            cache_misses.add(stats['misses'], labels, '_total')
+            for kind, storage in (('permanent', app.permanent_storage),
+                                  ('temporal', app.temporal_storage)):
+                if storage is None:
+                    continue
+                slabels = labels + [('storage', kind)]
+                storage_tasks.add(storage.count, slabels)
+                storage_results.add(storage.total_count, slabels)
+        return families
+
+    def _serialize_task(self, node, task):
+        """Splits the session data from the task, serializes the task and
+        puts it to the application's task cache."""
+        session_data = None
+        if (self.session_data_manager is not None
+                and node.controller.session_keys != ()):
+            session_data = self.session_data_manager.pop_session_data(
+                task, node.controller.session_keys)
+        task = CachedTask.from_task(task, session_data)
+        node.controller.task_cache.put(task)
+        return task
+
+    def _json_task_action(self, node, task):
+        payload = task.payload
+        if task.session_data:
+            sd_task = {'id' : task.id}
+            sd_task.update(task.session_data)
+            self._store_session_data(node, sd_task)
+            del sd_task['id']
+            if sd_task:
+                # attach the public session fields (e.g. encrypted
+                # session data) to the serialized task
+                payload = payload[:-1] + ',' + json.dumps(sd_task)[1:]
+        return '{"action":"' + ACTION_TASK + '","data":' + payload + '}'
 
     def _store_session_data(self, node, task):
+        # the project declares that its tasks contain no session data
+        if node.controller.session_keys == ():
+            return
+        if self.session_data_manager is not None:
+            with tracing.span('store_session_data'):
+                self.session_data_manager.store(node, task)
+
+    @staticmethod
+    def _retire(app):
+        app.removed = True
+        app.task_cache.clear()
+
+    def _drain_node(self, node):
+        """Unsubscribes the node from a removed application."""
+        node.unsubscribe()
+        self._discard_session_data(node)
+        self.registry.update(node)
+        node.dirty = False
+
+    def _discard_session_data(self, node):
         if self.session_data_manager is not None:
-            self.session_data_manager.store(node, task)
+            self.session_data_manager.discard(node)
 
     def _restore_session_data(self, node, result):
         if not KL_RESULT in result:
             if self.session_data_manager is not None:
                 self.session_data_manager.restore(node, result)
 
+    @property
+    def shard(self):
+        """The :class:`Shard <kaylee.shard.Shard>` owned by the Kaylee
+        instance when it is one of several instances serving the same
+        settings (e.g. a worker of ``kaylee run --workers N``). The
+        instance registers only the nodes whose IDs belong to the shard,
+        and its applications dispatch only the shard's tasks.
+        ``None`` (default) means that the instance owns everything."""
+        return self._shard
+
+    @shard.setter
+    def shard(self, shard):
+        self._shard = shard
+        for app in self._applications:
+            app.shard = shard
+
+    @property
+    def coordinator(self):
+        """The :class:`Coordinator <kaylee.coordinator.Coordinator>` of
+        the cluster the Kaylee instance belongs to (``None`` by default).
+        In a cluster, the :attr:`shard` (e.g. a :class:`RingShard
+        <kaylee.shard.RingShard>`) defines the nodes owned by the server,
+        while the applications' tasks are leased through the coordinator
+        (see :config:`CLUSTER`)."""
+        return self._coordinator
+
+    @coordinator.setter
+    def coordinator(self, coordinator):
+        self._coordinator = coordinator
+        for app in self._applications:
+            app.coordinator = coordinator
+
+    @property
+    def admin(self):
+        """The management API (:class:`AdminAPI
+        <kaylee.admin.AdminAPI>`) of the Kaylee instance."""
+        if self._admin is None:
+            self._admin = AdminAPI(self)
+        return self._admin
+
     @property
     def applications(self):
         """Available applications container (
@@ -263,6 +616,8 @@ class Config(DictAsObjectWrapper):
     configuration options (see :ref:`configuration` for full description).
     """
     def __init__(self, **kwargs):
+        kwargs.setdefault('COMPRESSION_MIN_SIZE', DEFAULT_COMPRESSION_MIN_SIZE)
+        kwargs.setdefault('METRICS_ENDPOINT', False)
         super(Config, self).__init__(**kwargs)
         self._dirty = True
         self._cached_dict = {}
@@ -277,6 +632,7 @@ class Config(DictAsObjectWrapper):
     def client_config(self):
         client_config_fields = [
             'AUTO_GET_ACTION',
+            'COMPRESSION_MIN_SIZE',
         ]
 
         if self._dirty:
@@ -287,16 +643,56 @@ class Config(DictAsObjectWrapper):
 
 
 class Applications(object):
-    """A readonly container for active Kaylee applications.
+    """A container for active Kaylee applications. The container is
+    modified only via :meth:`Kaylee.add_application`,
+    :meth:`Kaylee.remove_application` and
+    :meth:`Kaylee.reload_application`. The modifications are
+    copy-on-write, thus reading the container requires no locking.
 
     :param controllers: A list of :class:`Controller` objects.
     """
     def __init__(self, controllers):
         self._controllers = {c.name : c for c in controllers}
+        self._lock = threading.Lock()
 
         #: A list of apllications' names
         self.names = sorted(self._controllers.keys())
 
+    def add(self, controller):
+        with self._lock:
+            if controller.name in self._controllers:
+                raise KayleeError('Application "{}" already exists'
+                                  .format(controller.name))
+            self._update(controller.name, controller)
+
+    def remove(self, name):
+        """Removes and returns the application.
+
+        :throws KeyError: if the application was not found."""
+        with self._lock:
+            controller = self._controllers[name]
+            self._update(name, None)
+            return controller
+
+    def replace(self, controller):
+        """Replaces the application of the same name and returns the
+        replaced one.
+
+        :throws KeyError: if the application was not found."""
+        with self._lock:
+            old_controller = self._controllers[controller.name]
+            self._update(controller.name, controller)
+            return old_controller
+
+    def _update(self, name, controller):
+        controllers = dict(self._controllers)
+        if controller is None:
+            del controllers[name]
+        else:
+            controllers[name] = controller
+        self._controllers = controllers
+        self.names = sorted(controllers.keys())
+
     def __getitem__(self, name):
         """Gets an application (an instance of :class:`Controller`)
         by its name.
@@ -312,6 +708,11 @@ class Applications(object):
         """Returns the amount of applications in the container."""
         return len(self._controllers)
 
+    def __iter__(self):
+        """Returns the applications (:class:`Controller` objects)
+        iterator."""
+        return iter(self._controllers.values())
+
     def __str__(self):
         s = 'Kaylee applications({}): '.format(len(self))
         s += '[{}]'.format(', '.join(cname for cname in self._controllers))
@@ -72,6 +72,19 @@ class ApplicationCompletedError(NodeRequestRejectedError):
             .format(application.name) )
 
 
+class ApplicationRemovedError(NodeRequestRejectedError):
+    """Raised when a node request is rejected because the application the
+    node is subscribed to has been removed from (or reloaded in) a running
+    :class:`Kaylee` instance.
+
+    Base class: :class:`NodeRequestRejectedError`."""
+    def __init__(self, application):
+        self.application = application
+        super(ApplicationRemovedError, self).__init__(
+            'The application "{}" has been removed.'
+            .format(application.name) )
+
+
 class SettingsError(KayleeError):
     """Raised when Kaylee settings are invalid"""
     def __init__(self, message):
@@ -10,6 +10,9 @@
 """
 
 import os
+import ast
+import json
+import hashlib
 import importlib
 import inspect
 import types
@@ -21,7 +24,9 @@ import kaylee.contrib
 from .core import Kaylee
 from .errors import KayleeError, SettingsError
 from .util import (LazyObject, is_strong_subclass, MIN_SECRET_KEY_LENGTH,)
-from . import storage, controller, project, node, session
+from . import (storage, controller, project, node, session, coordinator,
+               tracing)
+from .shard import HashRing, RingShard
 
 import logging
 log = logging.getLogger(__name__)
@@ -79,13 +84,22 @@ def load(settings):
         registry = loader.registry
         sdm = loader.session_data_manager
         apps = loader.applications
+        cluster = loader.cluster
+        tracer = loader.tracer
     except (KeyError, AttributeError) as e:
         raise KayleeError('Settings error or object was not found: "{}"'
                           .format(e.args[0]))
-    return Kaylee(registry=registry,
-                  session_data_manager=sdm,
-                  applications=apps,
-                  **settings)
+    kl = Kaylee(registry=registry,
+                session_data_manager=sdm,
+                applications=apps,
+                **settings)
+    if cluster is not None:
+        kl.shard, kl.coordinator = cluster
+    if tracer is not None:
+        previous = tracing.install(tracer)
+        if previous is not None:
+            previous.close()
+    return kl
 
 
 class SettingsValidator:
@@ -93,6 +107,11 @@ class SettingsValidator:
     def validate(settings):
         SettingsValidator.validate_AUTO_GET_ACTION(settings)
         SettingsValidator.validate_SECRET_KEY(settings)
+        SettingsValidator.validate_CLUSTER(settings)
+        SettingsValidator.validate_COMPRESSION_MIN_SIZE(settings)
+        SettingsValidator.validate_METRICS_ENDPOINT(settings)
+        SettingsValidator.validate_TRACING(settings)
+        SettingsValidator.validate_SLOW_REQUESTS(settings)
 
     @staticmethod
     def validate_AUTO_GET_ACTION(settings):
@@ -112,8 +131,85 @@ class SettingsValidator:
                                 'characters are required)'
                                 .format(MIN_SECRET_KEY_LENGTH))
 
+    @staticmethod
+    def validate_CLUSTER(settings):
+        if 'CLUSTER' not in settings:
+            return
+        val = settings['CLUSTER']
+        servers = val.get('servers')
+        if not isinstance(servers, (list, tuple)) or not servers:
+            raise SettingsError('CLUSTER servers is not a non-empty list')
+        if val.get('server') not in servers:
+            raise SettingsError('CLUSTER server "{}" is not one of the '
+                                'CLUSTER servers'.format(val.get('server')))
+        if 'coordinator' not in val:
+            raise SettingsError('CLUSTER coordinator is not defined')
+
+    @staticmethod
+    def validate_COMPRESSION_MIN_SIZE(settings):
+        val = settings.get('COMPRESSION_MIN_SIZE')
+        if val is None:
+            return
+        if isinstance(val, bool) or not isinstance(val, int) or val < 0:
+            raise SettingsError('COMPRESSION_MIN_SIZE is not a non-negative '
+                                'integer or None')
+
+    @staticmethod
+    def validate_METRICS_ENDPOINT(settings):
+        val = settings.get('METRICS_ENDPOINT', False)
+        if not isinstance(val, bool):
+            raise SettingsError('METRICS_ENDPOINT is not a boolean')
+
+    @staticmethod
+    def validate_TRACING(settings):
+        val = settings.get('TRACING')
+        if val is None:
+            return
+        if not isinstance(val, dict):
+            raise SettingsError('TRACING is not a dict')
+        unknown = set(val) - {'sample_rate', 'path'}
+        if unknown:
+            raise SettingsError('Unknown TRACING options: {}'
+                                .format(', '.join(sorted(unknown))))
+        rate = val.get('sample_rate', 1.0)
+        if (isinstance(rate, bool) or not isinstance(rate, (int, float))
+                or not 0 <= rate <= 1):
+            raise SettingsError('TRACING sample_rate is not a number '
+                                'in [0, 1] range')
+        path = val.get('path')
+        if path is not None and not isinstance(path, str):
+            raise SettingsError('TRACING path is not a string')
+
+    @staticmethod
+    def validate_SLOW_REQUESTS(settings):
+        val = settings.get('SLOW_REQUESTS')
+        if val is None:
+            return
+        if not isinstance(val, dict):
+            raise SettingsError('SLOW_REQUESTS is not a dict')
+        unknown = set(val) - {'threshold', 'capacity'}
+        if unknown:
+            raise SettingsError('Unknown SLOW_REQUESTS options: {}'
+                                .format(', '.join(sorted(unknown))))
+        threshold = val.get('threshold')
+        if (isinstance(threshold, bool) or
+                not isinstance(threshold, (int, float)) or threshold < 0):
+            raise SettingsError('SLOW_REQUESTS threshold is not '
+                                'a non-negative number')
+        capacity = val.get('capacity', 100)
+        if (isinstance(capacity, bool) or not isinstance(capacity, int)
+                or capacity < 1):
+            raise SettingsError('SLOW_REQUESTS capacity is not a positive '
+                                'integer')
+
 
 class Loader:
+    """Loads Kaylee objects from the settings. The classes referred to by
+    the settings are resolved lazily by name: only the project packages
+    which may define the referenced names (see :class:`ProjectsManifest`)
+    are imported. The classes defined in the projects override the
+    built-in (:mod:`kaylee.contrib` and :mod:`kaylee.session`) ones.
+    """
     _loadable_base_classes = [
         project.Project,
         controller.Controller,
@@ -121,27 +217,74 @@ class Loader:
         storage.PermanentStorage,
         storage.TemporalStorage,
         session.SessionDataManager,
+        coordinator.Coordinator,
+    ]
+
+    _builtin_modules = [
+        kaylee.contrib,
+        session,
     ]
 
     def __init__(self, settings):
-        self._classes = defaultdict(dict)
         self._settings = settings
-        # load classes from contrib (non-refreshable)
-        self._update_classes(kaylee.contrib)
-        # load session data managers
-        self._update_classes(kaylee.session)
-        # load classes from project modules (refreshable for new modules only)
-        if 'PROJECTS_DIR' in settings:
-            projects_dir = settings['PROJECTS_DIR']
-            for mod in find_modules(projects_dir):
-                self._update_classes(mod)
+        self._classes = {}
+        self._packages = {}
+        self._manifest = None
+        self._projects_dir = settings.get('PROJECTS_DIR')
 
+    @property
+    def manifest(self):
+        """The :class:`ProjectsManifest` of the ``PROJECTS_DIR``
+        (``None`` if the directory is not defined)."""
+        if self._manifest is None and self._projects_dir is not None:
+            self._manifest = ProjectsManifest(self._projects_dir)
+        return self._manifest
+
+    def get_class(self, base_class, name):
+        """Returns a strong subclass of ``base_class`` by its name.
+
+        :throws KeyError: if the class was not found.
+        """
+        key = (base_class, name)
+        try:
+            return self._classes[key]
+        except KeyError:
+            pass
+        cls = self._find_class(base_class, name)
+        self._classes[key] = cls
+        return cls
+
+    def _find_class(self, base_class, name):
+        if self.manifest is not None:
+            for package_name in self.manifest.lookup(name):
+                cls = getattr(self._import_package(package_name), name, None)
+                if _is_loadable(cls, base_class):
+                    return cls
+        for module in self._builtin_modules:
+            cls = getattr(module, name, None)
+            if _is_loadable(cls, base_class):
+                return cls
+        raise KeyError(name)
+
+    def _import_package(self, package_name):
+        try:
+            return self._packages[package_name]
+        except KeyError:
+            pass
+        try:
+            pymod = importlib.import_module(package_name)
+        except ImportError as e:
+            log.error('Unable to import project package "{}": {}'
+                      .format(package_name, e))
+            pymod = None
+        self._packages[package_name] = pymod
+        return pymod
 
     @property
     def registry(self):
         settings = self._settings
         clsname = settings['REGISTRY']['name']
-        regcls = self._classes[node.NodesRegistry][clsname]
+        regcls = self.get_class(node.NodesRegistry, clsname)
         return regcls(**settings['REGISTRY']['config'])
 
     @property
@@ -149,7 +292,7 @@ class Loader:
         settings = self._settings
         if 'SESSION_DATA_MANAGER' in settings:
             clsname = settings['SESSION_DATA_MANAGER']['name']
-            sdmcls = self._classes[session.SessionDataManager][clsname]
+            sdmcls = self.get_class(session.SessionDataManager, clsname)
             sdm_config = settings['SESSION_DATA_MANAGER'].get('config', {})
         else:
             # Load default (should be Phony) session data manager in case it
@@ -169,22 +312,51 @@ class Loader:
                 apps.append(ct)
         return apps
 
-    def _update_classes(self, module):
-        """Updates the _classes field by the classes found in
-        the module."""
-        classes_from_module = get_classes_from_module(module)
-        for base_class in self._loadable_base_classes:
-            # update _classes[base_class] with
-            # { class_name : class } pairs, where `class` is a subclass of
-            # `base_class`
-            name_class_pairs = {c.__name__ : c for c in classes_from_module
-                                if is_strong_subclass(c, base_class)}
-            self._classes[base_class].update(name_class_pairs)
+    @property
+    def cluster(self):
+        """Returns the ``(shard, coordinator)`` pair loaded from the
+        :config:`CLUSTER` settings or ``None`` if not defined."""
+        settings = self._settings
+        if 'CLUSTER' not in settings:
+            return None
+        conf = settings['CLUSTER']
+        ring = HashRing(conf['servers'], conf.get('replicas', 100))
+        shard = RingShard(ring, conf['server'])
+        clsname = conf['coordinator']['name']
+        crdcls = self.get_class(coordinator.Coordinator, clsname)
+        crd = crdcls(conf['server'], **conf['coordinator'].get('config', {}))
+        return shard, crd
+
+    @property
+    def tracer(self):
+        """Returns the :class:`Tracer <kaylee.tracing.Tracer>` configured
+        by the :config:`TRACING` and :config:`SLOW_REQUESTS` settings or
+        ``None`` if neither is defined."""
+        settings = self._settings
+        conf = settings.get('TRACING')
+        slow_conf = settings.get('SLOW_REQUESTS')
+        if conf is None and slow_conf is None:
+            return None
+        # only the slow requests are captured if the tracing is disabled
+        kwargs = dict(conf) if conf is not None else {'sample_rate' : 0.0}
+        if slow_conf is not None:
+            kwargs['slow_request_threshold'] = slow_conf['threshold']
+            kwargs['slow_requests_capacity'] = slow_conf.get('capacity', 100)
+        return tracing.configure(**kwargs)
+
+    def load_application(self, conf):
+        """Loads an application (a :class:`Controller` object) from its
+        configuration, i.e. an item of the :config:`APPLICATIONS` list.
+        The result can be added to a running Kaylee instance via
+        :meth:`Kaylee.add_application <kaylee.Kaylee.add_application>` or
+        :meth:`Kaylee.reload_application <kaylee.Kaylee.reload_application>`.
+        """
+        return self._load_controller(conf)
 
     def _load_permanent_storage(self, conf):
         psconf = conf['controller']['permanent_storage']
         clsname = psconf['name']
-        pscls = self._classes[storage.PermanentStorage][clsname]
+        pscls = self.get_class(storage.PermanentStorage, clsname)
         return pscls(**psconf.get('config', {}))
 
     def _load_temporal_storage(self, conf):
@@ -192,19 +364,19 @@ class Loader:
             return None
         tsconf = conf['controller']['temporal_storage']
         clsname = tsconf['name']
-        tscls = self._classes[storage.TemporalStorage][clsname]
+        tscls = self.get_class(storage.TemporalStorage, clsname)
         return tscls(**tsconf.get('config', {}))
 
     def _load_project(self, conf):
         clsname = conf['project']['name']
-        pcls = self._classes[project.Project][clsname]
+        pcls = self.get_class(project.Project, clsname)
         pj_config = conf['project'].get('config', {})
         return pcls(**pj_config)
 
     def _load_controller(self, conf):
         # initialize objects
         clsname = conf['controller']['name']
-        ccls = self._classes[controller.Controller][clsname]
+        ccls = self.get_class(controller.Controller, clsname)
         app_name = conf['name']
         pjobj = self._load_project(conf)
         psobj = self._load_permanent_storage(conf)
@@ -215,6 +387,201 @@ class Loader:
         return cobj
 
 
+def _is_loadable(cls, base_class):
+    return inspect.isclass(cls) and is_strong_subclass(cls, base_class)
+
+
+class ProjectsManifest(object):
+    """The manifest of the names defined at the top level of the project
+    packages found in ``projects_dir``. The names are discovered by
+    parsing the packages' ``__init__.py`` files (and the modules they
+    star-import from), without importing the packages.
+
+    The manifest is cached in the ``cache_path`` JSON file and every
+    package entry is re-built only if the modification time of any of
+    its parsed files has changed. The manifest is not cached if the file
+    cannot be written.
+
+    :param projects_dir: the projects directory.
+    :param cache_path: the manifest cache file path (see
+                       :meth:`default_cache_path`).
+    """
+    CACHE_FILENAME = '.kaylee-manifest.json'
+    VERSION = 2
+
+    def __init__(self, projects_dir, cache_path=None):
+        self.projects_dir = projects_dir
+        if cache_path is None:
+            cache_path = self.default_cache_path(projects_dir)
+        self.cache_path = cache_path
+        #: ``{package_name : {'files' : {relpath : mtime_ns},
+        #: 'names' : [...], 'wildcard' : bool}}``
+        self.packages = {}
+        #: The amount of packages parsed (i.e. not found in the cache)
+        #: while building the manifest.
+        self.parsed = 0
+        self._index = None
+        self._build()
+
+    @classmethod
+    def default_cache_path(cls, projects_dir):
+        """Returns ``<projects_dir>/.kaylee-manifest.json`` if the
+        projects directory is writable. Otherwise (e.g. in a read-only
+        deployment) returns the path of a file keyed by the projects
+        directory in the user's cache directory (``$XDG_CACHE_HOME/kaylee``
+        or ``~/.cache/kaylee``)."""
+        if os.access(projects_dir, os.W_OK):
+            return os.path.join(projects_dir, cls.CACHE_FILENAME)
+        cache_dir = (os.environ.get('XDG_CACHE_HOME') or
+                     os.path.join(os.path.expanduser('~'), '.cache'))
+        key = hashlib.sha1(os.path.abspath(projects_dir).encode('utf-8'))
+        return os.path.join(cache_dir, 'kaylee',
+                            'manifest-{}.json'.format(key.hexdigest()[:16]))
+
+    def lookup(self, name):
+        """Returns a list of the packages which may define the name:
+        the packages which define it explicitly are followed by the ones
+        which could not be fully parsed."""
+        if self._index is None:
+            index = defaultdict(list)
+            for package_name in sorted(self.packages):
+                for defined_name in self.packages[package_name]['names']:
+                    index[defined_name].append(package_name)
+            self._wildcards = [pkg for pkg in sorted(self.packages)
+                               if self.packages[pkg]['wildcard']]
+            self._index = index
+        return self._index.get(name, []) + self._wildcards
+
+    def _build(self):
+        cached = self._read_cache()
+        changed = False
+        for package_name in find_packages(self.projects_dir):
+            entry = cached.get(package_name)
+            if entry is None or not self._is_valid(package_name, entry):
+                entry = self._scan_package(package_name)
+                self.parsed += 1
+                changed = True
+            self.packages[package_name] = entry
+        if changed or set(cached) != set(self.packages):
+            self._write_cache()
+
+    def _read_cache(self):
+        try:
+            with open(self.cache_path) as f:
+                data = json.load(f)
+            if data.get('version') == self.VERSION:
+                return data['packages']
+        except (OSError, ValueError, KeyError, AttributeError):
+            pass
+        return {}
+
+    def _write_cache(self):
+        tmp_path = self.cache_path + '.tmp'
+        try:
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            with open(tmp_path, 'w') as f:
+                json.dump({'version' : self.VERSION,
+                           'packages' : self.packages}, f)
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            log.debug('Unable to write the projects manifest {}: {}'
+                      .format(self.cache_path, e))
+
+    def _is_valid(self, package_name, entry):
+        package_dir = os.path.join(self.projects_dir, package_name)
+        try:
+            return all(
+                os.stat(os.path.join(package_dir, relpath)).st_mtime_ns
+                == mtime for relpath, mtime in entry['files'].items())
+        except OSError:
+            return False
+
+    def _scan_package(self, package_name):
+        package_dir = os.path.join(self.projects_dir, package_name)
+        names = set()
+        files = {}
+        wildcard = False
+        queue = ['__init__.py']
+        while queue:
+            relpath = queue.pop()
+            if relpath in files:
+                continue
+            fpath = os.path.join(package_dir, relpath)
+            try:
+                files[relpath] = os.stat(fpath).st_mtime_ns
+                with open(fpath, 'rb') as f:
+                    tree = ast.parse(f.read(), fpath)
+            except (OSError, SyntaxError, ValueError):
+                # let the import machinery report the error, if the
+                # package is ever imported
+                wildcard = True
+                continue
+            for stmt in _module_statements(tree.body):
+                if isinstance(stmt, ast.ClassDef):
+                    names.add(stmt.name)
+                elif isinstance(stmt, ast.Assign):
+                    for target in stmt.targets:
+                        names.update(_target_names(target))
+                elif isinstance(stmt, ast.AnnAssign):
+                    names.update(_target_names(stmt.target))
+                elif isinstance(stmt, ast.Import):
+                    names.update((alias.asname or alias.name).split('.')[0]
+                                 for alias in stmt.names)
+                elif isinstance(stmt, ast.ImportFrom):
+                    for alias in stmt.names:
+                        if alias.name != '*':
+                            names.add(alias.asname or alias.name)
+                            continue
+                        submodule = _relative_module_path(package_dir, stmt)
+                        if submodule is None:
+                            wildcard = True
+                        else:
+                            queue.append(submodule)
+        return {'files' : files, 'names' : sorted(names),
+                'wildcard' : wildcard}
+
+
+def _module_statements(body):
+    """Yields the module level statements including the ones nested in
+    the compound statements (e.g. the classes defined in an ``if`` or
+    ``try: ... except ImportError:`` block), but not in the function and
+    class bodies."""
+    for stmt in body:
+        yield stmt
+        if isinstance(stmt, (ast.FunctionDef, ast.AsyncFunctionDef,
+                             ast.ClassDef)):
+            continue
+        for field in ('body', 'orelse', 'finalbody'):
+            yield from _module_statements(getattr(stmt, field, ()))
+        for clause in (getattr(stmt, 'handlers', []) +
+                       getattr(stmt, 'cases', [])):
+            yield from _module_statements(clause.body)
+
+
+def _target_names(target):
+    """Returns the names bound by an assignment target."""
+    if isinstance(target, ast.Name):
+        return [target.id]
+    elif isinstance(target, (ast.Tuple, ast.List)):
+        return [name for elt in target.elts for name in _target_names(elt)]
+    elif isinstance(target, ast.Starred):
+        return _target_names(target.value)
+    return []
+
+
+def _relative_module_path(package_dir, stmt):
+    """Returns the path (relative to the package directory) of the module
+    star-imported by a ``from .module import *`` statement or ``None``
+    if the module cannot be located."""
+    if stmt.level != 1 or not stmt.module:
+        return None
+    relpath = stmt.module.replace('.', os.sep)
+    for candidate in (relpath + '.py', os.path.join(relpath, '__init__.py')):
+        if os.path.isfile(os.path.join(package_dir, candidate)):
+            return candidate
+    return None
+
+
 def get_classes_from_module(module):
     return [attr for attr in module.__dict__.values()
             if inspect.isclass(attr)]
@@ -2,10 +2,16 @@ from .start_env import StartEnvCommand
 from .run import RunCommand
 from .start_project import StartProjectCommand
 from .build import BuildCommand
+from .export import ExportCommand
+from .bench import BenchCommand
+from .profile import ProfileCommand
 
 commands_classes = [
     StartEnvCommand,
     StartProjectCommand,
     RunCommand,
     BuildCommand,
+    ExportCommand,
+    BenchCommand,
+    ProfileCommand,
 ]
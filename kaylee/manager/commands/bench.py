@@ -0,0 +1,627 @@
+from __future__ import print_function
+import os
+import sys
+import json
+import time
+import heapq
+import random
+import threading
+from argparse import ArgumentTypeError
+from kaylee.loader import load
+from kaylee.manager import LocalCommand
+
+
+BENCH_MODES = ['inproc', 'http']
+
+#: The client's session data attribute (see ``kaylee.coffee``).
+SESSION_DATA_ATTRIBUTE = '__kl_session_data__'
+
+
+def positive_int_type(val):
+    num = int(val)
+    if num < 1:
+        raise ArgumentTypeError('{} is not a positive integer'.format(val))
+    return num
+
+
+def rate_type(val):
+    rate = float(val)
+    if not 0.0 <= rate <= 1.0:
+        raise ArgumentTypeError('The rate must be in [0, 1] range, not {}'
+                                .format(val))
+    return rate
+
+
+def seconds_type(val):
+    seconds = float(val)
+    if seconds < 0:
+        raise ArgumentTypeError('{} is a negative time'.format(val))
+    return seconds
+
+
+class BenchCommand(LocalCommand):
+    name = 'bench'
+    help = ('Measures the server capacity by driving the applications '
+            'with simulated nodes')
+
+    args = {
+        ('-s', '--settings-file') : dict(default='settings.py'),
+        ('-a', '--application') : dict(
+            default=None,
+            help='Application name (required if there are several '
+                 'applications)'),
+        ('-n', '--nodes') : dict(default=1000,
+                                 type=positive_int_type,
+                                 help='Amount of simulated nodes'),
+        ('-d', '--duration') : dict(default=10.0,
+                                    type=seconds_type,
+                                    help='Benchmark duration in seconds'),
+        ('-r', '--results') : dict(default=None,
+                                   type=positive_int_type,
+                                   help='Stop after the amount of results '
+                                        'has been accepted'),
+        ('-m', '--mode') : dict(
+            choices=BENCH_MODES,
+            default='inproc',
+            help='"inproc" calls the Kaylee object directly, "http" '
+                 'serves the Kaylee WSGI application on a local socket'),
+        '--url' : dict(default=None,
+                       help='Benchmark a running server instead, e.g. '
+                            'http://127.0.0.1:5000/kaylee'),
+        ('-c', '--concurrency') : dict(
+            default=8,
+            type=positive_int_type,
+            help='Amount of client threads in the "http" mode'),
+        '--compute-delay' : dict(default=0.0,
+                                 type=seconds_type,
+                                 help='Mean task computation time in '
+                                      'seconds (exponentially distributed)'),
+        '--ramp-up' : dict(default=0.0,
+                           type=seconds_type,
+                           help='The nodes are registered evenly during '
+                                'the ramp-up period (in seconds)'),
+        '--churn' : dict(default=0.0,
+                         type=rate_type,
+                         help='Probability that a node leaves after '
+                              'sending a result and is replaced by a new '
+                              'node'),
+        '--failure-rate' : dict(default=0.0,
+                                type=rate_type,
+                                help='Probability that a node disappears '
+                                     'with a task and is replaced by a new '
+                                     'node'),
+        '--result' : dict(default='{"res": 1}',
+                          help='The JSON result sent by the nodes'),
+        '--seed' : dict(default=None, type=int,
+                        help='Random seed'),
+        '--json' : dict(default=False,
+                        action='store_true',
+                        help='Print the report in JSON format'),
+        ('-o', '--output') : dict(default=None,
+                                  help='Write the JSON report to the file'),
+    }
+
+    @staticmethod
+    def execute(opts):
+        if opts.url is None:
+            validate_settings_file(opts)
+        result = parse_result(opts.result)
+        report = run_bench(opts, result)
+        if opts.output is not None:
+            with open(opts.output, 'w') as f:
+                json.dump(report, f, indent=2, sort_keys=True)
+        if opts.json:
+            json.dump(report, sys.stdout, indent=2, sort_keys=True)
+            print()
+        else:
+            print_report(report)
+
+
+def validate_settings_file(opts):
+    if not os.path.exists(opts.settings_file):
+        raise OSError('Cannot find the settings file "{}"'
+                      .format(opts.settings_file))
+
+
+def parse_result(result):
+    try:
+        result = json.loads(result)
+    except ValueError as e:
+        raise ValueError('--result is not a valid JSON: {}'.format(e))
+    if not isinstance(result, dict):
+        raise ValueError('--result is not a JSON object')
+    return result
+
+
+class LocalTransport(object):
+    """Calls the :class:`Kaylee <kaylee.Kaylee>` object directly."""
+    def __init__(self, kl):
+        self.kl = kl
+
+    def register(self):
+        return json.loads(self.kl.register('127.0.0.1'))
+
+    def subscribe(self, node_id, app_name):
+        return json.loads(self.kl.subscribe(node_id, app_name))
+
+    def get_action(self, node_id):
+        return json.loads(self.kl.get_action(node_id))
+
+    def accept_result(self, node_id, data):
+        return json.loads(self.kl.accept_result(node_id, data))
+
+
+class HTTPTransport(object):
+    """Sends the requests to a Kaylee front-end via HTTP (see
+    :ref:`default-communication`).
+
+    :param url: the URL of the front-end, e.g.
+                ``http://127.0.0.1:5000/kaylee``.
+    """
+    def __init__(self, url):
+        from urllib.parse import urlsplit
+        parts = urlsplit(url)
+        if parts.scheme != 'http':
+            raise ValueError('Only http:// URLs are supported: {}'
+                             .format(url))
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.prefix = parts.path.rstrip('/')
+
+    def register(self):
+        return self._request('GET', '/register')
+
+    def subscribe(self, node_id, app_name):
+        return self._request('POST', '/apps/{}/subscribe/{}'
+                             .format(app_name, node_id), b'')
+
+    def get_action(self, node_id):
+        return self._request('GET', '/actions/' + node_id)
+
+    def accept_result(self, node_id, data):
+        return self._request('POST', '/actions/' + node_id,
+                             data.encode('utf-8'))
+
+    def _request(self, method, path, body=None):
+        from http.client import HTTPConnection
+        conn = HTTPConnection(self.host, self.port, timeout=30)
+        try:
+            headers = {'Content-Type' : 'application/json'}
+            conn.request(method, self.prefix + path, body, headers)
+            response = conn.getresponse()
+            data = response.read()
+            if response.status != 200:
+                raise IOError('HTTP {} {}'.format(response.status,
+                                                  response.reason))
+            return json.loads(data.decode('utf-8'))
+        finally:
+            conn.close()
+
+
+class BenchStats(object):
+    """The measurements collected by :class:`LoadGenerator`."""
+    ENDPOINTS = ('register', 'subscribe', 'get_action', 'accept_result')
+
+    def __init__(self):
+        #: endpoint -> list of the request latencies in seconds
+        self.latencies = {ep : [] for ep in self.ENDPOINTS}
+        #: endpoint -> amount of the failed requests
+        self.errors = {ep : 0 for ep in self.ENDPOINTS}
+        self.results = 0
+        self.registered = 0
+        self.failed = 0
+        self.churned = 0
+        self.unsubscribed = 0
+
+    def merge(self, other):
+        for ep in self.ENDPOINTS:
+            self.latencies[ep].extend(other.latencies[ep])
+            self.errors[ep] += other.errors[ep]
+        for attr in ('results', 'registered', 'failed', 'churned',
+                     'unsubscribed'):
+            setattr(self, attr, getattr(self, attr) + getattr(other, attr))
+
+    @property
+    def requests(self):
+        return sum(len(lat) for lat in self.latencies.values())
+
+
+# the states of a simulated node
+_NEW, _SUBSCRIBE, _GET_ACTION, _SEND_RESULT = range(4)
+
+
+class _SimulatedNode(object):
+    __slots__ = ('state', 'node_id', 'task')
+
+    def __init__(self):
+        self.state = _NEW
+        self.node_id = None
+        self.task = None
+
+
+class LoadGenerator(object):
+    """Drives an application with simulated nodes which follow the Kaylee
+    protocol: register -> subscribe -> get_action -> accept_result.
+
+    The nodes are scheduled by a single event loop, thus thousands of
+    nodes are simulated by a single thread. The loop sleeps only if all
+    the nodes are "computing" their tasks.
+
+    :param transport: :class:`LocalTransport` or :class:`HTTPTransport`.
+    :param app_name: the application name.
+    :param nodes: the amount of the simultaneously active nodes.
+    :param compute_delay: the mean task computation time in seconds.
+    :param churn: the probability that a node leaves after sending
+                  a result.
+    :param failure_rate: the probability that a node disappears with
+                         a task.
+    :param result: the result (a dict) sent by the nodes.
+    :param ramp_up: the period (in seconds) during which the nodes are
+                    registered.
+    """
+    def __init__(self, transport, app_name, nodes=1000, compute_delay=0.0,
+                 churn=0.0, failure_rate=0.0, result=None, ramp_up=0.0,
+                 seed=None, clock=time.perf_counter, sleep=time.sleep):
+        self.transport = transport
+        self.app_name = app_name
+        self.nodes = nodes
+        self.compute_delay = compute_delay
+        self.churn = churn
+        self.failure_rate = failure_rate
+        self.result = result if result is not None else {'res' : 1}
+        self.ramp_up = ramp_up
+        self.stats = BenchStats()
+        self._random = random.Random(seed)
+        self._clock = clock
+        self._sleep = sleep
+        self._events = []
+        self._seq = 0
+        self._stopped = False
+
+    def run(self, duration=None, max_results=None, stop_event=None):
+        """Runs the load until the ``duration`` (in seconds) expires,
+        ``max_results`` results have been accepted, all the nodes have
+        been unsubscribed (e.g. the application has been completed) or
+        the ``stop_event`` is set.
+
+        :returns: the elapsed time in seconds.
+        """
+        start = self._clock()
+        deadline = start + duration if duration is not None else None
+        for i in range(self.nodes):
+            self._schedule(start + self.ramp_up * i / self.nodes,
+                           _SimulatedNode())
+
+        while self._events:
+            if max_results is not None and \
+                    self.stats.results >= max_results:
+                break
+            if stop_event is not None and stop_event.is_set():
+                break
+            wake_time, _, node = self._events[0]
+            now = self._clock()
+            if deadline is not None and min(wake_time, now) >= deadline:
+                break
+            if wake_time > now:
+                delay = wake_time - now
+                if deadline is not None:
+                    delay = min(delay, deadline - now)
+                self._sleep(delay)
+                continue
+            heapq.heappop(self._events)
+            self._step(node)
+        return self._clock() - start
+
+    def _schedule(self, wake_time, node):
+        self._seq += 1
+        heapq.heappush(self._events, (wake_time, self._seq, node))
+
+    def _call(self, endpoint, *args):
+        func = getattr(self.transport, endpoint)
+        start = self._clock()
+        try:
+            response = func(*args)
+        except Exception:
+            response = None
+        self.stats.latencies[endpoint].append(self._clock() - start)
+        if response is None or (isinstance(response, dict)
+                                and 'error' in response):
+            self.stats.errors[endpoint] += 1
+            return None
+        return response
+
+    def _replace(self, node):
+        """The node leaves and a new node takes its place."""
+        self._schedule(self._clock(), _SimulatedNode())
+
+    def _step(self, node):
+        now = self._clock()
+        if node.state == _NEW:
+            response = self._call('register')
+            if response is None:
+                return self._schedule(now, node)
+            self.stats.registered += 1
+            node.node_id = response['node_id']
+            node.state = _SUBSCRIBE
+            self._schedule(now, node)
+        elif node.state == _SUBSCRIBE:
+            if self._call('subscribe', node.node_id,
+                          self.app_name) is None:
+                node.state = _NEW
+            else:
+                node.state = _GET_ACTION
+            self._schedule(now, node)
+        elif node.state == _GET_ACTION:
+            self._handle_action(node, self._call('get_action', node.node_id))
+        elif node.state == _SEND_RESULT:
+            if self._random.random() < self.failure_rate:
+                self.stats.failed += 1
+                return self._replace(node)
+            result = dict(self.result)
+            if SESSION_DATA_ATTRIBUTE in node.task:
+                result[SESSION_DATA_ATTRIBUTE] = \
+                    node.task[SESSION_DATA_ATTRIBUTE]
+            response = self._call('accept_result', node.node_id,
+                                  json.dumps(result))
+            node.task = None
+            if response is not None:
+                self.stats.results += 1
+                if self._random.random() < self.churn:
+                    self.stats.churned += 1
+                    return self._replace(node)
+            self._handle_action(node, response)
+
+    def _handle_action(self, node, response):
+        now = self._clock()
+        if response is None:
+            # the server has rejected the node, e.g. the node's
+            # registration has expired
+            node.state = _NEW
+            return self._schedule(now, node)
+        action = response.get('action')
+        if action == 'task':
+            node.task = response['data']
+            node.state = _SEND_RESULT
+            delay = 0.0
+            if self.compute_delay > 0:
+                delay = self._random.expovariate(1.0 / self.compute_delay)
+            self._schedule(now + delay, node)
+        elif action == 'unsubscribe':
+            # e.g. the application has been completed
+            self.stats.unsubscribed += 1
+        else:
+            node.state = _GET_ACTION
+            self._schedule(now, node)
+
+
+def percentile(sorted_values, pct):
+    """Returns the nearest-rank percentile of the sorted values."""
+    if not sorted_values:
+        return None
+    rank = max(int(round(pct / 100.0 * len(sorted_values))) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def rss_kb():
+    """Returns the resident set size of the process in KB or ``None``
+    if it is unknown."""
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') // 1024
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    try:
+        import resource
+        # the peak (not the current) RSS, which is still usable to
+        # detect the memory growth
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    except ImportError:
+        return None
+
+
+class _MemorySampler(threading.Thread):
+    def __init__(self, interval=0.5):
+        super(_MemorySampler, self).__init__(name='kaylee-bench-memory')
+        self.daemon = True
+        self.interval = interval
+        self.start_kb = self.peak_kb = rss_kb()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            self._sample()
+
+    def _sample(self):
+        current = rss_kb()
+        if current is not None and (self.peak_kb is None or
+                                    current > self.peak_kb):
+            self.peak_kb = current
+        return current
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+        end_kb = self._sample()
+        return {
+            'rss_start_kb' : self.start_kb,
+            'rss_peak_kb' : self.peak_kb,
+            'rss_end_kb' : end_kb,
+            'rss_growth_kb' : (end_kb - self.start_kb
+                               if None not in (end_kb, self.start_kb)
+                               else None),
+        }
+
+
+def run_bench(opts, result):
+    """Runs the benchmark described by the command options and returns
+    the report (a JSON-serializable dict)."""
+    server = None
+    kl = None
+    if opts.url is not None:
+        mode = 'url'
+        transport = HTTPTransport(opts.url)
+        app_name = opts.application
+        if app_name is None:
+            raise ValueError('--application is required with --url')
+    else:
+        mode = opts.mode
+        kl = load(opts.settings_file)
+        app_name = _get_app_name(kl, opts.application)
+        if mode == 'http':
+            server, url = _serve(kl)
+            transport = HTTPTransport(url)
+        else:
+            transport = LocalTransport(kl)
+
+    concurrency = opts.concurrency if mode != 'inproc' else 1
+    generators = []
+    for i in range(concurrency):
+        nodes = opts.nodes // concurrency + (i < opts.nodes % concurrency)
+        seed = opts.seed + i if opts.seed is not None else None
+        generators.append(LoadGenerator(
+            transport, app_name, nodes, opts.compute_delay, opts.churn,
+            opts.failure_rate, result, opts.ramp_up, seed))
+
+    sampler = _MemorySampler() if kl is not None else None
+    if sampler is not None:
+        sampler.start()
+    try:
+        elapsed = _run_generators(generators, opts.duration, opts.results)
+    finally:
+        memory = sampler.stop() if sampler is not None else None
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+
+    stats = BenchStats()
+    for gen in generators:
+        stats.merge(gen.stats)
+    return make_report(stats, elapsed, memory, {
+        'mode' : mode,
+        'application' : app_name,
+        'nodes' : opts.nodes,
+        'duration' : opts.duration,
+        'compute_delay' : opts.compute_delay,
+        'churn' : opts.churn,
+        'failure_rate' : opts.failure_rate,
+        'concurrency' : concurrency,
+    })
+
+
+def _get_app_name(kl, app_name):
+    names = kl.applications.names
+    if app_name is None:
+        if len(names) != 1:
+            raise ValueError('Please choose the application (-a): {}'
+                             .format(', '.join(names) or 'none found'))
+        return names[0]
+    if app_name not in names:
+        raise ValueError('Application "{}" was not found'.format(app_name))
+    return app_name
+
+
+def _serve(kl):
+    from werkzeug.serving import make_server, WSGIRequestHandler
+    from kaylee.contrib.frontends.wsgi_frontend import make_wsgi_app
+
+    class QuietRequestHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    server = make_server('127.0.0.1', 0, make_wsgi_app(kl), threaded=True,
+                         request_handler=QuietRequestHandler)
+    thread = threading.Thread(target=server.serve_forever,
+                              name='kaylee-bench-server')
+    thread.daemon = True
+    thread.start()
+    return server, 'http://127.0.0.1:{}/kaylee'.format(server.server_port)
+
+
+def _run_generators(generators, duration, max_results):
+    if len(generators) == 1:
+        return generators[0].run(duration, max_results)
+    # every thread runs its own share of the nodes
+    stop_event = threading.Event()
+    per_thread = (max_results // len(generators) + 1
+                  if max_results is not None else None)
+    threads = [threading.Thread(target=gen.run,
+                                args=(duration, per_thread, stop_event))
+               for gen in generators]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    try:
+        for thread in threads:
+            thread.join()
+    except KeyboardInterrupt:
+        stop_event.set()
+        for thread in threads:
+            thread.join()
+    return time.perf_counter() - start
+
+
+def make_report(stats, elapsed, memory, config):
+    endpoints = {}
+    for ep in BenchStats.ENDPOINTS:
+        lat = sorted(stats.latencies[ep])
+        ms = lambda val: round(val * 1000, 3) if val is not None else None
+        endpoints[ep] = {
+            'count' : len(lat),
+            'errors' : stats.errors[ep],
+            'p50_ms' : ms(percentile(lat, 50)),
+            'p90_ms' : ms(percentile(lat, 90)),
+            'p99_ms' : ms(percentile(lat, 99)),
+            'max_ms' : ms(lat[-1] if lat else None),
+        }
+    elapsed = max(elapsed, 1e-9)
+    return {
+        'config' : config,
+        'elapsed' : round(elapsed, 3),
+        'results' : stats.results,
+        'requests' : stats.requests,
+        'throughput' : {
+            'results_per_sec' : round(stats.results / elapsed, 2),
+            'requests_per_sec' : round(stats.requests / elapsed, 2),
+        },
+        'nodes' : {
+            'registered' : stats.registered,
+            'failed' : stats.failed,
+            'churned' : stats.churned,
+            'unsubscribed' : stats.unsubscribed,
+        },
+        'endpoints' : endpoints,
+        'memory' : memory,
+    }
+
+
+def print_report(report):
+    config = report['config']
+    print('Kaylee bench: application "{}", {} nodes, {} mode, {:.1f}s'
+          .format(config['application'], config['nodes'], config['mode'],
+                  report['elapsed']))
+    print('  results:  {} ({} per second)'.format(
+        report['results'], report['throughput']['results_per_sec']))
+    print('  requests: {} ({} per second)'.format(
+        report['requests'], report['throughput']['requests_per_sec']))
+    nodes = report['nodes']
+    print('  nodes:    {registered} registered, {failed} failed, '
+          '{churned} churned, {unsubscribed} unsubscribed'.format(**nodes))
+    memory = report['memory']
+    if memory is not None and memory['rss_start_kb'] is not None:
+        print('  memory:   RSS {rss_start_kb} KB at start, {rss_peak_kb} KB '
+              'peak, {rss_end_kb} KB at end ({rss_growth_kb:+} KB)'
+              .format(**memory))
+    print()
+    header = ('endpoint', 'count', 'errors', 'p50 ms', 'p90 ms', 'p99 ms',
+              'max ms')
+    rows = [header]
+    for ep in BenchStats.ENDPOINTS:
+        data = report['endpoints'][ep]
+        rows.append((ep, data['count'], data['errors'], data['p50_ms'],
+                     data['p90_ms'], data['p99_ms'], data['max_ms']))
+    widths = [max(len(str(row[i])) for row in rows)
+              for i in range(len(header))]
+    for row in rows:
+        print('  ' + '  '.join(str(c if c is not None else '-').ljust(w)
+                               for c, w in zip(row, widths)))
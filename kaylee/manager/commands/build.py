@@ -1,15 +1,31 @@
 from __future__ import print_function
 import os
 import sys
+import json
+import time
+import errno
+import hashlib
 import importlib
 import subprocess
 import shutil
-import kaylee
+from concurrent.futures import ThreadPoolExecutor
 from importlib.machinery import SourceFileLoader
+import kaylee
 from kaylee.manager import LocalCommand
 from kaylee.loader import find_packages, get_classes_from_module
+from kaylee.assets import bundle_assets
 from kaylee.util import ensure_dir
 
+KLCL_TEMPLATE_PATH = os.path.join(os.path.dirname(__file__),
+                                  'templates/build_template')
+
+
+def jobs_type(val):
+    jobs = int(val)
+    if jobs < 1:
+        raise ValueError('The amount of jobs must be a positive integer')
+    return jobs
+
 
 class BuildCommand(LocalCommand):
     name = 'build'
@@ -17,7 +33,23 @@ class BuildCommand(LocalCommand):
 
     args = {
         ('-s', '--settings-file') : dict(default='settings.py'),
-        ('-b', '--build-dir') : dict(default='_build')
+        ('-b', '--build-dir') : dict(default='_build'),
+        ('-j', '--jobs') : dict(default=os.cpu_count() or 1,
+                                type=jobs_type,
+                                help='Amount of parallel CoffeeScript '
+                                     'compiler processes'),
+        '--watch' : dict(default=False,
+                         action='store_true',
+                         help='Keep watching the projects and rebuild '
+                              'the changed files'),
+        '--interval' : dict(default=1.0,
+                            type=float,
+                            help='Watch mode polling interval in seconds'),
+        '--no-bundle' : dict(default=True,
+                             action='store_false',
+                             dest='bundle',
+                             help='Do not bundle, minify and precompress '
+                                  'the client files'),
     }
 
     @staticmethod
@@ -27,8 +59,16 @@ class BuildCommand(LocalCommand):
 
         print('Building Kaylee environment...')
         settings = SourceFileLoader('settings', opts.settings_file).load_module()
-        build_kaylee(opts)
-        build_projects(settings, opts)
+        manifest = BuildManifest(opts.build_dir)
+        try:
+            build_kaylee(opts, manifest)
+            build_projects(settings, opts, manifest)
+        finally:
+            manifest.save()
+        if opts.bundle:
+            build_bundles(settings, opts)
+        if opts.watch:
+            watch(settings, opts, manifest)
 
 
 def verify_settings(opts):
@@ -45,12 +85,90 @@ def verify_build_dir(opts):
                       .format(opts.build_dir, e))
 
 
-def build_kaylee(opts):
-    print('* Copying Kaylee test server files...')
-    KLCL_TEMPLATE_DIR = 'templates/build_template'
-    KLCL_TEMPLATE_PATH = os.path.join(os.path.dirname(__file__),
-                                      KLCL_TEMPLATE_DIR)
+class BuildManifest(object):
+    """Keeps the SHA-256 hashes and the outputs of the built source files
+    in the build directory, so that the unchanged files are not rebuilt.
+
+    A file is considered unchanged if its size and modification time
+    are the same as during the previous build. Otherwise its content hash
+    is compared, thus touching or re-saving a file does not trigger a
+    rebuild.
+    """
+    FILENAME = '.kaylee-build.json'
+    VERSION = 1
+
+    def __init__(self, build_dir):
+        self.path = os.path.join(build_dir, self.FILENAME)
+        self.files = {}
+        self._hashes = {}
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            if data.get('version') == self.VERSION:
+                self.files = data['files']
+        except (OSError, ValueError, KeyError):
+            pass
+
+    def is_fresh(self, src, outputs):
+        """Checks whether the outputs of the source file are up to date."""
+        entry = self.files.get(src)
+        if entry is None or entry['outputs'] != outputs:
+            return False
+        if not all(os.path.exists(out) for out in outputs):
+            return False
+        st = os.stat(src)
+        if [st.st_size, st.st_mtime_ns] == entry['stat']:
+            return True
+        if self._hash(src) != entry['sha256']:
+            return False
+        entry['stat'] = [st.st_size, st.st_mtime_ns]
+        return True
+
+    def update(self, src, outputs):
+        """Records that the outputs have been built from the source file."""
+        st = os.stat(src)
+        self.files[src] = {
+            'stat' : [st.st_size, st.st_mtime_ns],
+            'sha256' : self._hash(src),
+            'outputs' : outputs,
+        }
+
+    def remove_stale(self, src_dir, sources):
+        """Removes the outputs of the files which have been built from
+        ``src_dir``, but are no longer among the ``sources``.
 
+        :returns: the list of the removed source files.
+        """
+        prefix = os.path.join(src_dir, '')
+        stale = [src for src in self.files
+                 if src.startswith(prefix) and src not in sources]
+        for src in stale:
+            for out in self.files.pop(src)['outputs']:
+                if os.path.exists(out):
+                    os.remove(out)
+        return stale
+
+    def save(self):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'version' : self.VERSION, 'files' : self.files}, f)
+        os.replace(tmp_path, self.path)
+
+    def _hash(self, path):
+        st = os.stat(path)
+        key = (path, st.st_size, st.st_mtime_ns)
+        digest = self._hashes.get(key)
+        if digest is None:
+            h = hashlib.sha256()
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20), b''):
+                    h.update(chunk)
+            digest = self._hashes[key] = h.hexdigest()
+        return digest
+
+
+def build_kaylee(opts, manifest):
+    print('* Copying Kaylee test server files...')
     KLCL_CLIENT_PATH = os.path.join(os.path.dirname(kaylee.__file__),
                                     'client')
     CLIENT_FILES = [
@@ -69,48 +187,125 @@ def build_kaylee(opts):
     ensure_dir(os.path.join(dest_path, 'kaylee/js'))
     ensure_dir(os.path.join(dest_path, 'kaylee/css'))
 
-    for fname, out_fname in CLIENT_FILES:
-        fpath = os.path.join(KLCL_CLIENT_PATH, fname)
+    files = [(os.path.join(KLCL_CLIENT_PATH, fname), out_fname)
+             for fname, out_fname in CLIENT_FILES]
+    files += [(os.path.join(KLCL_TEMPLATE_PATH, fname), out_fname)
+              for fname, out_fname in TEMPLATE_FILES]
+    for fpath, out_fname in files:
         dest_fpath = os.path.join(dest_path, out_fname)
-        shutil.copy(fpath, dest_fpath)
+        if manifest.is_fresh(fpath, [dest_fpath]):
+            continue
+        copy_file(fpath, dest_fpath)
+        manifest.update(fpath, [dest_fpath])
 
-    for fname, out_fname in TEMPLATE_FILES:
-        fpath = os.path.join(KLCL_TEMPLATE_PATH, fname)
-        dest_fpath = os.path.join(dest_path, out_fname)
-        shutil.copy(fpath, dest_fpath)
 
+def build_projects(settings, opts, manifest, verbose=True):
+    """Builds the projects' client files which have changed since the
+    previous build and removes the outputs of the deleted files.
 
-def build_projects(settings, opts):
-    filetype_handlers = [
-        coffee_handler,
-        script_handler,
-        stylesheet_handler,
-        data_handler,
-    ]
+    :returns: the list of the rebuilt and the removed source files.
+    """
+    changed = []
+    for pkg_dir in find_projects(settings):
+        if verbose:
+            print('* Building {}...'.format(pkg_dir))
+        dest_dir = os.path.join(opts.build_dir, pkg_dir)
+        changed += build_project(pkg_dir, dest_dir, manifest, opts.jobs)
+    return changed
 
+
+def find_projects(settings):
+    """Returns the Kaylee projects' directories."""
     # Make sure that the command is able to import the projects'
     # Python packages.
-    sys.path.insert(0, settings.PROJECTS_DIR)
+    if settings.PROJECTS_DIR not in sys.path:
+        sys.path.insert(0, settings.PROJECTS_DIR)
+    return [pkg_dir for pkg_dir in find_packages(settings.PROJECTS_DIR)
+            if is_kaylee_project_directory(pkg_dir)]
+
 
-    for pkg_dir in find_packages(settings.PROJECTS_DIR):
-        if not is_kaylee_project_directory(pkg_dir):
+def build_bundles(settings, opts, verbose=True):
+    """Bundles, minifies and precompresses the Kaylee client and the
+    projects' client files (see :func:`kaylee.assets.bundle_assets`)."""
+    if verbose:
+        print('* Bundling the client files...')
+    bundle_assets(opts.build_dir, find_projects(settings),
+                  os.path.join(KLCL_TEMPLATE_PATH, 'index.html'))
+
+
+def build_project(pkg_dir, dest_dir, manifest, jobs=1):
+    """Builds the project client files from ``<pkg_dir>/client``:
+    compiles the CoffeeScript files (in parallel) and copies the scripts,
+    the stylesheets and the data files to ``dest_dir``. The files which
+    are up to date according to the manifest are skipped.
+
+    :returns: the list of the rebuilt and the removed source files.
+    """
+    client_dir = os.path.abspath(os.path.join(pkg_dir, 'client'))
+    sources = []
+    for fname in sorted(os.listdir(client_dir)):
+        fpath = os.path.join(client_dir, fname)
+        if os.path.isfile(fpath):
+            sources.append(fpath)
+
+    changed = []
+    coffee_files = []
+    for fpath in sources:
+        builder, out = get_builder(fpath, os.path.abspath(dest_dir))
+        if manifest.is_fresh(fpath, [out]):
             continue
-        print('* Building {}...'.format(pkg_dir))
-        dest_dir = os.path.join(opts.build_dir, pkg_dir)
-        opts.dest_dir = dest_dir
-        # clear destination directory before building
-        if os.path.isdir(dest_dir):
-            shutil.rmtree(dest_dir)
-        # build project client by applying appropriate
-        # file handlers
-        client_dir = os.path.join(pkg_dir, 'client')
-        for fname in os.listdir(client_dir):
-            fpath = os.path.join(client_dir, fname)
-            if not os.path.isfile(fpath):
+        ensure_dir(os.path.dirname(out))
+        if builder is compile_coffee:
+            coffee_files.append((fpath, out))
+            continue
+        builder(fpath, out)
+        manifest.update(fpath, [out])
+        changed.append(fpath)
+
+    if coffee_files:
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            # every compilation runs in a separate ``coffee`` process
+            futures = [(fpath, out, executor.submit(compile_coffee, fpath,
+                                                    out))
+                       for fpath, out in coffee_files]
+            errors = []
+            for fpath, out, future in futures:
+                try:
+                    future.result()
+                except Exception as e:
+                    errors.append(str(e))
+                    continue
+                manifest.update(fpath, [out])
+                changed.append(fpath)
+        if errors:
+            raise Exception('\n'.join(errors))
+
+    changed += manifest.remove_stale(client_dir, set(sources))
+    return changed
+
+
+def watch(settings, opts, manifest):
+    """Polls the projects' client files and rebuilds the changed ones
+    until interrupted."""
+    print('Watching for changes (press Ctrl+C to stop)...')
+    try:
+        while True:
+            time.sleep(opts.interval)
+            try:
+                changed = build_projects(settings, opts, manifest,
+                                         verbose=False)
+            except Exception as e:
+                print('Build failed: {}'.format(e))
                 continue
-            for handler in filetype_handlers:
-                if handler(fpath, opts) == True:
-                    break
+            if changed:
+                manifest.save()
+                if opts.bundle:
+                    build_bundles(settings, opts, verbose=False)
+                for fpath in changed:
+                    print('* Rebuilt {}'.format(fpath))
+    except KeyboardInterrupt:
+        pass
+
 
 def is_kaylee_project_directory(path):
     # check if 'client' directory exists
@@ -125,11 +320,22 @@ def is_kaylee_project_directory(path):
             return True
     return False
 
-def coffee_handler(fpath, opts):
-    if not fpath.endswith('.coffee'):
-        return False
 
-    args = ['coffee', '--bare', '-c', fpath]
+def get_builder(fpath, dest_dir):
+    """Returns the ``(builder, output_path)`` tuple of the client file."""
+    fname = os.path.basename(fpath)
+    base, ext = os.path.splitext(fname)
+    if ext == '.coffee':
+        return compile_coffee, os.path.join(dest_dir, 'js', base + '.js')
+    elif ext == '.js':
+        return copy_file, os.path.join(dest_dir, 'js', fname)
+    elif ext == '.css':
+        return copy_file, os.path.join(dest_dir, 'css', fname)
+    return link_file, os.path.join(dest_dir, 'data', fname)
+
+
+def compile_coffee(fpath, out):
+    args = ['coffee', '--bare', '-c', '-o', os.path.dirname(out), fpath]
     proc = subprocess.Popen(args,
                             close_fds=True,
                             stdin=subprocess.PIPE,
@@ -138,39 +344,42 @@ def coffee_handler(fpath, opts):
     #pylint: disable-msg=W0612
     #W0612: Unused variable 'stdoutdata'
     stdoutdata, stderrdata = proc.communicate()
-    if stderrdata != b'':
-        raise Exception('Error compiling .coffee script:\n{}'
-                        .format(stderrdata))
-
-    dest_dir = os.path.join(opts.dest_dir, 'js')
-    ensure_dir(dest_dir)
-    outpath = fpath.rsplit('.coffee', 1)[0] + '.js'
-    shutil.move(outpath, dest_dir)
-    return True
+    if stderrdata != b'' or proc.returncode != 0:
+        raise Exception('Error compiling .coffee script {}:\n{}'
+                        .format(fpath, stderrdata.decode('utf-8', 'replace')))
 
 
-def script_handler(fpath, opts):
-    if not fpath.endswith('.js'):
-        return False
+def copy_file(fpath, out):
+    shutil.copy2(fpath, out)
 
-    dest_dir = os.path.join(opts.dest_dir, 'js')
-    ensure_dir(dest_dir)
-    shutil.copy(fpath, dest_dir)
-    return True
 
+#: The Linux ``FICLONE`` ioctl request code (see ``ioctl_ficlone(2)``).
+FICLONE = 0x40049409
 
-def stylesheet_handler(fpath, opts):
-    if not fpath.endswith('.css'):
-        return False
-
-    dest_dir = os.path.join(opts.dest_dir, 'css')
-    ensure_dir(dest_dir)
-    shutil.copy(fpath, dest_dir)
-    return True
+def link_file(fpath, out):
+    """Hard-links the (data) file to the output path. If hard-linking is
+    not possible (e.g. the build directory is on another file system),
+    the file is reflinked (copy-on-write clone, Linux only) or copied."""
+    if os.path.lexists(out):
+        os.remove(out)
+    try:
+        os.link(fpath, out)
+        return
+    except OSError:
+        pass
+    try:
+        _reflink(fpath, out)
+    except OSError:
+        if os.path.exists(out):
+            os.remove(out)
+        shutil.copy2(fpath, out)
 
 
-def data_handler(fpath, opts):
-    dest_dir = os.path.join(opts.dest_dir, 'data')
-    ensure_dir(dest_dir)
-    shutil.copy(fpath, dest_dir)
-    return True
+def _reflink(fpath, out):
+    try:
+        import fcntl
+    except ImportError:
+        raise OSError(errno.ENOTSUP, 'Reflinks are not supported')
+    with open(fpath, 'rb') as src, open(out, 'wb') as dst:
+        fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+    shutil.copystat(fpath, out)
@@ -0,0 +1,241 @@
+from __future__ import print_function
+import os
+import sys
+import csv
+import json
+import struct
+from abc import ABCMeta, abstractmethod
+from array import array
+from kaylee.loader import load
+from kaylee.manager import LocalCommand
+
+
+EXPORT_FORMATS = ['jsonl', 'csv', 'npy']
+
+
+def chunk_size_type(val):
+    size = int(val)
+    if size < 1:
+        raise ValueError('Chunk size must be a positive integer')
+    return size
+
+
+class ExportCommand(LocalCommand):
+    name = 'export'
+    help = ("Exports an application's permanent results to "
+            "JSON Lines, CSV or NumPy .npy file")
+
+    args = {
+        'application' : dict(help='Application name'),
+        'output' : dict(help='Output file path'),
+        ('-s', '--settings-file') : dict(default='settings.py'),
+        ('-f', '--format') : dict(
+            choices=EXPORT_FORMATS,
+            default=None,
+            help='Output format (default: guessed from the output '
+                 'file extension)'),
+        ('-c', '--chunk-size') : dict(
+            default=1000,
+            type=chunk_size_type,
+            help='Amount of tasks fetched from the storage at once'),
+        ('-r', '--resume-after') : dict(
+            default=None,
+            metavar='TASK_ID',
+            help='Appends the results of the tasks following TASK_ID '
+                 'to the existing output file'),
+    }
+
+    @staticmethod
+    def execute(opts):
+        validate_settings_file(opts)
+        validate_format(opts)
+
+        kl = load(opts.settings_file)
+        try:
+            app = kl.applications[opts.application]
+        except KeyError:
+            raise ValueError('Application "{}" was not found'
+                             .format(opts.application))
+        print('Exporting "{}" results to {}...'.format(opts.application,
+                                                       opts.output))
+        count, cursor = export_storage(app.permanent_storage, opts)
+        print('{} task(s) exported. Last exported task: {}'
+              .format(count, cursor))
+
+
+def validate_settings_file(opts):
+    if not os.path.exists(opts.settings_file):
+        raise OSError('Cannot find the settings file "{}"'
+                      .format(opts.settings_file))
+
+
+def validate_format(opts):
+    if opts.format is None:
+        ext = os.path.splitext(opts.output)[1].lstrip('.').lower()
+        if ext not in EXPORT_FORMATS:
+            raise ValueError('Cannot guess export format from "{}", please '
+                             'specify with -f or --format'.format(opts.output))
+        opts.format = ext
+    if opts.resume_after is not None and not os.path.exists(opts.output):
+        raise OSError('Cannot resume: output file "{}" does not exist'
+                      .format(opts.output))
+
+
+def export_storage(storage, opts):
+    """Streams the results from the permanent storage to the output file
+    chunk by chunk. Returns ``(exported_tasks_count, last_task_id)``."""
+    exporter_cls = {
+        'jsonl' : JSONLinesExporter,
+        'csv' : CSVExporter,
+        'npy' : NpyExporter,
+    }[opts.format]
+
+    resume = opts.resume_after is not None
+    count = 0
+    cursor = opts.resume_after
+    with exporter_cls(opts.output, resume) as exporter:
+        for chunk in storage.iter_chunks(opts.chunk_size,
+                                         after=opts.resume_after):
+            exporter.write_chunk(chunk)
+            count += len(chunk)
+            cursor = chunk[-1][0]
+    return count, cursor
+
+
+class Exporter(object, metaclass=ABCMeta):
+    """Base class for the results exporters. An exporter receives
+    ``[(task_id, [res1, res2, ...]), ...]`` chunks and writes them
+    to the output file.
+
+    :param path: output file path.
+    :param resume: if ``True``, the data is appended to the existing file.
+    """
+    binary = False
+
+    def __init__(self, path, resume=False):
+        self.resume = resume
+        mode = 'a' if resume else 'w'
+        if self.binary:
+            mode = 'r+b' if resume else 'wb'
+            self._f = open(path, mode)
+        else:
+            self._f = open(path, mode, newline='')
+
+    @abstractmethod
+    def write_chunk(self, chunk):
+        """Writes a ``[(task_id, [res1, res2, ...]), ...]`` chunk."""
+
+    def close(self):
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class JSONLinesExporter(Exporter):
+    """Writes a ``{"task_id": ..., "results": [...]}`` line per task."""
+    def write_chunk(self, chunk):
+        self._f.writelines(
+            json.dumps({'task_id' : task_id, 'results' : results},
+                       separators=(',', ':')) + '\n'
+            for task_id, results in chunk)
+
+
+class CSVExporter(Exporter):
+    """Writes a row per task result. Dict results are expanded to columns
+    (the column names are taken from the first exported result), list
+    results are expanded to ``result_0``, ``result_1``, ... columns."""
+    def __init__(self, path, resume=False):
+        super(CSVExporter, self).__init__(path, resume)
+        self._writer = csv.writer(self._f)
+        self._fields = None
+
+    def write_chunk(self, chunk):
+        for task_id, results in chunk:
+            for result in results:
+                if self._fields is None:
+                    self._fields = _result_fields(result)
+                    if not self.resume:
+                        self._writer.writerow(['task_id'] + self._fields)
+                self._writer.writerow([task_id] + self._row(result))
+
+    def _row(self, result):
+        if isinstance(result, dict):
+            return [result.get(field, '') for field in self._fields]
+        elif isinstance(result, (list, tuple)):
+            return list(result)
+        return [result]
+
+
+def _result_fields(result):
+    if isinstance(result, dict):
+        return sorted(result.keys())
+    elif isinstance(result, (list, tuple)):
+        return ['result_{}'.format(i) for i in range(len(result))]
+    return ['result']
+
+
+class NpyExporter(Exporter):
+    """Writes the numeric results to a 2-dimensional ``float64`` NumPy
+    ``.npy`` array, a row per task result. The header of the file is
+    re-written on :meth:`close`, thus no NumPy installation is required
+    and the data is never kept in memory as a whole.
+    """
+    binary = True
+
+    MAGIC = b'\x93NUMPY\x01\x00'
+    #: Total (magic + header) length. Leaves enough space for the
+    #: array shape to grow.
+    HEADER_LENGTH = 128
+    DTYPE = '<f8' if sys.byteorder == 'little' else '>f8'
+
+    def __init__(self, path, resume=False):
+        super(NpyExporter, self).__init__(path, resume)
+        self._rows = 0
+        self._width = None
+        if resume:
+            self._rows, self._width = self._read_shape()
+            self._f.seek(0, os.SEEK_END)
+        else:
+            self._write_header()
+
+    def write_chunk(self, chunk):
+        buf = array('d')
+        for task_id, results in chunk:
+            for result in results:
+                row = result if isinstance(result, (list, tuple)) else [result]
+                if self._width is None:
+                    self._width = len(row)
+                elif len(row) != self._width:
+                    raise ValueError('Result of task {} has {} column(s), '
+                                     '{} expected'.format(task_id, len(row),
+                                                          self._width))
+                buf.extend(float(val) for val in row)
+                self._rows += 1
+        self._f.write(buf.tobytes())
+
+    def close(self):
+        self._f.seek(0)
+        self._write_header()
+        super(NpyExporter, self).close()
+
+    def _write_header(self):
+        shape = (self._rows, self._width or 0)
+        header = "{{'descr': '{}', 'fortran_order': False, 'shape': {}, }}" \
+                 .format(self.DTYPE, shape)
+        pad_len = self.HEADER_LENGTH - len(self.MAGIC) - 2 - len(header) - 1
+        header = (header + ' ' * pad_len + '\n').encode('latin1')
+        self._f.write(self.MAGIC + struct.pack('<H', len(header)) + header)
+
+    def _read_shape(self):
+        magic = self._f.read(len(self.MAGIC))
+        if magic != self.MAGIC:
+            raise ValueError('The output file is not a Kaylee .npy export')
+        header_len = struct.unpack('<H', self._f.read(2))[0]
+        header = self._f.read(header_len).decode('latin1')
+        shape_str = header.split("'shape': (", 1)[1].split(')', 1)[0]
+        rows, width = (int(x) for x in shape_str.split(','))
+        return rows, (width or None)
@@ -0,0 +1,65 @@
+from __future__ import print_function
+from argparse import ArgumentTypeError
+from kaylee.server import profile
+from kaylee.manager import LocalCommand
+from .run import port_type, validate_settings_file, validate_build_dir
+
+
+def interval_type(val):
+    interval = float(val)
+    if interval <= 0:
+        raise ArgumentTypeError('The sampling interval must be positive.')
+    return interval
+
+
+def duration_type(val):
+    duration = float(val)
+    if duration <= 0:
+        raise ArgumentTypeError('The duration must be positive.')
+    return duration
+
+
+class ProfileCommand(LocalCommand):
+    name = 'profile'
+    help = ('Runs Kaylee development/testing server under the statistical '
+            'profiler')
+
+    args = {
+        ('-s', '--settings-file') : dict(default='settings.py'),
+        ('-b', '--build-dir') : dict(default='_build'),
+        ('-p', '--port') : dict(default='5000',
+                                type=port_type,
+                                help='Web server port number'),
+        ('-o', '--output') : dict(default='kaylee.folded',
+                                  help='The folded stack samples file'),
+        ('-i', '--interval') : dict(default=5.0,
+                                    type=interval_type,
+                                    help='Sampling interval in milliseconds'),
+        ('-d', '--duration') : dict(default=None,
+                                    type=duration_type,
+                                    help='Stop the server after the amount '
+                                         'of seconds (runs until Ctrl+C '
+                                         'by default)'),
+        '--include-idle' : dict(default=False,
+                                action='store_true',
+                                help='Keep the samples of the threads '
+                                     'waiting for I/O or a lock'),
+        '--debug' : dict(default=False,
+                         action='store_true',
+                         help='Debug ON'),
+    }
+
+    @staticmethod
+    def execute(opts):
+        validate_settings_file(opts)
+        validate_build_dir(opts)
+        print('Launching Kaylee development/testing server under the '
+              'profiler...')
+        sampler = profile(opts.settings_file, opts.build_dir, opts.output,
+                          opts.port, opts.interval / 1000.0, opts.duration,
+                          opts.include_idle, opts.debug)
+        print('{} stack samples ({} sampling rounds) have been saved to {}.\n'
+              'Render them via e.g. "flamegraph.pl {} > kaylee.svg" or '
+              'https://www.speedscope.app'
+              .format(sampler.samples, sampler.rounds, opts.output,
+                      opts.output))
@@ -16,6 +16,14 @@ def port_type(port):
         raise '{} is not a valid port'.format(port)
 
 
+def workers_type(val):
+    workers = int(val)
+    if workers < 1:
+        raise ArgumentTypeError('The amount of workers must be a positive '
+                                'integer.')
+    return workers
+
+
 class RunCommand(LocalCommand):
     name = 'run'
     help = 'Runs Kaylee development/testing server'
@@ -26,6 +34,11 @@ class RunCommand(LocalCommand):
         ('-p', '--port') : dict(default='5000',
                                 type=port_type,
                                 help='Web server port number'),
+        ('-w', '--workers') : dict(default=1,
+                                   type=workers_type,
+                                   help='Amount of worker processes. The '
+                                        'nodes and the tasks are sharded '
+                                        'among the workers (Unix only)'),
         '--debug' : dict(default=False,
                          action='store_true',
                          help='Debug ON'),
@@ -55,4 +68,5 @@ def validate_build_dir(opts):
 
 def run_dev_server(opts):
     print('Launching Kaylee development/testing server...')
-    run(opts.settings_file, opts.build_dir, opts.port, opts.debug)
+    run(opts.settings_file, opts.build_dir, opts.port, opts.debug,
+        opts.workers)
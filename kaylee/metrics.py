@@ -0,0 +1,366 @@
+# -*- coding: utf-8 -*-
+"""
+    kaylee.metrics
+    ~~~~~~~~~~~~~~
+
+    This module implements the run-time metrics (counters, gauges and
+    latency histograms) and their export in the Prometheus text
+    exposition format.
+
+    The hot path recording is lock-free: every thread updates its own
+    cell of a metric, and the cells are summed up only when the metrics
+    are collected. The values which are already maintained elsewhere
+    (e.g. the application :class:`Progress <kaylee.progress.Progress>`
+    counters or the nodes count) are read by the collectors on demand
+    and cost nothing until then.
+
+    :copyright: (c) 2013 by Zaur Nasibov.
+    :license: MIT, see LICENSE for more details.
+"""
+import math
+import weakref
+import threading
+from abc import ABCMeta, abstractmethod
+from bisect import bisect_left
+from threading import get_ident
+
+#: The Content-Type of the exposition.
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+#: The default latency histogram buckets (in seconds).
+DEFAULT_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005,
+                   0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0)
+
+
+class MetricFamily(object):
+    """The collected samples of a metric.
+
+    :param name: the metric name.
+    :param type: ``'counter'``, ``'gauge'`` or ``'histogram'``.
+    :param help: the metric description.
+    """
+    def __init__(self, name, type, help):
+        #pylint: disable-msg=W0622
+        #W0622: Redefining built-in 'type', 'help'
+        self.name = name
+        self.type = type
+        self.help = help
+        #: A list of ``(sample name, labels, value)`` tuples.
+        self.samples = []
+
+    def add(self, value, labels=(), suffix=''):
+        """Adds a sample.
+
+        :param labels: a sequence of ``(label name, label value)`` pairs.
+        """
+        self.samples.append((self.name + suffix, tuple(labels), value))
+        return self
+
+
+class _Metric(object, metaclass=ABCMeta):
+    type = None
+
+    def __init__(self, name, help, labelnames=()):
+        #pylint: disable-msg=W0622
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._children_lock = threading.Lock()
+        #: The child of an unlabelled metric.
+        self._default = None
+        if not self.labelnames:
+            self._default = self._children[()] = self._new_child()
+
+    def labels(self, *values, **kwargs):
+        """Returns the child metric of the label values. The children
+        should be bound once (e.g. at the module level) rather than
+        per recorded event."""
+        if kwargs:
+            values = tuple(kwargs[name] for name in self.labelnames)
+        values = tuple(str(val) for val in values)
+        if len(values) != len(self.labelnames):
+            raise ValueError('Metric {} expects labels {}'
+                             .format(self.name, self.labelnames))
+        try:
+            return self._children[values]
+        except KeyError:
+            with self._children_lock:
+                return self._children.setdefault(values, self._new_child())
+
+    def collect(self):
+        family = MetricFamily(self.name, self.type, self.help)
+        for values, child in list(self._children.items()):
+            child.collect_into(family, list(zip(self.labelnames, values)))
+        return family
+
+    @abstractmethod
+    def _new_child(self):
+        """Returns a new child (the value of a label values' set)."""
+
+
+class _Cells(object):
+    """Per-thread values summed up on read. Only the owner thread writes
+    to its cell, thus no locking is required."""
+    __slots__ = ('_cells', )
+
+    def __init__(self):
+        self._cells = {}
+
+    def add(self, amount):
+        try:
+            self._cells[get_ident()][0] += amount
+        except KeyError:
+            self._cells[get_ident()] = [amount]
+
+    def get(self):
+        return sum(cell[0] for cell in list(self._cells.values()))
+
+
+class _CounterChild(_Cells):
+    __slots__ = ()
+
+    def inc(self, amount=1):
+        if amount < 0:
+            raise ValueError('Counters can only be increased')
+        self.add(amount)
+
+    def collect_into(self, family, labels):
+        family.add(self.get(), labels, '_total')
+
+
+class Counter(_Metric):
+    """A monotonically increasing counter, e.g.::
+
+        errors = registry.counter('errors', 'The amount of errors')
+        errors.inc()
+    """
+    type = 'counter'
+
+    def __init__(self, name, help, labelnames=()):
+        #pylint: disable-msg=W0622
+        if name.endswith('_total'):
+            name = name[:-len('_total')]
+        super(Counter, self).__init__(name, help, labelnames)
+
+    _new_child = _CounterChild
+
+    def inc(self, amount=1):
+        self._default.inc(amount)
+
+    def get(self):
+        return self._default.get()
+
+
+class _GaugeChild(_Cells):
+    __slots__ = ('_base', )
+
+    def __init__(self):
+        super(_GaugeChild, self).__init__()
+        self._base = 0
+
+    def inc(self, amount=1):
+        self.add(amount)
+
+    def dec(self, amount=1):
+        self.add(-amount)
+
+    def set(self, value):
+        self._cells = {}
+        self._base = value
+
+    def get(self):
+        return self._base + super(_GaugeChild, self).get()
+
+    def collect_into(self, family, labels):
+        family.add(self.get(), labels)
+
+
+class Gauge(_Metric):
+    """A value which can go up and down."""
+    type = 'gauge'
+    _new_child = _GaugeChild
+
+    def inc(self, amount=1):
+        self._default.inc(amount)
+
+    def dec(self, amount=1):
+        self._default.dec(amount)
+
+    def set(self, value):
+        self._default.set(value)
+
+    def get(self):
+        return self._default.get()
+
+
+class _HistogramChild(object):
+    __slots__ = ('_bounds', '_cells')
+
+    def __init__(self, bounds):
+        self._bounds = bounds
+        self._cells = {}
+
+    def observe(self, value):
+        cell = self._cells.get(get_ident())
+        if cell is None:
+            # bucket counters, sum
+            cell = self._cells[get_ident()] = [0] * (len(self._bounds) + 1) \
+                + [0.0]
+        cell[bisect_left(self._bounds, value)] += 1
+        cell[-1] += value
+
+    def collect_into(self, family, labels):
+        nbuckets = len(self._bounds) + 1
+        totals = [0] * nbuckets
+        total_sum = 0.0
+        for cell in list(self._cells.values()):
+            for i in range(nbuckets):
+                totals[i] += cell[i]
+            total_sum += cell[-1]
+        cumulative = 0
+        for bound, count in zip(self._bounds + (math.inf, ), totals):
+            cumulative += count
+            family.add(cumulative, labels + [('le', bound)], '_bucket')
+        family.add(total_sum, labels, '_sum')
+        family.add(cumulative, labels, '_count')
+
+
+class Histogram(_Metric):
+    """A histogram of the observed values (usually the latencies in
+    seconds).
+
+    :param buckets: the sorted upper bounds of the buckets.
+    """
+    type = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        #pylint: disable-msg=W0622
+        self.buckets = tuple(sorted(buckets))
+        super(Histogram, self).__init__(name, help, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self._default.observe(value)
+
+
+class MetricsRegistry(object):
+    """A set of metrics and collectors exported together."""
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def counter(self, name, help, labelnames=()):
+        """Returns the counter (created if it does not exist yet)."""
+        #pylint: disable-msg=W0622
+        return self._get_or_create(Counter, name, help, labelnames)
+
+    def gauge(self, name, help, labelnames=()):
+        #pylint: disable-msg=W0622
+        return self._get_or_create(Gauge, name, help, labelnames)
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        #pylint: disable-msg=W0622
+        return self._get_or_create(Histogram, name, help, labelnames,
+                                   buckets=buckets)
+
+    def add_collector(self, collector):
+        """Adds a function which returns a list of :class:`MetricFamily`
+        objects on every collection. The bound methods are referenced
+        weakly, i.e. the collector is removed together with its object."""
+        if hasattr(collector, '__self__'):
+            ref = weakref.WeakMethod(collector)
+        else:
+            ref = lambda: collector
+        with self._lock:
+            self._collectors.append(ref)
+
+    def collect(self, *collectors):
+        """Returns a list of :class:`MetricFamily` objects. The families
+        of the same name returned by several collectors are merged.
+
+        :param collectors: the collectors used for this collection only
+                           (e.g. the collector of a :class:`Kaylee
+                           <kaylee.Kaylee>` instance, so that the
+                           instances do not export each other's values).
+        """
+        families = [metric.collect() for metric in
+                    sorted(self._metrics.values(), key=lambda m: m.name)]
+        merged = {}
+        with self._lock:
+            self._collectors = [ref for ref in self._collectors
+                                if ref() is not None]
+            collectors = [ref() for ref in self._collectors] + list(collectors)
+        for collector in collectors:
+            if collector is None:
+                continue
+            for family in collector():
+                if family.name in merged:
+                    merged[family.name].samples.extend(family.samples)
+                else:
+                    merged[family.name] = family
+                    families.append(family)
+        return families
+
+    def exposition(self, *collectors):
+        """Returns the metrics in the Prometheus text exposition format
+        (see :meth:`collect`)."""
+        lines = []
+        for family in self.collect(*collectors):
+            lines.append('# HELP {} {}'.format(family.name,
+                                               _escape_help(family.help)))
+            lines.append('# TYPE {} {}'.format(family.name, family.type))
+            for name, labels, value in family.samples:
+                if labels:
+                    name += '{' + ','.join(
+                        '{}="{}"'.format(lname, _escape_label(lvalue))
+                        for lname, lvalue in labels) + '}'
+                lines.append('{} {}'.format(name, _format_value(value)))
+        return '\n'.join(lines) + '\n'
+
+    def _get_or_create(self, cls, name, help, labelnames, **kwargs):
+        #pylint: disable-msg=W0622
+        with self._lock:
+            metric = cls(name, help, labelnames, **kwargs)
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                if (type(existing) is not cls or
+                        existing.labelnames != metric.labelnames):
+                    raise ValueError('Metric {} is already registered with '
+                                     'another type or labels'.format(name))
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+
+def _format_value(value):
+    if value is None:
+        return 'NaN'
+    if isinstance(value, bool):
+        return str(int(value))
+    if isinstance(value, float):
+        if math.isinf(value):
+            return '+Inf' if value > 0 else '-Inf'
+        if value.is_integer() and abs(value) < 1e15:
+            return str(int(value))
+        return repr(value)
+    return str(value)
+
+
+def _escape_label(value):
+    if isinstance(value, float):
+        return _format_value(value)
+    return (str(value).replace('\\', '\\\\').replace('\n', '\\n')
+            .replace('"', '\\"'))
+
+
+def _escape_help(text):
+    return text.replace('\\', '\\\\').replace('\n', '\\n')
+
+
+#: The global registry of the Kaylee metrics.
+registry = MetricsRegistry()
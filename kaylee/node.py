@@ -20,8 +20,9 @@ from datetime import datetime
 from abc import ABCMeta, abstractmethod
 
 from .errors import (warn, InvalidNodeIDError, NodeNotSubscribedError,
-                     ApplicationCompletedError)
-from .util import parse_timedelta
+                     ApplicationCompletedError, ApplicationRemovedError)
+from .util import parse_timedelta, LRUCache
+from .taskcache import CachedTask
 
 #: The hex string formatted NodeID regular expression pattern which
 #: can be used in e.g. web frameworks' URL dispatchers.
@@ -36,7 +37,11 @@ class Node(object):
                     :class:`NodeID`
     """
     # __slots__ = ('id', '_task_id', 'subscription_timestamp', 'task_timestamp',
-    #              'controller', 'errors_count', 'session_data')
+    #              'controller', 'errors_count')
+
+    #: The maximum amount of the data keys tracked by
+    #: :meth:`add_resident_data`.
+    RESIDENT_DATA_CAPACITY = 64
 
     def __init__(self, node_id):
         if not isinstance(node_id, NodeID):
@@ -49,8 +54,8 @@ class Node(object):
         self._subscription_timestamp = None
         self._task_timestamp = None
         self._controller = None
-        self._session_data = None
         self._task_id = None
+        self._resident_data = None
 
     def subscribe(self, controller):
         self._controller = controller
@@ -66,6 +71,7 @@ class Node(object):
         self._task_timestamp = None
         self._controller = None
         self._task_id = None
+        self._resident_data = None
         #: Indicates that one of the Node attributes (except ID) has been
         #: changed. ``Node.dirty`` has to be set to ``False`` manually.
         self.dirty = True
@@ -73,10 +79,13 @@ class Node(object):
     def get_task(self):
         if self.controller is None:
             raise NodeNotSubscribedError(self)
+        if self.controller.removed:
+            raise ApplicationRemovedError(self.controller)
         if self.controller.completed:
             raise ApplicationCompletedError(self.controller)
         task = self.controller.get_task(self)
-        task['id'] = str(task['id']).strip()
+        if not isinstance(task, CachedTask):
+            task['id'] = str(task['id']).strip()
         return task
 
     def accept_result(self, result):
@@ -86,22 +95,30 @@ class Node(object):
             raise ApplicationCompletedError(self.controller)
         self.controller.accept_result(self, result)
 
+    def add_resident_data(self, keys):
+        """Remembers the data keys (e.g. the blobs' keys) which have been
+        sent to the node recently. Only the last
+        :attr:`RESIDENT_DATA_CAPACITY` keys are kept."""
+        if self._resident_data is None:
+            self._resident_data = LRUCache(self.RESIDENT_DATA_CAPACITY)
+        for key in keys:
+            if key not in self._resident_data:
+                self.dirty = True
+            self._resident_data.put(key, True)
+
+    def has_resident_data(self, keys):
+        """Checks whether all the data keys have been recently sent to
+        the node."""
+        if self._resident_data is None:
+            return False
+        return all(key in self._resident_data for key in keys)
+
     @property
     def controller(self):
         """Application which communicates with the node.
         It is an instance of :class:`Controller`."""
         return self._controller
 
-    @property
-    def session_data(self):
-        """Binary session data (:class:`str`)"""
-        return self._session_data
-
-    @session_data.setter
-    def session_data(self, val):
-        self._session_data = val
-        self.dirty = True
-
     @property
     def task_id(self):
         """The ID of the task being solved by the node."""
@@ -211,13 +228,23 @@ class NodeID(object):
             nid += struct.pack(">i", NodeID._inc)[2:4]
             NodeID._inc = (NodeID._inc + 1) % 0xFFFF
         # 4 bytes host
+        nid += NodeID._host_hash(remote_host)
+        # 10 bytes total
+        self._id = nid
+
+    @staticmethod
+    def _host_hash(remote_host):
         #pylint: disable-msg=E1101
         #E1101: Instance of 'md5' has no 'update' member
         host_hash = hashlib.md5()
         host_hash.update(remote_host.encode('utf-8'))
-        nid += host_hash.digest()[0:4]
-        # 10 bytes total
-        self._id = nid
+        return host_hash.digest()[0:4]
+
+    @staticmethod
+    def host_id_of(remote_host):
+        """Returns the :attr:`host_id` of the NodeIDs generated for the
+        remote host."""
+        return binascii.hexlify(NodeID._host_hash(remote_host)).decode()
 
     def _parse(self, nid):
         if isinstance(nid, NodeID):
@@ -255,6 +282,13 @@ class NodeID(object):
         t = struct.unpack(">i", self._id[0:4])[0]
         return datetime.fromtimestamp(t)
 
+    @property
+    def host_id(self):
+        """The hex-formatted remote host identifier hash, shared by all
+        the NodeIDs generated for the same remote host
+        (see :meth:`host_id_of`)."""
+        return binascii.hexlify(self._id[6:10]).decode()
+
     def __str__(self):
         """Hex representation of the NodeID"""
         return binascii.hexlify(self._id).decode()
@@ -327,7 +361,11 @@ class NodesRegistry(object, metaclass=ABCMeta):
 
     @abstractmethod
     def clean(self):
-        """Removes the obsolete nodes from the storage."""
+        """Removes the obsolete nodes from the storage.
+
+        :returns: a list of the removed nodes (:class:`Node` objects), so
+                  that their session data can be discarded.
+        """
 
     @abstractmethod
     def __len__(self):
@@ -351,6 +389,14 @@ class NodesRegistry(object, metaclass=ABCMeta):
         :param node: an instance of :class:`Node` or a valid node id.
         """
 
+    def hosts(self):
+        """Returns the amounts of the registered nodes per remote host as
+        a ``{host id : count}`` dict (see :attr:`NodeID.host_id`) or
+        ``None`` if the registry does not track the hosts. The counts
+        should be maintained incrementally, as the method is polled by
+        the admin API (see :mod:`kaylee.admin`)."""
+        return None
+
 def extract_node_id(node_or_node_id):
     """Extracts or constructs NodeID from the given object.
 
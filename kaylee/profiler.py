@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""
+    kaylee.profiler
+    ~~~~~~~~~~~~~~~
+
+    A statistical (sampling) profiler: a background thread periodically
+    samples the Python stacks of the other threads of the process. The
+    samples are aggregated in the "folded stacks" format (one
+    ``frame;frame;...;frame count`` line per unique stack, the outermost
+    frame first), which is consumed by the flame graph tools, e.g.
+    ``flamegraph.pl`` or https://www.speedscope.app.
+
+    Unlike the deterministic profilers (:mod:`cProfile`), the sampler
+    does not slow down the profiled code, thus it can be attached to
+    a server under load (see the ``kaylee profile`` command).
+
+    :copyright: (c) 2013 by Zaur Nasibov.
+    :license: MIT, see LICENSE for more details.
+"""
+import os
+import sys
+import time
+import threading
+from collections import Counter
+
+#: The ``(file name, function name)`` pairs of the innermost frames of
+#: the threads which are waiting for I/O or a lock.
+IDLE_FRAMES = frozenset([
+    ('selectors.py', 'select'),
+    ('selectors.py', 'poll'),
+    ('socket.py', 'accept'),
+    ('socket.py', 'readinto'),
+    ('socketserver.py', 'serve_forever'),
+    ('threading.py', 'wait'),
+    ('threading.py', '_wait_for_tstate_lock'),
+    ('queue.py', 'get'),
+])
+
+
+class StackSampler(object):
+    """Samples the stacks of all the threads (except its own one) every
+    ``interval`` seconds. The sampler is a context manager::
+
+        with StackSampler() as sampler:
+            serve()
+        sampler.save('kaylee.folded')
+
+    :param interval: the sampling interval in seconds.
+    :param include_idle: keep the samples of the threads which are
+                         waiting for I/O or a lock (see
+                         :data:`IDLE_FRAMES`).
+    """
+    def __init__(self, interval=0.005, include_idle=False):
+        self.interval = interval
+        self.include_idle = include_idle
+        #: A ``{stack : count}`` counter, a stack is a tuple of frame
+        #: labels, the outermost frame first.
+        self.stacks = Counter()
+        #: The amount of the sampling rounds.
+        self.rounds = 0
+        self._stop = threading.Event()
+        self._thread = None
+        self._labels = {}
+
+    def start(self):
+        if self._thread is not None:
+            raise RuntimeError('The sampler is already running')
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run,
+                                        name='kaylee-stack-sampler')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.stop()
+        return False
+
+    def sample(self):
+        """Takes a sample of the other threads' stacks."""
+        own_id = threading.get_ident()
+        stacks = self.stacks
+        for thread_id, frame in sys._current_frames().items():
+            #pylint: disable-msg=W0212
+            if thread_id == own_id:
+                continue
+            code = frame.f_code
+            if (not self.include_idle and
+                    (os.path.basename(code.co_filename), code.co_name)
+                    in IDLE_FRAMES):
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(self._label(frame.f_code))
+                frame = frame.f_back
+            stack.reverse()
+            stacks[tuple(stack)] += 1
+        self.rounds += 1
+
+    @property
+    def samples(self):
+        """The total amount of the collected stack samples."""
+        return sum(self.stacks.values())
+
+    def folded(self):
+        """Returns the list of the folded stack lines, the most frequent
+        stacks first."""
+        return ['{} {}'.format(';'.join(stack), count)
+                for stack, count in self.stacks.most_common()]
+
+    def save(self, path):
+        """Writes the folded stacks to a file."""
+        with open(path, 'w') as f:
+            for line in self.folded():
+                f.write(line + '\n')
+
+    def _run(self):
+        interval = self.interval
+        while not self._stop.is_set():
+            start = time.perf_counter()
+            self.sample()
+            # keep the sampling rate regardless of the sampling cost
+            self._stop.wait(max(0.0, interval -
+                                (time.perf_counter() - start)))
+
+    def _label(self, code):
+        try:
+            return self._labels[code]
+        except KeyError:
+            # e.g. "get_action (core.py:265)"; ";" separates the frames
+            label = '{} ({}:{})'.format(
+                code.co_name, os.path.basename(code.co_filename),
+                code.co_firstlineno).replace(';', ':')
+            self._labels[code] = label
+            return label
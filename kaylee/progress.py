@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""
+    kaylee.progress
+    ~~~~~~~~~~~~~~~
+
+    This module provides the application progress counters.
+
+    :copyright: (c) 2013 by Zaur Nasibov.
+    :license: MIT, see LICENSE for more details.
+"""
+import time
+import threading
+
+
+class Progress(object):
+    """Incrementally maintained progress counters of a Kaylee application.
+    The counters are updated by the bound controller and can be read
+    from any thread at no cost.
+
+    :param total: the total amount of tasks or ``None`` if unknown.
+    :param smoothing: the smoothing factor (0 < smoothing <= 1) of the
+                      exponentially weighted moving average of the
+                      throughput :attr:`rate`.
+    :param interval: the minimal time span (in seconds) between the
+                     throughput rate samples.
+    :param clock: a function returning the current time in seconds.
+    """
+    def __init__(self, total=None, smoothing=0.3, interval=1.0,
+                 clock=time.monotonic):
+        if not 0 < smoothing <= 1:
+            raise ValueError('Smoothing factor must be in (0, 1] range, not {}'
+                             .format(smoothing))
+        #: The total amount of tasks (``None`` if unknown).
+        self.total = total
+        #: The amount of new tasks generated by the project.
+        self.generated = 0
+        #: The amount of tasks dispatched to the nodes (including the
+        #: repeatedly dispatched tasks).
+        self.leased = 0
+        #: The amount of tasks with accepted results (or ``NO_SOLUTION``).
+        self.accepted = 0
+        #: The amount of rejected results.
+        self.rejected = 0
+        #: Indicates that the project will generate no more new tasks.
+        self.depleted = False
+
+        self.smoothing = smoothing
+        self.interval = interval
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._rate = None
+        self._sample_time = clock()
+        self._sample_accepted = 0
+
+    def task_generated(self):
+        with self._lock:
+            self.generated += 1
+
+    def task_leased(self):
+        with self._lock:
+            self.leased += 1
+
+    def result_accepted(self):
+        with self._lock:
+            self.accepted += 1
+            self._update_rate()
+
+    def result_rejected(self):
+        with self._lock:
+            self.rejected += 1
+            self._update_rate()
+
+    @property
+    def outstanding(self):
+        """The amount of generated, but not yet accepted tasks."""
+        return self.generated - self.accepted
+
+    @property
+    def rate(self):
+        """Smoothed throughput: accepted tasks per second. The rate is
+        re-calculated as the results are accepted or rejected and when it
+        is read, thus it decays while no results are accepted (e.g. while
+        the results are rejected or dropped as duplicates)."""
+        with self._lock:
+            self._update_rate()
+            return self._rate or 0.0
+
+    @property
+    def eta(self):
+        """Estimated time (in seconds) left to complete the application or
+        ``None`` if the total amount of tasks or the rate is unknown."""
+        with self._lock:
+            self._update_rate()
+            return self._eta()
+
+    @property
+    def completed(self):
+        """``True`` if all tasks have been accepted, i.e. either the total
+        amount of tasks is reached or the project is depleted and there
+        are no outstanding tasks."""
+        if self.total is not None and self.accepted >= self.total:
+            return True
+        return self.depleted and self.outstanding <= 0
+
+    def as_dict(self):
+        """Returns a consistent snapshot of the counters."""
+        with self._lock:
+            self._update_rate()
+            return {
+                'total' : self.total,
+                'generated' : self.generated,
+                'leased' : self.leased,
+                'accepted' : self.accepted,
+                'rejected' : self.rejected,
+                'outstanding' : self.outstanding,
+                'rate' : self._rate or 0.0,
+                'eta' : self._eta(),
+            }
+
+    def _eta(self):
+        rate = self._rate
+        if self.total is None or not rate:
+            return None
+        return max(self.total - self.accepted, 0) / rate
+
+    def _update_rate(self):
+        # is called with the lock acquired
+        now = self._clock()
+        elapsed = now - self._sample_time
+        if elapsed < self.interval:
+            return
+        rate = (self.accepted - self._sample_accepted) / elapsed
+        if self._rate is None:
+            self._rate = rate
+        else:
+            self._rate += self.smoothing * (rate - self._rate)
+        self._sample_time = now
+        self._sample_accepted = self.accepted
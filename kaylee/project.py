@@ -10,6 +10,8 @@
 """
 
 from abc import ABCMeta, abstractmethod
+from .progress import Progress
+from .blobs import BlobStore
 
 
 #: Defines auto project mode (see :attr:`Project.mode`)
@@ -26,6 +28,10 @@ KL_PROJECT_MODE = '__kl_project_mode__'
 KL_PROJECT_SCRIPT_URL = '__kl_project_script_url__'
 KL_PROJECT_STYLES = '__kl_project_styles__'
 
+#: The task key which contains a list of the blobs' keys referenced by
+#: the task (see :meth:`Project.add_blob`).
+KL_TASK_BLOBS = '__kl_blobs__'
+
 
 
 class Project(object, metaclass=ABCMeta):
@@ -35,6 +41,16 @@ class Project(object, metaclass=ABCMeta):
     :param mode: defines :attr:`Project.mode <kaylee.Project.mode>`.
     """
 
+    #: The session keys schema: a list of session variable names
+    #: (e.g. ``['#s1', '#s2']``) which the project's tasks may contain.
+    #: If defined, the session data manager looks up the listed keys only
+    #: instead of scanning every key of the task. An empty list indicates
+    #: that the tasks contain no session data, so that the session data
+    #: manager is not invoked at all. ``None`` (default) means that the
+    #: schema is unknown. The schema is validated when the project
+    #: is bound to a controller.
+    session_keys = None
+
     def __init__(self, script_url, mode, **kwargs):
         if mode not in [AUTO_PROJECT_MODE, MANUAL_PROJECT_MODE]:
             raise ValueError('Wrong project mode: {}'.format(mode))
@@ -66,6 +82,44 @@ class Project(object, metaclass=ABCMeta):
         #: Indicates whether the project was completed.
         self.completed = False
 
+        #: Progress counters (:class:`Progress <kaylee.progress.Progress>`)
+        #: maintained by the bound controller.
+        self.progress = Progress()
+
+        #: The project's immutable data blobs
+        #: (:class:`BlobStore <kaylee.blobs.BlobStore>`).
+        self.blobs = BlobStore()
+
+    def add_blob(self, data, content_type=None):
+        """Registers an immutable data blob shared among the tasks and
+        returns its key (the SHA-256 hash of the content). A task refers
+        to the blobs via the :data:`KL_TASK_BLOBS` key::
+
+          table_key = self.add_blob(lookup_table)
+          ...
+          task = {
+              'id' : '10',
+              KL_TASK_BLOBS : [table_key],
+          }
+
+        The client fetches and caches every blob only once before
+        processing the first task which refers to it. The blob data is
+        available to the client-side of the project via
+        :js:func:`kl.blob(key) <kl.blob>`.
+
+        :param data: ``bytes``, ``str`` or a JSON-serializable object.
+        :param content_type: the blob MIME type (guessed from the ``data``
+                             type by default).
+        """
+        return self.blobs.add(data, content_type)
+
+    @property
+    def total_tasks(self):
+        """The total amount of tasks or ``None`` if the project is not able
+        to calculate it (default). Used to calculate the progress and
+        the ETA of the application."""
+        return None
+
     @abstractmethod
     def next_task(self):
         """Returns the next task. The returned ``None`` value indicates that
@@ -86,6 +140,10 @@ class Project(object, metaclass=ABCMeta):
               # etc.
           }
 
+        :param task_id: the task ID normalized by the controller to
+                        a stripped string (see :meth:`Controller.task_id_of
+                        <kaylee.Controller.task_id_of>`), e.g. ``'10'``
+                        for a task generated with the ``10`` ID.
         :rtype: :class:`dict`
         """
 
@@ -93,7 +151,7 @@ class Project(object, metaclass=ABCMeta):
     def normalize_result(self, task_id, result):
         """Validates and normalizes the result.
 
-        :param task_id: The ID of the task.
+        :param task_id: The (normalized) ID of the task.
         :param result: The result to be validated and normalized.
         :throws ValueError: If the data is invalid.
         :return: normalized result.
@@ -109,14 +167,3 @@ class Project(object, metaclass=ABCMeta):
         :type storage: :class:`PermanentStorage`
         """
         pass
-
-    # @abstractproperty
-    # def progress(self):
-    #     """A tuple of 2 items indicating progress:
-    #     ``(amount_of_tasks_completed, total_amount_of_tasks)``
-
-    #     A negative (:data:`UNKNOWN_AMOUNT`) value of the second item in
-    #     the tuple indicates that the project is not able to calculate the
-    #     total amount of tasks.
-    #     """
-    #     pass
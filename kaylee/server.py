@@ -1,35 +1,56 @@
 # -*- coding: utf-8 -*-
 import os
+import re
+import json
+import time
+import socket
+import selectors
+import posixpath
+import mimetypes
+import signal
+import itertools
+import threading
+import multiprocessing
 
 from werkzeug.wrappers import Request, Response
 from werkzeug.exceptions import HTTPException
-from werkzeug.wsgi import SharedDataMiddleware
-from werkzeug.routing import Rule
-from werkzeug.serving import run_simple
+from werkzeug.routing import Map, Rule
+from werkzeug.serving import run_simple, make_server, WSGIRequestHandler
 
 import kaylee
-from kaylee.contrib.frontends.werkzeug_frontend import make_url_map
+from kaylee.errors import KayleeError
+from kaylee.blobs import BLOB_CACHE_CONTROL
+from kaylee.compression import negotiate_encoding
+from kaylee.project import KL_PROJECT_SCRIPT_URL, KL_PROJECT_STYLES
+from kaylee.shard import Shard, shard_index
+from kaylee.contrib.frontends.wsgi_frontend import make_wsgi_app
 from kaylee.util import setup_logging
+from kaylee.profiler import StackSampler
+from kaylee.assets import (load_assets_manifest, hashed_name_re,
+                           PRECOMPRESSED_EXTENSIONS)
 
 import logging
 log = logging.getLogger(__name__)
 
-url_map = make_url_map(url_prefix='/kaylee')
+#: Matches the node ID segment of a request line, e.g.
+#: ``GET /kaylee/actions/<node_id> HTTP/1.1``.
+node_id_request_re = re.compile(rb'^[A-Z]+ \S*/([0-9a-fA-F]{20})(?:[/?# ]|$)')
 
-@Request.application
-def application(request):
-    adapter = url_map.bind_to_environ(request.environ)
-    try:
-        endpoint, values = adapter.match()
-        return endpoint(request, **values)
-    except HTTPException as e:
-        return e
 
+def make_application(static_dir):
+    """Returns the Kaylee WSGI application which serves the Kaylee
+    front-end at ``/kaylee`` (see :class:`KayleeWSGIApplication
+    <kaylee.contrib.frontends.wsgi_frontend.KayleeWSGIApplication>`),
+    the static files at ``/static`` (see :class:`StaticFiles`) and the
+    ``index.html`` at ``/``.
 
-def run(settings_file, static_dir, port=5000, debug=False):
-    loglevel = logging.DEBUG if debug else logging.INFO
-    setup_logging(loglevel)
-    kaylee.setup(settings_file)
+    If the build directory contains the bundled assets, the applications'
+    project script and stylesheet URLs are replaced by the bundles' URLs.
+    """
+    assets = load_assets_manifest(static_dir)
+    if assets:
+        use_bundled_assets(kaylee.kl, assets)
+    url_map = Map()
 
     # index.html at 'http://server.address/' URL
     with open(os.path.join(static_dir, 'index.html')) as f:
@@ -41,11 +62,412 @@ def run(settings_file, static_dir, port=5000, debug=False):
     home_rule = Rule('/', methods=['GET'], endpoint=_home)
     url_map.add(home_rule)
 
+    @Request.application
+    def application(request):
+        adapter = url_map.bind_to_environ(request.environ)
+        try:
+            endpoint, values = adapter.match()
+            return endpoint(request, **values)
+        except HTTPException as e:
+            return e
+
     log.debug(static_dir)
-    # add static data middleware and start the server
-    app = SharedDataMiddleware(application,
-                               {'/static': static_dir })
+    # add static data middleware
+    static_app = StaticFiles(static_dir, '/static', fallback=application)
+    return make_wsgi_app(url_prefix='/kaylee', fallback=static_app)
+
+
+def use_bundled_assets(kl, assets, static_url='/static/'):
+    """Replaces the applications' project script and stylesheet URLs
+    (``/static/<path>``) by the URLs of the bundles which contain them.
+
+    :param assets: the assets manifest (see
+                   :func:`kaylee.assets.bundle_assets`).
+    """
+    for app in kl.applications:
+        config = app.project.client_config
+        for key in (KL_PROJECT_SCRIPT_URL, KL_PROJECT_STYLES):
+            url = config.get(key)
+            if not url or not url.startswith(static_url):
+                continue
+            bundle = assets.get(url[len(static_url):])
+            if bundle is not None:
+                config[key] = static_url + bundle
+
+
+class StaticFiles(object):
+    """A WSGI application which serves the static files of the build
+    directory.
+
+    * The content-hashed bundles (see
+      :func:`kaylee.assets.bundle_assets`) are immutable,
+      thus they are served with the far-future ``Cache-Control`` header.
+      The other files are revalidated by the browsers via ``ETag``.
+    * If the client accepts ``gzip`` and the precompressed ``<file>.gz``
+      sibling exists, the sibling is served.
+
+    :param static_dir: the static files directory.
+    :param url_prefix: the URL prefix of the static files.
+    :param fallback: the WSGI application which serves the other URLs.
+    """
+    def __init__(self, static_dir, url_prefix='/static', fallback=None):
+        self.static_dir = os.path.abspath(static_dir)
+        self.url_prefix = url_prefix.rstrip('/') + '/'
+        self.fallback = fallback
+
+    def __call__(self, environ, start_response):
+        path = environ.get('PATH_INFO', '')
+        if not path.startswith(self.url_prefix):
+            return self._fallback(environ, start_response)
+        fpath = self._resolve(path[len(self.url_prefix):])
+        if fpath is None or environ['REQUEST_METHOD'] not in ('GET', 'HEAD'):
+            return self._fallback(environ, start_response)
+
+        headers = [('Content-Type', _guess_type(fpath))]
+        if hashed_name_re.search(fpath):
+            headers.append(('Cache-Control', BLOB_CACHE_CONTROL))
+        else:
+            headers.append(('Cache-Control', 'no-cache'))
+        compressible = fpath.endswith(PRECOMPRESSED_EXTENSIONS)
+        if compressible:
+            headers.append(('Vary', 'Accept-Encoding'))
+            if negotiate_encoding(environ.get('HTTP_ACCEPT_ENCODING')) \
+                    == 'gzip' and os.path.isfile(fpath + '.gz'):
+                fpath += '.gz'
+                headers.append(('Content-Encoding', 'gzip'))
+
+        st = os.stat(fpath)
+        etag = '"{:x}-{:x}"'.format(st.st_mtime_ns, st.st_size)
+        headers.append(('ETag', etag))
+        inm = environ.get('HTTP_IF_NONE_MATCH')
+        if inm and (inm.strip() == '*' or
+                    etag in [tag.strip() for tag in inm.split(',')]):
+            start_response('304 Not Modified', headers[1:])
+            return []
 
+        headers.append(('Content-Length', str(st.st_size)))
+        start_response('200 OK', headers)
+        if environ['REQUEST_METHOD'] == 'HEAD':
+            return []
+        f = open(fpath, 'rb')
+        file_wrapper = environ.get('wsgi.file_wrapper')
+        if file_wrapper is not None:
+            return file_wrapper(f, 65536)
+        return _iter_file(f)
+
+    def _resolve(self, rel_path):
+        rel_path = posixpath.normpath('/' + rel_path).lstrip('/')
+        if not rel_path or rel_path.endswith('.gz'):
+            return None
+        fpath = os.path.join(self.static_dir, *rel_path.split('/'))
+        return fpath if os.path.isfile(fpath) else None
+
+    def _fallback(self, environ, start_response):
+        if self.fallback is not None:
+            return self.fallback(environ, start_response)
+        body = b'Not found'
+        start_response('404 Not Found', [('Content-Type', 'text/plain'),
+                                         ('Content-Length', str(len(body)))])
+        return [body]
+
+
+def _guess_type(fpath):
+    mimetype = mimetypes.guess_type(fpath)[0] or 'application/octet-stream'
+    if mimetype.startswith('text/') or mimetype == 'application/javascript':
+        mimetype += '; charset=utf-8'
+    return mimetype
+
+
+def _iter_file(f, chunk_size=65536):
+    with f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            yield chunk
+
+
+def run(settings_file, static_dir, port=5000, debug=False, workers=1):
+    """Runs the Kaylee development/testing server.
+
+    :param workers: the amount of worker processes. If more than one,
+                    the nodes and the applications' tasks are sharded
+                    among the workers (see :func:`run_workers`).
+    """
+    loglevel = logging.DEBUG if debug else logging.INFO
+    setup_logging(loglevel)
+    if workers > 1:
+        return run_workers(settings_file, static_dir, port, workers)
+
+    kaylee.setup(settings_file)
+    app = make_application(static_dir)
     run_simple('127.0.0.1', port, app, use_debugger=True,
                use_reloader=False)
 
+
+def profile(settings_file, static_dir, output, port=5000, interval=0.005,
+            duration=None, include_idle=False, debug=False):
+    """Runs the Kaylee development/testing server (multi-threaded) under
+    the statistical profiler (see :class:`kaylee.profiler.StackSampler`)
+    until it is interrupted or ``duration`` seconds have passed, and saves
+    the folded stack samples to the ``output`` file.
+
+    :returns: the sampler.
+    """
+    loglevel = logging.DEBUG if debug else logging.INFO
+    setup_logging(loglevel)
+    kaylee.setup(settings_file)
+    app = make_application(static_dir)
+    server = make_server('127.0.0.1', port, app, threaded=True)
+    timer = None
+    if duration:
+        timer = threading.Timer(duration, server.shutdown)
+        timer.daemon = True
+        timer.start()
+    log.info('Kaylee is serving on http://127.0.0.1:{}/ under the profiler'
+             .format(server.server_port))
+    with StackSampler(interval, include_idle) as sampler:
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if timer is not None:
+                timer.cancel()
+            server.server_close()
+    sampler.save(output)
+    return sampler
+
+
+def run_workers(settings_file, static_dir, port, workers, host='127.0.0.1'):
+    """Runs a multi-process Kaylee server (Unix only).
+
+    Every worker process loads its own Kaylee instance, which owns
+    a :class:`Shard <kaylee.shard.Shard>` of the nodes and of the tasks.
+    The main process accepts the connections and hands every connection
+    over (as a file descriptor) to the worker which owns the node
+    referred to by the request URL. The requests which do not refer to
+    a node (e.g. node registration or static files) are distributed
+    round-robin.
+
+    .. note:: The applications' tasks are partitioned by task ID hash,
+              i.e. every worker iterates over the whole project and
+              dispatches only its own tasks. The projects have to
+              generate the same task IDs in every process. The permanent
+              storages are not shared (unless they are external, e.g.
+              a database or the file system).
+
+    .. note:: The ``/metrics`` and ``/admin`` endpoints report the state
+              of the worker which has received the request only.
+    """
+    if not hasattr(socket, 'send_fds'):
+        raise KayleeError('Multi-process serving requires a Unix platform '
+                          'with Python 3.9+')
+    router = ShardRouter(host, port, workers)
+    ctx = multiprocessing.get_context('fork')
+    processes = []
+    for index in range(workers):
+        channel = router.add_worker()
+        proc = ctx.Process(target=_worker_main,
+                           args=(index, workers, router, channel,
+                                 settings_file, static_dir),
+                           name='kaylee-worker-{}'.format(index))
+        proc.daemon = True
+        proc.start()
+        channel.close()
+        processes.append(proc)
+    log.info('Kaylee is serving on http://{}:{}/ with {} workers'
+             .format(host, port, workers))
+    try:
+        router.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        router.close()
+        for proc in processes:
+            proc.terminate()
+            proc.join()
+
+
+class ShardRouter(object):
+    """Accepts the connections and hands them over to the worker
+    processes. The request line is peeked (not consumed), so that the
+    worker receives the connection intact.
+
+    The connections are multiplexed by a selector: a client which is
+    slow to send its request line does not hold up the other clients.
+    A connection is handed over (round-robin) with whatever has been
+    received if the request line does not arrive in ``peek_timeout``
+    seconds.
+
+    .. note:: The workers close a connection after a single request
+              (see :class:`ShardWorkerRequestHandler`), thus every
+              request is routed independently.
+
+    :param host: the listening address.
+    :param port: the listening port.
+    :param workers: the amount of the worker processes.
+    :param peek_timeout: the maximum time (in seconds) spent waiting
+                         for the request line.
+    """
+    PEEK_SIZE = 2048
+    #: The interval (in seconds) of re-peeking the connections whose
+    #: request line has been received partially.
+    POLL_INTERVAL = 0.005
+
+    def __init__(self, host, port, workers, peek_timeout=1.0):
+        self.workers = workers
+        self.peek_timeout = peek_timeout
+        self._channels = []
+        self._next_worker = itertools.cycle(range(workers))
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._sock.bind((host, port))
+        self._sock.listen(1024)
+        self._sock.setblocking(False)
+        self._shutdown = threading.Event()
+
+    @property
+    def address(self):
+        return self._sock.getsockname()
+
+    def add_worker(self):
+        """Creates the connection hand-over channel of the next worker and
+        returns the worker's end of the channel."""
+        router_end, worker_end = socket.socketpair(socket.AF_UNIX,
+                                                   socket.SOCK_DGRAM)
+        self._channels.append(router_end)
+        return worker_end
+
+    def route(self, request_line):
+        """Returns the index of the worker which serves the request."""
+        match = node_id_request_re.match(request_line)
+        if match is not None:
+            return shard_index(bytes.fromhex(match.group(1).decode()),
+                               self.workers)
+        return next(self._next_worker)
+
+    def serve_forever(self):
+        """Routes the connections until :meth:`shutdown` is called."""
+        selector = selectors.DefaultSelector()
+        selector.register(self._sock, selectors.EVENT_READ)
+        # the connections which wait for the request line:
+        # conn -> [address, deadline, peeked data, selected]
+        pending = {}
+        try:
+            while not self._shutdown.is_set():
+                # the connections with a partial request line stay
+                # readable, thus they are re-peeked periodically instead
+                # of being selected
+                partial = [conn for conn, state in pending.items()
+                           if not state[3]]
+                timeout = self.POLL_INTERVAL if partial else 0.5
+                for key, _ in selector.select(timeout):
+                    if key.fileobj is self._sock:
+                        self._accept(selector, pending)
+                    elif key.fileobj in pending:
+                        self._peek(selector, pending, key.fileobj)
+                for conn in partial:
+                    if conn in pending:
+                        self._peek(selector, pending, conn)
+                now = time.monotonic()
+                for conn in [conn for conn, state in pending.items()
+                             if state[1] <= now]:
+                    self._hand_over(selector, pending, conn)
+        finally:
+            for conn in pending:
+                conn.close()
+            selector.close()
+
+    def shutdown(self):
+        """Stops :meth:`serve_forever` (called from another thread)."""
+        self._shutdown.set()
+
+    def _accept(self, selector, pending):
+        while True:
+            try:
+                conn, addr = self._sock.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            conn.setblocking(False)
+            pending[conn] = [addr, time.monotonic() + self.peek_timeout,
+                             b'', True]
+            selector.register(conn, selectors.EVENT_READ)
+
+    def _peek(self, selector, pending, conn):
+        state = pending[conn]
+        try:
+            data = conn.recv(self.PEEK_SIZE, socket.MSG_PEEK)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            data = b''
+        if not data:
+            # the connection has been closed by the client
+            self._discard(selector, pending, conn)
+        elif b'\n' in data or len(data) >= self.PEEK_SIZE:
+            state[2] = data
+            self._hand_over(selector, pending, conn)
+        else:
+            state[2] = data
+            if state[3]:
+                # a partial request line: the connection is re-peeked
+                # by the polling loop from now on
+                state[3] = False
+                selector.unregister(conn)
+
+    def _hand_over(self, selector, pending, conn):
+        addr, _, data, _ = pending[conn]
+        self._discard(selector, pending, conn, close=False)
+        try:
+            index = self.route(data.split(b'\r\n', 1)[0])
+            peer = json.dumps(addr[:2]).encode()
+            # the worker receives the same (blocking) file description
+            conn.setblocking(True)
+            socket.send_fds(self._channels[index], [peer], [conn.fileno()])
+        except OSError as e:
+            log.warning('Unable to route connection from {}: {}'
+                        .format(addr, e))
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _discard(selector, pending, conn, close=True):
+        if pending.pop(conn)[3]:
+            selector.unregister(conn)
+        if close:
+            conn.close()
+
+    def close(self):
+        self._sock.close()
+        for channel in self._channels:
+            channel.close()
+
+
+class ShardWorkerRequestHandler(WSGIRequestHandler):
+    """The request handler of the worker processes. The connections are
+    routed once, when accepted by :class:`ShardRouter`, thus a kept-alive
+    connection could carry the requests of the nodes owned by other
+    workers. The handler speaks HTTP/1.0 (the threaded Werkzeug servers
+    default to HTTP/1.1 with keep-alive), i.e. a connection is closed
+    after a single request.
+    """
+    protocol_version = 'HTTP/1.0'
+
+
+def _worker_main(index, count, router, channel, settings_file, static_dir):
+    # the main process handles the interruption
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # release the router's sockets inherited from the main process
+    router.close()
+    kaylee.setup(settings_file)
+    kaylee.kl.shard = Shard(index, count)
+    app = make_application(static_dir)
+    server = make_server('127.0.0.1', 0, app, threaded=True,
+                         request_handler=ShardWorkerRequestHandler)
+    server.socket.close()
+    log.info('Kaylee worker {} (pid {}) has started'.format(index,
+                                                            os.getpid()))
+    while True:
+        msg, fds, _flags, _addr = socket.recv_fds(channel, 1024, 1)
+        if not fds:
+            continue
+        conn = socket.socket(fileno=fds[0])
+        server.process_request(conn, tuple(json.loads(msg.decode())))
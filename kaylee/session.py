@@ -12,18 +12,25 @@
 #Pylint false alarm of missing hashlib functions
 #pylint: disable-msg=E0611
 
+import os
+import sys
+import time
+import zlib
+import struct
+import threading
 import random
 import pickle
 import string
-import re
+from array import array
 from base64 import b64encode, b64decode
-from hmac import new as hmac
+from hmac import new as hmac, compare_digest
 from hashlib import sha1, sha256
-from Crypto.Cipher import AES
 from abc import ABCMeta, abstractmethod
 
-from .util import random_string
+from .node import NodeID
+from .util import random_string, parse_timedelta, ensure_dir, LRUCache
 from .errors import KayleeError, SessionKeyNameError
+from . import tracing
 
 
 SESSION_DATA_ATTRIBUTE = '__kl_session_data__'
@@ -33,7 +40,18 @@ class SessionDataManager(object, metaclass=ABCMeta):
     """The abstract base class representing Session data manager
     interface.
 
+    :param serializer: the session data serializer: ``'binary'`` (default),
+                       ``'pickle'`` or an instance of
+                       :class:`SessionDataSerializer`.
+    :param compression_threshold: the size (in bytes) of the serialized
+                                  session data starting from which the
+                                  :class:`BinarySerializer` compresses
+                                  the data. ``None`` disables compression.
     """
+    def __init__(self, serializer='binary', compression_threshold=1024):
+        #: Session data serializer (:class:`SessionDataSerializer`).
+        self.serializer = get_serializer(serializer, compression_threshold)
+
     @abstractmethod
     def store(self, node, task):
         """Stores the session variables found in task and then  removes
@@ -70,30 +88,79 @@ class SessionDataManager(object, metaclass=ABCMeta):
         :type result: dict
         """
 
+    def discard(self, node):
+        """Discards the session data stored for the node, e.g. when the
+        node is unregistered or unsubscribed. Does nothing by default."""
+
+    def clean(self):
+        """Removes the obsolete session data. Invoked by
+        :meth:`Kaylee.clean`. Does nothing by default."""
+
     @staticmethod
     def get_session_data(task):
         """Returns a dict with session variables found in task."""
-        # data keys regular expression
-        try:
-            key_reo = _encrypt.key_reo
-        except AttributeError:
-            key_reo = _encrypt.key_reo = re.compile(r'^#[\w]+$', re.ASCII)
-
-        # find task data by #keys, test names, store to dict and return
         ret = {}
         for key in task:
-            if key.startswith('#'):
-                if key_reo.match(key) is None:
+            if key[:1] == '#':
+                if not is_session_key(key):
                     raise SessionKeyNameError(key)
                 ret[key] = task[key]
         return ret
 
+    @staticmethod
+    def pop_session_data(task, session_keys=None):
+        """Removes the session variables from the task and returns them
+        as a dict.
+
+        :param session_keys: the validated session keys schema of the
+                             project (see :attr:`Project.session_keys
+                             <kaylee.Project.session_keys>`). If defined,
+                             only the listed keys are looked up in the
+                             task. Otherwise all task keys are scanned.
+        """
+        if session_keys is None:
+            session_keys = [key for key in task if key[:1] == '#']
+            for key in session_keys:
+                if not is_session_key(key):
+                    raise SessionKeyNameError(key)
+        return {key : task.pop(key) for key in session_keys if key in task}
+
     @staticmethod
     def remove_session_data_from_task(session_data_keys, task):
         for key in session_data_keys:
             del task[key]
 
 
+def is_session_key(key):
+    """Checks whether ``key`` is a valid session variable name, i.e.
+    ``'#'`` followed by one or more ASCII letters, digits or underscores."""
+    return (len(key) > 1 and key[0] == '#' and key.isascii()
+            and key[1:].replace('_', 'a').isalnum())
+
+
+def validate_session_keys(session_keys):
+    """Validates a project's session keys schema and returns it as a tuple
+    (or ``None`` if the schema is not defined).
+
+    :throws SessionKeyNameError: if any of the keys is not a valid
+                                 session variable name.
+    """
+    if session_keys is None:
+        return None
+    if isinstance(session_keys, str):
+        raise TypeError('session_keys must be a list of keys, not {}'
+                        .format(str.__name__))
+    session_keys = tuple(session_keys)
+    for key in session_keys:
+        if not isinstance(key, str) or not is_session_key(key):
+            raise SessionKeyNameError(key)
+    return session_keys
+
+
+def _node_session_keys(node):
+    controller = node.controller
+    return controller.session_keys if controller is not None else None
+
 
 class EncryptedSessionDataManager(SessionDataManager):
     """The implementation of this abstract class is a
@@ -105,16 +172,16 @@ class EncryptedSessionDataManager(SessionDataManager):
     :type secret_key: str
     """
 
-    def __init__(self, secret_key):
+    def __init__(self, secret_key, **kwargs):
         self.secret_key = secret_key
-        super(EncryptedSessionDataManager, self).__init__()
+        super(EncryptedSessionDataManager, self).__init__(**kwargs)
 
 
 class PhonySessionDataManager(SessionDataManager):
     """The default session data manager which throws :class:`KayleeError`
     if any session variables are encountered in an outgoing task."""
     def store(self, node, task):
-        session_data = self.get_session_data(task)
+        session_data = self.pop_session_data(task, _node_session_keys(node))
         if session_data == {}:
             return
         else:
@@ -128,22 +195,52 @@ KL_LOADER_DEFAULT_SESSION_DATA_MANAGER = PhonySessionDataManager
 
 
 class ServerSessionDataManager(SessionDataManager):
-    """A session data manager, which keeps the data in
-    :attr:`Node.session_data`."""
+    """A session data manager, which keeps the data on the server side
+    in a :class:`SessionStore` keyed by ``(node_id, task_id)``.
+    The session data is kept in an in-memory LRU cache of ``capacity``
+    entries. The entries evicted from the cache are spilled to
+    an optional durable store (e.g. :class:`SQLiteSessionStore`) or
+    discarded.
+
+    A node can keep the session data of a single task only, thus the data
+    expires when the node receives another task, is unsubscribed or
+    unregistered, or after ``timeout``.
+
+    :param capacity: the size of the in-memory cache.
+    :param durable_store: ``'file'``, ``'sqlite'`` (see
+                          :data:`SESSION_STORES`) or ``None``.
+    :param durable_store_config: a dict with the durable store
+                                 configuration, e.g. ``{'path' : '...'}``.
+    :param timeout: session data timeout in ``1d 12h 59m 59s`` format.
+    """
+    def __init__(self, capacity=100000, durable_store=None,
+                 durable_store_config=None, timeout='12h', **kwargs):
+        super(ServerSessionDataManager, self).__init__(**kwargs)
+        if durable_store is not None:
+            cls = SESSION_STORES[durable_store]
+            durable_store = cls(**(durable_store_config or {}))
+        #: Session data store (:class:`SessionStore`)
+        self.store_backend = TieredSessionStore(capacity, durable_store)
+        self.timeout = parse_timedelta(timeout)
+
     def store(self, node, task):
-        session_data = self.get_session_data(task)
+        session_data = self.pop_session_data(task, _node_session_keys(node))
         if session_data == {}:
             return
-
-        node.session_data = pickle.dumps(session_data, pickle.HIGHEST_PROTOCOL)
-        self.remove_session_data_from_task(session_data.keys(), task)
+        self.store_backend.put(node.id, task['id'],
+                               self.serializer.dumps(session_data))
 
     def restore(self, node, result):
-        if node.session_data is None:
+        data = self.store_backend.pop(node.id, node.task_id)
+        if data is None:
             return
-        session_data = pickle.loads(node.session_data)
-        node.session_data = None
-        result.update(session_data)
+        result.update(self.serializer.loads(data))
+
+    def discard(self, node):
+        self.store_backend.discard(node.id)
+
+    def clean(self):
+        self.store_backend.clean(self.timeout.total_seconds())
 
 
 class ClientSessionDataManager(EncryptedSessionDataManager):
@@ -160,7 +257,7 @@ class ClientSessionDataManager(EncryptedSessionDataManager):
 
       task = {
           id: 'i1',
-          '#__kl_sd__': 'yn/fCyEcW8AFrPps7XoxunC...' # 143 chars in total
+          '#__kl_sd__': '2$yn/fCyEcW8AFrPps7XoxunC...' # 75 chars in total
       }
 
     The Kaylee client-side engine automatically attaches the ``'#__kl_sd__``
@@ -173,91 +270,786 @@ class ClientSessionDataManager(EncryptedSessionDataManager):
           '#s2': [1, 2, 3]
       }
     """
-    def __init__(self, secret_key):
-        #pylint: disable-msg=W0231
-        #W0231: __init__ method from base class 'SessionDataManager'
-        #       is not called.
+    def __init__(self, secret_key, **kwargs):
         self.SESSION_DATA_ATTRIBUTE = SESSION_DATA_ATTRIBUTE
-        super(ClientSessionDataManager, self).__init__(secret_key)
+        super(ClientSessionDataManager, self).__init__(secret_key, **kwargs)
+        self._crypto = SessionCrypto(secret_key, self.serializer)
 
     def store(self, node, task):
-        session_data = self.get_session_data(task)
+        session_data = self.pop_session_data(task, _node_session_keys(node))
         if session_data == {}:
             return
-
-        task[self.SESSION_DATA_ATTRIBUTE] =  _encrypt(session_data,
-                                                      self.secret_key)
-        self.remove_session_data_from_task(session_data.keys(), task)
+        task[self.SESSION_DATA_ATTRIBUTE] = self._crypto.encrypt(session_data)
 
     def restore(self, node, result):
         if self.SESSION_DATA_ATTRIBUTE not in result:
             return
-        sd = _decrypt(result[self.SESSION_DATA_ATTRIBUTE], self.secret_key)
+        sd = self._crypto.decrypt(result[self.SESSION_DATA_ATTRIBUTE])
         del result[self.SESSION_DATA_ATTRIBUTE]
         result.update(sd)
 
 
-def _encrypt(data, secret_key):
-    """Encrypt the data and return its base64 representation.
+class SessionStore(object, metaclass=ABCMeta):
+    """The interface of server-side session data stores. A store keeps at
+    most one ``(task_id, data)`` entry per node.
+    """
+    @abstractmethod
+    def put(self, node_id, task_id, data, timestamp=None):
+        """Stores the serialized session data and replaces the previous
+        node entry (if any).
+
+        :type node_id: :class:`NodeID`
+        :type data: bytes
+        :param timestamp: the entry creation time (``time.time()`` if not
+                          defined).
+        """
+
+    @abstractmethod
+    def pop(self, node_id, task_id):
+        """Removes the node entry and returns its data if the entry
+        belongs to the task. Returns ``None`` otherwise."""
+
+    @abstractmethod
+    def discard(self, node_id):
+        """Removes the node entry if any."""
+
+    @abstractmethod
+    def clean(self, timeout):
+        """Removes the entries older than ``timeout`` seconds and returns
+        a list of affected nodes' ids."""
+
+    @abstractmethod
+    def __len__(self):
+        """Returns the amount of entries in the store."""
+
+
+class TieredSessionStore(SessionStore):
+    """A store which keeps the entries in an in-memory LRU cache.
+    The least recently used entries are moved to the ``durable`` store
+    when the cache is full, or dropped if ``durable`` is ``None``.
+
+    The store is thread-safe. The in-memory state is guarded by a single
+    lock which is never held during the durable store I/O. The I/O is
+    serialized per node by :attr:`LOCK_STRIPES` striped locks instead,
+    thus the requests of the other nodes do not wait on the disk writes.
+    """
+    #: The amount of the per-node locks guarding the durable store I/O.
+    LOCK_STRIPES = 32
+
+    def __init__(self, capacity, durable=None):
+        self._cache = LRUCache(capacity, self._evicted)
+        self._durable = durable
+        # the entries evicted from the cache, but not yet spilled
+        self._spilling = {}
+        # node id -> timestamp of the node's entry in the durable store
+        self._spilled = {}
+        # guards the cache and the spilled entries bookkeeping
+        self._lock = threading.Lock()
+        self._stripes = [threading.Lock() for _ in range(self.LOCK_STRIPES)]
+
+    def put(self, node_id, task_id, data, timestamp=None):
+        if timestamp is None:
+            timestamp = time.time()
+        with self._stripe(node_id):
+            with self._lock:
+                spilled = self._spilled.pop(node_id, None) is not None
+                self._spilling.pop(node_id, None)
+                self._cache.pop(node_id)
+                self._cache.put(node_id, (task_id, timestamp, data))
+            if spilled:
+                self._durable.discard(node_id)
+        self._spill()
+
+    def pop(self, node_id, task_id):
+        with self._stripe(node_id):
+            with self._lock:
+                entry = self._cache.pop(node_id)
+                if entry is None:
+                    entry = self._spilling.pop(node_id, None)
+                if entry is not None:
+                    return entry[2] if entry[0] == task_id else None
+                if self._spilled.pop(node_id, None) is None:
+                    return None
+            return self._durable.pop(node_id, task_id)
+
+    def discard(self, node_id):
+        with self._stripe(node_id):
+            with self._lock:
+                self._cache.pop(node_id)
+                self._spilling.pop(node_id, None)
+                spilled = self._spilled.pop(node_id, None) is not None
+            if spilled:
+                self._durable.discard(node_id)
+
+    def clean(self, timeout):
+        deadline = time.time() - timeout
+        removed = []
+        with self._lock:
+            # entries are ordered by their put() time
+            for node_id, (_, timestamp, _) in self._cache.items():
+                if timestamp >= deadline:
+                    break
+                removed.append(node_id)
+            for node_id in removed:
+                self._cache.pop(node_id)
+            for node_id, (_, timestamp, _) in list(self._spilling.items()):
+                if timestamp < deadline:
+                    del self._spilling[node_id]
+                    removed.append(node_id)
+        if self._durable is not None:
+            for node_id in self._durable.clean(timeout):
+                with self._lock:
+                    # the node's entry could have been replaced (and
+                    # spilled again) in the meantime
+                    if self._spilled.get(node_id, deadline) < deadline:
+                        del self._spilled[node_id]
+                removed.append(node_id)
+        return removed
+
+    def _evicted(self, node_id, entry):
+        # is called by the cache with the lock acquired, the entries are
+        # written to the durable store by _spill()
+        if self._durable is not None:
+            self._spilling[node_id] = entry
+
+    def _spill(self):
+        with self._lock:
+            node_ids = list(self._spilling)
+        for node_id in node_ids:
+            stripe = self._stripe(node_id)
+            # the entries of the busy stripes are served from memory
+            # until the next spill
+            if not stripe.acquire(blocking=False):
+                continue
+            try:
+                with self._lock:
+                    # the entry could have been popped or spilled by
+                    # another thread
+                    entry = self._spilling.pop(node_id, None)
+                    if entry is None:
+                        continue
+                    task_id, timestamp, data = entry
+                    self._spilled[node_id] = timestamp
+                self._durable.put(node_id, task_id, data, timestamp)
+            finally:
+                stripe.release()
+
+    def _stripe(self, node_id):
+        return self._stripes[hash(node_id) % self.LOCK_STRIPES]
+
+    def __len__(self):
+        with self._lock:
+            return (len(self._cache) + len(self._spilling) +
+                    len(self._spilled))
+
+
+class FileSessionStore(SessionStore):
+    """Keeps every entry in a separate file in the ``path`` directory."""
+    def __init__(self, path):
+        ensure_dir(path)
+        self.path = path
+
+    def put(self, node_id, task_id, data, timestamp=None):
+        fpath = self._path(node_id)
+        btask_id = task_id.encode('utf-8')
+        tmp_path = fpath + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(struct.pack('<H', len(btask_id)) + btask_id + data)
+        if timestamp is not None:
+            os.utime(tmp_path, (timestamp, timestamp))
+        os.replace(tmp_path, fpath)
+
+    def pop(self, node_id, task_id):
+        fpath = self._path(node_id)
+        try:
+            with open(fpath, 'rb') as f:
+                raw = f.read()
+            os.remove(fpath)
+        except OSError:
+            return None
+        tid_len = struct.unpack_from('<H', raw)[0]
+        if raw[2:2 + tid_len].decode('utf-8') != task_id:
+            return None
+        return raw[2 + tid_len:]
+
+    def discard(self, node_id):
+        try:
+            os.remove(self._path(node_id))
+        except OSError:
+            pass
+
+    def clean(self, timeout):
+        deadline = time.time() - timeout
+        removed = []
+        for fname in os.listdir(self.path):
+            fpath = os.path.join(self.path, fname)
+            try:
+                if os.path.getmtime(fpath) < deadline:
+                    os.remove(fpath)
+                    removed.append(NodeID(fname.split('.')[0]))
+            except (OSError, KayleeError):
+                pass
+        return removed
+
+    def _path(self, node_id):
+        return os.path.join(self.path, str(node_id))
+
+    def __len__(self):
+        return sum(1 for fname in os.listdir(self.path)
+                   if not fname.endswith('.tmp'))
+
+
+class SQLiteSessionStore(SessionStore):
+    """Keeps the entries in an SQLite database.
+
+    :param path: database file path.
+    """
+    def __init__(self, path):
+        import sqlite3
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False,
+                                   isolation_level=None)
+        self._db.execute('CREATE TABLE IF NOT EXISTS kl_sessions ('
+                         'node_id BLOB PRIMARY KEY, task_id TEXT, '
+                         'data BLOB, ts REAL)')
+        self._db.execute('CREATE INDEX IF NOT EXISTS kl_sessions_ts '
+                         'ON kl_sessions (ts)')
+
+    def put(self, node_id, task_id, data, timestamp=None):
+        if timestamp is None:
+            timestamp = time.time()
+        with self._lock:
+            self._db.execute('INSERT OR REPLACE INTO kl_sessions '
+                             'VALUES (?, ?, ?, ?)',
+                             (node_id.binary, task_id, data, timestamp))
+
+    def pop(self, node_id, task_id):
+        with self._lock:
+            row = self._db.execute('SELECT task_id, data FROM kl_sessions '
+                                   'WHERE node_id = ?',
+                                   (node_id.binary, )).fetchone()
+            if row is None:
+                return None
+            self._db.execute('DELETE FROM kl_sessions WHERE node_id = ?',
+                             (node_id.binary, ))
+        return row[1] if row[0] == task_id else None
+
+    def discard(self, node_id):
+        with self._lock:
+            self._db.execute('DELETE FROM kl_sessions WHERE node_id = ?',
+                             (node_id.binary, ))
+
+    def clean(self, timeout):
+        deadline = time.time() - timeout
+        with self._lock:
+            rows = self._db.execute('SELECT node_id FROM kl_sessions '
+                                    'WHERE ts < ?', (deadline, )).fetchall()
+            self._db.execute('DELETE FROM kl_sessions WHERE ts < ?',
+                             (deadline, ))
+        return [NodeID(row[0]) for row in rows]
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute(
+                'SELECT COUNT(*) FROM kl_sessions').fetchone()[0]
+
+
+#: Available durable session stores' names
+SESSION_STORES = {
+    'file' : FileSessionStore,
+    'sqlite' : SQLiteSessionStore,
+}
+
+
+class SessionDataSerializer(object, metaclass=ABCMeta):
+    """The interface of session data serializers."""
+    @abstractmethod
+    def dumps(self, data):
+        """Serializes the session data.
+
+        :rtype: bytes
+        """
+
+    @abstractmethod
+    def loads(self, data):
+        """Deserializes the session data.
+
+        :throws ValueError: if the data is malformed.
+        """
+
+
+class PickleSerializer(SessionDataSerializer):
+    """Serializes the data via :mod:`pickle`. Never use it to load
+    data which has not been verified (e.g. not encrypted) by the server."""
+    def dumps(self, data):
+        return pickle.dumps(data, pickle.HIGHEST_PROTOCOL)
+
+    def loads(self, data):
+        return pickle.loads(data)
+
+
+class BinarySerializer(SessionDataSerializer):
+    """Serializes the data into a compact typed binary format. Supported
+    types are ``None``, :class:`bool`, :class:`int`, :class:`float`,
+    :class:`str`, :class:`bytes` and :class:`list`, :class:`tuple`,
+    :class:`dict`, :class:`set`, :class:`frozenset` containers of them.
+    Long lists of floats and 64-bit integers are packed into arrays.
+
+    Unlike pickle, loading the data never executes any code.
+
+    :param compression_threshold: the serialized data size starting from
+                                  which the data is compressed with zlib.
+                                  ``None`` disables compression.
+    :param compression_level: zlib compression level.
+    """
+    RAW = 0x0
+    ZLIB = 0x1
+
+    #: The size of the data sample compressed to decide whether the
+    #: whole data should be compressed.
+    PROBE_SIZE = 4096
+    PROBE_MAX_RATIO = 0.9
+
+    def __init__(self, compression_threshold=1024, compression_level=1):
+        self.compression_threshold = compression_threshold
+        self.compression_level = compression_level
+
+    def dumps(self, data):
+        out = bytearray(b'\x00')
+        _bin_encode(data, out)
+        if (self.compression_threshold is not None
+                and len(out) >= self.compression_threshold
+                and self._is_compressible(out)):
+            compressed = zlib.compress(bytes(out[1:]), self.compression_level)
+            if len(compressed) + 1 < len(out):
+                return bytes((self.ZLIB, )) + compressed
+        return bytes(out)
+
+    def _is_compressible(self, out):
+        # A cheap probe which prevents spending CPU on compressing
+        # e.g. large arrays of random floats.
+        if len(out) <= self.PROBE_SIZE * 4:
+            return True
+        probe = bytes(out[1:self.PROBE_SIZE + 1])
+        return (len(zlib.compress(probe, self.compression_level))
+                < self.PROBE_SIZE * self.PROBE_MAX_RATIO)
+
+    def loads(self, data):
+        if not data:
+            raise ValueError('Empty session data')
+        flag = data[0]
+        if flag == self.RAW:
+            buf, pos = bytes(data), 1
+        elif flag == self.ZLIB:
+            try:
+                buf, pos = zlib.decompress(data[1:]), 0
+            except zlib.error as e:
+                raise ValueError(str(e))
+        else:
+            raise ValueError('Unknown session data format: {}'.format(flag))
+        try:
+            obj, pos = _bin_decode(buf, pos)
+        except (IndexError, struct.error, UnicodeDecodeError) as e:
+            raise ValueError('Malformed session data: {}'.format(e))
+        if pos != len(buf):
+            raise ValueError('Malformed session data: trailing bytes')
+        return obj
+
+
+#: Available session data serializers' names
+SERIALIZERS = {
+    'binary' : BinarySerializer,
+    'pickle' : PickleSerializer,
+}
+
+
+def get_serializer(serializer, compression_threshold=1024):
+    """Returns a serializer instance by its name (see :data:`SERIALIZERS`).
+    Serializer instances are returned as is."""
+    if isinstance(serializer, SessionDataSerializer):
+        return serializer
+    try:
+        cls = SERIALIZERS[serializer]
+    except KeyError:
+        raise KayleeError('Unknown session data serializer: {}'
+                          .format(serializer))
+    if cls is BinarySerializer:
+        return cls(compression_threshold)
+    return cls()
+
+
+# Binary format type tags
+_T_NONE = ord('N')
+_T_TRUE = ord('T')
+_T_FALSE = ord('F')
+_T_INT = ord('i')
+_T_FLOAT = ord('f')
+_T_STR = ord('s')
+_T_BYTES = ord('b')
+_T_LIST = ord('l')
+_T_TUPLE = ord('t')
+_T_DICT = ord('d')
+_T_SET = ord('S')
+_T_FROZENSET = ord('Z')
+# packed arrays, the tag is followed by array typecode
+_T_ARRAY = ord('a')
+
+_double = struct.Struct('<d')
+_SWAP_ARRAYS = sys.byteorder != 'little'
+# lists shorter than this are not checked for being packable
+_MIN_ARRAY_LEN = 8
+# (typecode, min, max) of the packed integer arrays
+_INT_ARRAY_TYPES = [
+    ('b', -2 ** 7, 2 ** 7 - 1),
+    ('h', -2 ** 15, 2 ** 15 - 1),
+    ('l', -2 ** 31, 2 ** 31 - 1),
+    ('q', -2 ** 63, 2 ** 63 - 1),
+]
+_FLOAT_TYPE_SET = {float}
+_INT_TYPE_SET = {int}
+_collection_types = {
+    _T_TUPLE : tuple,
+    _T_SET : set,
+    _T_FROZENSET : frozenset,
+}
+
+
+def _write_uvarint(n, out):
+    while n > 0x7f:
+        out.append((n & 0x7f) | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def _read_uvarint(buf, pos):
+    shift = 0
+    n = 0
+    while True:
+        b = buf[pos]
+        pos += 1
+        n |= (b & 0x7f) << shift
+        if b < 0x80:
+            return n, pos
+        shift += 7
+
+
+def _array_typecode(obj):
+    """Returns the typecode of an array the list can be packed into
+    or ``None``."""
+    types = set(map(type, obj))
+    if types == _FLOAT_TYPE_SET:
+        return 'd'
+    if types == _INT_TYPE_SET:
+        lo, hi = min(obj), max(obj)
+        for typecode, tmin, tmax in _INT_ARRAY_TYPES:
+            if tmin <= lo and hi <= tmax:
+                # 'l' is not guaranteed to be 4 bytes long
+                if typecode == 'l' and array('l').itemsize != 4:
+                    return 'q'
+                return typecode
+    return None
+
+
+def _bin_encode(obj, out):
+    #pylint: disable-msg=R0912
+    #R0912: Too many branches
+    t = type(obj)
+    if t is str:
+        b = obj.encode('utf-8')
+        if len(b) < 0x80:
+            out += bytes((_T_STR, len(b)))
+        else:
+            out.append(_T_STR)
+            _write_uvarint(len(b), out)
+        out += b
+    elif t is int:
+        z = obj << 1 if obj >= 0 else ((-obj) << 1) - 1
+        if z < 0x80:
+            out += bytes((_T_INT, z))
+        else:
+            out.append(_T_INT)
+            _write_uvarint(z, out)
+    elif t is float:
+        out.append(_T_FLOAT)
+        out += _double.pack(obj)
+    elif t is dict:
+        out.append(_T_DICT)
+        _write_uvarint(len(obj), out)
+        for key, val in obj.items():
+            _bin_encode(key, out)
+            _bin_encode(val, out)
+    elif t is list:
+        typecode = _array_typecode(obj) if len(obj) >= _MIN_ARRAY_LEN \
+                   else None
+        if typecode is not None:
+            arr = array(typecode, obj)
+            if _SWAP_ARRAYS:
+                arr.byteswap()
+            out.append(_T_ARRAY)
+            out.append(ord(typecode))
+            _write_uvarint(len(arr), out)
+            out += arr.tobytes()
+        else:
+            out.append(_T_LIST)
+            _write_uvarint(len(obj), out)
+            for item in obj:
+                _bin_encode(item, out)
+    elif obj is None:
+        out.append(_T_NONE)
+    elif obj is True:
+        out.append(_T_TRUE)
+    elif obj is False:
+        out.append(_T_FALSE)
+    elif t is bytes:
+        out.append(_T_BYTES)
+        _write_uvarint(len(obj), out)
+        out += obj
+    elif t is tuple or t is set or t is frozenset:
+        out.append(_T_TUPLE if t is tuple else
+                   _T_SET if t is set else _T_FROZENSET)
+        _write_uvarint(len(obj), out)
+        for item in obj:
+            _bin_encode(item, out)
+    else:
+        # subclasses of the supported types, e.g. IntEnum
+        for base_type in (bool, int, float, str, bytes, list, tuple, dict,
+                          frozenset, set):
+            if isinstance(obj, base_type):
+                _bin_encode(base_type(obj), out)
+                return
+        raise KayleeError('Cannot serialize session data of type {}'
+                          .format(t.__name__))
+
+
+def _bin_decode(buf, pos):
+    #pylint: disable-msg=R0911,R0912
+    #R0911: Too many return statements
+    #R0912: Too many branches
+    tag = buf[pos]
+    pos += 1
+    if tag == _T_STR:
+        n = buf[pos]
+        if n < 0x80:
+            pos += 1
+        else:
+            n, pos = _read_uvarint(buf, pos)
+        end = pos + n
+        if end > len(buf):
+            raise IndexError('string out of range')
+        return buf[pos:end].decode('utf-8'), end
+    elif tag == _T_INT:
+        z = buf[pos]
+        if z < 0x80:
+            pos += 1
+        else:
+            z, pos = _read_uvarint(buf, pos)
+        return (z >> 1) if not z & 1 else -((z + 1) >> 1), pos
+    elif tag == _T_FLOAT:
+        return _double.unpack_from(buf, pos)[0], pos + 8
+    elif tag == _T_DICT:
+        n, pos = _read_uvarint(buf, pos)
+        d = {}
+        for _ in range(n):
+            key, pos = _bin_decode(buf, pos)
+            d[key], pos = _bin_decode(buf, pos)
+        return d, pos
+    elif tag == _T_ARRAY:
+        typecode = chr(buf[pos])
+        if typecode not in 'bhlqd':
+            raise ValueError('Unknown array typecode: {}'.format(typecode))
+        n, pos = _read_uvarint(buf, pos + 1)
+        arr = array(typecode)
+        end = pos + n * arr.itemsize
+        if end > len(buf):
+            raise IndexError('array out of range')
+        arr.frombytes(memoryview(buf)[pos:end])
+        if _SWAP_ARRAYS:
+            arr.byteswap()
+        return arr.tolist(), end
+    elif tag in (_T_LIST, _T_TUPLE, _T_SET, _T_FROZENSET):
+        n, pos = _read_uvarint(buf, pos)
+        items = []
+        for _ in range(n):
+            item, pos = _bin_decode(buf, pos)
+            items.append(item)
+        if tag == _T_LIST:
+            return items, pos
+        return _collection_types[tag](items), pos
+    elif tag == _T_NONE:
+        return None, pos
+    elif tag == _T_TRUE:
+        return True, pos
+    elif tag == _T_FALSE:
+        return False, pos
+    elif tag == _T_BYTES:
+        n, pos = _read_uvarint(buf, pos)
+        if pos + n > len(buf):
+            raise IndexError('bytes out of range')
+        return buf[pos:pos + n], pos + n
+    raise ValueError('Unknown type tag: {}'.format(tag))
+
+
+class SessionCrypto(object):
+    """Session data encryption engine. The encryption keys are derived
+    from the secret key once per engine, so that the engine
+    should be re-used for all the data encrypted with the same key
+    (see :func:`get_session_crypto`).
+
+    The data is serialized and encrypted via AES-GCM, which both encrypts
+    and authenticates the data in a single pass. The output token format
+    is::
+
+      2$<base64(nonce + ciphertext + tag)>
+
+    The tokens produced by the previous AES-CBC + HMAC-SHA1 engine
+    (``<mac>?<iv>&<data>``) are still accepted by :meth:`decrypt`.
 
-    :param data: Data to encrypt. The data is pickled prior to encryption.
     :param secret_key: A secret key to use.
-    :type data: any pickable Python object
+    :param serializer: session data serializer (:class:`BinarySerializer`
+                       by default).
     :type secret_key: str
     """
-    bsecret_key = secret_key.encode('utf-8')
-    mac = hmac(bsecret_key, None, sha1)
-    encryption_key = sha256(bsecret_key).digest()
+    TOKEN_PREFIX = '2$'
+    NONCE_SIZE = 12
+    TAG_SIZE = 16
 
-    iv = bytes(random.randint(0, 0xFF) for i in range(16))
-    encryptor = AES.new(encryption_key, AES.MODE_CBC, iv)
+    def __init__(self, secret_key, serializer=None):
+        if serializer is None:
+            serializer = BinarySerializer()
+        self.serializer = serializer
+        # cryptography is imported on the first use only, so that
+        # importing Kaylee stays cheap if the data is not encrypted
+        from cryptography.exceptions import InvalidTag
+        from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+        bsecret_key = secret_key.encode('utf-8')
+        key = sha256(b'kaylee.session.v2|' + bsecret_key).digest()
+        self._aead = AESGCM(key)
+        self._decrypt_errors = (ValueError, TypeError, InvalidTag)
+        # legacy (v1) AES-CBC + HMAC-SHA1 decryption keys
+        self._legacy_key = sha256(bsecret_key).digest()
+        self._legacy_mac = hmac(bsecret_key, None, sha1)
 
-    encrypted_data = _encrypt_data(data, encryptor)
-    mac.update(b'|' + encrypted_data)
+    def encrypt(self, data):
+        """Encrypts the data and returns its string token representation.
 
-    b64_iv = b64encode(iv)
-    data_out_list = [b64_iv, encrypted_data]
-    data_out = (b'&'.join(data_out_list)).decode('utf-8')
-    mac_out = b64encode(mac.digest()).decode('utf-8')
+        :param data: Data to encrypt. The data is serialized prior
+                     to encryption.
+        """
+        nonce = os.urandom(self.NONCE_SIZE)
+        with tracing.span('session.serialize'):
+            val = self.serializer.dumps(data)
+        # AESGCM appends the tag to the encrypted data
+        with tracing.span('session.encrypt'):
+            encrypted_data = self._aead.encrypt(nonce, val, None)
+        token = b64encode(nonce + encrypted_data).decode('ascii')
+        return self.TOKEN_PREFIX + token
 
-    return '{}?{}'.format(mac_out, data_out)
+    def decrypt(self, s):
+        """Verifies and decrypts the token returned by :meth:`encrypt`.
+
+        :throws KayleeError: if the token is malformed or the
+                             verification fails.
+        """
+        if not s.startswith(self.TOKEN_PREFIX):
+            return self._legacy_decrypt(s)
+        try:
+            raw = b64decode(s[len(self.TOKEN_PREFIX):])
+            if len(raw) < self.NONCE_SIZE + self.TAG_SIZE:
+                raise ValueError('Token is too short')
+            with tracing.span('session.decrypt'):
+                val = self._aead.decrypt(raw[:self.NONCE_SIZE],
+                                         raw[self.NONCE_SIZE:], None)
+        except self._decrypt_errors:
+            raise KayleeError('Encrypted data signature verification failed.')
+        if val[:1] == _PICKLE_PROTO:
+            # verified token with pickled data issued prior to
+            # the serializers introduction
+            return pickle.loads(val)
+        try:
+            with tracing.span('session.deserialize'):
+                return self.serializer.loads(val)
+        except ValueError as e:
+            raise KayleeError('Encrypted data deserialization failed: {}'
+                              .format(e))
+
+    def _legacy_decrypt(self, s):
+        try:
+            base64_hash, data = s.split('?', 1)
+            iv, data = data.split('&', 1)
+            iv = b64decode(iv)
+            mac = self._legacy_mac.copy()
+            mac.update(b'|' + data.encode('utf-8'))
+            valid = compare_digest(b64decode(base64_hash), mac.digest())
+        except (ValueError, TypeError):
+            valid = False
+        if not valid:
+            raise KayleeError('Encrypted data signature verification failed.')
+
+        try:
+            decryptor = _aes_cbc(self._legacy_key, iv).decryptor()
+            val = decryptor.update(b64decode(data)) + decryptor.finalize()
+        except ValueError:
+            raise KayleeError('Encrypted data decryption failed.')
+        return pickle.loads(val.rstrip(b' '))
+
+
+_PICKLE_PROTO = b'\x80'
+
+_session_crypto_engines = {}
+
+def get_session_crypto(secret_key):
+    """Returns a cached :class:`SessionCrypto` engine for the secret key."""
+    try:
+        return _session_crypto_engines[secret_key]
+    except KeyError:
+        engine = _session_crypto_engines[secret_key] = \
+            SessionCrypto(secret_key)
+        return engine
+
+
+def _encrypt(data, secret_key):
+    """Encrypt the data and return its string token representation.
+
+    :param data: Data to encrypt (see :class:`BinarySerializer` for
+                 the supported types).
+    :param secret_key: A secret key to use.
+    :type secret_key: str
+    """
+    return get_session_crypto(secret_key).encrypt(data)
 
 
 def _decrypt(s, secret_key):
+    return get_session_crypto(secret_key).decrypt(s)
+
+
+def _legacy_encrypt(data, secret_key):
+    """The AES-CBC + HMAC-SHA1 encryption routine used prior to
+    :class:`SessionCrypto`. Kept for compatibility tests and benchmarks."""
     bsecret_key = secret_key.encode('utf-8')
-    base64_hash, data = s.split('?', 1)
     mac = hmac(bsecret_key, None, sha1)
+    encryption_key = sha256(bsecret_key).digest()
 
-    iv, data = data.split('&', 1)
-    iv = b64decode(iv)
+    iv = bytes(random.randint(0, 0xFF) for i in range(16))
+    encryptor = _aes_cbc(encryption_key, iv).encryptor()
 
-    decryption_key = sha256(bsecret_key).digest()
-    decryptor = AES.new(decryption_key, AES.MODE_CBC, iv)
+    val = _pad_data(pickle.dumps(data, pickle.HIGHEST_PROTOCOL))
+    encrypted_data = b64encode(encryptor.update(val) + encryptor.finalize())
+    mac.update(b'|' + encrypted_data)
 
-    mac.update(b'|' + data.encode('utf-8'))
-    decrypted_data = _decrypt_data(data, decryptor)
+    data_out = (b'&'.join([b64encode(iv), encrypted_data])).decode('utf-8')
+    mac_out = b64encode(mac.digest()).decode('utf-8')
+    return '{}?{}'.format(mac_out, data_out)
 
-    if b64decode(base64_hash) == mac.digest():
-        return decrypted_data
-    else:
-        raise KayleeError('Encrypted data signature verification failed.')
+
+def _aes_cbc(key, iv):
+    from cryptography.hazmat.backends import default_backend
+    from cryptography.hazmat.primitives.ciphers import (Cipher, algorithms,
+                                                        modes)
+    return Cipher(algorithms.AES(key), modes.CBC(iv), default_backend())
 
 
 def _pad_data(s):
     BLOCK_SIZE = 32
     PADDING = b' '
     return s + (BLOCK_SIZE - len(s) % BLOCK_SIZE) * PADDING
-
-
-def _encrypt_data(data, encryptor):
-    val = pickle.dumps(data, pickle.HIGHEST_PROTOCOL)
-    val = encryptor.encrypt(_pad_data(val))
-    val = b64encode(val)
-    return val
-
-
-def _decrypt_data(data, decryptor):
-    val = b64decode(data)
-    val = decryptor.decrypt(val).rstrip(b' ')
-    val = pickle.loads(val)
-    return val
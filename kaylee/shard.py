@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+    kaylee.shard
+    ~~~~~~~~~~~~
+
+    This module implements the partitioning of the nodes and the tasks
+    among several Kaylee instances (e.g. the worker processes of
+    a multi-process server or the servers of a cluster). Every instance
+    owns a shard: the nodes and the tasks whose IDs hash to the shard.
+
+    :copyright: (c) 2013 by Zaur Nasibov.
+    :license: MIT, see LICENSE for more details.
+"""
+import zlib
+import bisect
+import hashlib
+
+from .node import NodeID
+
+
+def _key_bytes(key):
+    if isinstance(key, NodeID):
+        return key.binary
+    elif not isinstance(key, bytes):
+        return str(key).strip().encode('utf-8')
+    return key
+
+
+def shard_index(key, count):
+    """Returns the index of the shard (out of ``count``) which owns
+    the key.
+
+    :param key: a :class:`NodeID <kaylee.NodeID>`, a binary string or
+                a task ID.
+    """
+    return zlib.crc32(_key_bytes(key)) % count
+
+
+class Shard(object):
+    """A shard of the nodes and the tasks.
+
+    :param index: the shard index (``0 <= index < count``).
+    :param count: the total amount of shards.
+    """
+    __slots__ = ('index', 'count')
+
+    def __init__(self, index, count):
+        if not 0 <= index < count:
+            raise ValueError('Shard index must be in [0, {}) range, not {}'
+                             .format(count, index))
+        self.index = index
+        self.count = count
+
+    def owns(self, key):
+        """Checks whether the key (see :func:`shard_index`) belongs to
+        the shard."""
+        return shard_index(key, self.count) == self.index
+
+    def __repr__(self):
+        return '<Shard {}/{}>'.format(self.index, self.count)
+
+
+class HashRing(object):
+    """A consistent hash ring of servers. Unlike :func:`shard_index`,
+    adding or removing a server moves only ``~1/len(servers)`` of the keys
+    to other servers.
+
+    :param servers: the servers' names.
+    :param replicas: the amount of the ring points per server.
+    """
+    def __init__(self, servers, replicas=100):
+        self.replicas = replicas
+        self._points = []
+        self._servers = []
+        for server in servers:
+            self.add(server)
+
+    def add(self, server):
+        for i in range(self.replicas):
+            point = self._hash('{}#{}'.format(server, i).encode('utf-8'))
+            pos = bisect.bisect(self._points, point)
+            self._points.insert(pos, point)
+            self._servers.insert(pos, server)
+
+    def remove(self, server):
+        pairs = [(p, s) for p, s in zip(self._points, self._servers)
+                 if s != server]
+        self._points = [p for p, s in pairs]
+        self._servers = [s for p, s in pairs]
+
+    def get(self, key):
+        """Returns the name of the server which owns the key (see
+        :func:`shard_index` for the supported key types)."""
+        if not self._points:
+            raise KeyError('The hash ring is empty')
+        pos = bisect.bisect(self._points, self._hash(_key_bytes(key)))
+        return self._servers[pos % len(self._servers)]
+
+    @property
+    def servers(self):
+        return sorted(set(self._servers))
+
+    @staticmethod
+    def _hash(data):
+        return int.from_bytes(hashlib.md5(data).digest()[:8], 'big')
+
+
+class RingShard(object):
+    """A shard of a :class:`HashRing`: the keys owned by the server.
+
+    :param ring: the hash ring.
+    :param server: the server's name.
+    """
+    __slots__ = ('ring', 'server')
+
+    def __init__(self, ring, server):
+        if server not in ring.servers:
+            raise ValueError('Server "{}" is not in the hash ring'
+                             .format(server))
+        self.ring = ring
+        self.server = server
+
+    def owns(self, key):
+        return self.ring.get(key) == self.server
+
+    def __repr__(self):
+        return '<RingShard {}>'.format(self.server)
@@ -0,0 +1,358 @@
+# -*- coding: utf-8 -*-
+"""
+    kaylee.simulator
+    ~~~~~~~~~~~~~~~~
+
+    A discrete-event simulator of volunteer nodes for evaluating the
+    controllers (and the scheduling policies) under node churn.
+
+    The simulated nodes call a real :class:`Kaylee` object, which serves
+    a real application (a controller with its project and storages), but
+    the computations and the time are simulated: every node has a speed,
+    every task has a cost, and the virtual clock jumps from one event to
+    the next one. Thus hours of volunteer computing are simulated in
+    seconds, and the same ``seed`` always gives the same results within
+    a process (set ``PYTHONHASHSEED`` to get the same results across the
+    processes, since the controllers keep the tasks in sets).
+
+    :copyright: (c) 2013 by Zaur Nasibov.
+    :license: MIT, see LICENSE for more details.
+"""
+import json
+import heapq
+import random
+import tracemalloc
+
+from .core import Kaylee, ACTION_TASK, ACTION_UNSUBSCRIBE
+from .contrib.registries import MemoryNodesRegistry
+from .session import SESSION_DATA_ATTRIBUTE
+
+# event types
+_ARRIVE, _POLL, _DONE, _DEPART = range(4)
+
+
+class SimulatedNode(object):
+    """The state of a simulated node."""
+    __slots__ = ('node_id', 'speed', 'task', 'task_cost', 'started',
+                 'departed', 'version')
+
+    def __init__(self, node_id, speed):
+        self.node_id = node_id
+        #: The amount of task cost units computed per (virtual) second.
+        self.speed = speed
+        self.task = None
+        self.task_cost = 0.0
+        self.started = None
+        self.departed = False
+        #: Invalidates the node's pending events.
+        self.version = 0
+
+
+class SimulationReport(object):
+    """The results of a simulation (see :meth:`Simulator.run`).
+    The times are measured in virtual seconds."""
+    def __init__(self):
+        #: The time when the application has been completed or ``None``
+        #: if it has not been completed.
+        self.makespan = None
+        #: The virtual time when the simulation has stopped.
+        self.duration = 0.0
+        #: The amount of the task actions sent to the nodes.
+        self.dispatches = 0
+        #: The amount of the dispatches of the previously dispatched tasks.
+        self.redundant_dispatches = 0
+        #: The amount of the results accepted without errors.
+        self.results_accepted = 0
+        #: The amount of the results rejected by the server.
+        self.results_rejected = 0
+        #: The amount of the faulty results sent by the nodes.
+        self.faulty_results = 0
+        #: The amount of the stored results which differ from the correct
+        #: ones.
+        self.wrong_results = 0
+        #: The amount of the tasks with stored results.
+        self.tasks_completed = 0
+        #: The total computation time of all the nodes.
+        self.total_compute = 0.0
+        #: The computation time which did not contribute to the stored
+        #: results: the computations interrupted by the node departures,
+        #: the rejected and redundant results.
+        self.wasted_compute = 0.0
+        #: The part of :attr:`wasted_compute` lost with the departed nodes.
+        self.lost_compute = 0.0
+        self.nodes_arrived = 0
+        self.nodes_departed = 0
+        #: The peak amount of simultaneously active nodes.
+        self.peak_nodes = 0
+        #: The peak amount of memory (in bytes) allocated during the
+        #: simulation or ``None`` if the memory has not been traced.
+        self.peak_memory = None
+        #: The amount of processed events.
+        self.events = 0
+
+    def as_dict(self):
+        return dict(self.__dict__)
+
+    def __repr__(self):
+        return 'SimulationReport({})'.format(', '.join(
+            '{}={!r}'.format(key, val)
+            for key, val in sorted(self.__dict__.items())))
+
+
+class Simulator(object):
+    """Simulates the volunteer nodes computing the tasks of an
+    application.
+
+    The nodes follow the Kaylee client protocol: register, subscribe,
+    request a task, compute it and send the result (receiving the next
+    task in response). A node which receives an error or a "nop" action
+    requests a task again after ``poll_interval``. The nodes which depart
+    in the middle of a computation never return their tasks.
+
+    The random distributions are seeded by ``seed``:
+
+    * the ``nodes`` initial nodes are active at the start and the new
+      nodes arrive as a Poisson process with ``arrival_rate`` nodes per
+      second;
+    * the node lifetime is exponentially distributed with the
+      ``mean_lifetime`` mean (the nodes never depart by default);
+    * the node speeds (task cost units per second) are log-normally
+      distributed with the mean of 1 and the ``speed_sigma`` shape;
+    * every result is faulty with the ``fault_rate`` probability.
+
+    :param controller: a fresh application (the project is consumed by
+                       the simulation).
+    :param solver: a function which returns the correct result of
+                   a task (a dict parsed from the JSON task).
+    :param task_cost: a function which returns the cost of a task.
+                      The cost of every task is ``1`` by default.
+    :param corrupt: a function which returns a faulty result for the
+                    correct result and a :class:`random.Random` object.
+                    By default the numbers in the result are replaced by
+                    random numbers.
+    :param latency: the time of a request/response round trip (added to
+                    the time of every task computation and poll).
+    :param trace_memory: trace the peak memory (via :mod:`tracemalloc`),
+                         which slows down the simulation.
+    :param \**kwargs: :class:`Kaylee` configuration options.
+    :type controller: :class:`Controller`
+    """
+    def __init__(self, controller, solver, nodes=10, arrival_rate=0.0,
+                 mean_lifetime=None, speed_sigma=0.5, fault_rate=0.0,
+                 task_cost=None, corrupt=None, latency=0.0,
+                 poll_interval=1.0, session_data_manager=None, seed=0,
+                 trace_memory=True, **kwargs):
+        self.controller = controller
+        self.solver = solver
+        self.nodes = nodes
+        self.arrival_rate = arrival_rate
+        self.mean_lifetime = mean_lifetime
+        self.speed_sigma = speed_sigma
+        self.fault_rate = fault_rate
+        self.task_cost = task_cost or (lambda task: 1.0)
+        self.corrupt = corrupt or corrupt_result
+        self.latency = latency
+        self.poll_interval = poll_interval
+        self.trace_memory = trace_memory
+        kwargs.setdefault('AUTO_GET_ACTION', True)
+        self.kl = Kaylee(MemoryNodesRegistry(timeout='1d'),
+                         session_data_manager, [controller], **kwargs)
+        self._random = random.Random(seed)
+        self._events = []
+        self._seq = 0
+        self._now = 0.0
+        self._active = 0
+        self._dispatched = set()
+        # task ID -> the computation time of the first accepted result
+        self._useful = {}
+        self.report = SimulationReport()
+
+    def run(self, max_time=24 * 3600.0, max_events=None):
+        """Runs the simulation until the application is completed, no
+        events are left or the virtual time exceeds ``max_time``.
+
+        :rtype: :class:`SimulationReport`
+        """
+        tracing = self.trace_memory and not tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.start()
+        try:
+            self._run(max_time, max_events)
+            if self.trace_memory:
+                self.report.peak_memory = tracemalloc.get_traced_memory()[1]
+        finally:
+            if tracing:
+                tracemalloc.stop()
+        self._finish()
+        return self.report
+
+    def _run(self, max_time, max_events):
+        for _ in range(self.nodes):
+            self._schedule(0.0, _ARRIVE)
+        if self.arrival_rate > 0:
+            self._schedule(self._random.expovariate(self.arrival_rate),
+                           _ARRIVE, arrival=True)
+
+        report = self.report
+        while self._events and not self.controller.completed:
+            if max_events is not None and report.events >= max_events:
+                break
+            time, _, event, node, version = heapq.heappop(self._events)
+            if time > max_time:
+                self._now = max_time
+                break
+            self._now = time
+            if node is not None and (node.departed or
+                                     version not in (None, node.version)):
+                continue
+            report.events += 1
+            if event == _ARRIVE:
+                self._arrive(arrival=node is None and version == 1)
+            elif event == _POLL:
+                self._handle_action(node, self._call(
+                    self.kl.get_action, node.node_id))
+            elif event == _DONE:
+                self._send_result(node)
+            elif event == _DEPART:
+                self._depart(node)
+        report.duration = self._now
+
+    def _schedule(self, time, event, node=None, arrival=False):
+        self._seq += 1
+        if event == _DEPART:
+            # the departure does not depend on the node's state
+            version = None
+        elif node is not None:
+            version = node.version
+        else:
+            version = int(arrival)
+        heapq.heappush(self._events, (time, self._seq, event, node, version))
+
+    @staticmethod
+    def _call(method, *args):
+        return json.loads(method(*args))
+
+    def _arrive(self, arrival):
+        if arrival:
+            # the next arrival of the Poisson process
+            self._schedule(self._now +
+                           self._random.expovariate(self.arrival_rate),
+                           _ARRIVE, arrival=True)
+        report = self.report
+        response = self._call(self.kl.register, 'simulator')
+        sigma = self.speed_sigma
+        node = SimulatedNode(response['node_id'],
+                             self._random.lognormvariate(-sigma ** 2 / 2,
+                                                         sigma))
+        report.nodes_arrived += 1
+        self._active += 1
+        report.peak_nodes = max(report.peak_nodes, self._active)
+        if self.mean_lifetime is not None:
+            self._schedule(self._now + self._random.expovariate(
+                1.0 / self.mean_lifetime), _DEPART, node)
+        response = self._call(self.kl.subscribe, node.node_id,
+                              self.controller.name)
+        if 'error' in response:
+            return self._schedule(self._now + self.poll_interval, _POLL, node)
+        self._handle_action(node, self._call(self.kl.get_action,
+                                             node.node_id))
+
+    def _handle_action(self, node, response):
+        action = response.get('action')
+        if action == ACTION_TASK:
+            task = response['data']
+            report = self.report
+            report.dispatches += 1
+            if task['id'] in self._dispatched:
+                report.redundant_dispatches += 1
+            else:
+                self._dispatched.add(task['id'])
+            node.task = task
+            node.task_cost = self.task_cost(task)
+            node.started = self._now
+            node.version += 1
+            self._schedule(self._now + self.latency +
+                           node.task_cost / node.speed, _DONE, node)
+        elif action == ACTION_UNSUBSCRIBE:
+            # e.g. the application has been completed
+            self._depart(node)
+        else:
+            # an error or "nop"
+            node.version += 1
+            self._schedule(self._now + self.latency + self.poll_interval,
+                           _POLL, node)
+
+    def _send_result(self, node):
+        report = self.report
+        task = node.task
+        compute = self._now - node.started
+        report.total_compute += compute
+        node.task = node.started = None
+
+        result = self.solver(task)
+        if self._random.random() < self.fault_rate:
+            report.faulty_results += 1
+            result = self.corrupt(result, self._random)
+        if SESSION_DATA_ATTRIBUTE in task:
+            result = dict(result)
+            result[SESSION_DATA_ATTRIBUTE] = task[SESSION_DATA_ATTRIBUTE]
+        response = self._call(self.kl.accept_result, node.node_id,
+                              json.dumps(result))
+        if 'error' in response:
+            report.results_rejected += 1
+        else:
+            report.results_accepted += 1
+            self._useful.setdefault(task['id'], compute)
+        self._handle_action(node, response)
+
+    def _depart(self, node):
+        report = self.report
+        if node.started is not None:
+            lost = self._now - node.started
+            report.total_compute += lost
+            report.lost_compute += lost
+        node.departed = True
+        self._active -= 1
+        report.nodes_departed += 1
+        self.kl.unregister(node.node_id)
+
+    def _finish(self):
+        report = self.report
+        ctrl = self.controller
+        if ctrl.completed:
+            report.makespan = report.duration
+        storage = ctrl.permanent_storage
+        useful = 0.0
+        for task_id in storage.keys():
+            report.tasks_completed += 1
+            useful += self._useful.get(task_id, 0.0)
+            expected = ctrl.project.normalize_result(
+                task_id, self.solver(_task_for_solver(ctrl, task_id)))
+            if any(res != expected for res in storage[task_id]):
+                report.wrong_results += 1
+        report.wasted_compute = report.total_compute - useful
+
+
+def _task_for_solver(controller, task_id):
+    task = controller.project[task_id]
+    task = dict(task)
+    task['id'] = str(task['id'])
+    return task
+
+
+def corrupt_result(result, rnd):
+    """Returns a copy of the result with the numbers (including the
+    numbers in the nested lists and dicts) replaced by random numbers."""
+    if isinstance(result, bool):
+        return not result
+    if isinstance(result, int):
+        # a wide range, so that the faulty results practically never
+        # match each other (e.g. in a results comparator)
+        return result + rnd.randint(1, 2 ** 31)
+    if isinstance(result, float):
+        return result + rnd.random() + 1.0
+    if isinstance(result, dict):
+        return {key : corrupt_result(val, rnd) for key, val in result.items()}
+    if isinstance(result, list):
+        return [corrupt_result(val, rnd) for val in result]
+    return result
@@ -152,6 +152,41 @@ class PermanentStorage(object, metaclass=ABCMeta):
     def total_count(self):
         pass
 
+    def iter_chunks(self, size, after=None):
+        """Returns an iterator over the stored results split in chunks.
+        Each yield item is a list of at most ``size``
+        ``(task_id, [res1, res2, ...])`` tuples. Only a single chunk is
+        kept in memory at a time.
+
+        The default implementation is based on :meth:`keys` and
+        :meth:`__getitem__`. Storage back-ends which support a native
+        bulk scan are encouraged to override it.
+
+        :param size: the maximum amount of tasks in a chunk.
+        :param after: a task ID cursor. If defined, the iteration starts
+                      from the task which follows the cursor in the
+                      :meth:`keys` order.
+        :type size: int
+        :throws KeyError: if the ``after`` task ID is not in the storage.
+        """
+        if size < 1:
+            raise ValueError('Chunk size must be a positive integer, not {}'
+                             .format(size))
+        # keys() may return a sequence (e.g. a list), which would restart
+        # from the first key after the cursor has been skipped to
+        keys = iter(self.keys())
+        if after is not None:
+            _skip_to_cursor(keys, after)
+
+        chunk = []
+        for task_id in keys:
+            chunk.append((task_id, self[task_id]))
+            if len(chunk) == size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
     def __contains__(self, task_id):
         """Checks if any of the task results are in the storage.
         Same as :meth:`PermanentStorage.contains(task_id)
@@ -160,8 +195,17 @@ class PermanentStorage(object, metaclass=ABCMeta):
 
     def __iter__(self):
         """The same as :meth:`PermanentStorage.keys`."""
-        return self.keys()
+        return iter(self.keys())
 
     def __len__(self):
         """Same as :meth:`PermanentStorage.count`."""
         return self.count
+
+
+def _skip_to_cursor(it, cursor):
+    """Consumes the iterator up to and including the ``cursor`` item."""
+    for item in it:
+        if item == cursor:
+            return
+    raise KeyError('Cursor task {} was not found in the storage'
+                   .format(cursor))
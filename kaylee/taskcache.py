@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""
+    kaylee.taskcache
+    ~~~~~~~~~~~~~~~~
+
+    This module provides the cache of serialized tasks, which is used
+    to re-dispatch a task (e.g. to several nodes) without re-building
+    and re-serializing it.
+
+    :copyright: (c) 2013 by Zaur Nasibov.
+    :license: MIT, see LICENSE for more details.
+"""
+import json
+import threading
+
+from .util import LRUCache
+from .project import KL_TASK_BLOBS
+
+
+class CachedTask(object):
+    """A serialized task.
+
+    :param task_id: the normalized (string) task ID.
+    :param payload: the JSON-encoded task without the session data.
+    :param session_data: the task's session variables.
+    :param blobs: the keys of the blobs referenced by the task.
+    """
+    __slots__ = ('id', 'payload', 'session_data', 'blobs')
+
+    def __init__(self, task_id, payload, session_data, blobs=()):
+        self.id = task_id
+        self.payload = payload
+        self.session_data = session_data
+        self.blobs = blobs
+
+    @classmethod
+    def from_task(cls, task, session_data=None):
+        """Serializes the task. The session variables have to be removed
+        from the task beforehand."""
+        return cls(task['id'], json.dumps(task, separators=(',', ':')),
+                   session_data or {}, tuple(task.get(KL_TASK_BLOBS, ())))
+
+    def __repr__(self):
+        return '<CachedTask {}>'.format(self.id)
+
+
+class TaskCache(object):
+    """A thread-safe LRU cache of :class:`CachedTask` objects keyed
+    by task ID.
+
+    :param capacity: the maximum amount of the cached tasks. ``0``
+                     disables the cache.
+    """
+    def __init__(self, capacity=1000):
+        self.capacity = capacity
+        self._cache = (LRUCache(capacity, self._evicted) if capacity > 0
+                       else None)
+        self._lock = threading.Lock()
+        self._bytes = 0
+        #: The amount of cache hits.
+        self.hits = 0
+        #: The amount of cache misses.
+        self.misses = 0
+
+    def get(self, task_id):
+        """Returns the cached task or ``None``."""
+        if self._cache is None:
+            return None
+        with self._lock:
+            task = self._cache.get(task_id)
+            if task is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return task
+
+    def put(self, task):
+        """Caches the task (an instance of :class:`CachedTask`)."""
+        if self._cache is None:
+            return
+        with self._lock:
+            old = self._cache.pop(task.id)
+            if old is not None:
+                self._bytes -= len(old.payload)
+            self._bytes += len(task.payload)
+            self._cache.put(task.id, task)
+
+    def invalidate(self, task_id):
+        """Removes the task from the cache, e.g. when it is completed."""
+        if self._cache is None:
+            return
+        with self._lock:
+            task = self._cache.pop(task_id)
+            if task is not None:
+                self._bytes -= len(task.payload)
+
+    def clear(self):
+        if self._cache is None:
+            return
+        with self._lock:
+            self._cache.clear()
+            self._bytes = 0
+
+    @property
+    def size(self):
+        """The total size of the cached payloads in bytes."""
+        return self._bytes
+
+    @property
+    def hit_rate(self):
+        """The ratio of the cache hits to the total amount of lookups."""
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self):
+        """Returns the cache metrics as a dict."""
+        return {
+            'tasks' : len(self),
+            'bytes' : self._bytes,
+            'hits' : self.hits,
+            'misses' : self.misses,
+            'hit_rate' : self.hit_rate,
+        }
+
+    def _evicted(self, task_id, task):
+        self._bytes -= len(task.payload)
+
+    def __contains__(self, task_id):
+        return self._cache is not None and task_id in self._cache
+
+    def __len__(self):
+        return len(self._cache) if self._cache is not None else 0
@@ -110,5 +110,10 @@ class KayleeTestsLoader(unittest.TestLoader):
 
 
 def main():
-    """Runs the testsuite as command line application."""
+    """Runs the testsuite as command line application.
+    ``--bench [options]`` runs the hot paths micro-benchmarks instead
+    (see :mod:`kaylee.testsuite.benchmarks.suite`)."""
+    if len(sys.argv) > 1 and sys.argv[1] == '--bench':
+        from kaylee.testsuite.benchmarks.suite import main as bench_main
+        sys.exit(bench_main(sys.argv[2:]))
     unittest.main(testLoader = KayleeTestsLoader(), defaultTest = 'default')
@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+import io
+import json
+import time
+
+from kaylee.testsuite import KayleeTest, load_tests
+from kaylee import Kaylee, NodeID, tracing
+from kaylee.admin import AdminAPI, make_token, verify_token
+from kaylee.tracing import Tracer
+from kaylee.session import ClientSessionDataManager
+from kaylee.contrib import (SimpleController, ResultsComparatorController,
+                            MemoryNodesRegistry, MemoryPermanentStorage,
+                            MemoryTemporalStorage)
+from kaylee.contrib.frontends.wsgi_frontend import make_wsgi_app
+from kaylee.testsuite.projects.auto_test_project import AutoTestProject
+from kaylee.util import generate_sercret_key
+
+
+class AdminTests(KayleeTest):
+    def setUp(self):
+        self.secret_key = generate_sercret_key()
+        self.app = SimpleController('app', AutoTestProject(),
+                                    MemoryPermanentStorage())
+        self.comparator = ResultsComparatorController(
+            'comparator', AutoTestProject(), MemoryPermanentStorage(),
+            MemoryTemporalStorage(), results_count_threshold=2)
+        sdm = ClientSessionDataManager(self.secret_key)
+        self.kl = Kaylee(MemoryNodesRegistry('10m'), sdm,
+                         [self.app, self.comparator],
+                         AUTO_GET_ACTION=True,
+                         SECRET_KEY=self.secret_key,
+                         SESSION_DATA_MANAGER={
+                             'name' : 'ClientSessionDataManager',
+                             'config' : {'secret_key' : self.secret_key}})
+
+    def _solve(self, app_name, results=1, host='127.0.0.1'):
+        kl = self.kl
+        node_id = json.loads(kl.register(host))['node_id']
+        kl.subscribe(node_id, app_name)
+        action = json.loads(kl.get_action(node_id))
+        for _ in range(results):
+            task_id = action['data']['id']
+            action = json.loads(kl.accept_result(
+                node_id, json.dumps({'id' : task_id, 'res' : 1})))
+        return node_id
+
+    def test_tokens(self):
+        token = make_token(self.secret_key)
+        self.assertTrue(verify_token(self.secret_key, token))
+        self.assertFalse(verify_token(generate_sercret_key(), token))
+        self.assertFalse(verify_token(self.secret_key, token + '0'))
+        self.assertFalse(verify_token(self.secret_key, 'invalid'))
+        self.assertFalse(verify_token(self.secret_key, 'x.' + token))
+        # malformed (non-ASCII) tokens
+        timestamp, signature = token.split('.')
+        self.assertFalse(verify_token(self.secret_key,
+                                      '\u00b2.' + signature))
+        self.assertFalse(verify_token(self.secret_key,
+                                      '\u0661\u0662.' + signature))
+        self.assertFalse(verify_token(self.secret_key,
+                                      timestamp + '.\u00e9' + signature))
+        self.assertFalse(verify_token(self.secret_key,
+                                      timestamp + '.\ud800'))
+        expired = make_token(self.secret_key, time.time() - 600)
+        self.assertFalse(verify_token(self.secret_key, expired))
+        self.assertTrue(verify_token(self.secret_key, expired, max_age=900))
+
+    def test_snapshot(self):
+        self._solve('app', results=3)
+        self._solve('app', results=1, host='10.0.0.1')
+        self._solve('comparator', results=1)
+        self.assertIsInstance(self.kl.admin, AdminAPI)
+        self.assertIs(self.kl.admin, self.kl.admin)
+
+        snapshot = self.kl.admin.snapshot()
+        self.assertEqual(snapshot['registry'], {
+            'nodes' : 3,
+            'hosts' : {NodeID.host_id_of('127.0.0.1') : 2,
+                       NodeID.host_id_of('10.0.0.1') : 1}})
+        self.assertEqual(sorted(snapshot['applications']),
+                         ['app', 'comparator'])
+
+        state = snapshot['applications']['app']
+        self.assertEqual(state['name'], 'app')
+        self.assertFalse(state['completed'])
+        self.assertFalse(state['removed'])
+        self.assertEqual(state['progress']['accepted'], 4)
+        self.assertEqual(state['permanent_storage'],
+                         {'tasks' : 4, 'results' : 4})
+        self.assertIsNone(state['temporal_storage'])
+        total = state['progress']['total']
+        self.assertEqual(state['completion'],
+                         4 / total if total else None)
+        self.assertEqual(state['task_cache']['tasks'],
+                         self.app.task_cache.stats()['tasks'])
+
+        state = self.kl.admin.application('comparator')
+        self.assertEqual(state['temporal_storage'],
+                         {'tasks' : 1, 'results' : 1})
+        self.assertEqual(state['permanent_storage'],
+                         {'tasks' : 0, 'results' : 0})
+        self.assertEqual(state['pool_size'], self.comparator.pool_size)
+        self.assertRaises(KeyError, self.kl.admin.application, 'unknown')
+
+    def test_config(self):
+        config = self.kl.admin.config()
+        self.assertTrue(config['AUTO_GET_ACTION'])
+        self.assertNotEqual(config['SECRET_KEY'], self.secret_key)
+        self.assertNotEqual(
+            config['SESSION_DATA_MANAGER']['config']['secret_key'],
+            self.secret_key)
+        self.assertEqual(config['SESSION_DATA_MANAGER']['name'],
+                         'ClientSessionDataManager')
+        self.assertNotIn(self.secret_key, json.dumps(config))
+        self.assertFalse(any(name.startswith('_') for name in config))
+
+    def test_handle(self):
+        self._solve('app')
+        admin = self.kl.admin
+        auth = 'Kaylee-Admin ' + make_token(self.secret_key)
+
+        status, body = admin.handle('', auth)
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(body)['registry']['nodes'], 1)
+        status, body = admin.handle('applications/app', auth)
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(body)['name'], 'app')
+        self.assertEqual(admin.handle('applications/unknown', auth)[0], 404)
+        self.assertEqual(admin.handle('unknown', auth)[0], 404)
+
+        previous = tracing.install(Tracer())
+        try:
+            self._solve('app')
+            status, body = admin.handle('tracing', auth)
+        finally:
+            tracing.install(previous)
+        self.assertEqual(status, 200)
+        data = json.loads(body)
+        self.assertEqual(data['stats']['register']['count'], 1)
+        self.assertIsNone(data['slow_requests'])
+
+        for auth in (None, '', make_token(self.secret_key),
+                     'Kaylee-Admin ' + self.secret_key,
+                     'Kaylee-Admin \u00b2.' + 'a' * 64,
+                     'Kaylee-Admin ' + make_token(generate_sercret_key())):
+            self.assertEqual(admin.handle('', auth)[0], 401)
+
+        # the API is disabled without the secret key
+        del self.kl.config.SECRET_KEY
+        self.assertEqual(admin.handle('', auth)[0], 404)
+
+    def test_wsgi_endpoint(self):
+        wsgi_app = make_wsgi_app(self.kl)
+
+        def request(path, method='GET', authorization=None):
+            response = {}
+            def start_response(status, headers):
+                response['status'] = status
+                response['headers'] = dict(headers)
+            environ = {'REQUEST_METHOD' : method,
+                       'PATH_INFO' : path,
+                       'wsgi.input' : io.BytesIO(b'')}
+            if authorization is not None:
+                environ['HTTP_AUTHORIZATION'] = authorization
+            response['body'] = b''.join(wsgi_app(environ, start_response))
+            return response
+
+        auth = 'Kaylee-Admin ' + make_token(self.secret_key)
+        res = request('/kaylee/admin', authorization=auth)
+        self.assertEqual(res['status'], '200 OK')
+        self.assertEqual(res['headers']['Content-Type'], 'application/json')
+        self.assertIn('applications', json.loads(res['body'].decode()))
+        res = request('/kaylee/admin/applications/comparator',
+                      authorization=auth)
+        self.assertEqual(json.loads(res['body'].decode())['name'],
+                         'comparator')
+        self.assertEqual(request('/kaylee/admin')['status'],
+                         '401 Unauthorized')
+        self.assertEqual(request('/kaylee/admin', 'POST', auth)['status'],
+                         '405 Method Not Allowed')
+
+
+kaylee_suite = load_tests([AdminTests, ])
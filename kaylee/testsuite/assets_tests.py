@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+import io
+import os
+import gzip
+import shutil
+import tempfile
+
+from kaylee.testsuite import KayleeTest, load_tests
+from kaylee.assets import (minify_js, minify_css, bundle_assets,
+                           load_assets_manifest, rewrite_asset_urls,
+                           hashed_name_re)
+from kaylee.server import StaticFiles
+
+
+INDEX_HTML = '''<html><head>
+  <script src="/static/kaylee/js/kaylee.js" type="text/javascript"></script>
+  <link href="/static/kaylee/css/klconsole.css" rel="stylesheet" />
+  <script src="/static/kaylee/js/jquery.min.js"></script>
+  <script src="/static/kaylee/js/kldebug.js"></script>
+  <script src="/static/other.js"></script>
+</head></html>'''
+
+
+class AssetsTests(KayleeTest):
+    def setUp(self):
+        self.build_dir = tempfile.mkdtemp(prefix='kl_unit_test__')
+        files = {
+            'kaylee/js/kaylee.js' : 'var kl = {};\n// comment\n'
+                                    'kl.x = 1 + 2;\n' * 50,
+            'kaylee/js/jquery.min.js' : 'var jQuery=function(){};',
+            'kaylee/js/kldebug.js' : 'kl.debug = function (a) {\n'
+                                     '    return a;\n};\n',
+            'kaylee/js/klworker.js' : 'var w = 1;\n' * 100,
+            'kaylee/css/klconsole.css' : 'body {\n  color : red;\n}\n',
+            'pj/js/pj.js' : 'pj.init = function() { lib(); };\n',
+            'pj/js/lib.js' : 'function lib() {\n    return 1;\n}\n',
+            'pj/css/pj.css' : '/* c */ .a > .b { margin : 0 }',
+            'nopj/js/lib.js' : 'var x = 1;',
+        }
+        for name, content in files.items():
+            self.write(name, content)
+        self.index_path = os.path.join(self.build_dir, 'index.tmpl.html')
+        with open(self.index_path, 'w') as f:
+            f.write(INDEX_HTML)
+
+    def tearDown(self):
+        shutil.rmtree(self.build_dir)
+
+    def write(self, name, content):
+        path = os.path.join(self.build_dir, name)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as f:
+            f.write(content)
+
+    def read(self, name):
+        with open(os.path.join(self.build_dir, name)) as f:
+            return f.read()
+
+    def test_minify_js(self):
+        src = ('/*! license */\n'
+               '// comment\n'
+               'var a = 1, b = a - -1, c = a + +b; /* inline */\n'
+               'var re = /[/]+\\//g, s = "a // b", t = \'it\\\'s\';\n'
+               'function f(x) {\n'
+               '    return x\n'
+               '        + 1;\n'
+               '}\n'
+               'var g = a\n'
+               '(b)\n'
+               'var n = 1 .toString(), d = x / 2 / y;\n')
+        self.assertEqual(minify_js(src),
+                         '/*! license */\n'
+                         'var a=1,b=a- -1,c=a+ +b;'
+                         'var re=/[/]+\\//g,s="a // b",t=\'it\\\'s\';'
+                         'function f(x){return x\n+1;}\n'
+                         'var g=a\n(b)\n'
+                         'var n=1 .toString(),d=x/2/y;')
+
+    def test_minify_css(self):
+        src = ('/* comment */ a  >  b , div :hover {\n'
+               '  color : red ;\n  content: " x  y " ;\n}\n'
+               '@media screen and (max-width: 10px) { a { margin: 0 auto; } }')
+        self.assertEqual(minify_css(src),
+                         'a>b,div :hover{color :red;content:" x  y "}'
+                         '@media screen and (max-width:10px)'
+                         '{a{margin:0 auto}}')
+
+    def test_bundle_assets(self):
+        assets = bundle_assets(self.build_dir, ['pj', 'nopj'],
+                               self.index_path)
+        self.assertEqual(assets, load_assets_manifest(self.build_dir))
+        kaylee_bundle = assets['kaylee/js/kaylee.js']
+        self.assertTrue(hashed_name_re.search(kaylee_bundle))
+        self.assertEqual(assets['kaylee/js/jquery.min.js'], kaylee_bundle)
+        self.assertEqual(assets['kaylee/js/kldebug.js'], kaylee_bundle)
+        self.assertNotIn('kaylee/js/klworker.js', assets)
+        self.assertNotIn('nopj/js/lib.js', assets)
+        self.assertEqual(assets['pj/js/lib.js'], assets['pj/js/pj.js'])
+        self.assertEqual(self.read(assets['pj/js/pj.js']),
+                         'function lib(){return 1;};\n'
+                         'pj.init=function(){lib();};')
+        self.assertEqual(self.read(assets['pj/css/pj.css']),
+                         '.a>.b{margin :0}')
+        self.assertTrue(self.read(kaylee_bundle).endswith(
+            'var jQuery=function(){};;\nkl.debug=function(a){return a;};'))
+
+        # precompressed siblings
+        with gzip.open(os.path.join(self.build_dir,
+                                    kaylee_bundle + '.gz')) as f:
+            self.assertEqual(f.read().decode(), self.read(kaylee_bundle))
+        self.assertTrue(os.path.exists(os.path.join(
+            self.build_dir, 'kaylee/js/klworker.js.gz')))
+        # too small to be compressed
+        self.assertFalse(os.path.exists(os.path.join(
+            self.build_dir, assets['pj/js/pj.js'] + '.gz')))
+
+        index = self.read('index.html')
+        self.assertEqual(index.count('<script'), 2)
+        self.assertIn('src="/static/{}"'.format(kaylee_bundle), index)
+        self.assertIn('href="/static/{}"'.format(
+            assets['kaylee/css/klconsole.css']), index)
+        self.assertIn('src="/static/other.js"', index)
+
+        # the outdated bundles are removed
+        self.write('pj/js/pj.js', 'pj.init = function() {};')
+        new_assets = bundle_assets(self.build_dir, ['pj'])
+        self.assertNotEqual(new_assets['pj/js/pj.js'], assets['pj/js/pj.js'])
+        self.assertFalse(os.path.exists(os.path.join(
+            self.build_dir, assets['pj/js/pj.js'])))
+        self.assertTrue(os.path.exists(os.path.join(
+            self.build_dir, kaylee_bundle)))
+
+    def test_rewrite_asset_urls(self):
+        html = rewrite_asset_urls(INDEX_HTML, {})
+        self.assertEqual(html, INDEX_HTML)
+
+    def test_static_files(self):
+        assets = bundle_assets(self.build_dir, ['pj'], self.index_path)
+        app = StaticFiles(self.build_dir, '/static')
+
+        def request(path, **extra):
+            environ = {'REQUEST_METHOD' : 'GET', 'PATH_INFO' : path,
+                       'wsgi.input' : io.BytesIO()}
+            environ.update(extra)
+            response = {}
+            def start_response(status, headers):
+                response['status'] = status
+                response['headers'] = dict(headers)
+            response['body'] = b''.join(app(environ, start_response))
+            return response
+
+        bundle = assets['kaylee/js/kaylee.js']
+        res = request('/static/' + bundle)
+        self.assertEqual(res['status'], '200 OK')
+        self.assertEqual(res['body'].decode(), self.read(bundle))
+        self.assertIn('immutable', res['headers']['Cache-Control'])
+        self.assertIn('javascript', res['headers']['Content-Type'])
+        self.assertNotIn('Content-Encoding', res['headers'])
+
+        res = request('/static/' + bundle,
+                      HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(res['headers']['Content-Encoding'], 'gzip')
+        self.assertEqual(res['headers']['Vary'], 'Accept-Encoding')
+        self.assertEqual(gzip.decompress(res['body']).decode(),
+                         self.read(bundle))
+
+        res = request('/static/kaylee/js/klworker.js')
+        self.assertEqual(res['headers']['Cache-Control'], 'no-cache')
+        etag = res['headers']['ETag']
+        res = request('/static/kaylee/js/klworker.js',
+                      HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res['status'], '304 Not Modified')
+        self.assertEqual(res['body'], b'')
+
+        for path in ('/static/missing.js', '/static/../../etc/passwd',
+                     '/static/kaylee/js/klworker.js.gz', '/other'):
+            self.assertEqual(request(path)['status'], '404 Not Found')
+        self.assertEqual(request('/static/%2e%2e/%2e%2e/etc/passwd')
+                         ['status'], '404 Not Found')
+
+
+kaylee_suite = load_tests([AssetsTests])
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+"""
+    kaylee.testsuite.benchmarks
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Performance benchmarks of Kaylee internals. Every benchmark module
+    can be executed directly, e.g.::
+
+      python -m kaylee.testsuite.benchmarks.session_bench
+
+    :copyright: (c) 2013 by Zaur Nasibov.
+    :license: MIT, see LICENSE for more details.
+"""
+import timeit
+
+
+def measure(func, number=1000, repeat=3):
+    """Returns the best time (in seconds) of a single ``func()`` call
+    out of ``repeat`` series of ``number`` calls."""
+    timer = timeit.Timer(func)
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def print_table(title, rows, header=('benchmark', 'value')):
+    """Prints a simple two-or-more columns table."""
+    widths = [max(len(str(row[i])) for row in [header] + list(rows))
+              for i in range(len(header))]
+    print(title)
+    print('  '.join(str(h).ljust(w) for h, w in zip(header, widths)))
+    for row in rows:
+        print('  '.join(str(c).ljust(w) for c, w in zip(row, widths)))
+    print()
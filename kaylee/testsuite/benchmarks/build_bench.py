@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""Measures the build time of the client files of a data-heavy project:
+a full build which copies every file (the former ``kaylee build``
+behaviour), the first incremental build (hard-linked data files) and
+a rebuild of the unchanged project."""
+import os
+import time
+import shutil
+import tempfile
+from kaylee.manager.commands.build import BuildManifest, build_project
+from kaylee.testsuite.benchmarks import print_table
+
+DATA_FILES = 50
+DATA_FILE_SIZE = 4 * 1024 * 1024
+SCRIPTS = 20
+
+
+def _make_project(root):
+    client_dir = os.path.join(root, 'pj', 'client')
+    os.makedirs(client_dir)
+    chunk = os.urandom(DATA_FILE_SIZE)
+    for i in range(DATA_FILES):
+        with open(os.path.join(client_dir, 'data{}.bin'.format(i)),
+                  'wb') as f:
+            f.write(chunk[i:] + chunk[:i])
+    for i in range(SCRIPTS):
+        with open(os.path.join(client_dir, 'lib{}.js'.format(i)), 'w') as f:
+            f.write('var x{} = {};\n'.format(i, i) * 1000)
+    return os.path.join(root, 'pj')
+
+
+def _timed(func):
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def run():
+    root = tempfile.mkdtemp()
+    try:
+        pkg_dir = _make_project(root)
+        client_dir = os.path.join(pkg_dir, 'client')
+        build_dir = os.path.join(root, '_build')
+        os.mkdir(build_dir)
+        dest_dir = os.path.join(build_dir, 'pj')
+
+        def full_copy():
+            if os.path.isdir(dest_dir):
+                shutil.rmtree(dest_dir)
+            os.makedirs(os.path.join(dest_dir, 'data'))
+            for fname in os.listdir(client_dir):
+                shutil.copy(os.path.join(client_dir, fname),
+                            os.path.join(dest_dir, 'data'))
+
+        def incremental():
+            manifest = BuildManifest(build_dir)
+            build_project(pkg_dir, dest_dir, manifest)
+            manifest.save()
+
+        results = [('full copy', _timed(full_copy))]
+        shutil.rmtree(dest_dir)
+        results.append(('incremental, first build', _timed(incremental)))
+        results.append(('incremental, unchanged', _timed(incremental)))
+        return results
+    finally:
+        shutil.rmtree(root)
+
+
+def main():
+    rows = [(name, '{:.3f}'.format(seconds)) for name, seconds in run()]
+    print_table('Build of {} x {} MB data files and {} scripts, seconds'
+                .format(DATA_FILES, DATA_FILE_SIZE // (1024 * 1024),
+                        SCRIPTS),
+                rows, header=('build', 'time'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""Measures the size reduction and the time of the response compression
+(:meth:`Kaylee.compress_response <kaylee.Kaylee.compress_response>`) of
+typical Kaylee payloads: a "nop" action (skipped by the size precheck),
+a task carrying a list of numbers and a large result."""
+import json
+import random
+from kaylee import Kaylee
+from kaylee.contrib import MemoryNodesRegistry
+from kaylee.testsuite.benchmarks import measure, print_table
+
+ACCEPT_ENCODING = 'gzip, deflate, br'
+
+
+def _payloads():
+    rnd = random.Random(0)
+    numbers = [rnd.randint(0, 10 ** 6) for i in range(1000)]
+    points = [{'x' : rnd.random(), 'y' : rnd.random()} for i in range(2000)]
+    return [
+        ('nop action', json.dumps({'action' : 'nop', 'data' : ''})),
+        ('task (1000 ints)', json.dumps({'action' : 'task', 'data' :
+                                         {'id' : '1', 'numbers' : numbers}})),
+        ('result (2000 points)', json.dumps({'id' : '1', 'res' : points})),
+    ]
+
+
+def run():
+    kl = Kaylee(MemoryNodesRegistry('1h'), None, [], AUTO_GET_ACTION=True)
+    results = []
+    for name, payload in _payloads():
+        body, encoding = kl.compress_response(payload, ACCEPT_ENCODING)
+        seconds = measure(lambda: kl.compress_response(payload,
+                                                       ACCEPT_ENCODING),
+                          number=200)
+        results.append({'payload' : name,
+                        'size' : len(payload.encode('utf-8')),
+                        'compressed' : len(body),
+                        'encoding' : encoding or '-',
+                        'usec' : seconds * 1e6})
+    return results
+
+
+def main():
+    rows = [(r['payload'], r['size'], r['compressed'], r['encoding'],
+             '{:.1f}'.format(r['usec'])) for r in run()]
+    print_table('Response compression', rows,
+                header=('payload', 'bytes', 'sent bytes', 'coding',
+                        'usec'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""Measures the startup time, the streaming throughput and the random
+access time of :class:`JSONLinesFileProject` against a project which
+loads the whole input file into memory."""
+import os
+import json
+import random
+import tempfile
+from kaylee.project import AUTO_PROJECT_MODE
+from kaylee.contrib.projects import JSONLinesFileProject
+from kaylee.testsuite.benchmarks import measure, print_table
+
+RECORDS = 200000
+
+
+class BenchProject(JSONLinesFileProject):
+    def normalize_result(self, task_id, result):
+        return result
+
+
+def _load_in_memory(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _stream_all(path):
+    pj = BenchProject('/script.js', AUTO_PROJECT_MODE, path)
+    while pj.next_task() is not None:
+        pass
+    return pj
+
+
+def run(records=RECORDS):
+    fd, path = tempfile.mkstemp(prefix='kl_bench_', suffix='.jsonl')
+    with os.fdopen(fd, 'w') as f:
+        for i in range(records):
+            f.write(json.dumps({'x' : i, 'payload' : 'a' * 40}) + '\n')
+    rnd = random.Random(1)
+    try:
+        startup = measure(
+            lambda: BenchProject('/script.js', AUTO_PROJECT_MODE, path), 100)
+        in_memory = measure(lambda: _load_in_memory(path), 1, 1)
+        stream = measure(lambda: _stream_all(path), 1, 1)
+        pj = _stream_all(path)
+        random_access = measure(
+            lambda: pj[str(rnd.randrange(records))], 10000)
+        index_bytes = pj._offsets.itemsize * len(pj._offsets)
+        pj.close()
+    finally:
+        os.remove(path)
+    return [
+        {'case' : 'file project startup', 'value' : startup * 1e6,
+         'unit' : 'usec'},
+        {'case' : 'in-memory load', 'value' : in_memory * 1e3,
+         'unit' : 'msec'},
+        {'case' : 'stream all tasks', 'value' : stream * 1e3,
+         'unit' : 'msec'},
+        {'case' : 'random access project[id]', 'value' : random_access * 1e6,
+         'unit' : 'usec'},
+        {'case' : 'offset index size', 'value' : index_bytes / 1024.0,
+         'unit' : 'KiB'},
+    ]
+
+
+def main():
+    rows = [(r['case'], '{:.2f}'.format(r['value']), r['unit'])
+            for r in run()]
+    print_table('JSON Lines file project ({} records)'.format(RECORDS),
+                rows, header=('benchmark', 'value', 'unit'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""Measures the loading time of a Kaylee instance which refers to one of
+50 generated project packages: the eager discovery (importing every
+project package) against the lazy, manifest-based one (cold and warm
+manifest cache). Every case is measured in a fresh interpreter."""
+import os
+import sys
+import shutil
+import tempfile
+import subprocess
+from kaylee.testsuite.benchmarks import print_table
+
+PROJECTS = 50
+#: The amount of generated functions per project module.
+FUNCTIONS = 300
+REPEAT = 5
+
+_PROJECT_MODULE = '''
+import decimal, fractions, xml.dom.minidom
+from kaylee.project import Project, AUTO_PROJECT_MODE
+from kaylee.contrib import SimpleController
+
+class Project{num}(Project):
+    def __init__(self, *args, **kwargs):
+        super(Project{num}, self).__init__('/script.js', AUTO_PROJECT_MODE,
+                                            *args, **kwargs)
+
+    def next_task(self):
+        return None
+
+    def __getitem__(self, task_id):
+        raise KeyError(task_id)
+
+    def normalize_result(self, task_id, result):
+        return result
+
+class Controller{num}(SimpleController):
+    pass
+'''
+
+_FUNCTION = '''
+def func_{num}(x, y=1):
+    """Function {num}."""
+    return [x * i + y for i in range({num})]
+'''
+
+_SETTINGS = '''
+REGISTRY = {{'name' : 'MemoryNodesRegistry', 'config' : {{'timeout' : '2s'}}}}
+AUTO_GET_ACTION = True
+SECRET_KEY = 'benchmark-secret-key-benchmark-secret'
+PROJECTS_DIR = {projects_dir!r}
+APPLICATIONS = [{{
+    'name' : 'bench',
+    'description' : 'Benchmark application',
+    'project' : {{'name' : 'Project0'}},
+    'controller' : {{
+        'name' : 'Controller0',
+        'permanent_storage' : {{'name' : 'MemoryPermanentStorage'}},
+    }},
+}}]
+'''
+
+_EAGER = '''
+import sys, time, importlib
+start = time.perf_counter()
+sys.path.insert(0, {projects_dir!r})
+from kaylee import loader
+for module in loader.find_modules({projects_dir!r}):
+    loader.get_classes_from_module(module)
+loader.load({settings_path!r})
+print(time.perf_counter() - start)
+'''
+
+_LAZY = '''
+import sys, time
+start = time.perf_counter()
+sys.path.insert(0, {projects_dir!r})
+from kaylee import loader
+loader.load({settings_path!r})
+print(time.perf_counter() - start)
+'''
+
+
+def _generate(root):
+    projects_dir = os.path.join(root, 'projects')
+    for num in range(PROJECTS):
+        package_dir = os.path.join(projects_dir, 'bench_project{}'.format(num))
+        os.makedirs(package_dir)
+        with open(os.path.join(package_dir, '__init__.py'), 'w') as f:
+            f.write('from .project import *\n')
+        with open(os.path.join(package_dir, 'project.py'), 'w') as f:
+            f.write(_PROJECT_MODULE.format(num=num))
+            for fnum in range(FUNCTIONS):
+                f.write(_FUNCTION.format(num=fnum))
+    settings_path = os.path.join(root, 'settings.py')
+    with open(settings_path, 'w') as f:
+        f.write(_SETTINGS.format(projects_dir=projects_dir))
+    return projects_dir, settings_path
+
+
+def _run(code, cleanup=None):
+    best = None
+    for _ in range(REPEAT):
+        if cleanup is not None:
+            cleanup()
+        out = subprocess.check_output([sys.executable, '-c', code])
+        elapsed = float(out.decode().strip().splitlines()[-1])
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def run():
+    root = tempfile.mkdtemp(prefix='kl_bench_')
+    try:
+        projects_dir, settings_path = _generate(root)
+        params = {'projects_dir' : projects_dir,
+                  'settings_path' : settings_path}
+        manifest_path = os.path.join(projects_dir, '.kaylee-manifest.json')
+
+        def remove_manifest():
+            if os.path.exists(manifest_path):
+                os.remove(manifest_path)
+
+        eager = _run(_EAGER.format(**params))
+        lazy_cold = _run(_LAZY.format(**params), remove_manifest)
+        lazy_warm = _run(_LAZY.format(**params))
+    finally:
+        shutil.rmtree(root)
+    return [
+        {'case' : 'eager (import all projects)', 'msec' : eager * 1e3},
+        {'case' : 'lazy, cold manifest', 'msec' : lazy_cold * 1e3},
+        {'case' : 'lazy, warm manifest', 'msec' : lazy_warm * 1e3},
+    ]
+
+
+def main():
+    rows = [(r['case'], '{:.1f}'.format(r['msec'])) for r in run()]
+    print_table('Kaylee loading time, {} projects'.format(PROJECTS),
+                rows, header=('discovery', 'msec'))
+
+
+if __name__ == '__main__':
+    main()
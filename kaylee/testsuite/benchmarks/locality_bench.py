@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""Simulates a pool of volunteer nodes solving blob-dependent tasks and
+reports the amount of bytes transferred per task (the task payload plus
+the blobs missing in the node's cache) with and without the
+locality-aware dispatch (see ``Controller.next_project_task``).
+
+Every node fetches a blob only once during its lifetime. The nodes
+leave after solving ``NODE_LIFETIME`` tasks and are replaced by fresh
+nodes with empty caches."""
+import json
+import random
+from kaylee import Kaylee
+from kaylee.project import KL_TASK_BLOBS
+from kaylee.contrib import (SimpleController, MemoryNodesRegistry,
+                            MemoryPermanentStorage)
+from kaylee.testsuite.projects.auto_test_project import AutoTestProject
+from kaylee.testsuite.benchmarks import print_table
+
+TASKS = 4000
+BLOBS = 40
+BLOB_SIZE = 64 * 1024
+NODES = 20
+NODE_LIFETIME = 50
+
+
+class BlobsProject(AutoTestProject):
+    def __init__(self, **kwargs):
+        super(BlobsProject, self).__init__(tasks_count=TASKS, **kwargs)
+        rnd = random.Random(1)
+        self.blob_keys = [self.add_blob(bytes([i]) * BLOB_SIZE)
+                          for i in range(BLOBS)]
+        self.task_blobs = [rnd.choice(self.blob_keys)
+                           for i in range(TASKS + 1)]
+
+    def __getitem__(self, task_id):
+        return {'id' : str(task_id), 'x' : int(task_id),
+                KL_TASK_BLOBS : [self.task_blobs[int(task_id)]]}
+
+
+class SimNode(object):
+    def __init__(self, kl):
+        self.kl = kl
+        self.node_id = json.loads(kl.register('127.0.0.1'))['node_id']
+        kl.subscribe(self.node_id, 'app')
+        self.cache = set()
+        self.solved = 0
+
+    def step(self):
+        """Solves a task and returns the amount of bytes received or
+        ``None`` if there are no tasks left."""
+        response = self.kl.get_action(self.node_id)
+        action = json.loads(response)
+        if action['action'] != 'task':
+            return None
+        received = len(response)
+        task = action['data']
+        for key in task[KL_TASK_BLOBS]:
+            if key not in self.cache:
+                received += len(self.kl.get_blob(key).data)
+                self.cache.add(key)
+        self.kl.accept_result(self.node_id,
+                              json.dumps({'res' : task['x']}))
+        self.solved += 1
+        return received
+
+
+def simulate(lookahead):
+    app = SimpleController('app', BlobsProject(), MemoryPermanentStorage(),
+                           locality_lookahead=lookahead)
+    kl = Kaylee(MemoryNodesRegistry('1d'), None, [app],
+                AUTO_GET_ACTION=False)
+    nodes = [SimNode(kl) for i in range(NODES)]
+    total = tasks = 0
+    while not app.completed:
+        for i, node in enumerate(nodes):
+            received = node.step()
+            if received is None:
+                break
+            total += received
+            tasks += 1
+            if node.solved == NODE_LIFETIME:
+                kl.unregister(node.node_id)
+                nodes[i] = SimNode(kl)
+        else:
+            continue
+        break
+    return {'lookahead' : lookahead, 'tasks' : tasks,
+            'bytes_per_task' : total / tasks}
+
+
+def run(lookaheads=(0, 8, 32, 128)):
+    return [simulate(lookahead) for lookahead in lookaheads]
+
+
+def main():
+    results = run()
+    base = results[0]['bytes_per_task']
+    rows = [(r['lookahead'], r['tasks'],
+             '{:.0f}'.format(r['bytes_per_task']),
+             '{:.1f}x'.format(base / r['bytes_per_task']))
+            for r in results]
+    print_table('Locality-aware dispatch: {} nodes, {} blobs of {} KiB, '
+                'node lifetime {} tasks'.format(NODES, BLOBS,
+                                                BLOB_SIZE // 1024,
+                                                NODE_LIFETIME),
+                rows, header=('lookahead', 'tasks', 'bytes/task',
+                              'reduction'))
+
+
+if __name__ == '__main__':
+    main()
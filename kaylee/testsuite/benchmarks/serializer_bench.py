@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""Compares the session data serializers: the serialized size, the size
+of the encrypted session token sent to the client and the CPU time per
+task (serialization + deserialization)."""
+import random
+from kaylee.session import (BinarySerializer, PickleSerializer,
+                            SessionCrypto)
+from kaylee.testsuite.benchmarks import measure, print_table
+
+SECRET_KEY = 'aJD2fn;1340913)*(!!&$)(#&<AHFB12b'
+
+_rnd = random.Random(1)
+
+SESSION_DATA_SAMPLES = {
+    'small' : {
+        '#s1' : 10,
+        '#s2' : [1, 2, 3],
+        '#word' : 'abcdefghijklmnopqrstuvwxyz',
+    },
+    'nested' : {
+        '#board' : [[_rnd.randint(0, 9) for i in range(9)] for j in range(9)],
+        '#meta' : {'level' : 3, 'seed' : 'abc', 'ok' : True},
+    },
+    'float_array_10k' : {
+        '#arr' : [_rnd.random() for i in range(10000)],
+    },
+    'sparse_array_10k' : {
+        '#arr' : [float(i % 7 == 0) for i in range(10000)],
+    },
+}
+
+SERIALIZERS = [
+    ('pickle', PickleSerializer()),
+    ('binary', BinarySerializer(compression_threshold=None)),
+    ('binary+zlib', BinarySerializer(compression_threshold=1024)),
+]
+
+
+def run(number=200):
+    results = []
+    for sample_name, data in sorted(SESSION_DATA_SAMPLES.items()):
+        for ser_name, ser in SERIALIZERS:
+            serialized = ser.dumps(data)
+            crypto = SessionCrypto(SECRET_KEY, ser)
+            cpu = measure(lambda: ser.loads(ser.dumps(data)), number)
+            results.append({
+                'sample' : sample_name,
+                'serializer' : ser_name,
+                'size' : len(serialized),
+                'token_size' : len(crypto.encrypt(data)),
+                'cpu' : cpu,
+            })
+    return results
+
+
+def main():
+    rows = [(r['sample'], r['serializer'], r['size'], r['token_size'],
+             '{:.2f}'.format(r['cpu'] * 1e6))
+            for r in run()]
+    print_table('Session data serializers', rows,
+                header=('sample', 'serializer', 'bytes', 'token bytes',
+                        'dumps+loads, us'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""Measures the throughput (requests per second) of the Kaylee server
+with 1, 2 and 4 worker processes (see :func:`kaylee.server.run_workers`).
+Every client process registers a few nodes and runs the
+``get_action`` / ``accept_result`` loop over HTTP."""
+import os
+import sys
+import json
+import time
+import shutil
+import socket
+import tempfile
+import subprocess
+import multiprocessing
+from http.client import HTTPConnection
+from kaylee.testsuite import PROJECTS_DIR
+from kaylee.testsuite.benchmarks import print_table
+
+WORKERS = (1, 2, 4)
+CLIENTS = 8
+NODES_PER_CLIENT = 4
+DURATION = 5.0
+PORT = 5431
+
+_SETTINGS = '''
+REGISTRY = {{'name' : 'MemoryNodesRegistry', 'config' : {{'timeout' : '1h'}}}}
+AUTO_GET_ACTION = True
+SECRET_KEY = 'benchmark-secret-key-benchmark-secret'
+PROJECTS_DIR = {projects_dir!r}
+APPLICATIONS = [{{
+    'name' : 'bench',
+    'description' : 'Benchmark application',
+    'project' : {{'name' : 'AutoTestProject',
+                  'config' : {{'tasks_count' : 10 ** 9}}}},
+    'controller' : {{
+        'name' : 'SimpleController',
+        'permanent_storage' : {{'name' : 'MemoryPermanentStorage'}},
+    }},
+}}]
+'''
+
+_SERVER = '''
+import sys
+sys.path.insert(0, {projects_dir!r})
+from kaylee.server import run
+run({settings_path!r}, {static_dir!r}, {port}, workers={workers})
+'''
+
+
+def _request(method, path, body=None):
+    conn = HTTPConnection('127.0.0.1', PORT)
+    try:
+        conn.request(method, path, body)
+        return json.loads(conn.getresponse().read().decode())
+    finally:
+        conn.close()
+
+
+def _client(duration, counter):
+    nodes = []
+    for _ in range(NODES_PER_CLIENT):
+        node_id = _request('GET', '/kaylee/register')['node_id']
+        _request('POST', '/kaylee/apps/bench/subscribe/' + node_id)
+        nodes.append(node_id)
+    actions = {node_id : _request('GET', '/kaylee/actions/' + node_id)
+               for node_id in nodes}
+    requests = 0
+    deadline = time.time() + duration
+    while time.time() < deadline:
+        for node_id in nodes:
+            task = actions[node_id]['data']
+            result = json.dumps({'id' : task['id'], 'res' : 1})
+            actions[node_id] = _request('POST', '/kaylee/actions/' + node_id,
+                                        result)
+            requests += 1
+    with counter.get_lock():
+        counter.value += requests
+
+
+def _wait_for_port(timeout=10.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', PORT), 0.1).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError('The server has not started')
+
+
+def _measure(workers, params):
+    code = _SERVER.format(workers=workers, port=PORT, **params)
+    server = subprocess.Popen([sys.executable, '-c', code],
+                              stderr=subprocess.DEVNULL)
+    try:
+        _wait_for_port()
+        counter = multiprocessing.Value('l', 0)
+        clients = [multiprocessing.Process(target=_client,
+                                           args=(DURATION, counter))
+                   for _ in range(CLIENTS)]
+        for client in clients:
+            client.start()
+        for client in clients:
+            client.join()
+        return counter.value / DURATION
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def run():
+    root = tempfile.mkdtemp(prefix='kl_bench_')
+    try:
+        settings_path = os.path.join(root, 'settings.py')
+        with open(settings_path, 'w') as f:
+            f.write(_SETTINGS.format(projects_dir=PROJECTS_DIR))
+        with open(os.path.join(root, 'index.html'), 'w') as f:
+            f.write('<html></html>')
+        params = {'projects_dir' : PROJECTS_DIR,
+                  'settings_path' : settings_path,
+                  'static_dir' : root}
+        results = []
+        for workers in WORKERS:
+            results.append({'workers' : workers,
+                            'rps' : _measure(workers, params)})
+            time.sleep(0.5)
+    finally:
+        shutil.rmtree(root)
+    return results
+
+
+def main():
+    rows = [(r['workers'], '{:.0f}'.format(r['rps'])) for r in run()]
+    print_table('Kaylee server throughput ({} CPUs, {} clients x {} nodes)'
+                .format(multiprocessing.cpu_count(), CLIENTS,
+                        NODES_PER_CLIENT),
+                rows, header=('workers', 'requests/sec'))
+
+
+if __name__ == '__main__':
+    main()
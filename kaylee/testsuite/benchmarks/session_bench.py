@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""Compares the session data encryption engine with the original
+(Kaylee 0.3) AES-CBC + HMAC-SHA1 routines."""
+import random
+import pickle
+from base64 import b64encode, b64decode
+from hmac import new as hmac
+from hashlib import sha1, sha256
+
+from kaylee.session import get_session_crypto
+from kaylee.testsuite.benchmarks import measure, print_table
+
+SECRET_KEY = 'aJD2fn;1340913)*(!!&$)(#&<AHFB12b'
+
+SESSION_DATA = {
+    '#s1' : 10,
+    '#s2' : [1, 2, 3],
+    '#word' : 'abcdefghijklmnopqrstuvwxyz',
+}
+
+
+# The original routines, kept verbatim for comparison.
+# They require PyCrypto (or PyCryptodome).
+def _v03_encrypt(data, secret_key):
+    from Crypto.Cipher import AES
+    bsecret_key = secret_key.encode('utf-8')
+    mac = hmac(bsecret_key, None, sha1)
+    encryption_key = sha256(bsecret_key).digest()
+    iv = bytes(random.randint(0, 0xFF) for i in range(16))
+    encryptor = AES.new(encryption_key, AES.MODE_CBC, iv)
+    val = pickle.dumps(data, pickle.HIGHEST_PROTOCOL)
+    val = encryptor.encrypt(val + (32 - len(val) % 32) * b' ')
+    encrypted_data = b64encode(val)
+    mac.update(b'|' + encrypted_data)
+    data_out = (b'&'.join([b64encode(iv), encrypted_data])).decode('utf-8')
+    mac_out = b64encode(mac.digest()).decode('utf-8')
+    return '{}?{}'.format(mac_out, data_out)
+
+
+def _v03_decrypt(s, secret_key):
+    from Crypto.Cipher import AES
+    bsecret_key = secret_key.encode('utf-8')
+    base64_hash, data = s.split('?', 1)
+    mac = hmac(bsecret_key, None, sha1)
+    iv, data = data.split('&', 1)
+    iv = b64decode(iv)
+    decryption_key = sha256(bsecret_key).digest()
+    decryptor = AES.new(decryption_key, AES.MODE_CBC, iv)
+    mac.update(b'|' + data.encode('utf-8'))
+    val = decryptor.decrypt(b64decode(data)).rstrip(b' ')
+    decrypted_data = pickle.loads(val)
+    if b64decode(base64_hash) == mac.digest():
+        return decrypted_data
+    raise ValueError('verification failed')
+
+
+def run(number=2000):
+    crypto = get_session_crypto(SECRET_KEY)
+    token = crypto.encrypt(SESSION_DATA)
+    res = {
+        'encrypt' : measure(lambda: crypto.encrypt(SESSION_DATA), number),
+        'decrypt' : measure(lambda: crypto.decrypt(token), number),
+        'token_length' : len(token),
+    }
+    try:
+        legacy_token = _v03_encrypt(SESSION_DATA, SECRET_KEY)
+    except ImportError:
+        return res
+    res.update({
+        'legacy_encrypt' : measure(
+            lambda: _v03_encrypt(SESSION_DATA, SECRET_KEY), number),
+        'legacy_decrypt' : measure(
+            lambda: _v03_decrypt(legacy_token, SECRET_KEY), number),
+        'legacy_token_length' : len(legacy_token),
+    })
+    res['roundtrip_speedup'] = ((res['legacy_encrypt'] + res['legacy_decrypt'])
+                                / (res['encrypt'] + res['decrypt']))
+    return res
+
+
+def main():
+    res = run()
+    rows = [
+        ('encrypt, us', '{:.2f}'.format(res['encrypt'] * 1e6)),
+        ('decrypt, us', '{:.2f}'.format(res['decrypt'] * 1e6)),
+        ('token length', res['token_length']),
+    ]
+    if 'legacy_encrypt' in res:
+        rows += [
+            ('v0.3 encrypt, us', '{:.2f}'.format(res['legacy_encrypt'] * 1e6)),
+            ('v0.3 decrypt, us', '{:.2f}'.format(res['legacy_decrypt'] * 1e6)),
+            ('v0.3 token length', res['legacy_token_length']),
+            ('round-trip speedup', '{:.2f}x'.format(res['roundtrip_speedup'])),
+        ]
+    print_table('Session data encryption', rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""Compares the session variables extraction from an outgoing task:
+the v0.3 regex scan, the schema-less single pass scan and the
+project's session keys schema."""
+import re
+from kaylee.session import SessionDataManager
+from kaylee.testsuite.benchmarks import measure, print_table
+
+_key_reo = re.compile(r'^#[\w]+$', re.ASCII)
+
+TASK = dict({'id' : 'i1', '#s1' : 10, '#s2' : [1, 2, 3]},
+            **{'field{}'.format(i) : i for i in range(20)})
+SESSION_KEYS = ('#s1', '#s2')
+
+
+def _v03_extract(task):
+    ret = {}
+    for key in task:
+        if key.startswith('#'):
+            if _key_reo.match(key) is None:
+                raise ValueError(key)
+            ret[key] = task[key]
+    for key in ret.keys():
+        del task[key]
+    return ret
+
+
+def run(number=20000):
+    pop = SessionDataManager.pop_session_data
+    cases = [
+        ('v0.3 regex scan', lambda: _v03_extract(dict(TASK))),
+        ('single pass scan', lambda: pop(dict(TASK))),
+        ('session keys schema', lambda: pop(dict(TASK), SESSION_KEYS)),
+        ('dict copy only', lambda: dict(TASK)),
+    ]
+    return [{'case' : name, 'time' : measure(func, number)}
+            for name, func in cases]
+
+
+def main():
+    rows = [(r['case'], '{:.2f}'.format(r['time'] * 1e6)) for r in run()]
+    print_table('Session data extraction ({} keys task)'.format(len(TASK)),
+                rows, header=('case', 'usec/task'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""Compares the controllers under node churn and faulty results via the
+discrete-event simulator (see ``kaylee.simulator``): 100 volunteers of
+different speeds join and leave the application, and 2% of the results
+are faulty."""
+import time
+from kaylee.simulator import Simulator
+from kaylee.contrib import (SimpleController, ResultsComparatorController,
+                            MemoryPermanentStorage, MemoryTemporalStorage)
+from kaylee.testsuite.projects.auto_test_project import AutoTestProject
+from kaylee.testsuite.benchmarks import print_table
+
+TASKS = 5000
+
+
+def solver(task):
+    return {'res' : int(task['id']) % 7}
+
+
+def simple():
+    return SimpleController('app', AutoTestProject(tasks_count=TASKS),
+                            MemoryPermanentStorage())
+
+
+def comparator(threshold):
+    def factory():
+        return ResultsComparatorController(
+            'app', AutoTestProject(tasks_count=TASKS),
+            MemoryPermanentStorage(), MemoryTemporalStorage(),
+            results_count_threshold=threshold)
+    return factory
+
+
+CONTROLLERS = [
+    ('SimpleController', simple),
+    ('ResultsComparator(2)', comparator(2)),
+    ('ResultsComparator(3)', comparator(3)),
+]
+
+
+def run(seed=1):
+    results = []
+    for name, factory in CONTROLLERS:
+        start = time.perf_counter()
+        report = Simulator(factory(), solver, nodes=100, arrival_rate=0.2,
+                           mean_lifetime=600, speed_sigma=0.5,
+                           fault_rate=0.02, latency=0.1,
+                           task_cost=lambda task: 5.0, seed=seed).run()
+        results.append((name, report, time.perf_counter() - start))
+    return results
+
+
+def main():
+    rows = []
+    for name, report, elapsed in run():
+        rows.append((
+            name,
+            '{:.0f}'.format(report.makespan) if report.makespan else '-',
+            report.dispatches,
+            report.redundant_dispatches,
+            '{:.0%}'.format(report.wasted_compute / report.total_compute),
+            report.wrong_results,
+            '{:.1f}'.format(report.peak_memory / 2 ** 20),
+            '{:.2f}'.format(elapsed),
+        ))
+    print_table('{} tasks, 100 nodes, churn, 2% faulty results'.format(TASKS),
+                rows, header=('controller', 'makespan, s', 'dispatches',
+                              'redundant', 'wasted', 'wrong results',
+                              'peak MB', 'simulated in, s'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,399 @@
+# -*- coding: utf-8 -*-
+"""Micro-benchmarks of the Kaylee hot paths compared against a stored
+baseline. Run it via::
+
+  python run-tests.py --bench [options]
+  python -m kaylee.testsuite.benchmarks.suite [options]
+
+The suite fails (exits with status 1) if any benchmark is slower than its
+baseline by more than the regression threshold. The baseline is recorded
+by ``--update-baseline``; the timings depend on the machine, thus the
+baseline should be re-recorded on the machine which runs the suite.
+"""
+from __future__ import print_function
+import os
+import sys
+import json
+import functools
+import time
+import struct
+import argparse
+import platform
+
+from kaylee.core import Kaylee, ACTION_NOP
+from kaylee.node import Node, NodeID, extract_node_id
+from kaylee.session import SessionDataManager, ClientSessionDataManager
+from kaylee.taskcache import CachedTask
+from kaylee.metrics import MetricsRegistry
+from kaylee import tracing
+from kaylee.contrib import (SimpleController, MemoryNodesRegistry,
+                            MemoryTemporalStorage, MemoryPermanentStorage)
+from kaylee.testsuite.projects.auto_test_project import AutoTestProject
+from kaylee.testsuite.benchmarks import measure, print_table
+
+#: The default baseline file.
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             'baseline.json')
+
+#: The default regression threshold: 0.25 means "25% slower".
+DEFAULT_THRESHOLD = 0.25
+
+SECRET_KEY = 'aJD2fn;1340913)*(!!&$)(#&<AHFB12b'
+
+TASK = {
+    'id' : '1234',
+    'data' : [0.5] * 16,
+    '#s1' : 10,
+    '#s2' : [1, 2, 3],
+}
+
+#: A list of ``(name, factory, number)`` tuples. A factory accepts the
+#: suite context and returns the function to measure. If the number of
+#: calls per measurement is ``None``, it is calibrated so that
+#: a measurement takes at least :data:`MIN_MEASUREMENT_TIME`.
+BENCHMARKS = []
+
+#: The minimum duration (in seconds) of a calibrated measurement.
+MIN_MEASUREMENT_TIME = 0.2
+
+
+def benchmark(name, number=None):
+    def decorator(factory):
+        BENCHMARKS.append((name, factory, number))
+        return factory
+    return decorator
+
+
+class Context(object):
+    """The fixtures shared by the benchmarks."""
+    def __init__(self, registry_size):
+        self.registry_size = registry_size
+        self._registry = None
+        self._timestamp = int(time.time())
+
+    @property
+    def registry(self):
+        """A registry populated with ``registry_size`` nodes."""
+        if self._registry is None:
+            self._registry = MemoryNodesRegistry(timeout='1d')
+            for i in range(self.registry_size):
+                # distinct IDs (NodeID counter wraps after 0xFFFF IDs)
+                nid = NodeID(struct.pack('>iIH', self._timestamp, i, 0))
+                self._registry.add(Node(nid))
+        return self._registry
+
+    def registry_node(self):
+        return Node(NodeID(struct.pack('>iIH', self._timestamp,
+                                       self.registry_size // 2, 0)))
+
+
+@benchmark('node_id.generate')
+def _node_id_generate(ctx):
+    return lambda: NodeID.for_host('192.168.10.20')
+
+
+@benchmark('node_id.parse')
+def _node_id_parse(ctx):
+    sid = str(NodeID())
+    return lambda: NodeID(sid)
+
+
+@benchmark('node_id.str')
+def _node_id_str(ctx):
+    nid = NodeID()
+    return lambda: str(nid)
+
+
+@benchmark('node_id.compare')
+def _node_id_compare(ctx):
+    n1, n2 = NodeID(), NodeID()
+    return lambda: n1 == n2 or n1 < n2
+
+
+@benchmark('extract_node_id.str')
+def _extract_node_id_str(ctx):
+    sid = str(NodeID())
+    return lambda: extract_node_id(sid)
+
+
+@benchmark('extract_node_id.node')
+def _extract_node_id_node(ctx):
+    node = Node(NodeID())
+    return lambda: extract_node_id(node)
+
+
+@benchmark('registry.add')
+def _registry_add(ctx):
+    registry = ctx.registry
+    node = ctx.registry_node()
+    return lambda: registry.add(node)
+
+
+@benchmark('registry.get')
+def _registry_get(ctx):
+    registry = ctx.registry
+    sid = str(ctx.registry_node().id)
+    return lambda: registry[sid]
+
+
+@benchmark('registry.update')
+def _registry_update(ctx):
+    registry = ctx.registry
+    node = ctx.registry_node()
+    registry.add(node)
+
+    def update():
+        node.dirty = True
+        registry.update(node)
+    return update
+
+
+@benchmark('registry.clean', number=1)
+def _registry_clean(ctx):
+    # nothing expires: measures the scan of the whole registry
+    return ctx.registry.clean
+
+
+@benchmark('session.get_session_data')
+def _session_get_session_data(ctx):
+    return lambda: SessionDataManager.get_session_data(TASK)
+
+
+@benchmark('session.store')
+def _session_store(ctx):
+    sdm = ClientSessionDataManager(SECRET_KEY)
+    node = Node(NodeID())
+    return lambda: sdm.store(node, dict(TASK))
+
+
+@benchmark('session.restore')
+def _session_restore(ctx):
+    sdm = ClientSessionDataManager(SECRET_KEY)
+    node = Node(NodeID())
+    task = dict(TASK)
+    sdm.store(node, task)
+    result = {'res' : 1, sdm.SESSION_DATA_ATTRIBUTE :
+              task[sdm.SESSION_DATA_ATTRIBUTE]}
+    return lambda: sdm.restore(node, dict(result))
+
+
+@benchmark('temporal_storage.cycle')
+def _temporal_storage_cycle(ctx):
+    # the ResultsComparatorController.accept_result() path of a task
+    # with results_count_threshold == 2
+    storage = MemoryTemporalStorage()
+    n1, n2 = NodeID(), NodeID()
+
+    def cycle():
+        if not storage.contains('t1'):
+            storage.add('t1', n1, 10)
+        if storage.contains('t1', n2):
+            return
+        results = storage['t1']
+        if len(results) == 1:
+            del storage['t1']
+    return cycle
+
+
+@benchmark('json.action_nop')
+def _json_action_nop(ctx):
+    return lambda: Kaylee._json_action(ACTION_NOP)
+
+
+@benchmark('json.action_task')
+def _json_action_task(ctx):
+    app = SimpleController('app', AutoTestProject(), MemoryPermanentStorage())
+    kl = Kaylee(MemoryNodesRegistry('10m'), None, [app])
+    node = Node(NodeID())
+    node.subscribe(app)
+    task = {k : v for k, v in TASK.items() if k[:1] != '#'}
+    return lambda: kl._json_task_action(node, CachedTask.from_task(task))
+
+
+@benchmark('metrics.counter_inc')
+def _metrics_counter_inc(ctx):
+    counter = MetricsRegistry().counter('bench', 'Benchmark.', ['endpoint'])
+    return counter.labels('get_action').inc
+
+
+@benchmark('metrics.histogram_observe')
+def _metrics_histogram_observe(ctx):
+    hist = MetricsRegistry().histogram('bench', 'Benchmark.', ['endpoint'])
+    return functools.partial(hist.labels('get_action').observe, 0.00042)
+
+
+@benchmark('tracing.disabled_span')
+def _tracing_disabled_span(ctx):
+    # the cost of an instrumented phase if the tracing is disabled
+    tracing.install(None)
+
+    def phase():
+        with tracing.span('phase'):
+            pass
+    return phase
+
+
+def run(names=None, registry_size=10 ** 6, scale=1.0, repeat=5):
+    """Runs the benchmarks and returns a ``{name : seconds}`` dict of the
+    best per-call timings.
+
+    :param names: the substrings of the benchmark names to run
+                  (all benchmarks are run by default).
+    :param scale: the factor of the measurement duration.
+    """
+    ctx = Context(registry_size)
+    results = {}
+    for name, factory, number in BENCHMARKS:
+        if names and not any(n in name for n in names):
+            continue
+        func = factory(ctx)
+        if number is None:
+            number = calibrate(func, MIN_MEASUREMENT_TIME * scale)
+        results[name] = measure(func, number, repeat)
+    return results
+
+
+def calibrate(func, min_time):
+    """Returns the number of calls which take at least ``min_time``
+    seconds."""
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            return number
+        # aim slightly above min_time to avoid another round
+        number = max(number * 2, int(number * min_time * 1.2 /
+                                     max(elapsed, 1e-9)))
+
+
+def load_baseline(path):
+    """Returns the baseline dict or ``None`` if it does not exist."""
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_baseline(path, results, registry_size):
+    baseline = {
+        'python' : platform.python_version(),
+        'platform' : platform.platform(),
+        'registry_size' : registry_size,
+        'results' : {name : round(val, 12)
+                     for name, val in sorted(results.items())},
+    }
+    with open(path, 'w') as f:
+        json.dump(baseline, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def compare(results, baseline, threshold, registry_size):
+    """Compares the results with the baseline.
+
+    :returns: a list of ``(name, current, baseline, ratio, status)``
+              tuples, where the status is ``'ok'``, ``'faster'``,
+              ``'REGRESSION'``, ``'new'`` or ``'skipped'`` (the registry
+              benchmarks are skipped if the registry size differs from the
+              baseline's one).
+    """
+    base_results = baseline['results'] if baseline is not None else {}
+    same_registry = (baseline is not None and
+                     baseline.get('registry_size') == registry_size)
+    rows = []
+    for name in sorted(results):
+        current = results[name]
+        base = base_results.get(name)
+        if base is None:
+            rows.append((name, current, None, None, 'new'))
+            continue
+        if name.startswith('registry.') and not same_registry:
+            rows.append((name, current, base, None, 'skipped'))
+            continue
+        ratio = current / base
+        if ratio > 1 + threshold:
+            status = 'REGRESSION'
+        elif ratio < 1 / (1 + threshold):
+            status = 'faster'
+        else:
+            status = 'ok'
+        rows.append((name, current, base, ratio, status))
+    return rows
+
+
+def _usec(val):
+    return '{:.3f}'.format(val * 1e6) if val is not None else '-'
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='run-tests.py --bench',
+        description='Kaylee hot paths micro-benchmarks.')
+    parser.add_argument('names', nargs='*',
+                        help='run only the benchmarks whose names contain '
+                             'the substrings')
+    parser.add_argument('--baseline', default=BASELINE_PATH,
+                        help='the baseline file')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='the regression threshold, e.g. 0.25 fails '
+                             'the suite if a benchmark is 25%% slower than '
+                             'its baseline')
+    parser.add_argument('--update-baseline', action='store_true',
+                        help='record the results as the new baseline')
+    parser.add_argument('--registry-size', type=int, default=10 ** 6,
+                        help='the amount of nodes in the registry')
+    parser.add_argument('--quick', action='store_true',
+                        help='10 times shorter measurements')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='the amount of measurements per benchmark '
+                             '(the best one is compared)')
+    parser.add_argument('--json', action='store_true',
+                        help='print the comparison in JSON format')
+    opts = parser.parse_args(argv)
+
+    results = run(opts.names, opts.registry_size,
+                  scale=0.1 if opts.quick else 1.0, repeat=opts.repeat)
+    if opts.update_baseline:
+        baseline = load_baseline(opts.baseline) if opts.names else None
+        if baseline is not None:
+            # update the selected benchmarks only
+            merged = dict(baseline['results'])
+            merged.update(results)
+            results = merged
+        save_baseline(opts.baseline, results, opts.registry_size)
+        print('The baseline has been saved to {}'.format(opts.baseline))
+        return 0
+
+    baseline = load_baseline(opts.baseline)
+    rows = compare(results, baseline, opts.threshold, opts.registry_size)
+    regressions = [row[0] for row in rows if row[4] == 'REGRESSION']
+    if opts.json:
+        json.dump({
+            'threshold' : opts.threshold,
+            'regressions' : regressions,
+            'benchmarks' : {
+                name : {'seconds' : cur, 'baseline' : base, 'ratio' : ratio,
+                        'status' : status}
+                for name, cur, base, ratio, status in rows},
+        }, sys.stdout, indent=2, sort_keys=True)
+        print()
+    else:
+        if baseline is None:
+            print('No baseline found at {}, run with --update-baseline '
+                  'to record one.\n'.format(opts.baseline))
+        print_table(
+            'Kaylee hot paths (registry of {} nodes, threshold {:.0%})'
+            .format(opts.registry_size, opts.threshold),
+            [(name, _usec(cur), _usec(base),
+              '{:.2f}x'.format(ratio) if ratio is not None else '-', status)
+             for name, cur, base, ratio, status in rows],
+            header=('benchmark', 'us', 'baseline us', 'ratio', 'status'))
+        if regressions:
+            print('Regressions: {}'.format(', '.join(regressions)))
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
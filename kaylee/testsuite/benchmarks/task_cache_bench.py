@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""Compares the cost of re-dispatching a task: re-building it via
+``project[task_id]`` and re-serializing it versus serving the serialized
+task from the controller's task cache."""
+import random
+from kaylee import Kaylee
+from kaylee.node import Node, NodeID
+from kaylee.taskcache import CachedTask, TaskCache
+from kaylee.contrib import (SimpleController, MemoryNodesRegistry,
+                            MemoryPermanentStorage)
+from kaylee.testsuite.projects.auto_test_project import AutoTestProject
+from kaylee.testsuite.benchmarks import measure, print_table
+
+
+class BenchProject(AutoTestProject):
+    def __init__(self, size, **kwargs):
+        super(BenchProject, self).__init__(**kwargs)
+        rnd = random.Random(1)
+        self.data = [rnd.random() for i in range(size)]
+
+    def __getitem__(self, task_id):
+        return {'id' : str(task_id), 'data' : list(self.data)}
+
+
+def run(sizes=(10, 1000, 10000)):
+    results = []
+    for size in sizes:
+        app = SimpleController('app', BenchProject(size),
+                               MemoryPermanentStorage())
+        kl = Kaylee(MemoryNodesRegistry('10m'), None, [app])
+        node = Node(NodeID())
+        node.subscribe(app)
+        cache = TaskCache()
+        cache.put(CachedTask.from_task(app.project['1']))
+
+        def rebuild():
+            return kl._json_task_action(node, CachedTask.from_task(
+                app.project['1']))
+
+        def cached():
+            return kl._json_task_action(node, cache.get('1'))
+
+        results.append({'size' : size,
+                        'payload' : cache.size,
+                        'rebuild' : measure(rebuild, 200),
+                        'cached' : measure(cached, 200)})
+    return results
+
+
+def main():
+    rows = [(r['size'], r['payload'],
+             '{:.2f}'.format(r['rebuild'] * 1e6),
+             '{:.2f}'.format(r['cached'] * 1e6),
+             '{:.1f}x'.format(r['rebuild'] / r['cached']))
+            for r in run()]
+    print_table('Task re-dispatch', rows,
+                header=('floats', 'payload bytes', 'rebuild usec',
+                        'cached usec', 'speedup'))
+
+
+if __name__ == '__main__':
+    main()
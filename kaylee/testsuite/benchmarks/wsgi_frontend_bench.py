@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""Measures the per-request time of the ``get_action`` and
+``accept_result`` requests served by the werkzeug front-end and by the
+framework-free WSGI front-end. The WSGI applications are called
+directly, i.e. no network or HTTP parsing is involved."""
+import io
+import json
+import kaylee
+from werkzeug.wrappers import Request
+from werkzeug.exceptions import HTTPException
+from kaylee import Kaylee
+from kaylee.contrib import (SimpleController, MemoryNodesRegistry,
+                            MemoryPermanentStorage)
+from kaylee.contrib.frontends.werkzeug_frontend import make_url_map
+from kaylee.contrib.frontends.wsgi_frontend import make_wsgi_app
+from kaylee.testsuite.projects.auto_test_project import AutoTestProject
+from kaylee.testsuite.benchmarks import measure, print_table
+
+REQUESTS = 5000
+
+
+def _werkzeug_app():
+    url_map = make_url_map(url_prefix='/kaylee')
+
+    @Request.application
+    def application(request):
+        adapter = url_map.bind_to_environ(request.environ)
+        try:
+            endpoint, values = adapter.match()
+            return endpoint(request, **values)
+        except HTTPException as e:
+            return e
+    return application
+
+
+def _environ(method, path, body=b''):
+    return {
+        'REQUEST_METHOD' : method,
+        'PATH_INFO' : path,
+        'SCRIPT_NAME' : '',
+        'QUERY_STRING' : '',
+        'SERVER_NAME' : 'localhost',
+        'SERVER_PORT' : '80',
+        'SERVER_PROTOCOL' : 'HTTP/1.1',
+        'REMOTE_ADDR' : '127.0.0.1',
+        'CONTENT_TYPE' : 'application/json',
+        'CONTENT_LENGTH' : str(len(body)),
+        'wsgi.version' : (1, 0),
+        'wsgi.url_scheme' : 'http',
+        'wsgi.input' : io.BytesIO(body),
+        'wsgi.errors' : io.StringIO(),
+        'wsgi.multithread' : False,
+        'wsgi.multiprocess' : False,
+        'wsgi.run_once' : False,
+    }
+
+
+def _call(app, environ):
+    def start_response(status, headers):
+        pass
+    return b''.join(app(environ, start_response))
+
+
+def _setup():
+    app = SimpleController('bench', AutoTestProject(tasks_count=10 ** 9),
+                           MemoryPermanentStorage())
+    kl = Kaylee(MemoryNodesRegistry('1h'), None, [app],
+                AUTO_GET_ACTION=False)
+    kaylee.kl._setup(kl)
+    node_id = json.loads(kl.register('127.0.0.1'))['node_id']
+    kl.subscribe(node_id, 'bench')
+    return node_id
+
+
+def _bench(app, node_id):
+    path = '/kaylee/actions/' + node_id
+
+    def get_action():
+        return _call(app, _environ('GET', path))
+
+    def round_trip():
+        task = json.loads(get_action().decode())['data']
+        body = json.dumps({'id' : task['id'], 'res' : 1}).encode()
+        _call(app, _environ('POST', path, body))
+
+    return measure(get_action, REQUESTS), measure(round_trip, REQUESTS)
+
+
+def run():
+    node_id = _setup()
+    try:
+        results = []
+        for name, app in (('werkzeug', _werkzeug_app()),
+                          ('bare WSGI', make_wsgi_app())):
+            get_action, round_trip = _bench(app, node_id)
+            results.append({'frontend' : name,
+                            'get_action' : get_action * 1e6,
+                            'round_trip' : round_trip * 1e6})
+    finally:
+        kaylee.kl._setup(None)
+    return results
+
+
+def main():
+    rows = [(r['frontend'], '{:.1f}'.format(r['get_action']),
+             '{:.1f}'.format(r['round_trip'])) for r in run()]
+    print_table('WSGI front-ends, usec per request',
+                rows, header=('frontend', 'get_action',
+                              'get_action + accept_result'))
+
+
+if __name__ == '__main__':
+    main()
@@ -191,6 +191,59 @@ class KayleeCommandsManagerTests(KayleeTest):
             fpath = os.path.join(build_path, 'kaylee', fname)
             self.assertTrue(os.path.exists(fpath))
 
+    def test_incremental_build(self):
+        from argparse import Namespace
+        from kaylee.manager.commands.build import (BuildManifest,
+                                                   build_projects)
+        env_path = _start_env()
+        os.chdir(env_path)
+        shutil.copytree(_pjoin(RES_DIR, 'monte_carlo_pi'),
+                        _pjoin(env_path, 'monte_carlo_pi'))
+        client_dir = _pjoin(env_path, 'monte_carlo_pi', 'client')
+        with open(_pjoin(client_dir, 'table.dat'), 'wb') as f:
+            f.write(b'0123456789' * 100)
+
+        settings = SourceFileLoader(
+            'settings', _pjoin(env_path, 'settings.py')).load_module()
+        opts = Namespace(build_dir='_build', jobs=2)
+        os.mkdir('_build')
+
+        def _build():
+            manifest = BuildManifest('_build')
+            changed = build_projects(settings, opts, manifest, verbose=False)
+            manifest.save()
+            return [os.path.basename(fpath) for fpath in changed]
+
+        self.assertEqual(_build(), ['monte_carlo_pi.js', 'table.dat'])
+        build_path = _pjoin(env_path, '_build', 'monte_carlo_pi')
+        js_path = _pjoin(build_path, 'js', 'monte_carlo_pi.js')
+        data_path = _pjoin(build_path, 'data', 'table.dat')
+        self.assertTrue(os.path.exists(js_path))
+        # the data files are hard-linked
+        self.assertTrue(os.path.samefile(data_path,
+                                         _pjoin(client_dir, 'table.dat')))
+        self.assertTrue(os.path.exists(_pjoin('_build',
+                                              BuildManifest.FILENAME)))
+
+        self.assertEqual(_build(), [])
+        # touching a file does not change its content
+        os.utime(_pjoin(client_dir, 'monte_carlo_pi.js'),
+                 ns=(0, 10 ** 18))
+        self.assertEqual(_build(), [])
+        with open(_pjoin(client_dir, 'monte_carlo_pi.js'), 'a') as f:
+            f.write('// changed')
+        self.assertEqual(_build(), ['monte_carlo_pi.js'])
+        with open(js_path) as f:
+            self.assertTrue(f.read().endswith('// changed'))
+        # a deleted output is rebuilt
+        os.remove(data_path)
+        self.assertEqual(_build(), ['table.dat'])
+        # the outputs of the deleted files are removed
+        os.remove(_pjoin(client_dir, 'table.dat'))
+        self.assertEqual(_build(), ['table.dat'])
+        self.assertFalse(os.path.exists(data_path))
+        self.assertEqual(_build(), [])
+
     def test_run(self):
         env_path = _start_env()
         os.chdir(env_path)
@@ -200,6 +253,116 @@ class KayleeCommandsManagerTests(KayleeTest):
             self.assertRaises(OSError, lmanager.parse, ['run'])
 
 
+    def test_profile(self):
+        env_path = _start_env()
+        os.chdir(env_path)
+        lmanager = LocalCommandsManager()
+
+        with nostdout():
+            self.assertRaises(OSError, lmanager.parse, ['profile'])
+            self.assertRaises(SystemExit, lmanager.parse,
+                              ['profile', '-s', 'settings.py', '-i', '0'])
+
+    def test_export(self):
+        import json
+        import struct
+        from argparse import Namespace
+        from kaylee.contrib import MemoryPermanentStorage
+        from kaylee.manager.commands.export import export_storage, Exporter
+
+        # the exporters are abstract
+        self.assertRaises(TypeError, Exporter, 'out.jsonl')
+        lmanager = LocalCommandsManager()
+        tmpdir = tmp_chdir()
+        with nostdout():
+            self.assertRaises(OSError, lmanager.parse,
+                              ['export', 'app', 'out.jsonl'])
+
+        ps = MemoryPermanentStorage()
+        for i in range(10):
+            ps.add('t{}'.format(i), {'x' : i, 'y' : 2 * i})
+
+        def _export(fname, fmt, resume_after=None):
+            opts = Namespace(output=_pjoin(tmpdir, fname), format=fmt,
+                             chunk_size=3, resume_after=resume_after)
+            return export_storage(ps, opts)
+
+        # JSON Lines
+        self.assertEqual(_export('out.jsonl', 'jsonl'), (10, 't9'))
+        ps.add('t10', {'x' : 10, 'y' : 20})
+        self.assertEqual(_export('out.jsonl', 'jsonl', 't9'), (1, 't10'))
+        with open(_pjoin(tmpdir, 'out.jsonl')) as f:
+            lines = [json.loads(line) for line in f]
+        self.assertEqual(len(lines), 11)
+        self.assertEqual(lines[10], {'task_id' : 't10',
+                                     'results' : [{'x' : 10, 'y' : 20}]})
+
+        # CSV
+        _export('out.csv', 'csv')
+        with open(_pjoin(tmpdir, 'out.csv')) as f:
+            rows = f.read().splitlines()
+        self.assertEqual(rows[0], 'task_id,x,y')
+        self.assertEqual(rows[4], 't3,3,6')
+        self.assertEqual(len(rows), 12)
+
+        # NumPy .npy
+        ps = MemoryPermanentStorage()
+        for i in range(7):
+            ps.add(str(i), [i, i / 2.0])
+        _export('out.npy', 'npy')
+        ps.add('7', [7, 3.5])
+        _export('out.npy', 'npy', '6')
+        with open(_pjoin(tmpdir, 'out.npy'), 'rb') as f:
+            data = f.read()
+        self.assertTrue(data.startswith(b'\x93NUMPY'))
+        self.assertIn(b"'shape': (8, 2)", data[:128])
+        values = struct.unpack('<16d', data[128:])
+        self.assertEqual(values[-2:], (7.0, 3.5))
+
+    def test_bench(self):
+        import json
+        import copy
+        from argparse import Namespace
+        from kaylee.testsuite import test_settings
+        from kaylee.manager.commands.bench import run_bench
+
+        lmanager = LocalCommandsManager()
+        tmpdir = tmp_chdir()
+        with nostdout():
+            self.assertRaises(OSError, lmanager.parse, ['bench'])
+            lmanager.parse(['bench', '-s', test_settings.__file__,
+                            '-n', '5', '-d', '5', '--json',
+                            '-o', 'report.json'])
+        with open(_pjoin(tmpdir, 'report.json')) as f:
+            report = json.load(f)
+        # the test project has 10 tasks only
+        self.assertEqual(report['nodes']['unsubscribed'], 5)
+        self.assertGreaterEqual(report['nodes']['registered'], 5)
+        self.assertGreaterEqual(report['results'], 10)
+
+        settings = {k : copy.deepcopy(getattr(test_settings, k))
+                    for k in dir(test_settings) if k.isupper()}
+        settings['APPLICATIONS'][0]['project']['config'] = {
+            'tasks_count' : 10 ** 6 }
+        for mode in ['inproc', 'http']:
+            opts = Namespace(settings_file=settings, url=None, mode=mode,
+                             application=None, concurrency=2, nodes=50,
+                             duration=10, results=200, compute_delay=0.0,
+                             ramp_up=0.0, churn=0.2, failure_rate=0.1,
+                             seed=0)
+            report = run_bench(opts, {'res' : 1})
+            self.assertEqual(report['config']['mode'], mode)
+            self.assertGreaterEqual(report['results'], 200)
+            self.assertGreater(report['nodes']['churned'], 0)
+            self.assertGreater(report['nodes']['failed'], 0)
+            self.assertGreater(report['nodes']['registered'], 50)
+            for data in report['endpoints'].values():
+                self.assertEqual(data['errors'], 0)
+                self.assertLessEqual(data['p50_ms'], data['max_ms'])
+            self.assertEqual(report['endpoints']['accept_result']['count'],
+                             report['results'])
+            self.assertIn('rss_growth_kb', report['memory'])
+
     def _validate_content(self, gtdir, tmpdir, files_to_validate):
         for fpath in files_to_validate:
             with open(_pjoin(tmpdir, fpath)) as f:
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+import zlib
+import json
+
+from kaylee.testsuite import KayleeTest, load_tests
+from kaylee import Kaylee, loader
+from kaylee.compression import negotiate_encoding, compress, decompress
+from kaylee.contrib import (SimpleController, MemoryNodesRegistry,
+                            MemoryPermanentStorage)
+from kaylee.errors import SettingsError
+from kaylee.testsuite.projects.auto_test_project import AutoTestProject
+
+
+class CompressionTests(KayleeTest):
+    def test_negotiate_encoding(self):
+        self.assertIsNone(negotiate_encoding(None))
+        self.assertIsNone(negotiate_encoding(''))
+        self.assertIsNone(negotiate_encoding('identity, br'))
+        self.assertEqual(negotiate_encoding('gzip, deflate, br'), 'gzip')
+        self.assertEqual(negotiate_encoding('deflate'), 'deflate')
+        self.assertEqual(negotiate_encoding('GZIP'), 'gzip')
+        self.assertEqual(negotiate_encoding('gzip;q=0.5, deflate'),
+                         'deflate')
+        self.assertEqual(negotiate_encoding('gzip;q=0, deflate;q=0'), None)
+        self.assertEqual(negotiate_encoding('*'), 'gzip')
+        self.assertEqual(negotiate_encoding('*;q=0.1, gzip;q=0'), 'deflate')
+        self.assertEqual(negotiate_encoding('gzip;q=bad, deflate;q=0.2'),
+                         'deflate')
+
+    def test_compress_decompress(self):
+        data = b'{"id":"1","res":[' + b'1,' * 1000 + b'1]}'
+        for encoding in ('gzip', 'deflate'):
+            compressed = compress(data, encoding)
+            self.assertLess(len(compressed), len(data))
+            self.assertEqual(decompress(compressed, encoding.upper()), data)
+        # gzip is readable by the standard tools
+        self.assertEqual(zlib.decompress(compress(data, 'gzip'), 31), data)
+        # raw deflate data
+        raw = zlib.compressobj(6, zlib.DEFLATED, -15)
+        raw_data = raw.compress(data) + raw.flush()
+        self.assertEqual(decompress(raw_data, 'deflate'), data)
+
+        for encoding in (None, '', 'identity'):
+            self.assertIs(decompress(data, encoding), data)
+        self.assertRaises(ValueError, decompress, data, 'br')
+        self.assertRaises(ValueError, decompress, data, 'gzip')
+        self.assertRaises(ValueError, decompress, data, 'deflate')
+        self.assertRaises(ValueError, decompress,
+                          compress(data, 'gzip')[:-10], 'gzip')
+        self.assertRaises(ValueError, decompress, compress(data, 'gzip'),
+                          'gzip', max_size=100)
+
+    def test_kaylee(self):
+        app = SimpleController('app', AutoTestProject(),
+                               MemoryPermanentStorage())
+        kl = Kaylee(MemoryNodesRegistry('10m'), None, [app],
+                    AUTO_GET_ACTION=False)
+        self.assertEqual(kl.config.client_config()['COMPRESSION_MIN_SIZE'],
+                         1024)
+        node_id = json.loads(kl.register('127.0.0.1'))['node_id']
+        kl.subscribe(node_id, 'app')
+
+        # the tiny responses are never compressed
+        nop = kl.accept_result(node_id, json.dumps({'id' : '0', 'res' : 0}))
+        body, encoding = kl.compress_response(nop, 'gzip')
+        self.assertIsNone(encoding)
+        self.assertEqual(body, nop.encode('utf-8'))
+
+        large = json.dumps({'data' : 'x' * 2000})
+        body, encoding = kl.compress_response(large, 'gzip, deflate')
+        self.assertEqual(encoding, 'gzip')
+        self.assertEqual(decompress(body, 'gzip').decode('utf-8'), large)
+        body, encoding = kl.compress_response(large, None)
+        self.assertIsNone(encoding)
+
+        kl.config.COMPRESSION_MIN_SIZE = None
+        self.assertIsNone(kl.compress_response(large, 'gzip')[1])
+
+        # compressed results
+        task = json.loads(kl.get_action(node_id))['data']
+        result = json.dumps({'id' : task['id'], 'res' : 42}).encode()
+        kl.accept_result(node_id, compress(result, 'deflate'), 'deflate')
+        self.assertEqual(app.permanent_storage[task['id']], [42])
+        task = json.loads(kl.get_action(node_id))['data']
+        res = kl.accept_result(node_id, b'garbage', 'gzip')
+        self.assertIn('error', json.loads(res))
+
+    def test_settings(self):
+        settings = {
+            'REGISTRY' : {'name' : 'MemoryNodesRegistry',
+                          'config' : {'timeout' : '2s'}},
+            'AUTO_GET_ACTION' : True,
+            'COMPRESSION_MIN_SIZE' : 512,
+        }
+        kl = loader.load(settings)
+        self.assertEqual(kl.config.COMPRESSION_MIN_SIZE, 512)
+        settings['COMPRESSION_MIN_SIZE'] = None
+        self.assertIsNone(loader.load(settings).config.COMPRESSION_MIN_SIZE)
+        for val in (-1, '1k', True):
+            settings['COMPRESSION_MIN_SIZE'] = val
+            self.assertRaises(SettingsError, loader.load, settings)
+
+
+kaylee_suite = load_tests([CompressionTests])
@@ -6,8 +6,11 @@ from kaylee.testsuite import (load_tests, TestPermanentStorage)
 from kaylee.testsuite.helper import SubclassTestsBase
 from kaylee.testsuite.projects.auto_test_project import AutoTestProject
 from kaylee.node import Node, NodeID
+from kaylee.project import KL_TASK_BLOBS
 from kaylee.contrib.controllers import SimpleController
-from kaylee.errors import InvalidResultError
+from kaylee.errors import InvalidResultError, SessionKeyNameError
+from kaylee.shard import Shard
+from kaylee.taskcache import CachedTask
 
 
 
@@ -42,6 +45,26 @@ class ControllerTestsBase(SubclassTestsBase, metaclass=ABCMeta):
         ctr.accept_result(node, res)
         self.assertRaises(InvalidResultError, ctr.accept_result, node, {})
 
+    def test_progress(self):
+        node, ctr = self.make_node_and_controller()
+        self.assertIs(ctr.progress, ctr.project.progress)
+        total = ctr.project.total_tasks
+        self.assertEqual(ctr.progress.total, total)
+        ctr.get_task(node)
+        self.assertRaises(InvalidResultError, ctr.accept_result, node, {})
+        self.assertEqual(ctr.progress.rejected, 1)
+        while not ctr.completed:
+            task = ctr.get_task(node)
+            self.solve(ctr, node, task)
+        progress = ctr.progress
+        self.assertEqual(progress.accepted, total)
+        self.assertEqual(progress.generated, total)
+        self.assertEqual(progress.outstanding, 0)
+        self.assertGreaterEqual(progress.leased, total)
+
+    def solve(self, ctr, node, task):
+        ctr.accept_result(node, { 'res' : task['id'] })
+
     def make_node_and_controller(self):
         ctr = self.cls_instance()
         n = Node(NodeID())
@@ -58,6 +81,135 @@ class SimpleControllerTests(ControllerTestsBase):
         storage = TestPermanentStorage()
         self.assertRaises(TypeError, Controller, 'app', project, storage)
 
+    def test_session_keys(self):
+        project = AutoTestProject()
+        project.session_keys = ['#s1', '#s_2']
+        ctr = SimpleController('app', project, TestPermanentStorage())
+        self.assertEqual(ctr.session_keys, ('#s1', '#s_2'))
+
+        for keys in [['#s1', 's2'], ['#'], ['#я'], '#s1', [1]]:
+            project.session_keys = keys
+            self.assertRaises((SessionKeyNameError, TypeError),
+                              SimpleController, 'app', project,
+                              TestPermanentStorage())
+
+    def test_locality_lookahead(self):
+        class BlobsProject(AutoTestProject):
+            def __getitem__(self, task_id):
+                blob = 'b1' if int(task_id) in (1, 9) else 'b0'
+                return {'id' : str(task_id), KL_TASK_BLOBS : [blob]}
+
+        ctr = SimpleController('app', BlobsProject(tasks_count=10),
+                               TestPermanentStorage(), locality_lookahead=3)
+        node = Node(NodeID())
+        node.subscribe(ctr)
+        node.add_resident_data(['b0'])
+        ids = [ctr.get_task(node)['id'] for i in range(3)]
+        self.assertEqual(ids, ['2', '3', '4'])
+        # the oldest task has been bypassed too many times
+        self.assertEqual(ctr.get_task(node)['id'], '1')
+
+        fresh_node = Node(NodeID())
+        fresh_node.subscribe(ctr)
+        self.assertEqual(ctr.get_task(fresh_node)['id'], '5')
+        ids = [ctr.get_task(node)['id'] for i in range(5)]
+        self.assertEqual(ids, ['6', '7', '8', '10', '9'])
+        self.assertEqual(ctr.progress.generated, 10)
+
+    def test_shard(self):
+        shards = [Shard(i, 3) for i in range(3)]
+        ids = []
+        for shard in shards:
+            ctr = SimpleController('app', AutoTestProject(tasks_count=30),
+                                   TestPermanentStorage())
+            self.assertEqual(ctr.progress.total, 30)
+            ctr.shard = shard
+            self.assertIsNone(ctr.progress.total)
+            node = Node(NodeID())
+            node.subscribe(ctr)
+            while True:
+                task = ctr.next_project_task(node)
+                if task is None:
+                    break
+                self.assertTrue(shard.owns(task['id']))
+                ids.append(int(task['id']))
+        # the shards partition the tasks
+        self.assertEqual(sorted(ids), list(range(1, 31)))
+
+    def test_duplicate_results(self):
+        storage = TestPermanentStorage()
+        ctr = SimpleController('app', AutoTestProject(tasks_count=2),
+                               storage)
+        owners = {}
+        for _ in range(2):
+            node = Node(NodeID())
+            node.subscribe(ctr)
+            owners[ctr.get_task(node)['id']] = node
+        # the project is depleted, a pooled task is re-dispatched
+        node = Node(NodeID())
+        node.subscribe(ctr)
+        task_id = ctr.get_task(node)['id']
+        other_id = ({'1', '2'} - {task_id}).pop()
+
+        # both nodes return the results of the re-dispatched task
+        ctr.accept_result(node, {'res' : 1})
+        ctr.accept_result(owners[task_id], {'res' : 1})
+        self.assertEqual(ctr.progress.accepted, 1)
+        self.assertEqual(len(storage), 1)
+        self.assertFalse(ctr.completed)
+        self.assertAlmostEqual(ctr.snapshot()['completion'], 0.5)
+
+        ctr.accept_result(owners[other_id], {'res' : 1})
+        self.assertEqual(ctr.progress.accepted, 2)
+        self.assertTrue(ctr.completed)
+
+    def test_non_string_task_ids(self):
+        class IntIDsProject(AutoTestProject):
+            def __init__(self, *args, **kwargs):
+                super(IntIDsProject, self).__init__(*args, **kwargs)
+                self.lookups = []
+
+            def __getitem__(self, task_id):
+                self.lookups.append(task_id)
+                return {'id' : int(task_id)}
+
+            def next_task(self):
+                if self.task_id < self.tasks_count:
+                    self.task_id += 1
+                    return {'id' : self.task_id}
+                return None
+
+        project = IntIDsProject(tasks_count=2)
+        storage = TestPermanentStorage()
+        ctr = SimpleController('app', project, storage)
+        node1, node2 = Node(NodeID()), Node(NodeID())
+        for node in (node1, node2):
+            node.subscribe(ctr)
+            task = node.get_task()
+            self.assertEqual(node.task_id, task['id'])
+            ctr.task_cache.put(CachedTask.from_task(task))
+        self.assertEqual(node1.task_id, '1')
+        self.assertIn('1', ctr.task_cache)
+        self.assertIn('2', ctr.task_cache)
+
+        ctr.accept_result(node1, {'res' : 1})
+        # the completed task is removed from the cache
+        self.assertNotIn('1', ctr.task_cache)
+        self.assertIn('2', ctr.task_cache)
+        self.assertIn('1', storage)
+
+        # the pooled task is served from the cache, then from the project
+        node3 = Node(NodeID())
+        node3.subscribe(ctr)
+        self.assertIsInstance(node3.get_task(), CachedTask)
+        self.assertEqual(node3.task_id, '2')
+        ctr.task_cache.clear()
+        self.assertEqual(node3.get_task()['id'], '2')
+        self.assertEqual(project.lookups, ['2'])
+        ctr.accept_result(node3, {'res' : 2})
+        self.assertEqual(len(ctr.task_cache), 0)
+        self.assertTrue(ctr.completed)
+
     def cls_instance(self):
         return SimpleController('test_simple_controller_app',
                                 AutoTestProject(),
@@ -0,0 +1,271 @@
+# -*- coding: utf-8 -*-
+import os
+import json
+import shutil
+import tempfile
+
+from kaylee.testsuite import KayleeTest, load_tests
+from kaylee import Kaylee, NodeID, loader
+from kaylee.contrib import (SimpleController, MemoryNodesRegistry,
+                            MemoryPermanentStorage, SQLiteCoordinator)
+from kaylee.errors import SettingsError
+from kaylee.shard import HashRing, RingShard
+from kaylee.testsuite.projects.auto_test_project import AutoTestProject
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class SQLiteCoordinatorTests(KayleeTest):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'cluster.db')
+        self.clock = Clock()
+        self.c1 = SQLiteCoordinator('s1', self.path, '10s', clock=self.clock)
+        self.c2 = SQLiteCoordinator('s2', self.path, '10s', clock=self.clock)
+
+    def tearDown(self):
+        self.c1.close()
+        self.c2.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_lease(self):
+        c1, c2 = self.c1, self.c2
+        self.assertTrue(c1.lease('app', 1))
+        self.assertFalse(c2.lease('app', '1'))
+        # renewal
+        self.assertTrue(c1.lease('app', '1'))
+        # the leases are per application
+        self.assertTrue(c2.lease('app2', '1'))
+
+        self.clock.now += 11
+        self.assertTrue(c2.lease('app', '1'))
+        self.assertFalse(c1.lease('app', '1'))
+
+        c2.release('app', '1')
+        self.assertTrue(c1.lease('app', '1'))
+
+    def test_lease_expired(self):
+        c1, c2 = self.c1, self.c2
+        c1.lease('app', '1')
+        c1.lease('app', '2')
+        c1.complete('app', '2')
+        self.assertIsNone(c2.lease_expired('app'))
+        self.clock.now += 11
+        self.assertEqual(c2.lease_expired('app'), '1')
+        self.assertIsNone(c2.lease_expired('app'))
+        self.assertFalse(c1.lease('app', '1'))
+
+    def test_complete(self):
+        c1, c2 = self.c1, self.c2
+        c1.lease('app', '1')
+        c1.lease('app', '2')
+        self.assertEqual(c1.pending('app'), 2)
+        self.assertTrue(c2.complete('app', '1'))
+        self.assertFalse(c1.complete('app', '1'))
+        self.assertFalse(c2.lease('app', '1'))
+        self.assertEqual(c1.pending('app'), 1)
+        # a task which has never been leased
+        self.assertTrue(c1.complete('app', '3'))
+        self.assertFalse(c2.complete('app', '3'))
+
+        self.assertFalse(c2.is_completed('app'))
+        c1.set_completed('app')
+        self.assertTrue(c2.is_completed('app'))
+
+
+class HashRingTests(KayleeTest):
+    def test_get(self):
+        ring = HashRing(['s1', 's2', 's3'])
+        self.assertEqual(ring.servers, ['s1', 's2', 's3'])
+        node_ids = [NodeID() for i in range(300)]
+        owners = {node_id : ring.get(node_id) for node_id in node_ids}
+        counts = {s : list(owners.values()).count(s) for s in ring.servers}
+        for count in counts.values():
+            self.assertGreater(count, 50)
+        self.assertEqual(ring.get(node_ids[0]), owners[node_ids[0]])
+
+        # only the keys of the removed server are moved
+        ring.remove('s3')
+        for node_id, owner in owners.items():
+            if owner != 's3':
+                self.assertEqual(ring.get(node_id), owner)
+            else:
+                self.assertIn(ring.get(node_id), ['s1', 's2'])
+
+        ring.remove('s1')
+        ring.remove('s2')
+        self.assertRaises(KeyError, ring.get, node_ids[0])
+
+    def test_ring_shard(self):
+        ring = HashRing(['s1', 's2'])
+        shards = [RingShard(ring, 's1'), RingShard(ring, 's2')]
+        for i in range(50):
+            self.assertEqual(len([s for s in shards if s.owns(str(i))]), 1)
+        self.assertRaises(ValueError, RingShard, ring, 's3')
+
+
+class ClusterTests(KayleeTest):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'cluster.db')
+        self.clock = Clock()
+        self.ring = HashRing(['s1', 's2'])
+        self.coordinators = []
+
+    def tearDown(self):
+        for crd in self.coordinators:
+            crd.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def _server(self, name, storage, tasks_count=6):
+        project = AutoTestProject(tasks_count=tasks_count)
+        app = SimpleController('app', project, storage)
+        kl = Kaylee(MemoryNodesRegistry('10m'), None, [app],
+                    AUTO_GET_ACTION=True)
+        crd = SQLiteCoordinator(name, self.path, '10s', clock=self.clock)
+        self.coordinators.append(crd)
+        kl.shard = RingShard(self.ring, name)
+        kl.coordinator = crd
+        self.assertIs(app.coordinator, crd)
+        self.assertIsNone(app.progress.total)
+        node_id = json.loads(kl.register('127.0.0.1'))['node_id']
+        self.assertTrue(kl.shard.owns(NodeID(node_id)))
+        kl.subscribe(node_id, 'app')
+        return kl, app, node_id
+
+    def test_no_double_dispatch(self):
+        storage = MemoryPermanentStorage()
+        kl1, app1, node1 = self._server('s1', storage)
+        kl2, app2, node2 = self._server('s2', storage)
+
+        dispatched = []
+        action1 = json.loads(kl1.get_action(node1))
+        action2 = json.loads(kl2.get_action(node2))
+        while True:
+            progressed = False
+            for kl, node_id, action in ((kl1, node1, action1),
+                                        (kl2, node2, action2)):
+                if action['action'] != 'task':
+                    continue
+                task_id = action['data']['id']
+                dispatched.append(task_id)
+                result = json.dumps({'id' : task_id, 'res' : task_id})
+                action.clear()
+                action.update(json.loads(kl.accept_result(node_id, result)))
+                progressed = True
+            if not progressed:
+                break
+
+        self.assertEqual(sorted(dispatched, key=int),
+                         ['1', '2', '3', '4', '5', '6'])
+        self.assertEqual(len(storage), 6)
+        # a server learns about the completion on the next request
+        for kl, node_id, app in ((kl1, node1, app1), (kl2, node2, app2)):
+            if not app.completed:
+                kl.subscribe(node_id, 'app')
+                action = json.loads(kl.get_action(node_id))
+                self.assertEqual(action['action'], 'unsubscribe')
+            self.assertTrue(app.completed)
+
+    def test_failover(self):
+        storage = MemoryPermanentStorage()
+        kl1, app1, node1 = self._server('s1', storage, tasks_count=1)
+        kl2, app2, node2 = self._server('s2', storage, tasks_count=1)
+        task = json.loads(kl1.get_action(node1))['data']
+        self.assertEqual(task['id'], '1')
+        # the task is pending on s1
+        action = json.loads(kl2.get_action(node2))
+        self.assertEqual(action['action'], 'unsubscribe')
+        self.assertFalse(app2.completed)
+
+        # s1 fails, its lease expires and is taken over by s2
+        self.clock.now += 11
+        kl2.subscribe(node2, 'app')
+        action = json.loads(kl2.get_action(node2))
+        self.assertEqual(action['data']['id'], '1')
+        kl2.accept_result(node2, json.dumps({'id' : '1', 'res' : 2}))
+        self.assertTrue(app2.completed)
+
+        # the late result of s1 is dropped
+        kl1.accept_result(node1, json.dumps({'id' : '1', 'res' : 1}))
+        self.assertEqual(storage['1'], [2])
+        self.assertTrue(app1.completed)
+        # and is not counted as accepted
+        self.assertEqual(app1.progress.accepted, 0)
+        self.assertEqual(app2.progress.accepted, 1)
+
+    def test_expired_pooled_task(self):
+        storage = MemoryPermanentStorage()
+        kl1, app1, node1 = self._server('s1', storage, tasks_count=1)
+        kl2, app2, node2 = self._server('s2', storage, tasks_count=1)
+        task = json.loads(kl1.get_action(node1))['data']
+        self.assertEqual(task['id'], '1')
+        self.assertEqual(app1.pool_size, 1)
+
+        # the lease of s1 expires and the task is taken over by s2
+        self.clock.now += 11
+        action = json.loads(kl2.get_action(node2))
+        self.assertEqual(action['data']['id'], '1')
+        # the pooled task is not dispatched by s1 again
+        action = json.loads(kl1.get_action(node1))
+        self.assertEqual(action['action'], 'unsubscribe')
+        self.assertEqual(app1.pool_size, 0)
+        self.assertFalse(app1.completed)
+
+    def test_expired_lookahead_tasks(self):
+        storage = MemoryPermanentStorage()
+        kl1, app1, node1 = self._server('s1', storage, tasks_count=3)
+        kl2, app2, node2 = self._server('s2', storage, tasks_count=3)
+        app1.locality_lookahead = 3
+        # s1 buffers (and leases) all the tasks
+        action = json.loads(kl1.get_action(node1))
+        self.assertEqual(action['data']['id'], '1')
+
+        # the leases of s1 expire and the tasks are taken over by s2
+        self.clock.now += 11
+        ids = []
+        action = json.loads(kl2.get_action(node2))
+        for _ in range(2):
+            ids.append(action['data']['id'])
+            result = json.dumps({'id' : ids[-1], 'res' : 1})
+            action = json.loads(kl2.accept_result(node2, result))
+        ids.append(action['data']['id'])
+        self.assertEqual(ids, ['1', '2', '3'])
+
+        # the buffered tasks are not dispatched by s1 again
+        action = json.loads(kl1.get_action(node1))
+        self.assertEqual(action['action'], 'unsubscribe')
+        self.assertEqual(len(app1._lookahead), 0)
+
+    def test_settings(self):
+        settings = {
+            'REGISTRY' : {'name' : 'MemoryNodesRegistry',
+                          'config' : {'timeout' : '2s'}},
+            'AUTO_GET_ACTION' : True,
+            'CLUSTER' : {
+                'server' : 's2',
+                'servers' : ['s1', 's2'],
+                'coordinator' : {
+                    'name' : 'SQLiteCoordinator',
+                    'config' : {'path' : self.path},
+                },
+            },
+        }
+        kl = loader.load(settings)
+        self.coordinators.append(kl.coordinator)
+        self.assertIsInstance(kl.coordinator, SQLiteCoordinator)
+        self.assertEqual(kl.coordinator.owner, 's2')
+        self.assertEqual(kl.shard.server, 's2')
+
+        settings['CLUSTER']['server'] = 's3'
+        self.assertRaises(SettingsError, loader.load, settings)
+
+
+kaylee_suite = load_tests([SQLiteCoordinatorTests, HashRingTests,
+                           ClusterTests])
@@ -1,8 +1,18 @@
 # -*- coding: utf-8 -*-
 import json
+import time
+import socket
+import threading
 
 from kaylee.testsuite import KayleeTest, load_tests
-from kaylee import NodeID, loader
+from kaylee import NodeID, loader, Kaylee, KayleeError
+from kaylee.contrib import (SimpleController, MemoryNodesRegistry,
+                            MemoryPermanentStorage)
+from kaylee.session import ClientSessionDataManager, SESSION_DATA_ATTRIBUTE
+from kaylee.testsuite.projects.auto_test_project import AutoTestProject
+from kaylee.shard import Shard, shard_index
+from kaylee.server import ShardRouter, ShardWorkerRequestHandler
+from werkzeug.serving import make_server
 
 from datetime import datetime
 
@@ -48,5 +58,239 @@ class KayleeTests(KayleeTest):
         self.assertIsNone(node.subscription_timestamp)
         self.assertIn(node, kl.registry)
 
+    def test_get_blob(self):
+        kl = loader.load(self.settings)
+        app = kl.applications['test.1']
+        key = app.project.add_blob(b'blob data')
+        self.assertEqual(kl.get_blob(key).data, b'blob data')
+        self.assertRaises(KeyError, kl.get_blob, '0' * 64)
+
+    def test_task_cache(self):
+        class SessionProject(AutoTestProject):
+            def __getitem__(self, task_id):
+                return {'id' : str(task_id), 'data' : [1, 2], '#s1' : 'sd'}
+
+        app = SimpleController('app', SessionProject(tasks_count=1),
+                               MemoryPermanentStorage())
+        sdm = ClientSessionDataManager(self.settings.SECRET_KEY)
+        kl = Kaylee(MemoryNodesRegistry('10m'), sdm, [app],
+                    AUTO_GET_ACTION=True)
+        node_ids = []
+        for i in range(2):
+            node_id = json.loads(kl.register('127.0.0.1'))['node_id']
+            kl.subscribe(node_id, 'app')
+            node_ids.append(node_id)
+
+        actions = [json.loads(kl.get_action(node_id))
+                   for node_id in node_ids]
+        cache = app.task_cache
+        self.assertEqual(cache.hits, 1)
+        self.assertEqual(len(cache), 1)
+        self.assertGreater(cache.size, 0)
+        for action in actions:
+            self.assertEqual(action['action'], 'task')
+            task = action['data']
+            sd = task.pop(SESSION_DATA_ATTRIBUTE)
+            self.assertEqual(task, {'id' : '1', 'data' : [1, 2]})
+            self.assertEqual(sdm._crypto.decrypt(sd), {'#s1' : 'sd'})
+
+        # the cache entry is invalidated as the task is completed
+        result = {'res' : '1', SESSION_DATA_ATTRIBUTE : sd}
+        kl.accept_result(node_ids[0], json.dumps(result))
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(app.permanent_storage['1'], [1])
+
+    def test_add_remove_application(self):
+        app1 = SimpleController('app1', AutoTestProject(),
+                                MemoryPermanentStorage())
+        kl = Kaylee(MemoryNodesRegistry('10m'), None, [app1],
+                    AUTO_GET_ACTION=True)
+        app2 = SimpleController('app2', AutoTestProject(),
+                                MemoryPermanentStorage())
+        kl.add_application(app2)
+        self.assertEqual(kl.applications.names, ['app1', 'app2'])
+        self.assertRaises(KayleeError, kl.add_application, app2)
+
+        node1 = json.loads(kl.register('127.0.0.1'))['node_id']
+        node2 = json.loads(kl.register('127.0.0.1'))['node_id']
+        kl.subscribe(node1, 'app1')
+        kl.subscribe(node2, 'app2')
+        task = json.loads(kl.get_action(node2))['data']
+        kl.get_action(node1)
+
+        self.assertIs(kl.remove_application('app2'), app2)
+        self.assertTrue(app2.removed)
+        self.assertEqual(kl.applications.names, ['app1'])
+        self.assertRaises(KayleeError, kl.remove_application, 'app2')
+        self.assertIn('error', json.loads(kl.subscribe(node1, 'app2')))
+
+        # the in-flight result is accepted, then the node is drained
+        action = json.loads(kl.accept_result(
+            node2, json.dumps({'id' : task['id'], 'res' : 5})))
+        self.assertEqual(action['action'], 'unsubscribe')
+        self.assertEqual(app2.permanent_storage[task['id']], [5])
+        self.assertIsNone(kl.registry[node2].controller)
+
+        # the other application is not affected
+        action = json.loads(kl.get_action(node1))
+        self.assertEqual(action['action'], 'task')
+
+    def test_reload_application(self):
+        app = SimpleController('app', AutoTestProject(),
+                               MemoryPermanentStorage())
+        kl = Kaylee(MemoryNodesRegistry('10m'), None, [app],
+                    AUTO_GET_ACTION=True)
+        node_id = json.loads(kl.register('127.0.0.1'))['node_id']
+        kl.subscribe(node_id, 'app')
+        kl.get_action(node_id)
+
+        new_app = SimpleController('app', AutoTestProject(tasks_count=3),
+                                   MemoryPermanentStorage())
+        self.assertIs(kl.reload_application(new_app), app)
+        self.assertIs(kl.applications['app'], new_app)
+        self.assertTrue(app.removed)
+        self.assertFalse(new_app.removed)
+        action = json.loads(kl.get_action(node_id))
+        self.assertEqual(action['action'], 'unsubscribe')
+
+        kl.subscribe(node_id, 'app')
+        self.assertIs(kl.registry[node_id].controller, new_app)
+        action = json.loads(kl.get_action(node_id))
+        self.assertEqual(action['action'], 'task')
+
+        missing = SimpleController('missing', AutoTestProject(),
+                                   MemoryPermanentStorage())
+        self.assertRaises(KayleeError, kl.reload_application, missing)
+
+    def test_shard(self):
+        app = SimpleController('app', AutoTestProject(),
+                               MemoryPermanentStorage())
+        kl = Kaylee(MemoryNodesRegistry('10m'), None, [app],
+                    AUTO_GET_ACTION=True)
+        kl.shard = Shard(1, 4)
+        self.assertIs(app.shard, kl.shard)
+        for i in range(20):
+            node_id = json.loads(kl.register('127.0.0.1'))['node_id']
+            self.assertEqual(shard_index(NodeID(node_id), 4), 1)
+
+        new_app = SimpleController('app2', AutoTestProject(),
+                                   MemoryPermanentStorage())
+        kl.add_application(new_app)
+        self.assertIs(new_app.shard, kl.shard)
+
+    def test_shard_router(self):
+        router = ShardRouter('127.0.0.1', 0, 4)
+        try:
+            node_id = NodeID()
+            index = shard_index(node_id, 4)
+            for line in ['GET /kaylee/actions/{} HTTP/1.0',
+                         'POST /kaylee/actions/{}?x=1 HTTP/1.1',
+                         'POST /kaylee/apps/app/subscribe/{} HTTP/1.1']:
+                line = line.format(node_id).encode()
+                self.assertEqual(router.route(line), index)
+            # the requests without node ID are distributed round-robin
+            indices = [router.route(b'GET /kaylee/register HTTP/1.1')
+                       for i in range(8)]
+            self.assertEqual(indices, [0, 1, 2, 3, 0, 1, 2, 3])
+        finally:
+            router.close()
+
+    def test_shard_router_stalled_client(self):
+        if not hasattr(socket, 'send_fds'):
+            self.skipTest('socket.send_fds() is not available')
+        router = ShardRouter('127.0.0.1', 0, 2, peek_timeout=0.5)
+        channels = [router.add_worker() for _ in range(2)]
+        thread = threading.Thread(target=router.serve_forever)
+        thread.start()
+        clients = []
+        try:
+            def connect(data):
+                client = socket.create_connection(router.address)
+                clients.append(client)
+                if data:
+                    client.sendall(data)
+                return client
+
+            def receive(channel, timeout):
+                channel.settimeout(timeout)
+                msg, fds, _, _ = socket.recv_fds(channel, 1024, 1)
+                conn = socket.socket(fileno=fds[0])
+                conn.setblocking(False)
+                try:
+                    data = conn.recv(1024, socket.MSG_PEEK)
+                except BlockingIOError:
+                    data = b''
+                finally:
+                    conn.close()
+                return tuple(json.loads(msg.decode())), data
+
+            node_id = NodeID()
+            index = shard_index(node_id, 2)
+            request = 'GET /kaylee/actions/{} HTTP/1.1\r\n\r\n' \
+                .format(node_id).encode()
+            # an idle and a slow client do not block the routing
+            idle = connect(b'')
+            slow = connect(b'GET /kay')
+            start = time.monotonic()
+            client = connect(request)
+            peer, data = receive(channels[index], 0.4)
+            self.assertLess(time.monotonic() - start, 0.4)
+            self.assertEqual(peer, client.getsockname())
+            self.assertEqual(data, request)
+
+            # the slow request line is completed
+            slow.sendall('lee/actions/{} HTTP/1.1\r\n'.format(node_id)
+                         .encode())
+            peer, data = receive(channels[index], 0.4)
+            self.assertEqual(peer, slow.getsockname())
+            # the idle client is handed over (round-robin) after
+            # the timeout
+            peer, data = receive(channels[0], 2)
+            self.assertEqual(peer, idle.getsockname())
+            self.assertEqual(data, b'')
+        finally:
+            router.shutdown()
+            thread.join()
+            router.close()
+            for sock in clients + channels:
+                sock.close()
+
+
+    def test_shard_worker_closes_connections(self):
+        # the newer threaded Werkzeug servers switch the handlers which
+        # do not define their own protocol version to HTTP/1.1
+        self.assertIn('protocol_version', vars(ShardWorkerRequestHandler))
+
+        def app(environ, start_response):
+            start_response('200 OK', [('Content-Type', 'text/plain')])
+            return [b'ok']
+
+        server = make_server('127.0.0.1', 0, app, threaded=True,
+                             request_handler=ShardWorkerRequestHandler)
+        thread = threading.Thread(target=server.handle_request)
+        thread.start()
+        client = socket.create_connection(('127.0.0.1',
+                                           server.server_port))
+        try:
+            # two kept-alive requests of the nodes of different shards
+            request = ('GET /kaylee/actions/{} HTTP/1.1\r\n'
+                       'Host: localhost\r\n'
+                       'Connection: keep-alive\r\n\r\n')
+            client.sendall((request.format(NodeID()) +
+                            request.format(NodeID())).encode())
+            client.settimeout(2)
+            response = b''
+            while True:
+                data = client.recv(1024)
+                if not data:
+                    break
+                response += data
+            # the connection is closed after a single request
+            self.assertTrue(response.startswith(b'HTTP/1.0 200'))
+            self.assertEqual(response.count(b'HTTP/1.'), 1)
+        finally:
+            client.close()
+            thread.join()
+            server.server_close()
 
 kaylee_suite = load_tests([KayleeTests])
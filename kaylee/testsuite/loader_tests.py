@@ -6,13 +6,17 @@
 from kaylee.testsuite import KayleeTest, load_tests, PROJECTS_DIR
 
 import os
+import sys
+import time
+import shutil
+import tempfile
 from kaylee import loader, Kaylee, KayleeError
 from kaylee.errors import SettingsError
 from kaylee.contrib import (MemoryTemporalStorage,
                             MemoryPermanentStorage,
                             MemoryNodesRegistry)
 from kaylee.session import ClientSessionDataManager
-from kaylee.loader import Loader, SettingsValidator
+from kaylee.loader import Loader, SettingsValidator, ProjectsManifest
 from kaylee.util import generate_sercret_key
 
 _test_REGISTRY = {
@@ -103,6 +107,13 @@ class KayleeLoaderTests(KayleeTest):
         self.assertIsInstance(app.permanent_storage, MemoryPermanentStorage)
         #self.assertIsInstance(app.project.storage, MemoryPermanentStorage)
 
+    def test_load_application(self):
+        settings = dict(TestSettingsWithApps.__dict__)
+        ldr = Loader(settings)
+        app = ldr.load_application(settings['APPLICATIONS'][0])
+        self.assertEqual(app.name, 'test.1')
+        self.assertEqual(app.__class__.__name__, 'TestController1')
+
     def test_load_registry(self):
         settings = dict(TestSettings.__dict__)
         ldr = Loader(settings)
@@ -148,4 +159,173 @@ class KayleeLoaderTests(KayleeTest):
         # }))
 
 
-kaylee_suite = load_tests([KayleeLoaderTests])
+class ProjectsManifestTests(KayleeTest):
+    def setUp(self):
+        self.projects_dir = tempfile.mkdtemp()
+        self._write('lazy_pkg_a/__init__.py',
+                    'import os\n'
+                    'from .projects import *\n'
+                    'from kaylee.contrib import MemoryTemporalStorage as MTS\n'
+                    'class ControllerA(object):\n'
+                    '    pass\n')
+        self._write('lazy_pkg_a/projects.py',
+                    'class ProjectA(object):\n'
+                    '    pass\n')
+        self._write('lazy_pkg_b/__init__.py',
+                    'from kaylee.contrib.projects import *\n')
+        self._write('lazy_pkg_c/__init__.py', 'def broken(:\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.projects_dir)
+
+    def _write(self, relpath, content):
+        path = os.path.join(self.projects_dir, relpath)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    def test_names(self):
+        manifest = ProjectsManifest(self.projects_dir)
+        entry = manifest.packages['lazy_pkg_a']
+        self.assertEqual(entry['names'],
+                         ['ControllerA', 'MTS', 'ProjectA', 'os'])
+        self.assertFalse(entry['wildcard'])
+        self.assertEqual(sorted(entry['files']),
+                         ['__init__.py', 'projects.py'])
+        # absolute star imports and syntax errors make the packages
+        # candidates for every name
+        self.assertTrue(manifest.packages['lazy_pkg_b']['wildcard'])
+        self.assertTrue(manifest.packages['lazy_pkg_c']['wildcard'])
+
+        self.assertEqual(manifest.lookup('ProjectA'),
+                         ['lazy_pkg_a', 'lazy_pkg_b', 'lazy_pkg_c'])
+        self.assertEqual(manifest.lookup('Unknown'),
+                         ['lazy_pkg_b', 'lazy_pkg_c'])
+
+    def test_nested_names(self):
+        self._write('lazy_pkg_d/__init__.py',
+                    'try:\n'
+                    '    from json import loads\n'
+                    'except ImportError:\n'
+                    '    loads = None\n'
+                    'if loads is not None:\n'
+                    '    class ProjectD(object):\n'
+                    '        class Inner(object):\n'
+                    '            pass\n'
+                    'else:\n'
+                    '    ProjectD, *OtherD = None, None\n'
+                    'def helper():\n'
+                    '    class Local(object):\n'
+                    '        pass\n')
+        manifest = ProjectsManifest(self.projects_dir)
+        entry = manifest.packages['lazy_pkg_d']
+        self.assertEqual(entry['names'], ['OtherD', 'ProjectD', 'loads'])
+        self.assertFalse(entry['wildcard'])
+        self.assertEqual(manifest.lookup('ProjectD')[0], 'lazy_pkg_d')
+
+    def test_cache(self):
+        manifest = ProjectsManifest(self.projects_dir)
+        self.assertEqual(manifest.parsed, 3)
+        self.assertTrue(os.path.exists(manifest.cache_path))
+
+        manifest = ProjectsManifest(self.projects_dir)
+        self.assertEqual(manifest.parsed, 0)
+        self.assertEqual(manifest.lookup('ProjectA')[0], 'lazy_pkg_a')
+
+        # a modified submodule invalidates its package's entry only
+        path = self._write('lazy_pkg_a/projects.py',
+                           'class ProjectB(object):\n'
+                           '    pass\n')
+        mtime = time.time() + 10
+        os.utime(path, (mtime, mtime))
+        manifest = ProjectsManifest(self.projects_dir)
+        self.assertEqual(manifest.parsed, 1)
+        self.assertEqual(manifest.lookup('ProjectA'),
+                         ['lazy_pkg_b', 'lazy_pkg_c'])
+        self.assertEqual(manifest.lookup('ProjectB')[0], 'lazy_pkg_a')
+
+        # removed packages are dropped
+        shutil.rmtree(os.path.join(self.projects_dir, 'lazy_pkg_c'))
+        manifest = ProjectsManifest(self.projects_dir)
+        self.assertEqual(manifest.parsed, 0)
+        self.assertNotIn('lazy_pkg_c', manifest.packages)
+
+    def test_corrupted_cache(self):
+        cache_path = os.path.join(self.projects_dir,
+                                  ProjectsManifest.CACHE_FILENAME)
+        with open(cache_path, 'w') as f:
+            f.write('{"version": 1, "packa')
+        manifest = ProjectsManifest(self.projects_dir)
+        self.assertEqual(manifest.parsed, 3)
+
+    def test_unwritable_cache(self):
+        # the cache directory cannot be created under a file
+        path = self._write('file', '')
+        cache_path = os.path.join(path, 'cache.json')
+        manifest = ProjectsManifest(self.projects_dir, cache_path)
+        self.assertEqual(manifest.lookup('ControllerA'), ['lazy_pkg_a',
+                                                          'lazy_pkg_b',
+                                                          'lazy_pkg_c'])
+        self.assertFalse(os.path.exists(cache_path))
+
+    def test_default_cache_path(self):
+        self.assertEqual(ProjectsManifest.default_cache_path(
+                             self.projects_dir),
+                         os.path.join(self.projects_dir,
+                                      ProjectsManifest.CACHE_FILENAME))
+        # the manifest of a read-only projects directory is cached in
+        # the user's cache directory
+        cache_home = os.path.join(self.projects_dir, 'cache')
+        previous = os.environ.get('XDG_CACHE_HOME')
+        os.environ['XDG_CACHE_HOME'] = cache_home
+        try:
+            paths = [ProjectsManifest.default_cache_path(path)
+                     for path in ('/nonexistent/a', '/nonexistent/b')]
+        finally:
+            if previous is None:
+                del os.environ['XDG_CACHE_HOME']
+            else:
+                os.environ['XDG_CACHE_HOME'] = previous
+        self.assertNotEqual(paths[0], paths[1])
+        for path in paths:
+            self.assertEqual(os.path.dirname(path),
+                             os.path.join(cache_home, 'kaylee'))
+
+    def test_lazy_import(self):
+        # the package with the import error is never imported, since
+        # none of its names is referenced
+        ldr = Loader(dict(TestSettingsWithApps.__dict__))
+        apps = ldr.applications
+        self.assertEqual(apps[0].__class__.__name__, 'TestController1')
+        self.assertIn('auto_test_project', ldr._packages)
+        self.assertNotIn('import_error_project', ldr._packages)
+        self.assertNotIn('import_error_project', sys.modules)
+
+    def test_project_classes_override_builtins(self):
+        self._write('lazy_pkg_d/__init__.py',
+                    'from kaylee.contrib import MemoryNodesRegistry as _R\n'
+                    'class MemoryNodesRegistry(_R):\n'
+                    '    pass\n')
+        sys.path.insert(0, self.projects_dir)
+        try:
+            ldr = Loader({'PROJECTS_DIR' : self.projects_dir,
+                          'REGISTRY' : _test_REGISTRY})
+            reg = ldr.registry
+        finally:
+            sys.path.remove(self.projects_dir)
+            sys.modules.pop('lazy_pkg_d', None)
+        self.assertIsInstance(reg, MemoryNodesRegistry)
+        self.assertEqual(type(reg).__module__, 'lazy_pkg_d')
+        # the packages which define the name explicitly are tried first
+        self.assertEqual(list(ldr._packages), ['lazy_pkg_d'])
+
+    def test_class_not_found(self):
+        settings = dict(TestSettingsWithApps.__dict__)
+        ldr = Loader(settings)
+        from kaylee.project import Project
+        self.assertRaises(KeyError, ldr.get_class, Project, 'NoSuchProject')
+
+
+kaylee_suite = load_tests([KayleeLoaderTests, ProjectsManifestTests])
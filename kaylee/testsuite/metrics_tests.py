@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+import io
+import json
+import threading
+
+from kaylee.testsuite import KayleeTest, load_tests
+from kaylee import Kaylee
+from kaylee.metrics import MetricsRegistry, MetricFamily, CONTENT_TYPE
+from kaylee.contrib import (SimpleController, MemoryNodesRegistry,
+                            MemoryPermanentStorage)
+from kaylee.contrib.frontends.wsgi_frontend import make_wsgi_app
+from kaylee.testsuite.projects.auto_test_project import AutoTestProject
+
+
+def _samples(registry, name):
+    for family in registry.collect():
+        if family.name == name:
+            return family.samples
+    return None
+
+
+class MetricsTests(KayleeTest):
+    def test_counter(self):
+        reg = MetricsRegistry()
+        counter = reg.counter('events_total', 'The events.')
+        self.assertEqual(counter.name, 'events')
+        counter.inc()
+        counter.inc(2)
+        self.assertEqual(counter.get(), 3)
+        self.assertRaises(ValueError, counter.inc, -1)
+        # get-or-create
+        self.assertIs(reg.counter('events', 'The events.'), counter)
+        self.assertRaises(ValueError, reg.gauge, 'events', 'The events.')
+        self.assertEqual(_samples(reg, 'events'), [('events_total', (), 3)])
+
+    def test_gauge(self):
+        reg = MetricsRegistry()
+        gauge = reg.gauge('level', 'The level.')
+        gauge.inc(5)
+        gauge.dec()
+        self.assertEqual(gauge.get(), 4)
+        gauge.set(10)
+        gauge.dec(3)
+        self.assertEqual(gauge.get(), 7)
+
+    def test_labels(self):
+        reg = MetricsRegistry()
+        counter = reg.counter('requests', 'The requests.', ['endpoint'])
+        counter.labels('register').inc()
+        counter.labels(endpoint='register').inc()
+        counter.labels('subscribe').inc()
+        self.assertIs(counter.labels('register'), counter.labels('register'))
+        self.assertRaises(ValueError, counter.labels)
+        self.assertRaises(ValueError, counter.labels, 'a', 'b')
+        self.assertEqual(sorted(_samples(reg, 'requests')), [
+            ('requests_total', (('endpoint', 'register'), ), 2),
+            ('requests_total', (('endpoint', 'subscribe'), ), 1),
+        ])
+
+    def test_histogram(self):
+        reg = MetricsRegistry()
+        hist = reg.histogram('latency_seconds', 'The latency.',
+                             buckets=[0.1, 1.0])
+        for val in (0.05, 0.1, 0.5, 2.0):
+            hist.observe(val)
+        samples = _samples(reg, 'latency_seconds')
+        self.assertEqual(samples, [
+            ('latency_seconds_bucket', (('le', 0.1), ), 2),
+            ('latency_seconds_bucket', (('le', 1.0), ), 3),
+            ('latency_seconds_bucket', (('le', float('inf')), ), 4),
+            ('latency_seconds_sum', (), 2.65),
+            ('latency_seconds_count', (), 4),
+        ])
+
+    def test_threads(self):
+        reg = MetricsRegistry()
+        counter = reg.counter('events', 'The events.')
+        hist = reg.histogram('latency', 'The latency.', buckets=[1.0])
+
+        def work():
+            for _ in range(1000):
+                counter.inc()
+                hist.observe(0.5)
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(counter.get(), 4000)
+        self.assertEqual(_samples(reg, 'latency')[-1][2], 4000)
+
+    def test_exposition(self):
+        reg = MetricsRegistry()
+        reg.counter('events', 'The "events".\nMore', ['kind']) \
+            .labels('a"b\\c').inc()
+        reg.histogram('latency', 'The latency.', buckets=[0.5]).observe(1)
+        self.assertEqual(reg.exposition(), '\n'.join([
+            '# HELP events The "events".\\nMore',
+            '# TYPE events counter',
+            'events_total{kind="a\\"b\\\\c"} 1',
+            '# HELP latency The latency.',
+            '# TYPE latency histogram',
+            'latency_bucket{le="0.5"} 0',
+            'latency_bucket{le="+Inf"} 1',
+            'latency_sum 1',
+            'latency_count 1',
+        ]) + '\n')
+
+    def test_collectors(self):
+        reg = MetricsRegistry()
+
+        class Source(object):
+            def collect(self):
+                return [MetricFamily('source', 'gauge', 'A source.').add(1)]
+        source1, source2 = Source(), Source()
+        reg.add_collector(source1.collect)
+        reg.add_collector(source2.collect)
+        reg.add_collector(lambda: [MetricFamily('func', 'gauge', 'A func.')
+                                   .add(2)])
+        # the same families are merged
+        self.assertEqual(_samples(reg, 'source'),
+                         [('source', (), 1), ('source', (), 1)])
+        self.assertEqual(_samples(reg, 'func'), [('func', (), 2)])
+        # bound methods are referenced weakly
+        del source1, source2
+        self.assertIsNone(_samples(reg, 'source'))
+        self.assertEqual(_samples(reg, 'func'), [('func', (), 2)])
+
+    def test_kaylee_metrics(self):
+        app = SimpleController('metrics_app', AutoTestProject(),
+                               MemoryPermanentStorage())
+        kl = Kaylee(MemoryNodesRegistry('10m'), None, [app],
+                    AUTO_GET_ACTION=True, METRICS_ENDPOINT=True)
+        node_id = json.loads(kl.register('127.0.0.1'))['node_id']
+        kl.subscribe(node_id, 'metrics_app')
+        kl.get_action(node_id)
+        kl.accept_result(node_id, json.dumps({'id' : '1', 'res' : 10}))
+        kl.get_action('invalid node id')
+
+        text = kl.export_metrics()
+        lines = text.splitlines()
+        # the result is answered with the next task
+        self.assertIn('kaylee_app_tasks_generated_total'
+                      '{app="metrics_app"} 2', lines)
+        self.assertIn('kaylee_app_results_accepted_total'
+                      '{app="metrics_app"} 1', lines)
+        self.assertIn('kaylee_app_storage_results'
+                      '{app="metrics_app",storage="permanent"} 1', lines)
+        self.assertIn('# TYPE kaylee_request_duration_seconds histogram',
+                      lines)
+        self.assertTrue(any(line.startswith(
+            'kaylee_request_errors_total{endpoint="get_action"}')
+            for line in lines))
+
+        kl.config.METRICS_ENDPOINT = False
+        self.assertIsNone(kl.export_metrics())
+
+    def test_instances(self):
+        kls = [Kaylee(MemoryNodesRegistry('10m'), None,
+                      [SimpleController('app', AutoTestProject(),
+                                        MemoryPermanentStorage())],
+                      METRICS_ENDPOINT=True)
+               for _ in range(2)]
+        kls[0].register('127.0.0.1')
+        # every instance exports its own values only
+        for kl, nodes in zip(kls, (1, 0)):
+            lines = [line for line in kl.export_metrics().splitlines()
+                     if line.startswith(('kaylee_nodes ',
+                                         'kaylee_app_completed{'))]
+            self.assertEqual(lines, ['kaylee_nodes {}'.format(nodes),
+                                     'kaylee_app_completed{app="app"} 0'])
+        # the endpoint is disabled by default
+        kl = Kaylee(MemoryNodesRegistry('10m'), None, [])
+        self.assertIsNone(kl.export_metrics())
+
+    def test_wsgi_endpoint(self):
+        app = SimpleController('app', AutoTestProject(),
+                               MemoryPermanentStorage())
+        kl = Kaylee(MemoryNodesRegistry('10m'), None, [app],
+                    METRICS_ENDPOINT=True)
+        wsgi_app = make_wsgi_app(kl)
+
+        def request(method):
+            response = {}
+            def start_response(status, headers):
+                response['status'] = status
+                response['headers'] = dict(headers)
+            environ = {'REQUEST_METHOD' : method,
+                       'PATH_INFO' : '/kaylee/metrics',
+                       'wsgi.input' : io.BytesIO(b'')}
+            response['body'] = b''.join(wsgi_app(environ, start_response))
+            return response
+
+        res = request('GET')
+        self.assertEqual(res['status'], '200 OK')
+        self.assertEqual(res['headers']['Content-Type'], CONTENT_TYPE)
+        self.assertIn(b'# TYPE kaylee_nodes gauge', res['body'])
+        self.assertEqual(request('POST')['status'], '405 Method Not Allowed')
+        kl.config.METRICS_ENDPOINT = False
+        self.assertEqual(request('GET')['status'], '404 Not Found')
+
+
+kaylee_suite = load_tests([MetricsTests, ])
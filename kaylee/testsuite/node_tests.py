@@ -30,6 +30,16 @@ class NodeIDTests(KayleeTest):
         self.assertRaises(TypeError, NodeID.for_host, 1000)
         self.assertRaises(TypeError, NodeID.for_host, 100.1)
 
+    def test_host_id(self):
+        n1 = NodeID.for_host('127.0.0.1')
+        n2 = NodeID.for_host('127.0.0.1')
+        n3 = NodeID.for_host('10.0.0.1')
+        self.assertEqual(len(n1.host_id), 8)
+        self.assertEqual(n1.host_id, n2.host_id)
+        self.assertNotEqual(n1.host_id, n3.host_id)
+        self.assertEqual(NodeID.host_id_of('10.0.0.1'), n3.host_id)
+        self.assertEqual(NodeID(str(n3)).host_id, n3.host_id)
+
     def test_extract_node_id(self):
         n  = NodeID.for_host('127.0.0.1')
         n1 = extract_node_id(n)
@@ -119,17 +129,30 @@ class NodeTests(KayleeTest):
         self.assertTrue(node.dirty)
         node.dirty = False
 
-        node.session_data = '123'
+    def test_resident_data(self):
+        node = Node(NodeID())
+        self.assertFalse(node.has_resident_data(['k1']))
+        node.add_resident_data(['k1', 'k2'])
         self.assertTrue(node.dirty)
         node.dirty = False
+        node.add_resident_data(['k1'])
+        self.assertFalse(node.dirty)
+        self.assertTrue(node.has_resident_data(['k1', 'k2']))
+        self.assertFalse(node.has_resident_data(['k1', 'k3']))
+
+        keys = ['x{}'.format(i) for i in range(Node.RESIDENT_DATA_CAPACITY)]
+        node.add_resident_data(keys)
+        self.assertFalse(node.has_resident_data(['k1']))
+        self.assertTrue(node.has_resident_data(keys))
+
+        node.subscribe(TestController.new_test_instance())
+        node.unsubscribe()
+        self.assertFalse(node.has_resident_data(keys))
 
     def test_get_set_properties(self):
         nid = NodeID.for_host('127.0.0.1')
         node = Node(nid)
 
-        node.session_data = 'sd1'
-        self.assertEqual(node.session_data, 'sd1')
-
         ctrl = TestController.new_test_instance()
         node.subscribe(ctrl)
         now = datetime.now()
@@ -144,5 +167,38 @@ class NodeTests(KayleeTest):
                         <= timedelta(seconds = 3))
         self.assertEqual(node.task_id, 'tid789')
 
+    def test_registry_clean(self):
+        import struct
+        import time
+        from kaylee.contrib import MemoryNodesRegistry
+        registry = MemoryNodesRegistry(timeout='10s')
+        fresh = Node(NodeID.for_host('127.0.0.1'))
+        obsolete = Node(NodeID(struct.pack('>i', int(time.time()) - 20)
+                               + b'\x00' * 6))
+        registry.add(fresh)
+        registry.add(obsolete)
+        self.assertEqual(registry.clean(), [obsolete])
+        self.assertEqual(len(registry), 1)
+        self.assertIn(fresh, registry)
+        self.assertNotIn(obsolete, registry)
+        self.assertEqual(registry.hosts(), {fresh.id.host_id : 1})
+
+    def test_registry_hosts(self):
+        from kaylee.contrib import MemoryNodesRegistry
+        registry = MemoryNodesRegistry(timeout='10s')
+        nodes = [Node(NodeID.for_host(host))
+                 for host in ('10.0.0.1', '10.0.0.1', '10.0.0.2')]
+        for node in nodes:
+            registry.add(node)
+        # re-adding a node does not change the counts
+        registry.add(nodes[0])
+        host1, host2 = NodeID.host_id_of('10.0.0.1'), \
+            NodeID.host_id_of('10.0.0.2')
+        self.assertEqual(registry.hosts(), {host1 : 2, host2 : 1})
+        del registry[nodes[2]]
+        del registry[nodes[2]]
+        del registry[nodes[0].id]
+        self.assertEqual(registry.hosts(), {host1 : 1})
+
 
 kaylee_suite = load_tests([NodeTests, NodeIDTests, ])
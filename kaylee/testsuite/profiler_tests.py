@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+import os
+import time
+import shutil
+import tempfile
+import threading
+
+from kaylee.testsuite import KayleeTest, load_tests
+from kaylee.profiler import StackSampler
+from kaylee import server, setup
+
+
+def _busy_loop(stop_event):
+    while not stop_event.is_set():
+        sum(range(1000))
+
+
+class ProfilerTests(KayleeTest):
+    def test_sampler(self):
+        stop_event = threading.Event()
+        thread = threading.Thread(target=_busy_loop, args=(stop_event, ))
+        thread.start()
+        try:
+            with StackSampler(interval=0.001) as sampler:
+                time.sleep(0.2)
+        finally:
+            stop_event.set()
+            thread.join()
+        self.assertGreater(sampler.rounds, 0)
+        self.assertGreater(sampler.samples, 0)
+        lines = sampler.folded()
+        busy = [line for line in lines if '_busy_loop (' in line]
+        self.assertTrue(busy)
+        stack, count = busy[0].rsplit(' ', 1)
+        self.assertGreater(int(count), 0)
+        # the outermost frame goes first
+        self.assertTrue(stack.startswith('_bootstrap ('))
+        self.assertTrue(stack.endswith('_busy_loop (profiler_tests.py:{})'
+                                       .format(_busy_loop.__code__
+                                               .co_firstlineno)))
+        # the sampler does not sample itself
+        self.assertFalse(any('sample (' in line for line in lines))
+        # the waiting threads are skipped by default
+        self.assertFalse(any(line.split(' ', 1)[0].endswith('test_sampler')
+                             for line in lines))
+
+        # the calling thread is not sampled
+        sampler = StackSampler(include_idle=True)
+        sampler.sample()
+        self.assertFalse(any('test_sampler (' in line
+                             for line in sampler.folded()))
+        with sampler:
+            self.assertRaises(RuntimeError, sampler.start)
+
+    def test_profile_server(self):
+        from kaylee.testsuite import test_settings
+        tmpdir = tempfile.mkdtemp()
+        try:
+            with open(os.path.join(tmpdir, 'index.html'), 'w') as f:
+                f.write('<html></html>')
+            output = os.path.join(tmpdir, 'kaylee.folded')
+            sampler = server.profile(test_settings.__file__, tmpdir, output,
+                                     port=0, interval=0.002, duration=0.3,
+                                     include_idle=True)
+            self.assertGreater(sampler.rounds, 0)
+            with open(output) as f:
+                data = f.read()
+            self.assertIn('serve_forever', data)
+        finally:
+            setup(None)
+            shutil.rmtree(tmpdir)
+
+
+kaylee_suite = load_tests([ProfilerTests, ])
@@ -1,6 +1,12 @@
+import os
+import json
+import tempfile
+from hashlib import sha256
 from kaylee.testsuite import KayleeTest, load_tests
 from kaylee.project import Project, AUTO_PROJECT_MODE, MANUAL_PROJECT_MODE
 from kaylee.testsuite.helper import NonAbstractProject
+from kaylee.progress import Progress
+from kaylee.contrib.projects import JSONLinesFileProject, FixedWidthFileProject
 
 class ProjectTests(KayleeTest):
     def setUp(self):
@@ -34,5 +40,156 @@ class ProjectTests(KayleeTest):
     def test_is_abstract(self):
         self.assertRaises(TypeError, Project, '/script.ks', AUTO_PROJECT_MODE)
 
+    def test_blobs(self):
+        pj = NonAbstractProject('/script.js', AUTO_PROJECT_MODE)
+        k1 = pj.add_blob(b'\x00\x01')
+        k2 = pj.add_blob('text')
+        k3 = pj.add_blob({'table' : [1, 2, 3]})
+        self.assertEqual(pj.add_blob(b'\x00\x01'), k1)
+        self.assertEqual(len(pj.blobs), 3)
+        self.assertEqual(k1, sha256(b'\x00\x01').hexdigest())
 
-kaylee_suite = load_tests([ProjectTests, ])
+        blob = pj.blobs[k1]
+        self.assertEqual(blob.data, b'\x00\x01')
+        self.assertEqual(blob.content_type, 'application/octet-stream')
+        self.assertEqual(pj.blobs[k2].content_type,
+                         'text/plain; charset=utf-8')
+        self.assertEqual(json.loads(pj.blobs[k3].data.decode('utf-8')),
+                         {'table' : [1, 2, 3]})
+        self.assertEqual(pj.blobs[k3].content_type, 'application/json')
+        headers = dict(blob.headers)
+        self.assertEqual(headers['ETag'], '"{}"'.format(k1))
+        self.assertIn('immutable', headers['Cache-Control'])
+        self.assertTrue(blob.matches('"{}"'.format(k1)))
+        self.assertTrue(blob.matches('"abc", W/"{}"'.format(k1)))
+        self.assertFalse(blob.matches('"abc"'))
+        self.assertFalse(blob.matches(None))
+
+
+class ProgressTests(KayleeTest):
+    def test_counters(self):
+        progress = Progress(total=4)
+        self.assertFalse(progress.completed)
+        for i in range(3):
+            progress.task_generated()
+            progress.task_leased()
+        progress.task_leased()
+        progress.result_accepted()
+        progress.result_rejected()
+        self.assertEqual(progress.as_dict(), {
+            'total' : 4, 'generated' : 3, 'leased' : 4, 'accepted' : 1,
+            'rejected' : 1, 'outstanding' : 2, 'rate' : 0.0, 'eta' : None,
+        })
+
+        # unknown total amount of tasks
+        progress = Progress()
+        progress.task_generated()
+        progress.depleted = True
+        self.assertFalse(progress.completed)
+        progress.result_accepted()
+        self.assertTrue(progress.completed)
+
+    def test_rate_and_eta(self):
+        now = [0.0]
+        progress = Progress(total=100, smoothing=0.5, interval=1.0,
+                            clock=lambda: now[0])
+        progress.result_accepted()
+        self.assertEqual(progress.rate, 0.0)
+        self.assertIsNone(progress.eta)
+
+        now[0] = 2.0
+        progress.result_accepted()
+        self.assertEqual(progress.rate, 1.0)  # 2 results in 2 seconds
+        self.assertEqual(progress.eta, 98.0)
+
+        now[0] = 2.5
+        for i in range(5):
+            progress.result_accepted()
+        self.assertEqual(progress.rate, 1.0)  # no new sample yet
+        now[0] = 3.0
+        progress.result_accepted()
+        self.assertEqual(progress.rate, 3.5)  # 1.0 + 0.5 * (6.0 - 1.0)
+
+        # the rate decays while no results are accepted
+        now[0] = 5.0
+        self.assertEqual(progress.rate, 1.75)  # 3.5 + 0.5 * (0.0 - 3.5)
+        self.assertEqual(progress.eta, 92 / 1.75)
+        now[0] = 6.0
+        progress.result_rejected()
+        self.assertEqual(progress.as_dict()['rate'], 0.875)
+
+        self.assertRaises(ValueError, Progress, smoothing=0)
+
+    def test_project_progress(self):
+        project = NonAbstractProject('/script.js', AUTO_PROJECT_MODE)
+        self.assertIsInstance(project.progress, Progress)
+        self.assertIsNone(project.total_tasks)
+
+
+class JSONLinesTestProject(JSONLinesFileProject):
+    def normalize_result(self, task_id, result):
+        return result
+
+
+class FixedWidthTestProject(FixedWidthFileProject):
+    def normalize_result(self, task_id, result):
+        return result
+
+
+class FileProjectTests(KayleeTest):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(prefix='kl_project_')
+        os.close(fd)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def write(self, data):
+        with open(self.path, 'wb') as f:
+            f.write(data)
+
+    def test_json_lines_project(self):
+        self.write(b'{"a": 1}\n\n[1, 2]\n  \n{"a": 3, "id": "x"}')
+        pj = JSONLinesTestProject('/script.js', AUTO_PROJECT_MODE, self.path)
+        self.assertIsNone(pj.total_tasks)
+        # random access before streaming
+        self.assertEqual(pj['1'], {'id' : '1', 'data' : [1, 2]})
+        self.assertEqual(pj.next_task(), {'id' : '0', 'a' : 1})
+        self.assertEqual(pj.next_task(), {'id' : '1', 'data' : [1, 2]})
+        self.assertEqual(pj.next_task(), {'id' : '2', 'a' : 3})
+        self.assertIsNone(pj.next_task())
+        self.assertEqual(pj.total_tasks, 3)
+        self.assertEqual(pj['0'], {'id' : '0', 'a' : 1})
+        for task_id in ['3', '-1', 'abc']:
+            self.assertRaises(KeyError, pj.__getitem__, task_id)
+        pj.close()
+
+        self.write(b'')
+        pj = JSONLinesTestProject('/script.js', AUTO_PROJECT_MODE, self.path)
+        self.assertIsNone(pj.next_task())
+        self.assertEqual(pj.total_tasks, 0)
+
+    def test_fixed_width_project(self):
+        self.write(b'ab  12\ncd  34\nef  5')
+        pj = FixedWidthTestProject('/script.js', AUTO_PROJECT_MODE,
+                                   self.path, record_size=7,
+                                   fields=[('name', 4), ('num', 2)])
+        self.assertEqual(pj.total_tasks, 2)
+        self.assertEqual(pj['1'], {'id' : '1', 'name' : 'cd', 'num' : '34'})
+        self.assertEqual(pj.next_task(), {'id' : '0', 'name' : 'ab',
+                                          'num' : '12'})
+        self.assertEqual(pj.next_task()['id'], '1')
+        self.assertIsNone(pj.next_task())
+        self.assertRaises(KeyError, pj.__getitem__, '2')
+        pj.close()
+
+        pj = FixedWidthTestProject('/script.js', AUTO_PROJECT_MODE,
+                                   self.path, record_size=7)
+        self.assertEqual(pj['0'], {'id' : '0', 'data' : 'ab  12'})
+        pj.close()
+        self.assertRaises(ValueError, FixedWidthTestProject, '/script.js',
+                          AUTO_PROJECT_MODE, self.path, record_size=2,
+                          fields=[('name', 4)])
+
+
+kaylee_suite = load_tests([ProjectTests, ProgressTests, FileProjectTests, ])
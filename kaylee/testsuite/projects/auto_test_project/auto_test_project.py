@@ -34,8 +34,6 @@ class AutoTestProject(Project):
         except (KeyError, ValueError):
             raise InvalidResultError(result, 'The result is wrong.')
 
-    #pylint: disable-msg=W0613
-    #W0613: Unused argument 'result'
-    def result_stored(self, task_id, result, storage):
-        if len(storage) == self.TASKS_COUNT:
-            self.completed = True
+    @property
+    def total_tasks(self):
+        return self.tasks_count
@@ -1,12 +1,53 @@
+import os
+import time
+import shutil
+import struct
+import tempfile
+import threading
 from copy import deepcopy
 from kaylee.testsuite import KayleeTest, load_tests
 from kaylee.node import Node, NodeID
 from kaylee import KayleeError
-from kaylee.session import (_encrypt, _decrypt, ClientSessionDataManager,
+from kaylee.session import (_encrypt, _decrypt, _legacy_encrypt,
+                            get_session_crypto, ClientSessionDataManager,
                             ServerSessionDataManager, PhonySessionDataManager,
                             SESSION_DATA_ATTRIBUTE, EncryptedSessionDataManager,
-                            SessionDataManager,)
+                            SessionDataManager, BinarySerializer,
+                            PickleSerializer, get_serializer, SessionCrypto,
+                            TieredSessionStore, FileSessionStore,
+                            SQLiteSessionStore)
 from kaylee.errors import SessionKeyNameError
+from kaylee.contrib.controllers import SimpleController
+from kaylee.testsuite import TestPermanentStorage
+from kaylee.testsuite.projects.auto_test_project import AutoTestProject
+
+
+class SchemaProject(AutoTestProject):
+    session_keys = ['#s1']
+
+
+class _SlowSessionStore(object):
+    """Delegates to a session store with an I/O latency."""
+    def __init__(self, store):
+        self._store = store
+
+    def put(self, *args):
+        time.sleep(0.0005)
+        self._store.put(*args)
+
+    def pop(self, *args):
+        time.sleep(0.0005)
+        return self._store.pop(*args)
+
+    def discard(self, node_id):
+        self._store.discard(node_id)
+
+    def clean(self, timeout):
+        return self._store.clean(timeout)
+
+    def __len__(self):
+        return len(self._store)
+
 
 class KayleeSessionTests(KayleeTest):
     def test_encrypt_decrypt(self):
@@ -32,6 +73,23 @@ class KayleeSessionTests(KayleeTest):
         d4_d = _decrypt(s4, 'abc')
         self.assertEqual(d4, d4_d)
 
+        # tampered ciphertext and wrong key
+        s5 = s1[:-4] + ('AAAA' if s1[-4:] != 'AAAA' else 'BBBB')
+        self.assertRaises(KayleeError, _decrypt, s5, 'abc')
+        self.assertRaises(KayleeError, _decrypt, s1, 'abd')
+        self.assertNotEqual(_encrypt(d1, 'abc'), s1)
+
+    def test_legacy_decrypt(self):
+        d1 = {'#f1' : 'val1', '#f2' : [1, 2, 3]}
+        s1 = _legacy_encrypt(d1, 'abc')
+        self.assertEqual(_decrypt(s1, 'abc'), d1)
+        self.assertRaises(KayleeError, _decrypt, s1[3:], 'abc')
+        self.assertRaises(KayleeError, _decrypt, s1, 'abd')
+
+    def test_session_crypto_cache(self):
+        self.assertIs(get_session_crypto('abc'), get_session_crypto('abc'))
+        self.assertIsNot(get_session_crypto('abc'), get_session_crypto('abd'))
+
     def test_session_errors(self):
         # test for unicode characters in encrypted data
         derr = [
@@ -41,6 +99,36 @@ class KayleeSessionTests(KayleeTest):
         for d in derr:
             self.assertRaises(SessionKeyNameError, SessionDataManager.get_session_data, d)
 
+    def test_pop_session_data(self):
+        task = {'id' : 'i1', '#s1' : 10, '#s2' : [1, 2], 'data' : 'abc'}
+        t1 = dict(task)
+        self.assertEqual(SessionDataManager.pop_session_data(t1),
+                         {'#s1' : 10, '#s2' : [1, 2]})
+        self.assertEqual(t1, {'id' : 'i1', 'data' : 'abc'})
+
+        # with a schema only the declared keys are looked up
+        t2 = dict(task)
+        self.assertEqual(SessionDataManager.pop_session_data(t2, ('#s1', '#s3')),
+                         {'#s1' : 10})
+        self.assertEqual(t2, {'id' : 'i1', 'data' : 'abc', '#s2' : [1, 2]})
+
+        self.assertRaises(SessionKeyNameError,
+                          SessionDataManager.pop_session_data,
+                          {'id' : 'i1', '#s-1' : 1})
+
+        # the manager uses the schema of the node's controller
+        node = Node(NodeID())
+        node.subscribe(SimpleController('app', SchemaProject(),
+                                        TestPermanentStorage()))
+        node.task_id = 'i1'
+        ssdm = ServerSessionDataManager()
+        t3 = dict(task)
+        ssdm.store(node, t3)
+        self.assertEqual(t3, {'id' : 'i1', 'data' : 'abc', '#s2' : [1, 2]})
+        result = {}
+        ssdm.restore(node, result)
+        self.assertEqual(result, {'#s1' : 10})
+
     def test_node_session_data_manager(self):
         node = Node(NodeID.for_host('127.0.0.1'))
         task = {
@@ -50,9 +138,10 @@ class KayleeSessionTests(KayleeTest):
         }
 
         nsdm = ServerSessionDataManager()
-        self.assertIsNone(node.session_data)
+        node.task_id = 'i1'
         nsdm.store(node, task)
-        self.assertIsNotNone(node.session_data)
+        self.assertEqual(len(nsdm.store_backend), 1)
+        self.assertNotIn('#s1', task)
 
         result = {
             'res' : 'someres',
@@ -65,8 +154,7 @@ class KayleeSessionTests(KayleeTest):
 
         }
         self.assertEqual(result, expected_restored_result)
-        self.assertIsNone(node.session_data)
-
+        self.assertEqual(len(nsdm.store_backend), 0)
 
         # test that session is not store in case of no session variables
         task = {
@@ -74,12 +162,163 @@ class KayleeSessionTests(KayleeTest):
         }
 
         orig_task = deepcopy(task)
+        node.task_id = 'i2'
         nsdm.store(node, task)
-        self.assertIsNone(node.session_data)
+        self.assertEqual(len(nsdm.store_backend), 0)
 
         nsdm.restore(node, task)
         self.assertEqual(task, orig_task)
 
+        # the data of a stale task is not restored
+        nsdm.store(node, {'id' : 'i3', '#s1' : 1})
+        result = {}
+        nsdm.restore(node, result)
+        self.assertEqual(result, {})
+
+        # discard
+        node.task_id = 'i4'
+        nsdm.store(node, {'id' : 'i4', '#s1' : 1})
+        nsdm.discard(node)
+        self.assertEqual(len(nsdm.store_backend), 0)
+
+    def test_expired_node_session_data(self):
+        from kaylee import Kaylee
+        from kaylee.contrib import MemoryNodesRegistry
+        registry = MemoryNodesRegistry('10s')
+        sdm = ServerSessionDataManager()
+        kl = Kaylee(registry, sdm)
+        fresh = Node(NodeID.for_host('127.0.0.1'))
+        obsolete = Node(NodeID(struct.pack('>i', int(time.time()) - 20)
+                               + b'\x00' * 6))
+        for node in (fresh, obsolete):
+            registry.add(node)
+            sdm.store(node, {'id' : 'i1', '#s1' : 1})
+        # the session data expires together with the node
+        kl.clean()
+        self.assertEqual(len(sdm.store_backend), 1)
+        fresh.task_id = 'i1'
+        result = {}
+        sdm.restore(fresh, result)
+        self.assertEqual(result, {'#s1' : 1})
+
+    def test_session_stores(self):
+        tmp_dir = tempfile.mkdtemp(prefix='kl_sessions_')
+        try:
+            stores = [
+                FileSessionStore(os.path.join(tmp_dir, 'files')),
+                SQLiteSessionStore(os.path.join(tmp_dir, 'sessions.db')),
+            ]
+            for durable in stores + [None]:
+                self._test_session_store(durable)
+            for durable in stores:
+                self._test_session_store(durable, capacity=None)
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def _test_session_store(self, durable, capacity=2):
+        if capacity is None:
+            store = durable
+        else:
+            store = TieredSessionStore(capacity, durable)
+        nids = [NodeID() for _ in range(4)]
+        for i, nid in enumerate(nids):
+            store.put(nid, 't{}'.format(i), 'd{}'.format(i).encode())
+
+        expected = 4 if durable is not None else capacity
+        self.assertEqual(len(store), expected)
+        if durable is None:
+            # evicted entries are lost
+            self.assertIsNone(store.pop(nids[0], 't0'))
+        else:
+            self.assertEqual(store.pop(nids[0], 't0'), b'd0')
+        self.assertIsNone(store.pop(nids[0], 't0'))
+        # wrong task id
+        self.assertIsNone(store.pop(nids[3], 't0'))
+        self.assertIsNone(store.pop(nids[3], 't3'))
+        # replacing an entry
+        store.put(nids[2], 't5', b'd5')
+        self.assertEqual(store.pop(nids[2], 't5'), b'd5')
+        store.discard(nids[1])
+        self.assertIsNone(store.pop(nids[1], 't1'))
+        self.assertEqual(len(store), 0)
+
+        store.put(nids[0], 't0', b'd0', time.time() - 100)
+        store.put(nids[1], 't1', b'd1')
+        self.assertEqual(store.clean(50), [nids[0]])
+        self.assertEqual(len(store), 1)
+        store.discard(nids[1])
+
+    def test_tiered_session_store_threads(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            durable = _SlowSessionStore(
+                SQLiteSessionStore(os.path.join(tmp_dir, 'sd.db')))
+            # the entries are constantly spilled by the other threads
+            store = TieredSessionStore(2, durable)
+            errors = []
+
+            def work(thread):
+                for _ in range(10):
+                    nids = [NodeID() for _ in range(4)]
+                    for i, nid in enumerate(nids):
+                        store.put(nid, 't{}'.format(i), b'd')
+                        store.put(nid, 't{}'.format(i), b'd2')
+                    for i, nid in enumerate(nids):
+                        if store.pop(nid, 't{}'.format(i)) != b'd2':
+                            errors.append((thread, i))
+
+            threads = [threading.Thread(target=work, args=(i, ))
+                       for i in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            # no entry is lost or spilled twice
+            self.assertEqual(errors, [])
+            self.assertEqual(len(store), 0)
+            self.assertEqual(len(durable), 0)
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_tiered_session_store_io(self):
+        # the nodes whose entries are guarded by different locks
+        nids, stripes = [], set()
+        while len(nids) < 3:
+            nid = NodeID()
+            stripe = hash(nid) % TieredSessionStore.LOCK_STRIPES
+            if stripe not in stripes:
+                stripes.add(stripe)
+                nids.append(nid)
+        started, release = threading.Event(), threading.Event()
+
+        class _BlockingSessionStore(_SlowSessionStore):
+            def put(self, node_id, *args):
+                if node_id == nids[0]:
+                    started.set()
+                    release.wait(5)
+                self._store.put(node_id, *args)
+
+        durable = _BlockingSessionStore(TieredSessionStore(10))
+        store = TieredSessionStore(1, durable)
+        store.put(nids[0], 't0', b'd0')
+        # the entry of nids[0] is spilled by a blocked write
+        thread = threading.Thread(target=store.put,
+                                  args=(nids[1], 't1', b'd1'))
+        thread.start()
+        try:
+            self.assertTrue(started.wait(5))
+            start = time.monotonic()
+            store.put(nids[2], 't2', b'd2')
+            self.assertEqual(store.pop(nids[2], 't2'), b'd2')
+            self.assertEqual(store.pop(nids[1], 't1'), b'd1')
+            self.assertLess(time.monotonic() - start, 1)
+            self.assertTrue(thread.is_alive())
+        finally:
+            release.set()
+            thread.join()
+        self.assertEqual(store.pop(nids[0], 't0'), b'd0')
+        self.assertEqual(len(store), 0)
+        self.assertEqual(len(durable), 0)
 
     def test_json_session_data_manager(self):
         node = Node(NodeID.for_host('127.0.0.1'))
@@ -145,4 +384,65 @@ class KayleeSessionTests(KayleeTest):
     def test_is_abstract(self):
         self.assertRaises(TypeError, SessionDataManager)
 
+    def test_binary_serializer(self):
+        bs = BinarySerializer(compression_threshold=None)
+        values = [
+            None, True, False, 0, 1, -1, 2 ** 70, -2 ** 70, 0.5, '', 'abc',
+            'юникод', b'\x00\xff', [], [1, 'a', None], (1, (2, )),
+            {'a' : 1, 2 : [3], (4, 5) : {6}}, {1, 2, 3}, frozenset(['x']),
+            [0.5] * 100, list(range(-50, 50)), [2 ** 64] * 10,
+            {'#s1' : [1.5, 2] * 10},
+        ]
+        for val in values:
+            restored = bs.loads(bs.dumps(val))
+            self.assertEqual(restored, val)
+            self.assertIs(type(restored), type(val))
+
+        self.assertRaises(KayleeError, bs.dumps, object())
+        self.assertRaises(KayleeError, bs.dumps, {'#a' : object()})
+        data = bs.dumps({'#s1' : 'abc'})
+        self.assertRaises(ValueError, bs.loads, data[:-1])
+        self.assertRaises(ValueError, bs.loads, data + b'\x00')
+        self.assertRaises(ValueError, bs.loads, b'\x05' + data[1:])
+        self.assertRaises(ValueError, bs.loads, b'')
+
+        # compression
+        large = {'#arr' : [0.0] * 10000}
+        cbs = BinarySerializer(compression_threshold=1024)
+        self.assertLess(len(cbs.dumps(large)), len(bs.dumps(large)) // 10)
+        self.assertEqual(cbs.loads(cbs.dumps(large)), large)
+        small = {'#s1' : 1}
+        self.assertEqual(cbs.dumps(small), bs.dumps(small))
+
+    def test_serializer_config(self):
+        self.assertIsInstance(get_serializer('binary'), BinarySerializer)
+        self.assertIsInstance(get_serializer('pickle'), PickleSerializer)
+        self.assertIsNone(get_serializer('binary', None).compression_threshold)
+        pser = PickleSerializer()
+        self.assertIs(get_serializer(pser), pser)
+        self.assertRaises(KayleeError, get_serializer, 'abc')
+
+        self.assertIsInstance(ServerSessionDataManager().serializer,
+                              BinarySerializer)
+        for ser in ['pickle', 'binary']:
+            node = Node(NodeID.for_host('127.0.0.1'))
+            node.task_id = 'i1'
+            ssdm = ServerSessionDataManager(serializer=ser)
+            ssdm.store(node, {'id' : 'i1', '#s1' : {1, 2}})
+            result = {}
+            ssdm.restore(node, result)
+            self.assertEqual(result, {'#s1' : {1, 2}})
+
+            csdm = ClientSessionDataManager('abc', serializer=ser)
+            task = {'id' : 'i1', '#s1' : {1, 2}}
+            csdm.store(node, task)
+            result = {SESSION_DATA_ATTRIBUTE : task[SESSION_DATA_ATTRIBUTE]}
+            csdm.restore(node, result)
+            self.assertEqual(result, {'#s1' : {1, 2}})
+
+    def test_pickled_token_compatibility(self):
+        # tokens issued with pickled data are still accepted
+        token = SessionCrypto('abc', PickleSerializer()).encrypt({'#s1' : 1})
+        self.assertEqual(_decrypt(token, 'abc'), {'#s1' : 1})
+
 kaylee_suite = load_tests([KayleeSessionTests, ])
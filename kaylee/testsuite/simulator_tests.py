@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+from kaylee.testsuite import KayleeTest, load_tests
+from kaylee.simulator import Simulator, corrupt_result
+from kaylee.contrib import (SimpleController, ResultsComparatorController,
+                            MemoryPermanentStorage, MemoryTemporalStorage)
+from kaylee.testsuite.projects.auto_test_project import AutoTestProject
+
+
+def _solver(task):
+    return {'res' : int(task['id']) * 2}
+
+
+def _simple_app(tasks_count=200):
+    return SimpleController('app', AutoTestProject(tasks_count=tasks_count),
+                            MemoryPermanentStorage())
+
+
+def _comparator_app(tasks_count=200):
+    return ResultsComparatorController(
+        'app', AutoTestProject(tasks_count=tasks_count),
+        MemoryPermanentStorage(), MemoryTemporalStorage(),
+        results_count_threshold=2)
+
+
+class SimulatorTests(KayleeTest):
+    def test_simple_run(self):
+        report = Simulator(_simple_app(), _solver, nodes=10,
+                           speed_sigma=0, trace_memory=False).run()
+        self.assertEqual(report.tasks_completed, 200)
+        # the depleted project's pending tasks are re-dispatched
+        # to the idle nodes
+        self.assertEqual(report.dispatches - report.redundant_dispatches,
+                         200)
+        self.assertEqual(report.results_accepted, 200)
+        self.assertEqual(report.wrong_results, 0)
+        # 10 nodes of speed 1 compute 200 tasks of cost 1
+        self.assertAlmostEqual(report.makespan, 20.0)
+        self.assertAlmostEqual(report.total_compute, 200.0)
+        self.assertAlmostEqual(report.wasted_compute, 0.0)
+        self.assertIsNone(report.peak_memory)
+
+        report = Simulator(_simple_app(), _solver, nodes=10, speed_sigma=0,
+                           task_cost=lambda task: 2.0, latency=0.5,
+                           trace_memory=False).run()
+        self.assertAlmostEqual(report.makespan, 50.0)
+
+    def test_determinism(self):
+        def _run():
+            return Simulator(_comparator_app(), _solver, nodes=20,
+                             arrival_rate=0.5, mean_lifetime=30,
+                             fault_rate=0.1, seed=42,
+                             trace_memory=False).run().as_dict()
+        self.assertEqual(_run(), _run())
+
+    def test_churn(self):
+        report = Simulator(_simple_app(), _solver, nodes=20,
+                           arrival_rate=1.0, mean_lifetime=5,
+                           seed=1).run()
+        self.assertIsNotNone(report.makespan)
+        self.assertGreater(report.nodes_departed, 0)
+        self.assertGreater(report.lost_compute, 0)
+        self.assertGreater(report.redundant_dispatches, 0)
+        self.assertGreaterEqual(report.wasted_compute, report.lost_compute)
+        self.assertGreater(report.peak_memory, 0)
+        self.assertLessEqual(report.peak_nodes, report.nodes_arrived)
+
+    def test_faulty_results(self):
+        simple = Simulator(_simple_app(), _solver, nodes=10,
+                           fault_rate=0.2, seed=3, trace_memory=False).run()
+        self.assertGreater(simple.faulty_results, 0)
+        # the simple controller stores the faulty results, except the
+        # duplicate results of the already completed tasks
+        self.assertGreater(simple.wrong_results, 0)
+        self.assertLessEqual(simple.wrong_results, simple.faulty_results)
+        self.assertEqual(simple.tasks_completed, 200)
+
+        # the comparator unsubscribes the nodes which request the tasks
+        # they have already computed, thus new nodes have to arrive
+        comparator = Simulator(_comparator_app(), _solver, nodes=10,
+                               arrival_rate=0.5, fault_rate=0.2, seed=3,
+                               trace_memory=False).run()
+        self.assertEqual(comparator.tasks_completed, 200)
+        self.assertEqual(comparator.wrong_results, 0)
+        self.assertGreater(comparator.redundant_dispatches, 200)
+        self.assertGreater(comparator.wasted_compute, 0)
+
+    def test_max_time(self):
+        report = Simulator(_simple_app(), _solver, nodes=1,
+                           speed_sigma=0, trace_memory=False).run(
+                               max_time=10.5)
+        self.assertIsNone(report.makespan)
+        self.assertEqual(report.duration, 10.5)
+        self.assertEqual(report.tasks_completed, 10)
+
+    def test_corrupt_result(self):
+        import random
+        rnd = random.Random(0)
+        res = {'a' : 1, 'b' : [0.5, True], 'c' : 'text'}
+        corrupted = corrupt_result(res, rnd)
+        self.assertNotEqual(corrupted['a'], 1)
+        self.assertNotEqual(corrupted['b'][0], 0.5)
+        self.assertEqual(corrupted['b'][1], False)
+        self.assertEqual(corrupted['c'], 'text')
+
+
+kaylee_suite = load_tests([SimulatorTests, ])
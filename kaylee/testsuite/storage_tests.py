@@ -432,6 +432,30 @@ class PermanentStorageTestsBase(SubclassTestsBase):
             ps.add('t0', res)
             self.assertTrue(ps.contains('t0', res))
 
+    def test_iter_chunks(self):
+        ps = self.cls_instance()
+        self.assertEqual(list(ps.iter_chunks(10)), [])
+
+        self._fill_storage(ps, self.MANY)
+        ps.add('t0', 'r00')
+        chunks = list(ps.iter_chunks(self.SOME))
+        self.assertEqual(len(chunks), math.ceil(self.MANY / self.SOME))
+        self.assertTrue(all(len(chunk) <= self.SOME for chunk in chunks))
+        items = [item for chunk in chunks for item in chunk]
+        self.assertEqual([tid for tid, _ in items], list(ps.keys()))
+        self.assertEqual(dict(items)['t0'], ['r0', 'r00'])
+
+        # resume from a cursor
+        cursor = items[self.SOME + 1][0]
+        resumed = [item for chunk in ps.iter_chunks(self.SOME, after=cursor)
+                   for item in chunk]
+        self.assertEqual(resumed, items[self.SOME + 2:])
+        last = items[-1][0]
+        self.assertEqual(list(ps.iter_chunks(self.SOME, after=last)), [])
+
+        self.assertRaises(KeyError, list, ps.iter_chunks(10, after='xx'))
+        self.assertRaises(ValueError, list, ps.iter_chunks(0))
+
     @staticmethod
     def _fill_storage(ps, count, tgen_func=_tgen, rgen_func=_rgen):
         for i in range(0, count):
@@ -446,6 +470,20 @@ class MemoryPermanentStorageTests(PermanentStorageTestsBase):
         return MemoryPermanentStorage()
 
 
+class _ListKeysPermanentStorage(MemoryPermanentStorage):
+    # a back-end whose keys() returns a list and which relies on the
+    # default iter_chunks() implementation
+    iter_chunks = PermanentStorage.iter_chunks
+
+    def keys(self):
+        return list(self._d)
+
+
+class ListKeysPermanentStorageTests(PermanentStorageTestsBase):
+    def cls_instance(self):
+        return _ListKeysPermanentStorage()
+
+
 class MemoryTemporalStorageTests(TemporalStorageTestsBase):
     def test_is_abstract(self):
         self.assertRaises(TypeError, TemporalStorage)
@@ -456,5 +494,6 @@ class MemoryTemporalStorageTests(TemporalStorageTestsBase):
 
 kaylee_suite = load_tests([
    MemoryTemporalStorageTests,
-   MemoryPermanentStorageTests
+   MemoryPermanentStorageTests,
+   ListKeysPermanentStorageTests,
 ])
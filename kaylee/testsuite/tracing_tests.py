@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+import os
+import json
+import time
+import shutil
+import tempfile
+
+from kaylee.testsuite import KayleeTest, load_tests
+from kaylee import Kaylee, loader, tracing
+from kaylee.tracing import Tracer, FileExporter, SlowRequestLog
+from kaylee.errors import SettingsError
+from kaylee.loader import SettingsValidator
+from kaylee.session import ClientSessionDataManager, SESSION_DATA_ATTRIBUTE
+from kaylee.contrib import (SimpleController, MemoryNodesRegistry,
+                            MemoryPermanentStorage)
+from kaylee.testsuite.projects.auto_test_project import AutoTestProject
+from kaylee.util import generate_sercret_key
+
+
+class _ListExporter(object):
+    def __init__(self):
+        self.traces = []
+        self.closed = False
+
+    def export(self, events):
+        self.traces.append(events)
+
+    def close(self):
+        self.closed = True
+
+
+class _SessionProject(AutoTestProject):
+    def __getitem__(self, task_id):
+        return {'id' : str(task_id), '#s1' : 'sd'}
+
+
+class TracingTests(KayleeTest):
+    def setUp(self):
+        self.exporter = _ListExporter()
+        self.previous = tracing.install(Tracer(exporter=self.exporter))
+
+    def tearDown(self):
+        tracing.install(self.previous)
+
+    def test_disabled(self):
+        tracing.install(None)
+        with tracing.trace('request') as span:
+            with tracing.span('phase'):
+                pass
+        span.annotate('key', 'value')
+        self.assertIs(span, tracing.trace('other'))
+        self.assertIsNone(tracing.stats())
+
+    def test_spans(self):
+        # no active request span
+        with tracing.span('orphan'):
+            pass
+        self.assertEqual(self.exporter.traces, [])
+
+        with tracing.trace('request', {'node' : 'n1'}):
+            with tracing.span('phase1'):
+                with tracing.span('phase2') as span:
+                    span.annotate('size', 10)
+            with tracing.span('phase1'):
+                pass
+        with tracing.trace('request'):
+            pass
+
+        self.assertEqual(len(self.exporter.traces), 2)
+        events = self.exporter.traces[0]
+        self.assertEqual([e['name'] for e in events],
+                         ['request', 'phase1', 'phase2', 'phase1'])
+        root = events[0]
+        self.assertEqual(root['args'], {'node' : 'n1'})
+        self.assertEqual(events[2]['args'], {'size' : 10})
+        for event in events:
+            self.assertEqual(event['ph'], 'X')
+            self.assertGreaterEqual(event['ts'], root['ts'])
+            self.assertLessEqual(event['ts'] + event['dur'],
+                                 root['ts'] + root['dur'] + 0.01)
+
+        stats = tracing.stats()
+        self.assertEqual(stats['request']['count'], 2)
+        self.assertEqual(stats['phase1']['count'], 2)
+        self.assertEqual(stats['phase2']['count'], 1)
+        self.assertLessEqual(stats['phase2']['max'], stats['request']['max'])
+        self.assertAlmostEqual(stats['phase1']['mean'],
+                               stats['phase1']['total'] / 2)
+        tracing.get_tracer().reset()
+        self.assertEqual(tracing.stats(), {})
+
+    def test_errors(self):
+        try:
+            with tracing.trace('request'):
+                with tracing.span('phase'):
+                    raise ValueError()
+        except ValueError:
+            pass
+        events = self.exporter.traces[0]
+        self.assertEqual(events[0]['args'], {'error' : 'ValueError'})
+        self.assertEqual(events[1]['args'], {'error' : 'ValueError'})
+        # the active span is restored
+        with tracing.span('phase'):
+            pass
+        self.assertEqual(len(self.exporter.traces), 1)
+
+    def test_sampling(self):
+        tracing.install(Tracer(sample_rate=0.0, exporter=self.exporter))
+        for _ in range(10):
+            with tracing.trace('request'):
+                with tracing.span('phase'):
+                    pass
+        self.assertEqual(self.exporter.traces, [])
+
+        tracer = Tracer(sample_rate=0.5)
+        tracing.install(tracer)
+        for _ in range(1000):
+            with tracing.trace('request'):
+                pass
+        self.assertTrue(300 < tracer.stats()['request']['count'] < 700)
+        self.assertRaises(ValueError, Tracer, 1.5)
+
+    def test_file_exporter(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmpdir, 'trace.json')
+            for _ in range(2):
+                tracer = Tracer(exporter=FileExporter(path))
+                tracing.install(tracer)
+                with tracing.trace('request'):
+                    with tracing.span('phase'):
+                        pass
+                tracer.close()
+            with open(path) as f:
+                data = f.read()
+            # the closing bracket is optional in the Trace Event Format
+            events = json.loads(data.rstrip().rstrip(',') + ']')
+            self.assertEqual([e['name'] for e in events],
+                             ['request', 'phase', 'request', 'phase'])
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_kaylee_phases(self):
+        secret_key = generate_sercret_key()
+        app = SimpleController('app', _SessionProject(),
+                               MemoryPermanentStorage())
+        sdm = ClientSessionDataManager(secret_key)
+        kl = Kaylee(MemoryNodesRegistry('10m'), sdm, [app],
+                    AUTO_GET_ACTION=True)
+        node_id = json.loads(kl.register('127.0.0.1'))['node_id']
+        kl.subscribe(node_id, 'app')
+        task = json.loads(kl.get_action(node_id))['data']
+        result = {'res' : 1,
+                  SESSION_DATA_ATTRIBUTE : task[SESSION_DATA_ATTRIBUTE]}
+        kl.accept_result(node_id, json.dumps(result))
+
+        traces = {events[0]['name'] : [e['name'] for e in events]
+                  for events in self.exporter.traces}
+        self.assertEqual(traces['register'], ['register', 'registry.add'])
+        self.assertIn('session.encrypt', traces['get_action'])
+        names = traces['accept_result']
+        for phase in ('parse_result', 'restore_session_data',
+                      'session.decrypt', 'controller.accept_result',
+                      'normalize_result', 'storage.permanent.add',
+                      'result_stored', 'get_action'):
+            self.assertIn(phase, names)
+        # the phases are nested into the request
+        self.assertLess(names.index('restore_session_data'),
+                        names.index('session.decrypt'))
+
+        kl.get_action('invalid')
+        events = self.exporter.traces[-1]
+        self.assertEqual(events[0]['name'], 'get_action')
+        self.assertEqual(events[0]['args'], {'error' : 'InvalidNodeIDError'})
+
+    def test_slow_requests(self):
+        slow_log = SlowRequestLog(0.01, capacity=2)
+        tracer = Tracer(sample_rate=0.0, slow_requests=slow_log)
+        tracing.install(tracer)
+        for i in range(3):
+            with tracing.trace('request', {'index' : i}):
+                tracing.annotate('node_id', 'n1')
+                with tracing.span('phase1'):
+                    with tracing.span('phase2'):
+                        time.sleep(0.02)
+        with tracing.trace('fast'):
+            pass
+        # the slow requests are captured regardless of the sampling
+        self.assertEqual(tracer.stats(), {})
+        records = tracing.slow_requests()
+        self.assertEqual(len(records), 2)
+        self.assertEqual([rec['index'] for rec in records], [1, 2])
+        record = records[0]
+        self.assertEqual(record['endpoint'], 'request')
+        self.assertEqual(record['node_id'], 'n1')
+        self.assertGreaterEqual(record['duration'], 0.02)
+        self.assertEqual([(ph['name'], ph['depth'])
+                          for ph in record['phases']],
+                         [('phase1', 1), ('phase2', 2)])
+        phase2 = record['phases'][1]
+        self.assertGreaterEqual(phase2['offset'], 0)
+        self.assertLessEqual(phase2['offset'] + phase2['duration'],
+                             record['duration'])
+        slow_log.clear()
+        self.assertEqual(len(slow_log), 0)
+
+        tracing.install(Tracer())
+        self.assertIsNone(tracing.slow_requests())
+
+    def test_kaylee_slow_requests(self):
+        kl = loader.load({
+            'AUTO_GET_ACTION' : True,
+            'REGISTRY' : {'name' : 'MemoryNodesRegistry',
+                          'config' : {'timeout' : '2s'}},
+            'SLOW_REQUESTS' : {'threshold' : 0, 'capacity' : 10},
+        })
+        tracer = tracing.get_tracer()
+        self.assertEqual(tracer.sample_rate, 0.0)
+        app = SimpleController('app', AutoTestProject(),
+                               MemoryPermanentStorage())
+        kl.add_application(app)
+        node_id = json.loads(kl.register('127.0.0.1'))['node_id']
+        kl.subscribe(node_id, 'app')
+        kl.get_action(node_id)
+        result = json.dumps({'id' : '1', 'res' : 1})
+        response = kl.accept_result(node_id, result)
+
+        records = tracing.slow_requests()
+        self.assertEqual([rec['endpoint'] for rec in records],
+                         ['register', 'subscribe', 'get_action',
+                          'accept_result'])
+        record = records[-1]
+        self.assertEqual(record['node_id'], node_id)
+        self.assertEqual(record['app'], 'app')
+        self.assertEqual(record['request_size'], len(result))
+        self.assertEqual(record['response_size'], len(response))
+        self.assertIn('normalize_result',
+                      [ph['name'] for ph in record['phases']])
+
+    def test_settings(self):
+        sv = SettingsValidator
+        sv.validate_TRACING({})
+        sv.validate_TRACING({'TRACING' : {'sample_rate' : 0.1,
+                                          'path' : 'trace.json'}})
+        for val in ([], {'rate' : 1}, {'sample_rate' : 2},
+                    {'sample_rate' : True}, {'path' : 1}):
+            self.assertRaises(SettingsError, sv.validate_TRACING,
+                              {'TRACING' : val})
+        sv.validate_SLOW_REQUESTS({'SLOW_REQUESTS' : {'threshold' : 0.5}})
+        for val in (0.5, {}, {'threshold' : '1s'}, {'threshold' : -1},
+                    {'threshold' : 1, 'capacity' : 0},
+                    {'threshold' : 1, 'size' : 10}):
+            self.assertRaises(SettingsError, sv.validate_SLOW_REQUESTS,
+                              {'SLOW_REQUESTS' : val})
+
+        kl = loader.load({
+            'AUTO_GET_ACTION' : True,
+            'REGISTRY' : {'name' : 'MemoryNodesRegistry',
+                          'config' : {'timeout' : '2s'}},
+            'TRACING' : {'sample_rate' : 0.5},
+        })
+        self.assertIsInstance(kl, Kaylee)
+        tracer = tracing.get_tracer()
+        self.assertEqual(tracer.sample_rate, 0.5)
+        self.assertIsNone(tracer.exporter)
+        # the replaced tracer is closed
+        self.assertTrue(self.exporter.closed)
+
+
+kaylee_suite = load_tests([TracingTests, ])
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+import io
+import json
+import zlib
+
+from kaylee.testsuite import KayleeTest, load_tests
+from kaylee import Kaylee
+from kaylee.contrib import (SimpleController, MemoryNodesRegistry,
+                            MemoryPermanentStorage)
+from kaylee.contrib.frontends.wsgi_frontend import make_wsgi_app
+from kaylee.testsuite.projects.auto_test_project import AutoTestProject
+
+
+class WSGIFrontendTests(KayleeTest):
+    def setUp(self):
+        self.app = SimpleController('app', AutoTestProject(),
+                                    MemoryPermanentStorage())
+        self.kl = Kaylee(MemoryNodesRegistry('10m'), None, [self.app],
+                         AUTO_GET_ACTION=True)
+        self.wsgi_app = make_wsgi_app(self.kl)
+
+    def request(self, method, path, body=b'', **extra):
+        environ = {
+            'REQUEST_METHOD' : method,
+            'PATH_INFO' : path,
+            'REMOTE_ADDR' : '127.0.0.1',
+            'CONTENT_LENGTH' : str(len(body)),
+            'wsgi.input' : io.BytesIO(body),
+        }
+        environ.update(extra)
+        response = {}
+        def start_response(status, headers):
+            response['status'] = status
+            response['headers'] = dict(headers)
+        response['body'] = b''.join(self.wsgi_app(environ, start_response))
+        return response
+
+    def test_actions(self):
+        res = self.request('GET', '/kaylee/register')
+        self.assertEqual(res['status'], '200 OK')
+        self.assertEqual(res['headers']['Content-Type'], 'application/json')
+        self.assertEqual(res['headers']['Content-Length'],
+                         str(len(res['body'])))
+        node_id = json.loads(res['body'].decode())['node_id']
+
+        res = self.request('POST', '/kaylee/apps/app/subscribe/' + node_id)
+        self.assertEqual(json.loads(res['body'].decode())['test_key'],
+                         'test_value')
+
+        res = self.request('GET', '/kaylee/actions/' + node_id)
+        action = json.loads(res['body'].decode())
+        self.assertEqual(action, {'action' : 'task', 'data' : {'id' : '1'}})
+
+        body = json.dumps({'id' : '1', 'res' : 10}).encode()
+        res = self.request('POST', '/kaylee/actions/' + node_id, body)
+        action = json.loads(res['body'].decode())
+        self.assertEqual(action['data']['id'], '2')
+        self.assertEqual(self.app.permanent_storage['1'], [10])
+
+    def test_errors(self):
+        res = self.request('GET', '/kaylee/unknown')
+        self.assertEqual(res['status'], '404 Not Found')
+        res = self.request('GET', '/other/register')
+        self.assertEqual(res['status'], '404 Not Found')
+        res = self.request('POST', '/kaylee/register')
+        self.assertEqual(res['status'], '405 Method Not Allowed')
+        self.assertEqual(res['headers']['Allow'], 'GET')
+        res = self.request('GET', '/kaylee/apps/app/subscribe/' + '0' * 20)
+        self.assertEqual(res['status'], '405 Method Not Allowed')
+        # Kaylee errors are reported in JSON
+        res = self.request('GET', '/kaylee/actions/' + '0' * 20)
+        self.assertIn('error', json.loads(res['body'].decode()))
+
+    def test_blobs(self):
+        key = self.app.project.add_blob(b'blob data')
+        res = self.request('GET', '/kaylee/blobs/' + key)
+        self.assertEqual(res['status'], '200 OK')
+        self.assertEqual(res['body'], b'blob data')
+        etag = res['headers']['ETag']
+        res = self.request('GET', '/kaylee/blobs/' + key,
+                           HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res['status'], '304 Not Modified')
+        self.assertEqual(res['body'], b'')
+        res = self.request('GET', '/kaylee/blobs/' + '0' * 64)
+        self.assertEqual(res['status'], '404 Not Found')
+
+    def test_compression(self):
+        self.kl.config.COMPRESSION_MIN_SIZE = 0
+        res = self.request('GET', '/kaylee/register',
+                           HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(res['headers']['Content-Encoding'], 'gzip')
+        self.assertEqual(res['headers']['Vary'], 'Accept-Encoding')
+        self.assertEqual(res['headers']['Content-Length'],
+                         str(len(res['body'])))
+        node_id = json.loads(zlib.decompress(res['body'], 31))['node_id']
+        self.request('POST', '/kaylee/apps/app/subscribe/' + node_id)
+
+        res = self.request('GET', '/kaylee/actions/' + node_id)
+        self.assertNotIn('Content-Encoding', res['headers'])
+        self.assertEqual(json.loads(res['body'].decode())['data']['id'], '1')
+
+        body = zlib.compress(json.dumps({'id' : '1', 'res' : 10}).encode())
+        res = self.request('POST', '/kaylee/actions/' + node_id, body,
+                           HTTP_CONTENT_ENCODING='deflate',
+                           HTTP_ACCEPT_ENCODING='deflate')
+        self.assertEqual(res['headers']['Content-Encoding'], 'deflate')
+        action = json.loads(zlib.decompress(res['body']))
+        self.assertEqual(action['data']['id'], '2')
+        self.assertEqual(self.app.permanent_storage['1'], [10])
+
+    def test_fallback(self):
+        def fallback(environ, start_response):
+            start_response('200 OK', [])
+            return [b'fallback']
+        self.wsgi_app = make_wsgi_app(self.kl, '/kl/', fallback)
+        self.assertEqual(self.request('GET', '/index.html')['body'],
+                         b'fallback')
+        res = self.request('GET', '/kl/register')
+        self.assertIn('node_id', json.loads(res['body'].decode()))
+
+
+kaylee_suite = load_tests([WSGIFrontendTests])
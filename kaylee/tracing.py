@@ -0,0 +1,407 @@
+# -*- coding: utf-8 -*-
+"""
+    kaylee.tracing
+    ~~~~~~~~~~~~~~
+
+    This module implements the optional request tracing: every sampled
+    Kaylee API call (e.g. :meth:`Kaylee.accept_result
+    <kaylee.Kaylee.accept_result>`) is recorded as a tree of nested spans,
+    one per request processing phase (result parsing, session data
+    restoration, result normalization, storing etc.).
+
+    The finished traces are aggregated into per-phase timing statistics
+    (see :meth:`Tracer.stats`) and optionally written to a file in the
+    `Trace Event Format`_ which can be opened by ``chrome://tracing``
+    or `Perfetto`_.
+
+    The requests slower than a threshold are captured (together with
+    their phases' timings, the node and application and the payload
+    sizes) into a bounded :class:`SlowRequestLog`, regardless of the
+    sampling.
+
+    The tracing is disabled by default and costs a single global lookup
+    per instrumented phase then. A tracer is installed via
+    :func:`install` or by the :config:`TRACING` and
+    :config:`SLOW_REQUESTS` settings.
+
+    .. _Trace Event Format: https://docs.google.com/document/d/
+       1CvAClvFfyA5R-PhYUmn5OOQtYMH4h6I0nSsKchNAySU
+    .. _Perfetto: https://ui.perfetto.dev
+
+    :copyright: (c) 2013 by Zaur Nasibov.
+    :license: MIT, see LICENSE for more details.
+"""
+import os
+import json
+import time
+import random
+import logging
+import threading
+from time import perf_counter
+from threading import get_ident
+from collections import deque
+
+log = logging.getLogger(__name__)
+
+# the perf_counter() values are converted to the wall-clock time
+_EPOCH = time.time() - perf_counter()
+
+# the innermost active span of the current thread
+_local = threading.local()
+
+#: The installed tracer (``None`` if the tracing is disabled).
+_tracer = None
+
+
+class _NoopSpan(object):
+    """The span returned when nothing is traced."""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        return False
+
+    def annotate(self, key, value):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class Span(object):
+    """A timed phase of a traced request. The spans are context managers::
+
+        with tracing.span('normalize_result'):
+            ...
+    """
+    __slots__ = ('tracer', 'name', 'args', 'parent', 'root', 'finished',
+                 'sampled', 'start', 'end')
+
+    def __init__(self, tracer, name, args, parent, sampled=True):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+        self.parent = parent
+        self.root = parent.root if parent is not None else self
+        #: The finished spans of the trace (kept by the root span only).
+        self.finished = [] if parent is None else None
+        #: ``False`` if the trace is recorded for the slow requests
+        #: capture only.
+        self.sampled = sampled
+        self.start = self.end = None
+
+    @property
+    def duration(self):
+        return self.end - self.start
+
+    def annotate(self, key, value):
+        """Attaches a value to the span (exported as the event argument)."""
+        if self.args is None:
+            self.args = {}
+        self.args[key] = value
+
+    def __enter__(self):
+        _local.span = self
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.end = perf_counter()
+        _local.span = self.parent
+        if exc_type is not None:
+            self.annotate('error', exc_type.__name__)
+        root = self.root
+        root.finished.append(self)
+        if root is self:
+            self.tracer.finish(self.finished)
+        return False
+
+
+class Tracer(object):
+    """Samples the requests, aggregates the phases' timings and exports
+    the finished traces.
+
+    :param sample_rate: the fraction of the traced requests
+                        (``1.0`` traces every request).
+    :param exporter: an object with the ``export(events)`` and ``close()``
+                     methods which receives the list of the `Trace Event
+                     Format` events of every finished trace (e.g.
+                     :class:`FileExporter`) or ``None``.
+    :param slow_requests: the log of the slow requests. If defined, every
+                          request is traced, but only the sampled ones
+                          are aggregated and exported.
+    :type slow_requests: :class:`SlowRequestLog` or ``None``
+    """
+    def __init__(self, sample_rate=1.0, exporter=None, slow_requests=None):
+        if not 0.0 <= sample_rate <= 1.0:
+            raise ValueError('sample_rate is not in [0.0, 1.0] range')
+        self.sample_rate = sample_rate
+        self.exporter = exporter
+        self.slow_requests = slow_requests
+        self._random = random.Random()
+        self._lock = threading.Lock()
+        # span name -> [count, total time, max time]
+        self._stats = {}
+        self._pid = os.getpid()
+
+    def trace(self, name, args=None):
+        """Returns a span nested into the active span of the current
+        thread or a root span of a new (sampled) trace."""
+        parent = getattr(_local, 'span', None)
+        if parent is not None:
+            return Span(self, name, args, parent)
+        sampled = (self.sample_rate >= 1.0 or
+                   self._random.random() < self.sample_rate)
+        if not sampled and self.slow_requests is None:
+            return _NOOP_SPAN
+        return Span(self, name, args, None, sampled)
+
+    def span(self, name, args=None):
+        """Returns a span nested into the active span of the current
+        thread. Nothing is traced if there is no active span (i.e. the
+        request is not sampled)."""
+        parent = getattr(_local, 'span', None)
+        if parent is None:
+            return _NOOP_SPAN
+        return Span(self, name, args, parent)
+
+    def finish(self, spans):
+        """Aggregates and exports the finished spans of a trace (the root
+        span is the last one) and captures the slow request."""
+        root = spans[-1]
+        slow_requests = self.slow_requests
+        if (slow_requests is not None and
+                root.end - root.start >= slow_requests.threshold):
+            slow_requests.add(root, spans)
+        if not root.sampled:
+            return
+        with self._lock:
+            stats = self._stats
+            for span in spans:
+                duration = span.end - span.start
+                try:
+                    entry = stats[span.name]
+                except KeyError:
+                    entry = stats[span.name] = [0, 0.0, 0.0]
+                entry[0] += 1
+                entry[1] += duration
+                if duration > entry[2]:
+                    entry[2] = duration
+            if self.exporter is not None:
+                self.exporter.export(self._events(spans))
+
+    def stats(self):
+        """Returns the aggregated timings (in seconds) of the traced
+        phases, e.g.::
+
+          {
+              'accept_result' : {'count' : 10, 'total' : 0.0021,
+                                 'mean' : 0.00021, 'max' : 0.0008},
+              'normalize_result' : { ... },
+          }
+        """
+        with self._lock:
+            return {name : {'count' : count, 'total' : total,
+                            'mean' : total / count, 'max' : max_time}
+                    for name, (count, total, max_time) in self._stats.items()}
+
+    def reset(self):
+        """Resets the aggregated timings."""
+        with self._lock:
+            self._stats = {}
+
+    def close(self):
+        if self.exporter is not None:
+            with self._lock:
+                self.exporter.close()
+
+    def _events(self, spans):
+        tid = get_ident()
+        events = []
+        # the events are ordered by the start time, parents first
+        for span in sorted(spans, key=lambda span: span.start):
+            event = {
+                'name' : span.name,
+                'cat' : 'kaylee',
+                'ph' : 'X',
+                'ts' : round((_EPOCH + span.start) * 1e6, 3),
+                'dur' : round((span.end - span.start) * 1e6, 3),
+                'pid' : self._pid,
+                'tid' : tid,
+            }
+            if span.args:
+                event['args'] = span.args
+            events.append(event)
+        return events
+
+
+class FileExporter(object):
+    """Appends the traces' events to a file in the JSON Array Format of
+    the Trace Event Format. The file is written incrementally and is never
+    terminated by the closing bracket, which the format allows, so that
+    the file stays valid if the server is killed.
+
+    :param path: the trace file path.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'a')
+        if self._file.tell() == 0:
+            self._file.write('[\n')
+
+    def export(self, events):
+        self._file.write(''.join(json.dumps(event) + ',\n'
+                                 for event in events))
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class SlowRequestLog(object):
+    """A bounded ring buffer of the requests which took at least
+    ``threshold`` seconds. The oldest records are dropped once the
+    ``capacity`` is reached. A record is a dict, e.g.::
+
+      {
+          'endpoint' : 'accept_result',
+          'time' : 1371541925.123,     # the request start (UNIX time)
+          'duration' : 0.31,
+          'node_id' : '51bf3e9c00000001abcd',
+          'app' : 'hash_cracker',
+          'request_size' : 1024,
+          'response_size' : 64,
+          'phases' : [
+              {'name' : 'parse_result', 'offset' : 0.00001,
+               'duration' : 0.00002, 'depth' : 1},
+              ...
+          ],
+      }
+
+    The phases are ordered by their start, ``offset`` is the time from
+    the request start and ``depth`` is the nesting level (``1`` for the
+    phases of the request itself).
+
+    :param threshold: the slow request duration in seconds.
+    :param capacity: the maximum amount of the records.
+    """
+    def __init__(self, threshold, capacity=100):
+        self.threshold = threshold
+        self.capacity = capacity
+        self._records = deque(maxlen=capacity)
+        self._lock = threading.Lock()
+
+    def add(self, root, spans):
+        """Records a finished request (see :meth:`Tracer.finish`)."""
+        phases = []
+        for span in sorted(spans, key=lambda span: span.start):
+            if span is root:
+                continue
+            depth = 0
+            parent = span
+            while parent is not root:
+                depth += 1
+                parent = parent.parent
+            phases.append({'name' : span.name,
+                           'offset' : span.start - root.start,
+                           'duration' : span.end - span.start,
+                           'depth' : depth})
+        record = {'endpoint' : root.name,
+                  'time' : _EPOCH + root.start,
+                  'duration' : root.end - root.start}
+        if root.args:
+            record.update(root.args)
+        record['phases'] = phases
+        with self._lock:
+            self._records.append(record)
+        log.warning('Slow request: {} took {:.1f} ms'.format(
+            root.name, record['duration'] * 1000))
+
+    def records(self):
+        """Returns the list of the records, the oldest first."""
+        with self._lock:
+            return list(self._records)
+
+    def clear(self):
+        with self._lock:
+            self._records.clear()
+
+    def __len__(self):
+        return len(self._records)
+
+
+def install(tracer):
+    """Installs the global tracer and returns the previous one. ``None``
+    disables the tracing."""
+    global _tracer
+    #pylint: disable-msg=W0603
+    previous, _tracer = _tracer, tracer
+    return previous
+
+
+def get_tracer():
+    """Returns the installed tracer or ``None``."""
+    return _tracer
+
+
+def trace(name, args=None):
+    """Returns a request span (see :meth:`Tracer.trace`) of the installed
+    tracer."""
+    if _tracer is None:
+        return _NOOP_SPAN
+    return _tracer.trace(name, args)
+
+
+def span(name, args=None):
+    """Returns a phase span (see :meth:`Tracer.span`) of the installed
+    tracer."""
+    if _tracer is None:
+        return _NOOP_SPAN
+    return _tracer.span(name, args)
+
+
+def annotate(key, value):
+    """Attaches a value (e.g. the node ID) to the request span of the
+    current trace. Nothing is done if the request is not traced."""
+    if _tracer is None:
+        return
+    current = getattr(_local, 'span', None)
+    if current is not None:
+        current.root.annotate(key, value)
+
+
+def stats():
+    """Returns the aggregated timings of the installed tracer (see
+    :meth:`Tracer.stats`) or ``None`` if the tracing is disabled."""
+    if _tracer is None:
+        return None
+    return _tracer.stats()
+
+
+def slow_requests():
+    """Returns the records of the slow requests (see
+    :meth:`SlowRequestLog.records`) or ``None`` if the slow requests are
+    not captured."""
+    if _tracer is None or _tracer.slow_requests is None:
+        return None
+    return _tracer.slow_requests.records()
+
+
+def configure(sample_rate=1.0, path=None, slow_request_threshold=None,
+              slow_requests_capacity=100):
+    """Creates a :class:`Tracer` from the :config:`TRACING` and
+    :config:`SLOW_REQUESTS` settings.
+
+    :param path: the trace file (see :class:`FileExporter`) or ``None``.
+    :param slow_request_threshold: the threshold of the
+                                   :class:`SlowRequestLog` or ``None``
+                                   if the slow requests are not captured.
+    """
+    exporter = FileExporter(path) if path is not None else None
+    slow_log = None
+    if slow_request_threshold is not None:
+        slow_log = SlowRequestLog(slow_request_threshold,
+                                  slow_requests_capacity)
+    return Tracer(sample_rate, exporter, slow_log)
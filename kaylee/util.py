@@ -24,6 +24,7 @@ import contextlib
 import logging
 import itertools
 from datetime import timedelta
+from collections import OrderedDict
 from .errors import KayleeError
 
 
@@ -189,3 +190,56 @@ def ensure_dir(path):
 def setup_logging(loglevel=logging.INFO):
     log_format = '%(levelname)s[%(name)s]: %(message)s'
     logging.basicConfig(level=loglevel, format=log_format)
+
+
+class LRUCache(object):
+    """A simple least recently used items cache. The cache is not
+    thread-safe: the users which share it between threads (e.g.
+    :class:`TaskCache <kaylee.taskcache.TaskCache>` or
+    :class:`TieredSessionStore <kaylee.session.TieredSessionStore>`)
+    guard it with a lock.
+
+    :param capacity: the maximum amount of items in the cache.
+    :param on_evict: a ``callback(key, value)`` called when an item is
+                     evicted from the cache due to the lack of capacity.
+    """
+    def __init__(self, capacity, on_evict=None):
+        if capacity < 1:
+            raise ValueError('Cache capacity must be a positive integer')
+        self.capacity = capacity
+        self._on_evict = on_evict
+        self._d = OrderedDict()
+
+    def get(self, key, default=None):
+        """Returns the cached value and marks it as the most recently
+        used one."""
+        try:
+            self._d.move_to_end(key)
+            return self._d[key]
+        except KeyError:
+            return default
+
+    def put(self, key, value):
+        self._d[key] = value
+        self._d.move_to_end(key)
+        while len(self._d) > self.capacity:
+            old_key, old_value = self._d.popitem(last=False)
+            if self._on_evict is not None:
+                self._on_evict(old_key, old_value)
+
+    def pop(self, key, default=None):
+        return self._d.pop(key, default)
+
+    def clear(self):
+        self._d.clear()
+
+    def items(self):
+        """Returns the ``(key, value)`` iterator, from the least recently
+        used item to the most recently used one."""
+        return iter(self._d.items())
+
+    def __contains__(self, key):
+        return key in self._d
+
+    def __len__(self):
+        return len(self._d)
@@ -76,7 +76,7 @@ setup(
     install_requires=[
         'Werkzeug>=0.9.1',
         'Jinja2>=2.7',
-        'pycrypto>=2.6',
+        'cryptography>=2.0',
     ],
 
     test_suite='kaylee.testsuite.suite',